@@ -47,11 +47,16 @@ from models import (
     WebhookEvent,
     utc_now,
 )
+from services.ai_router import hedge_metrics, provider_routing_report
 from services.booking_service import SLOT_MAP, reschedule_paid_booking
+from services.circuit_breaker import breaker_snapshots
 from services.fulfillment_service import ensure_booking_fulfillment
 from services.payment_reconciliation_service import (
     lock_matching_payment_reconciliations,
 )
+from services.request_timing import performance_report
+from services.shared_answer_cache import shared_cache_metrics
+from services.ttl_cache import cache_stats
 
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
@@ -466,6 +471,28 @@ def metrics():
         db.close()
 
 
+@admin_bp.get("/performance")
+def performance():
+    """Return rolling request-phase latency histograms for this process."""
+
+    payload = performance_report()
+    payload["ai_hedging"] = hedge_metrics()
+    payload["ai_breakers"] = breaker_snapshots()
+    payload["ai_shared_cache"] = shared_cache_metrics()
+    payload["caches"] = cache_stats()
+    payload["generated_at"] = utc_now().isoformat(timespec="seconds") + "Z"
+    return jsonify(payload)
+
+
+@admin_bp.get("/ai-providers")
+def ai_providers():
+    """Return per-provider AI health and the order providers are tried in."""
+
+    payload = provider_routing_report()
+    payload["generated_at"] = utc_now().isoformat(timespec="seconds") + "Z"
+    return jsonify(payload)
+
+
 @admin_bp.get("/document-orders")
 def document_orders():
     """Expose privacy-minimised Document Studio UAT state to operators.
@@ -10,18 +10,22 @@ import hashlib
 import re
 import unicodedata
 import uuid
+from collections import deque
+from functools import partial
 
 from concurrent.futures import ThreadPoolExecutor
-from threading import BoundedSemaphore, Lock
-from collections import defaultdict, deque
+from dataclasses import dataclass
+from typing import Any
+from threading import BoundedSemaphore, Lock, Timer
 from datetime import datetime, time as dt_time, timedelta, timezone
 from urllib.parse import urlsplit
 
-from flask import Flask, g, jsonify, request
+from flask import Flask, g, has_app_context, jsonify, request
 from config import (
     AI_CONSENT_VERSION,
     ALLOW_INSECURE_WEBHOOKS,
     ADMIN_TOKEN,
+    ANALYTICS_TALLY_FLUSH_SECONDS,
     ADMIN_PASSWORD,
     AUTO_CREATE_SCHEMA,
     ENV,
@@ -62,14 +66,21 @@ from config import (
     AI_CALL_COOLDOWN_SECONDS,
     GLOBAL_REQUEST_LIMIT,
     GLOBAL_REQUEST_WINDOW_SECONDS,
+    INBOUND_MAX_ATTEMPTS,
     INBOUND_MESSAGE_LEASE_SECONDS,
+    INBOUND_RETRY_BASE_SECONDS,
+    INBOUND_RETRY_MAX_SECONDS,
     INBOUND_USER_LOCK_TIMEOUT_SECONDS,
+    INBOUND_WORKER_THREADS,
     LEGAL_CONTENT_REVIEWED_VERSION,
     LEGAL_CONTENT_REVIEWED_ON,
     LEGAL_CONTENT_VERSION,
     PRIVACY_EMAIL,
     PRIVACY_POLICY_URL,
     PROCESSED_MESSAGE_TTL_DAYS,
+    RATE_LIMIT_BACKEND,
+    RATE_LIMIT_REDIS_TIMEOUT_SECONDS,
+    RATE_LIMIT_REDIS_URL,
     TERMS_OF_SERVICE_URL,
     USER_MESSAGE_LIMIT,
     USER_MESSAGE_WINDOW_SECONDS,
@@ -80,6 +91,10 @@ from config import (
     WEBHOOK_EVENT_TTL_DAYS,
     WEBHOOK_MAX_PAYLOAD_BYTES,
     WEBHOOK_REPLAY_WINDOW_SECONDS,
+    WHATSAPP_ASYNC_DELIVERY,
+    WHATSAPP_ASYNC_INGESTION,
+    WHATSAPP_COALESCE_REPLIES,
+    WHATSAPP_SENDER_THREADS,
 )
 from location_service import detect_district_and_state
 from models import (
@@ -100,26 +115,43 @@ from models import (
 from db import (
     EXPECTED_SCHEMA_REVISION,
     SessionLocal,
+    after_commit,
+    commit_now,
+    engine,
     get_db_health,
     get_schema_revision,
     init_db,
+    lock_engine,
+    unit_of_work,
 )
+from sqlalchemy import func, text
 from sqlalchemy.exc import IntegrityError
 from admin import admin_bp
 from category_labels import CATEGORY_LABELS
 from subcategory_labels import SUBCATEGORY_LABELS
 from utils.date_utils import format_date_readable
 from utils.i18n import t
+from services import request_timing
+from services.rate_limit_service import build_rate_limit_store
+from services.ttl_cache import TTLCache
 from services.whatsapp_service import (
+    INTERACTIVE_BODY_MAX,
+    LIST_BODY_MAX,
+    button_message,
     is_ambiguous_delivery_failure,
     is_retryable_delivery_failure,
+    list_message,
+    text_message,
+    validate_message,
     send_text as _wa_send_text,
     send_buttons as _wa_send_buttons,
     send_typing_on as _wa_send_typing_on,
     send_typing_off as _wa_send_typing_off,
     send_list_picker as _wa_send_list_picker,
     send_payment_receipt_pdf as _wa_send_payment_receipt_pdf,
+    send_prepared as _wa_send_prepared,
 )
+from services.interactive_menus import MenuCache
 from services.receipt_service import generate_pdf_receipt
 from services.ai_router import ai_reply_router
 from services.booking_service import (
@@ -131,7 +163,7 @@ from services.booking_service import (
     mark_booking_as_paid,
     payment_capacity_conflict,
     SLOT_MAP,
-    expire_old_pending_bookings,
+    expire_pending_booking_if_stale,
 )
 from services.engagement_service import (
     HOME_BUTTON_IDS,
@@ -159,6 +191,7 @@ from services.document_studio_service import (
     DOCUMENT_STUDIO_IDS,
     DOCUMENT_STUDIO_QUESTION,
     DOCUMENT_STUDIO_REVIEW,
+    PRODUCT_ID_PREFIX as DOCUMENT_PRODUCT_ID_PREFIX,
     START_ID_PREFIX as DOCUMENT_START_ID_PREFIX,
     UAT_PRODUCT_CODE,
     cancel_order as cancel_document_order,
@@ -177,12 +210,13 @@ from services.document_studio_service import (
     summary_values as document_summary_values,
     validate_answer as validate_document_answer,
 )
-from services.analytics_service import record_event
+from services.analytics_service import Tally, record_event
 from services.fulfillment_service import ensure_booking_fulfillment
 from services.outbox_service import (
     CONVERSATION_DELIVERY_KIND,
     enqueue_job,
     process_job,
+    recipient_ordering_key,
 )
 from services.payment_reconciliation_service import (
     fetch_current_razorpay_capture,
@@ -227,22 +261,24 @@ GLOBAL_REQ_LIMIT = GLOBAL_REQUEST_LIMIT
 GLOBAL_REQ_WINDOW = GLOBAL_REQUEST_WINDOW_SECONDS
 
 # ===============================
-# RATE LIMITING STORES (IN-MEMORY)
+# RATE LIMITING STORE
 # ===============================
-user_message_times = defaultdict(lambda: deque())
-user_last_ai_call = {}
-global_request_times = deque()
-_rate_limit_guard = Lock()
-_rate_limit_notice_times: dict[tuple[str, str], float] = {}
-_rate_limit_last_cleanup = 0.0
-_RATE_LIMIT_CLEANUP_INTERVAL_SECONDS = 300.0
 _RATE_LIMIT_STATE_MAX_KEYS = 100_000
+rate_limit_store = build_rate_limit_store(
+    RATE_LIMIT_BACKEND,
+    redis_url=RATE_LIMIT_REDIS_URL,
+    redis_timeout_seconds=RATE_LIMIT_REDIS_TIMEOUT_SECONDS,
+    max_memory_keys=_RATE_LIMIT_STATE_MAX_KEYS,
+)
+_rate_limit_guard = Lock()
 
-# The Render topology intentionally uses one Gunicorn worker with threads.
-# Serialize messages from the same WhatsApp account inside that process so two
-# rapid replies cannot mutate a conversation state out of order.
+# Serialize messages from the same WhatsApp account so two rapid replies cannot
+# mutate a conversation state out of order. Threads share these reference-
+# counted locks; PostgreSQL advisory locks extend the guarantee across
+# Gunicorn worker processes.
 _user_processing_locks: dict[str, tuple[Lock, int]] = {}
 _user_processing_locks_guard = Lock()
+_USER_LOCK_PERSONALIZATION = b"nyaysetu-user"
 _outbox_executor = ThreadPoolExecutor(
     max_workers=4,
     thread_name_prefix="nyaysetu-outbox",
@@ -257,14 +293,12 @@ atexit.register(
     cancel_futures=False,
 )
 
-
 def _run_outbox_job(job_id: int) -> None:
     try:
         process_job(job_id)
     finally:
         _outbox_submission_slots.release()
 
-
 def submit_outbox_job(job_id: int) -> bool:
     """Best-effort low-latency kick; the durable worker remains authoritative."""
 
@@ -283,11 +317,209 @@ def submit_outbox_job(job_id: int) -> bool:
         raise
     return True
 
+# Fast-ack ingestion hands committed inbox rows to this pool. At most one drain
+# per sender runs at a time; a submission that arrives while it is running
+# asks the active drain to look again instead of starting a second one.
+_inbound_executor = ThreadPoolExecutor(
+    max_workers=INBOUND_WORKER_THREADS,
+    thread_name_prefix="nyaysetu-inbound",
+)
+_inbound_drains: dict[str, bool] = {}
+_inbound_drains_guard = Lock()
+atexit.register(
+    _inbound_executor.shutdown,
+    wait=False,
+    cancel_futures=False,
+)
+
+# A blocked sender is retried this many times before it is left to the next
+# message or the recovery job.
+_INBOUND_RETRY_ROUNDS = 8
+
+def _run_inbound_drain(wa_id: str, retry_round: int = 0) -> None:
+    while True:
+        try:
+            blocked = _drain_inbound(wa_id)[1]
+        except Exception:
+            blocked = True
+            logger.exception(
+                "INBOUND_DRAIN_FAILED | user=%s",
+                masked_identifier(wa_id),
+            )
+        with _inbound_drains_guard:
+            if not _inbound_drains.get(wa_id):
+                _inbound_drains.pop(wa_id, None)
+                break
+            _inbound_drains[wa_id] = False
+        # A new message arrived during the drain and has just been tried.
+        retry_round = 0
+    if blocked:
+        _schedule_inbound_retry(wa_id, retry_round)
+
+def _schedule_inbound_retry(wa_id: str, retry_round: int) -> None:
+    """Drain a blocked sender again after an exponential backoff."""
+
+    if INBOUND_RETRY_BASE_SECONDS <= 0:
+        return
+    if retry_round >= _INBOUND_RETRY_ROUNDS:
+        logger.warning(
+            "INBOUND_RETRY_EXHAUSTED | user=%s | rounds=%s",
+            masked_identifier(wa_id),
+            retry_round,
+        )
+        return
+    delay = min(
+        INBOUND_RETRY_MAX_SECONDS,
+        INBOUND_RETRY_BASE_SECONDS * 2**retry_round,
+    )
+    timer = Timer(
+        delay,
+        submit_inbound_drain,
+        args=(wa_id,),
+        kwargs={"retry_round": retry_round + 1},
+    )
+    timer.daemon = True
+    timer.start()
+
+def submit_inbound_drain(wa_id: str, *, retry_round: int = 0) -> bool:
+    """Best-effort kick; the durable inbox and recovery job stay authoritative."""
+
+    with _inbound_drains_guard:
+        if wa_id in _inbound_drains:
+            _inbound_drains[wa_id] = True
+            return True
+        _inbound_drains[wa_id] = False
+    try:
+        _inbound_executor.submit(_run_inbound_drain, wa_id, retry_round)
+    except RuntimeError:
+        with _inbound_drains_guard:
+            _inbound_drains.pop(wa_id, None)
+        # Shutdown can reject new work. The committed RECEIVED row remains
+        # available to `python -m jobs.process_inbound`.
+        logger.info("Inbound worker unavailable during shutdown")
+        return False
+    return True
+
+# Async delivery hands each committed reply job to this pool. Jobs for one
+# recipient run one at a time in commit order, so a message's replies never
+# overtake an earlier message's; different recipients are sent in parallel.
+# A job that failed and waits for a retry keeps holding its place: the
+# recipient's later jobs stay PENDING until the outbox worker sends it.
+_outbound_executor = ThreadPoolExecutor(
+    max_workers=WHATSAPP_SENDER_THREADS,
+    thread_name_prefix="nyaysetu-sender",
+)
+_outbound_queues: dict[str, deque[int]] = {}
+_outbound_queues_guard = Lock()
+atexit.register(
+    _outbound_executor.shutdown,
+    wait=False,
+    cancel_futures=False,
+)
+
+def _run_outbound_queue(wa_id: str) -> None:
+    while True:
+        with _outbound_queues_guard:
+            queue = _outbound_queues[wa_id]
+            if not queue:
+                _outbound_queues.pop(wa_id, None)
+                return
+            job_id = queue.popleft()
+        try:
+            process_job(job_id)
+        except Exception:
+            logger.exception(
+                "OUTBOUND_DELIVERY_FAILED | user=%s | job_id=%s",
+                masked_identifier(wa_id),
+                job_id,
+            )
+
+def submit_outbound_delivery(wa_id: str, job_id: int) -> bool:
+    """Best-effort ordered send; the committed outbox job stays authoritative."""
+
+    with _outbound_queues_guard:
+        queue = _outbound_queues.get(wa_id)
+        if queue is not None:
+            queue.append(job_id)
+            return True
+        _outbound_queues[wa_id] = deque([job_id])
+    try:
+        _outbound_executor.submit(_run_outbound_queue, wa_id)
+    except RuntimeError:
+        with _outbound_queues_guard:
+            _outbound_queues.pop(wa_id, None)
+        # Shutdown can reject new work. The committed PENDING job remains
+        # available to the outbox worker.
+        logger.info("Outbound sender unavailable during shutdown")
+        return False
+    return True
+
+# Typing indicators are cosmetic: they never wait on Meta and a failed one never
+# aborts a reply. Each user has at most one indicator task; requests arriving
+# while it is queued replace the state it sends, so an on/off pair around a
+# fast AI answer costs one call instead of two.
+_typing_executor = ThreadPoolExecutor(
+    max_workers=2,
+    thread_name_prefix="nyaysetu-typing",
+)
+_typing_states: dict[str, bool | None] = {}
+_typing_states_guard = Lock()
+atexit.register(
+    _typing_executor.shutdown,
+    wait=False,
+    cancel_futures=True,
+)
+
+
+def _run_typing_indicator(wa_id: str) -> None:
+    while True:
+        with _typing_states_guard:
+            typing = _typing_states.get(wa_id)
+            if typing is None:
+                _typing_states.pop(wa_id, None)
+                return
+            _typing_states[wa_id] = None
+        sender = _wa_send_typing_on if typing else _wa_send_typing_off
+        try:
+            result = sender(wa_id)
+        except Exception:
+            result = {"ok": False, "error": "typing_indicator_exception"}
+        if not isinstance(result, dict) or not result.get("ok"):
+            logger.debug(
+                "TYPING_INDICATOR_FAILED | user=%s | typing=%s",
+                masked_identifier(wa_id),
+                typing,
+            )
+
+def _submit_typing_indicator(wa_id: str, typing: bool) -> dict:
+    with _typing_states_guard:
+        running = wa_id in _typing_states
+        _typing_states[wa_id] = typing
+    if not running:
+        try:
+            _typing_executor.submit(_run_typing_indicator, wa_id)
+        except RuntimeError:
+            with _typing_states_guard:
+                _typing_states.pop(wa_id, None)
+    return {"ok": True, "queued": True}
+
+category_tally = Tally(
+    CategoryAnalytics,
+    ("category", "subcategory"),
+    flush_interval_seconds=ANALYTICS_TALLY_FLUSH_SECONDS,
+)
+
 # ===============================
 # MAINTENANCE DEDUPE (IN-MEMORY)
 # ===============================
-maintenance_last_sent = {}
 MAINTENANCE_DEDUPE_SECONDS = 3
+# wa_id -> epoch seconds of the last acknowledgement; entries expire with the
+# dedupe window.
+maintenance_last_sent = TTLCache(
+    max_entries=_RATE_LIMIT_STATE_MAX_KEYS,
+    ttl_seconds=MAINTENANCE_DEDUPE_SECONDS,
+    name="maintenance_notices",
+)
 
 WELCOME_KEYWORDS = {"hi", "hii", "hie", "hello", "hey", "start"}
 
@@ -323,6 +555,24 @@ DOCUMENT_STUDIO_KEYWORDS = {
     "agreement test",
 }
 
+
+def _keyword_intents(**keyword_groups) -> dict[str, frozenset[str]]:
+    intents: dict[str, set[str]] = {}
+    for intent, group in keyword_groups.items():
+        for keyword in group:
+            intents.setdefault(keyword, set()).add(intent)
+    return {keyword: frozenset(names) for keyword, names in intents.items()}
+
+
+# One lookup per message replaces the membership tests scattered through the
+# conversation handler. Booking commands are normalised separately.
+_KEYWORD_INTENTS = _keyword_intents(
+    welcome=WELCOME_KEYWORDS,
+    home=HOME_KEYWORDS,
+    restart=RESTART_KEYWORDS,
+    documents=DOCUMENT_STUDIO_KEYWORDS,
+)
+
 ADVOCATE_INTAKE_PREFIX = (
     "Hi NyaySetu, I want to request consultation coordination with an "
     "independent advocate."
@@ -357,7 +607,6 @@ ADVOCATE_INTAKE_TIMINGS = {
 
 app.register_blueprint(admin_bp)
 
-
 class WhatsAppDeliveryError(RuntimeError):
     """Raised when Meta did not accept an outbound message."""
 
@@ -377,7 +626,6 @@ class WhatsAppDeliveryError(RuntimeError):
         self.retryable = retryable
         self.ambiguous = ambiguous
 
-
 def _require_whatsapp_delivery(
     result,
     *,
@@ -399,34 +647,165 @@ def _require_whatsapp_delivery(
         )
     return result
 
+def _queue_reply(
+    operation: str,
+    message: dict | None,
+    payload: dict,
+    send,
+) -> dict | None:
+    """Collect a validated reply until the current message commits.
+
+    Async delivery persists it as an outbox job. Otherwise ``send`` runs
+    right after the commit, so no Graph call holds the transaction open.
+    """
+
+    if not has_app_context():
+        return None
+    replies = g.get("outbound_replies")
+    deferred = g.get("deferred_sends")
+    if replies is None and deferred is None:
+        return None
+    if message is not None:
+        validate_message(message)
+    if replies is not None:
+        replies.append({"operation": operation, **payload})
+        return {"ok": True, "queued": True}
+    deferred.append((operation, payload, send))
+    return {"ok": True, "deferred": True}
+
+def _after_replies(db, action, delivery: dict) -> None:
+    """Run ``action`` once the message commits, after the replies before it.
+
+    Async delivery sends those replies from the message's outbox job, so
+    there ``delivery`` is appended to the job as its next step instead.
+    """
+
+    flush_replies()
+    replies = g.get("outbound_replies") if has_app_context() else None
+    if replies is not None:
+        replies.append(delivery)
+        return
+    deferred = g.get("deferred_sends") if has_app_context() else None
+    if deferred is None:
+        after_commit(db, action)
+        return
+    deferred.append((None, None, action))
+
+def _send_committed_replies(deferred: list) -> None:
+    """Send the replies of a committed message in order.
+
+    A failed send raises with that reply and every reply behind it as its
+    payload, so the caller queues them together as one delivery job.
+    """
+
+    for index, (operation, payload, send) in enumerate(deferred):
+        if operation is None:
+            send()
+            continue
+        try:
+            _require_whatsapp_delivery(
+                send(),
+                operation=operation,
+                payload=payload,
+            )
+        except WhatsAppDeliveryError as exc:
+            unsent = [
+                {"operation": unsent_operation, **unsent_payload}
+                for unsent_operation, unsent_payload, _ in deferred[index:]
+                if unsent_operation is not None
+            ]
+            if len(unsent) > 1:
+                exc.payload = {"deliveries": unsent}
+            raise
+
+def _hold_text(wa_id: str, body: str) -> dict | None:
+    """Hold a reply text so the handler's next interactive can carry it."""
+
+    if not has_app_context() or not g.get("coalesce_replies"):
+        return None
+    validate_message(text_message(wa_id, body))
+    flush_replies()
+    g.pending_text = (wa_id, body)
+    return {"ok": True, "held": True}
+
+def _absorb_pending_text(wa_id: str, body: str, limit: int) -> str | None:
+    """Return ``body`` prefixed with the held text when both fit together."""
+
+    pending = g.get("pending_text") if has_app_context() else None
+    if pending is None:
+        return None
+    held_wa_id, text = pending
+    merged = f"{text.strip()}\n\n{body.strip()}"
+    if held_wa_id != wa_id or len(merged) > limit:
+        flush_replies()
+        return None
+    g.pending_text = None
+    return merged
+
+def flush_replies() -> None:
+    """Send a held text now; a barrier before anything it must precede."""
+
+    pending = g.pop("pending_text", None) if has_app_context() else None
+    if pending is not None:
+        _send_text_now(*pending)
 
 def send_text(wa_id: str, body: str):
+    held = _hold_text(wa_id, body)
+    if held is not None:
+        return held
+    return _send_text_now(wa_id, body)
+
+def _send_text_now(wa_id: str, body: str):
+    payload = {"to": wa_id, "body": body}
+    send = partial(_wa_send_text, wa_id, body)
+    queued = _queue_reply("text", text_message(wa_id, body), payload, send)
+    if queued is not None:
+        return queued
     return _require_whatsapp_delivery(
-        _wa_send_text(wa_id, body),
+        send(),
         operation="text",
-        payload={"to": wa_id, "body": body},
+        payload=payload,
     )
 
-
-def send_buttons(wa_id: str, body: str, buttons: list):
+def send_buttons(
+    wa_id: str,
+    body: str,
+    buttons: list,
+    *,
+    prepared: dict | None = None,
+):
+    merged = _absorb_pending_text(wa_id, body, INTERACTIVE_BODY_MAX)
+    if merged is not None:
+        body, prepared = merged, None
+    payload = {
+        "to": wa_id,
+        "body": body,
+        "buttons": buttons,
+    }
+    send = (
+        partial(_wa_send_prepared, wa_id, prepared)
+        if prepared
+        else partial(_wa_send_buttons, wa_id, body, buttons)
+    )
+    queued = _queue_reply(
+        "buttons",
+        None if prepared else button_message(wa_id, body, buttons),
+        payload,
+        send,
+    )
+    if queued is not None:
+        return queued
     return _require_whatsapp_delivery(
-        _wa_send_buttons(wa_id, body, buttons),
+        send(),
         operation="buttons",
-        payload={
-            "to": wa_id,
-            "body": body,
-            "buttons": buttons,
-        },
+        payload=payload,
     )
 
+def send_typing_on(wa_id: str):
+    return _submit_typing_indicator(wa_id, True)
 
-def send_typing_on(*args, **kwargs):
-    return _require_whatsapp_delivery(_wa_send_typing_on(*args, **kwargs))
-
-
-def send_typing_off(*args, **kwargs):
-    return _require_whatsapp_delivery(_wa_send_typing_off(*args, **kwargs))
-
+def send_typing_off(wa_id: str):
+    return _submit_typing_indicator(wa_id, False)
 
 def send_list_picker(
     wa_id: str,
@@ -434,38 +813,77 @@ def send_list_picker(
     body: str,
     rows: list,
     section_title: str = "Options",
+    *,
+    prepared: dict | None = None,
 ):
-    return _require_whatsapp_delivery(
-        _wa_send_list_picker(
+    merged = _absorb_pending_text(wa_id, body, LIST_BODY_MAX)
+    if merged is not None:
+        body, prepared = merged, None
+    payload = {
+        "to": wa_id,
+        "header": header,
+        "body": body,
+        "rows": rows,
+        "section_title": section_title,
+    }
+    send = (
+        partial(_wa_send_prepared, wa_id, prepared)
+        if prepared
+        else partial(
+            _wa_send_list_picker,
             wa_id,
             header=header,
             body=body,
             rows=rows,
             section_title=section_title,
+        )
+    )
+    queued = _queue_reply(
+        "list",
+        None if prepared else list_message(
+            wa_id,
+            header,
+            body,
+            rows,
+            section_title,
         ),
+        payload,
+        send,
+    )
+    if queued is not None:
+        return queued
+    return _require_whatsapp_delivery(
+        send(),
         operation="list",
-        payload={
-            "to": wa_id,
-            "header": header,
-            "body": body,
-            "rows": rows,
-            "section_title": section_title,
-        },
+        payload=payload,
     )
 
+def send_compiled_menu(wa_id: str, user, name: str):
+    """Send a cached menu from ``interactive_menus`` without revalidating it."""
+
+    menu = interactive_menus.get(name, user)
+    if menu.operation == "buttons":
+        return send_buttons(
+            wa_id,
+            menu.fields["body"],
+            menu.fields["buttons"],
+            prepared=menu.message,
+        )
+    return send_list_picker(wa_id, **menu.fields, prepared=menu.message)
 
 def send_payment_receipt_pdf(*args, **kwargs):
+    flush_replies()
     return _require_whatsapp_delivery(
         _wa_send_payment_receipt_pdf(*args, **kwargs)
     )
 
-
 @app.before_request
 def apply_request_guards():
     request_id = request.headers.get("X-Request-ID", "").strip()
     if not re.fullmatch(r"[A-Za-z0-9._:-]{1,128}", request_id):
         request_id = uuid.uuid4().hex
     g.request_id = request_id
+    request_timing.begin_request()
 
     if (
         request.content_length is not None
@@ -474,34 +892,22 @@ def apply_request_guards():
         return jsonify({"error": "payload_too_large"}), 413
     return None
 
-
 @app.after_request
 def add_response_headers(response):
     response.headers["X-Request-ID"] = getattr(g, "request_id", uuid.uuid4().hex)
     response.headers["X-Content-Type-Options"] = "nosniff"
     response.headers["Referrer-Policy"] = "no-referrer"
-    if (
-        request.path == "/webhook"
-        and request.method == "POST"
-        and getattr(g, "inbound_message_claimed", False)
-        and response.status_code < 500
-    ):
-        if not finish_inbound_message(
-            getattr(g, "inbound_message_id", None)
-        ):
-            # Do not acknowledge an event whose durable terminal state could
-            # not be recorded. Its lease makes a later Meta retry recoverable.
-            response.status_code = 503
 
-    if (
-        request.path == "/webhook"
-        and request.method == "POST"
-        and getattr(g, "whatsapp_batch_has_more", False)
-        and response.status_code < 400
-    ):
-        # Meta retries the complete batch. On the retry we select the next
-        # message whose durable ID has not yet been processed.
-        response.status_code = 503
+    timing = request_timing.current()
+    if timing is not None:
+        total = request_timing.finish_request(
+            timing,
+            request_id=response.headers["X-Request-ID"],
+            endpoint=request.endpoint,
+            status_code=response.status_code,
+        )
+        if ENV != "production":
+            response.headers["Server-Timing"] = timing.server_timing(total)
     return response
 
 # ===============================
@@ -551,7 +957,6 @@ BTN_REVIEW_CHANGE_TIME = "review_change_time"
 BTN_REVIEW_CANCEL = "review_cancel"
 BTN_SUPPORT_CANCEL = "support_cancel"
 
-
 # ===============================
 # HELPERS
 # ===============================
@@ -625,143 +1030,47 @@ def get_or_create_user(db, wa_id):
             welcome_sent=False,     
             created_at=utc_now(),
         )
-        db.add(user)
         try:
+            # The savepoint keeps a lost insert race from discarding the rest
+            # of the caller's unit of work.
+            with db.begin_nested():
+                db.add(user)
             db.commit()
-            db.refresh(user)
             record_event("user_created", user_id=user.id)
         except IntegrityError:
             # Meta may deliver two first messages concurrently. The unique
             # WhatsApp ID is the source of truth; fetch the winner.
-            db.rollback()
             user = db.query(User).filter_by(whatsapp_id=wa_id).first()
             if not user:
                 raise
 
     return user
 
-
 # ===============================
 # RATE LIMIT HELPERS
 # ===============================
-def _oldest_message_time(wa_id: str) -> float:
-    times = user_message_times.get(wa_id)
-    return times[-1] if times else 0.0
-
-
-def _trim_oldest_keys(mapping, timestamp_for_key) -> None:
-    overflow = len(mapping) - _RATE_LIMIT_STATE_MAX_KEYS
-    if overflow <= 0:
-        return
-    oldest = sorted(mapping, key=timestamp_for_key)[:overflow]
-    for key in oldest:
-        mapping.pop(key, None)
-
-
-def _prune_rate_limit_state(now: float) -> None:
-    """Bound idle per-user state; caller must hold ``_rate_limit_guard``."""
-
-    global _rate_limit_last_cleanup
-
-    state_is_bounded = all(
-        len(mapping) <= _RATE_LIMIT_STATE_MAX_KEYS
-        for mapping in (
-            user_message_times,
-            user_last_ai_call,
-            _rate_limit_notice_times,
+def _rate_limit_hit(key: str, limit: int, window_seconds: float) -> bool:
+    try:
+        return rate_limit_store.hit(key, limit, window_seconds)
+    except Exception:
+        # An unavailable shared store must not take the whole bot down. Fail
+        # open; the provider-side and AI cooldown limits still apply.
+        logger.warning(
+            "RATE_LIMIT_STORE_UNAVAILABLE | backend=%s | request_id=%s",
+            RATE_LIMIT_BACKEND,
+            getattr(g, "request_id", "unknown"),
+            exc_info=True,
         )
-    )
-    cleanup_elapsed = now - _rate_limit_last_cleanup
-    if (
-        state_is_bounded
-        and 0 <= cleanup_elapsed < _RATE_LIMIT_CLEANUP_INTERVAL_SECONDS
-    ):
-        return
-
-    for wa_id, times in list(user_message_times.items()):
-        if times and times[-1] > now:
-            times.clear()
-        while times and now - times[0] > USER_MSG_WINDOW:
-            times.popleft()
-        if not times:
-            user_message_times.pop(wa_id, None)
-
-    ai_idle_ttl = max(300.0, float(AI_CALL_COOLDOWN) * 2)
-    for wa_id, last_call in list(user_last_ai_call.items()):
-        if last_call > now or now - last_call > ai_idle_ttl:
-            user_last_ai_call.pop(wa_id, None)
-
-    notice_idle_ttl = max(
-        300.0,
-        float(USER_MSG_WINDOW),
-        float(GLOBAL_REQ_WINDOW),
-    )
-    for key, last_sent in list(_rate_limit_notice_times.items()):
-        if last_sent > now or now - last_sent > notice_idle_ttl:
-            _rate_limit_notice_times.pop(key, None)
-
-    _trim_oldest_keys(user_message_times, _oldest_message_time)
-    _trim_oldest_keys(
-        user_last_ai_call,
-        lambda wa_id: user_last_ai_call[wa_id],
-    )
-    _trim_oldest_keys(
-        _rate_limit_notice_times,
-        lambda key: _rate_limit_notice_times[key],
-    )
-    _rate_limit_last_cleanup = now
-
-
-def is_user_rate_limited(wa_id):
-    now = time_module.time()
-    with _rate_limit_guard:
-        _prune_rate_limit_state(now)
-        times = user_message_times[wa_id]
-
-        while times and now - times[0] > USER_MSG_WINDOW:
-            times.popleft()
-
-        if len(times) >= USER_MSG_LIMIT:
-            return True
-
-        times.append(now)
-        _trim_oldest_keys(user_message_times, _oldest_message_time)
         return False
 
+def is_user_rate_limited(wa_id):
+    return _rate_limit_hit(f"user:{wa_id}", USER_MSG_LIMIT, USER_MSG_WINDOW)
 
 def is_ai_rate_limited(wa_id):
-    now = time_module.time()
-    with _rate_limit_guard:
-        last_call = user_last_ai_call.get(wa_id, 0)
-
-        if now - last_call < AI_CALL_COOLDOWN:
-            return True
-
-        user_last_ai_call[wa_id] = now
-        _trim_oldest_keys(
-            user_last_ai_call,
-            lambda key: user_last_ai_call[key],
-        )
-        return False
-
+    return _rate_limit_hit(f"ai:{wa_id}", 1, AI_CALL_COOLDOWN)
 
 def is_global_rate_limited():
-    now = time_module.time()
-    with _rate_limit_guard:
-        if global_request_times and global_request_times[-1] > now:
-            global_request_times.clear()
-        while (
-            global_request_times
-            and now - global_request_times[0] > GLOBAL_REQ_WINDOW
-        ):
-            global_request_times.popleft()
-
-        if len(global_request_times) >= GLOBAL_REQ_LIMIT:
-            return True
-
-        global_request_times.append(now)
-        return False
-
+    return _rate_limit_hit("global", GLOBAL_REQ_LIMIT, GLOBAL_REQ_WINDOW)
 
 def should_send_rate_limit_notice(
     scope: str,
@@ -770,41 +1079,24 @@ def should_send_rate_limit_notice(
 ) -> bool:
     """Allow at most one rate-limit response per user and limit window."""
 
-    now = time_module.time()
-    key = (str(scope), str(wa_id))
-    with _rate_limit_guard:
-        last_sent = _rate_limit_notice_times.get(key, 0)
-        if now - last_sent < max(1.0, float(cooldown_seconds)):
-            return False
-        _rate_limit_notice_times[key] = now
-        _trim_oldest_keys(
-            _rate_limit_notice_times,
-            lambda notice_key: _rate_limit_notice_times[notice_key],
-        )
-        return True
-
+    return not _rate_limit_hit(
+        f"notice:{scope}:{wa_id}",
+        1,
+        max(1.0, float(cooldown_seconds)),
+    )
 
 def should_send_maintenance_notice(wa_id: str, now: float) -> bool:
     """Deduplicate and bound process-local maintenance acknowledgements."""
 
     with _rate_limit_guard:
-        stale_before = now - max(60.0, MAINTENANCE_DEDUPE_SECONDS * 10)
-        for key, last_sent in list(maintenance_last_sent.items()):
-            if last_sent > now or last_sent < stale_before:
-                maintenance_last_sent.pop(key, None)
-        last_sent = maintenance_last_sent.get(wa_id, 0)
-        if now - last_sent < MAINTENANCE_DEDUPE_SECONDS:
+        last_sent = maintenance_last_sent.get(wa_id, now=now)
+        # A timestamp from the future means the clock moved backwards.
+        if last_sent is not None and last_sent <= now:
             return False
-        maintenance_last_sent[wa_id] = now
-        _trim_oldest_keys(
-            maintenance_last_sent,
-            lambda key: maintenance_last_sent[key],
-        )
+        maintenance_last_sent.set(wa_id, now, now=now)
         return True
 
-def _acquire_user_processing_lock(wa_id: str) -> Lock | None:
-    """Acquire a bounded in-process lock for the configured one-worker topology."""
-
+def _acquire_local_user_lock(wa_id: str, timeout: float) -> Lock | None:
     with _user_processing_locks_guard:
         entry = _user_processing_locks.get(wa_id)
         if entry:
@@ -814,7 +1106,7 @@ def _acquire_user_processing_lock(wa_id: str) -> Lock | None:
             lock = Lock()
             _user_processing_locks[wa_id] = (lock, 1)
 
-    acquired = lock.acquire(timeout=INBOUND_USER_LOCK_TIMEOUT_SECONDS)
+    acquired = lock.acquire(timeout=timeout)
     if acquired:
         return lock
 
@@ -832,11 +1124,7 @@ def _acquire_user_processing_lock(wa_id: str) -> Lock | None:
             )
     return None
 
-
-def _release_user_processing_lock(wa_id: str, lock: Lock | None) -> None:
-    if lock is None:
-        return
-
+def _release_local_user_lock(wa_id: str, lock: Lock) -> None:
     lock.release()
     with _user_processing_locks_guard:
         current = _user_processing_locks.get(wa_id)
@@ -848,6 +1136,107 @@ def _release_user_processing_lock(wa_id: str, lock: Lock | None) -> None:
         else:
             _user_processing_locks[wa_id] = (lock, references)
 
+def _user_advisory_lock_key(wa_id: str) -> int:
+    """Return a signed 64-bit key so unrelated users practically never collide."""
+
+    digest = hashlib.blake2b(
+        wa_id.encode(),
+        digest_size=8,
+        person=_USER_LOCK_PERSONALIZATION,
+    ).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def _acquire_user_advisory_lock(wa_id: str, timeout: float):
+    """Hold a PostgreSQL session lock on a connection from the lock pool.
+
+    A session-level lock survives the handler's own commits, and a crashed
+    worker's connection closes, which releases the lock automatically.
+    """
+
+    connection = lock_engine().connect()
+    try:
+        connection.execute(
+            text("SELECT set_config('lock_timeout', :timeout, false)"),
+            {"timeout": f"{max(1, int(timeout * 1000))}ms"},
+        )
+        connection.execute(
+            text("SELECT pg_advisory_lock(:lock_key)"),
+            {"lock_key": _user_advisory_lock_key(wa_id)},
+        )
+        connection.execute(
+            text("SELECT set_config('lock_timeout', '0', false)")
+        )
+    except Exception:
+        connection.invalidate()
+        connection.close()
+        raise
+    return connection
+
+def _release_user_advisory_lock(wa_id: str, connection) -> None:
+    try:
+        connection.execute(
+            text("SELECT pg_advisory_unlock(:lock_key)"),
+            {"lock_key": _user_advisory_lock_key(wa_id)},
+        )
+    except Exception:
+        # Never return a connection that may still hold the lock to the pool.
+        connection.invalidate()
+        logger.exception(
+            "USER_LOCK_RELEASE_FAILED | user=%s",
+            masked_identifier(wa_id),
+        )
+    finally:
+        connection.close()
+
+@dataclass(frozen=True)
+class UserProcessingLease:
+    lock: Lock
+    connection: Any = None
+
+def _acquire_user_processing_lock(wa_id: str) -> UserProcessingLease | None:
+    """Serialize one sender's messages across threads and worker processes.
+
+    Threads in this process queue on a reference-counted lock first, so only
+    one of them waits on the database. On PostgreSQL the holder then takes an
+    advisory lock that other Gunicorn workers wait on. Both waits share the
+    ``INBOUND_USER_LOCK_TIMEOUT_SECONDS`` budget.
+    """
+
+    deadline = time_module.monotonic() + INBOUND_USER_LOCK_TIMEOUT_SECONDS
+    lock = _acquire_local_user_lock(wa_id, INBOUND_USER_LOCK_TIMEOUT_SECONDS)
+    if lock is None:
+        return None
+    if engine.dialect.name != "postgresql":
+        return UserProcessingLease(lock)
+
+    try:
+        connection = _acquire_user_advisory_lock(
+            wa_id,
+            max(0.001, deadline - time_module.monotonic()),
+        )
+    except Exception:
+        _release_local_user_lock(wa_id, lock)
+        logger.warning(
+            "USER_LOCK_TIMEOUT | user=%s | request_id=%s",
+            masked_identifier(wa_id),
+            getattr(g, "request_id", "unknown"),
+            exc_info=True,
+        )
+        return None
+    return UserProcessingLease(lock, connection)
+
+def _release_user_processing_lock(
+    wa_id: str,
+    lease: UserProcessingLease | None,
+) -> None:
+    if lease is None:
+        return
+
+    try:
+        if lease.connection is not None:
+            _release_user_advisory_lock(wa_id, lease.connection)
+    finally:
+        _release_local_user_lock(wa_id, lease.lock)
 
 def claim_inbound_message(db, message_id: str | None) -> str:
     """Return CLAIMED, DONE, or BUSY for a durable inbound message ID."""
@@ -907,45 +1296,35 @@ def claim_inbound_message(db, message_id: str | None) -> str:
             return "DONE"
         return "BUSY"
 
+def finish_inbound_message(db, message_id: str | None) -> bool:
+    """Mark a claim DONE in the caller's transaction, with its business work."""
 
-def finish_inbound_message(message_id: str | None) -> bool:
     if not message_id:
         return True
-
-    db = get_db()
-    try:
-        event = (
-            db.query(InboundMessageEvent)
-            .filter(InboundMessageEvent.message_id == message_id)
-            .first()
-        )
-        if not event:
-            return False
-        now = utc_now()
-        event.status = "DONE"
-        event.last_error = None
-        event.lease_expires_at = None
-        event.processed_at = now
-        event.expires_at = now + timedelta(days=PROCESSED_MESSAGE_TTL_DAYS)
-        db.commit()
-        return True
-    except Exception:
-        db.rollback()
-        logger.exception(
-            "Unable to complete inbound message claim | request_id=%s",
-            getattr(g, "request_id", "unknown"),
-        )
-        return False
-    finally:
-        db.close()
-
-
-def fail_inbound_message(
-    message_id: str | None,
-    reason: str,
-) -> None:
-    if not message_id:
-        return
+
+    event = (
+        db.query(InboundMessageEvent)
+        .filter(InboundMessageEvent.message_id == message_id)
+        .first()
+    )
+    if not event:
+        return False
+    now = utc_now()
+    event.status = "DONE"
+    event.last_error = None
+    event.lease_expires_at = None
+    event.payload = None
+    event.processed_at = now
+    event.expires_at = now + timedelta(days=PROCESSED_MESSAGE_TTL_DAYS)
+    db.flush()
+    return True
+
+def fail_inbound_message(
+    message_id: str | None,
+    reason: str,
+) -> None:
+    if not message_id:
+        return
 
     db = get_db()
     try:
@@ -958,6 +1337,19 @@ def fail_inbound_message(
             event.status = "FAILED"
             event.last_error = reason[:500]
             event.lease_expires_at = None
+            if (
+                event.payload is not None
+                and (event.attempts or 0) >= INBOUND_MAX_ATTEMPTS
+            ):
+                # A queued message that keeps failing must not block the
+                # sender's later messages forever. Drop its text and leave
+                # the FAILED row as operator evidence.
+                event.payload = None
+                logger.error(
+                    "INBOUND_MESSAGE_ABANDONED | request_id=%s | attempts=%s",
+                    getattr(g, "request_id", "unknown"),
+                    event.attempts,
+                )
             event.expires_at = utc_now() + timedelta(
                 days=PROCESSED_MESSAGE_TTL_DAYS
             )
@@ -971,11 +1363,11 @@ def fail_inbound_message(
     finally:
         db.close()
 
-
 def complete_inbound_after_delivery_failure(
     db,
     message_id: str | None,
     failure: WhatsAppDeliveryError,
+    wa_id: str,
 ) -> tuple[bool, int | None]:
     """Finish business processing and durably defer only a safe failed send."""
 
@@ -1002,12 +1394,14 @@ def complete_inbound_after_delivery_failure(
                 CONVERSATION_DELIVERY_KIND,
                 delivery_payload,
                 dedupe_key=f"inbound-delivery:{message_digest}",
+                ordering_key=recipient_ordering_key(wa_id),
             )
             job_id = job.id
 
         now = utc_now()
         event.status = "DONE"
         event.lease_expires_at = None
+        event.payload = None
         event.processed_at = now
         event.expires_at = now + timedelta(days=PROCESSED_MESSAGE_TTL_DAYS)
         if failure.retryable:
@@ -1019,7 +1413,7 @@ def complete_inbound_after_delivery_failure(
         event.last_error = f"{outcome}:{failure.error}"[:500]
         # This single transaction preserves any state mutation made immediately
         # before the failed send, the terminal inbox claim, and its retry job.
-        db.commit()
+        commit_now(db)
         return True, job_id
     except Exception:
         db.rollback()
@@ -1029,6 +1423,118 @@ def complete_inbound_after_delivery_failure(
         )
         return False, None
 
+def record_inbound_messages(
+    db,
+    envelopes: list[tuple[dict, dict, str]],
+) -> list[str]:
+    """Durably queue new messages and return their senders in batch order."""
+
+    candidate_ids = [message["id"] for _, message, _ in envelopes]
+    known_ids = {
+        row[0]
+        for row in (
+            db.query(InboundMessageEvent.message_id)
+            .filter(InboundMessageEvent.message_id.in_(candidate_ids))
+            .all()
+        )
+    }
+    expires_at = utc_now() + timedelta(days=PROCESSED_MESSAGE_TTL_DAYS)
+    senders: list[str] = []
+    for _, message, wa_id in envelopes:
+        if message["id"] in known_ids:
+            continue
+        known_ids.add(message["id"])
+        db.add(
+            InboundMessageEvent(
+                message_id=message["id"],
+                status="RECEIVED",
+                attempts=0,
+                wa_id=wa_id,
+                payload=json.dumps(message, separators=(",", ":")),
+                expires_at=expires_at,
+            )
+        )
+        if wa_id not in senders:
+            senders.append(wa_id)
+    db.commit()
+    return senders
+
+def _next_queued_inbound_event(db, wa_id: str) -> InboundMessageEvent | None:
+    return (
+        db.query(InboundMessageEvent)
+        .filter(
+            InboundMessageEvent.wa_id == wa_id,
+            InboundMessageEvent.status != "DONE",
+            InboundMessageEvent.payload.is_not(None),
+        )
+        .order_by(InboundMessageEvent.id.asc())
+        .first()
+    )
+
+def drain_inbound_messages(wa_id: str, limit: int = 50) -> int:
+    """Handle one sender's queued messages oldest first; return the count."""
+
+    return _drain_inbound(wa_id, limit)[0]
+
+def _drain_inbound(wa_id: str, limit: int = 50) -> tuple[int, bool]:
+    """Return the messages handled and whether a failed or busy head remains."""
+
+    processed = 0
+    blocked = False
+    with app.app_context():
+        g.request_id = uuid.uuid4().hex
+        db = get_db()
+        try:
+            while processed < limit:
+                event = _next_queued_inbound_event(db, wa_id)
+                if event is None:
+                    break
+                try:
+                    message = json.loads(event.payload)
+                except ValueError:
+                    event.status = "FAILED"
+                    event.last_error = "InvalidQueuedPayload"
+                    event.payload = None
+                    db.commit()
+                    continue
+                # A later message must wait while an earlier one is leased by
+                # another worker or is waiting for its retry.
+                response = _handle_inbound_envelope(db, message, wa_id)
+                if response.status_code >= 500:
+                    blocked = True
+                    break
+                processed += 1
+        finally:
+            db.close()
+    return processed, blocked
+
+def drain_pending_inbound_messages(max_senders: int = 100) -> tuple[int, int]:
+    """Recover queued messages left by a restart; return senders and messages."""
+
+    db = get_db()
+    try:
+        senders = [
+            row[0]
+            for row in (
+                db.query(InboundMessageEvent.wa_id)
+                .filter(
+                    InboundMessageEvent.wa_id.is_not(None),
+                    InboundMessageEvent.status != "DONE",
+                    InboundMessageEvent.payload.is_not(None),
+                )
+                .group_by(InboundMessageEvent.wa_id)
+                .order_by(func.min(InboundMessageEvent.id))
+                .limit(max_senders)
+                .all()
+            )
+        ]
+    finally:
+        db.close()
+
+    processed = 0
+    for wa_id in senders:
+        processed += drain_inbound_messages(wa_id)
+    return len(senders), processed
 
 # =================================================
 # Name
@@ -1076,7 +1582,6 @@ def normalize_name(raw: str):
 
     return name
 
-
 def is_booking_intent(text: str) -> bool:
     """Match an explicit booking command without hijacking normal AI questions."""
 
@@ -1085,6 +1590,14 @@ def is_booking_intent(text: str) -> bool:
     return normalized in BOOKING_KEYWORDS
 
 
+def message_keywords(lower_text: str) -> frozenset[str]:
+    """Return every global keyword intent matched by a normalised message."""
+
+    intents = _KEYWORD_INTENTS.get(lower_text, frozenset())
+    if is_booking_intent(lower_text):
+        intents = intents | {"booking"}
+    return intents
+
 def parse_advocate_intake(text: str) -> dict[str, str] | None:
     """Validate and parse the structured intake created by the public site."""
 
@@ -1132,14 +1645,12 @@ def parse_advocate_intake(text: str) -> dict[str, str] | None:
         "message": normalized,
     }
 
-
 def masked_identifier(value: str) -> str:
     value = str(value or "")
     if len(value) <= 6:
         return "***"
     return f"{value[:3]}***{value[-2:]}"
 
-
 def _valid_whatsapp_message_id(value) -> bool:
     return bool(
         isinstance(value, str)
@@ -1149,11 +1660,9 @@ def _valid_whatsapp_message_id(value) -> bool:
         and all(ord(character) >= 32 for character in value)
     )
 
-
 def _valid_whatsapp_sender(value: str) -> bool:
     return bool(re.fullmatch(r"\+?[0-9]{6,32}", str(value or "")))
 
-
 def extract_whatsapp_messages(payload: dict) -> list[tuple[dict, dict, str]]:
     """Flatten Meta's batched entry/change/message envelope safely."""
 
@@ -1175,39 +1684,73 @@ def extract_whatsapp_messages(payload: dict) -> list[tuple[dict, dict, str]]:
                     envelopes.append((value, message, wa_id))
     return envelopes
 
-
 def clear_booking_draft(user) -> None:
     user.temp_date = None
     user.temp_slot = None
     user.last_payment_link = None
 
+def _home_menu(user) -> dict:
+    return {"body": t(user, "home_menu"), "buttons": home_buttons(user)}
+
+def _document_home_menu(user) -> dict:
+    return {
+        "header": t(user, "home_service_header"),
+        "body": t(user, "home_menu"),
+        "section_title": t(user, "home_service_section"),
+        "rows": document_home_rows(user, t),
+    }
+
+def _more_options_menu(user) -> dict:
+    return {
+        "header": t(user, "more_menu_header"),
+        "body": t(user, "more_menu_body"),
+        "section_title": t(user, "more_menu_section"),
+        "rows": more_menu_rows(user),
+    }
+
+def _category_menu(user) -> dict:
+    return {
+        "header": t(user, "select_category"),
+        "body": t(user, "choose_category"),
+        "section_title": t(user, "select_category"),
+        "rows": [
+            {
+                "id": f"cat_{category.lower().replace(' ', '_').replace('&', 'and')}",
+                "title": get_category_label(category, user),
+            }
+            for category in CATEGORY_SUBCATEGORIES.keys()
+        ],
+    }
+
+def _legal_guides_menu(user) -> dict:
+    return {
+        "header": legal_ui(user, "guide_categories"),
+        "body": legal_ui(user, "guide_categories_body"),
+        "section_title": legal_ui(user, "guide_categories"),
+        "rows": legal_guide_rows(user),
+    }
+
+# Menus that vary only by language are compiled and validated once per
+# (menu, language, LEGAL_CONTENT_VERSION) instead of on every send.
+interactive_menus = MenuCache(
+    {
+        "home": ("buttons", _home_menu),
+        "document_home": ("list", _document_home_menu),
+        "more_options": ("list", _more_options_menu),
+        "categories": ("list", _category_menu),
+        "legal_guides": ("list", _legal_guides_menu),
+    },
+    version=LEGAL_CONTENT_VERSION,
+)
 
 def send_home(wa_id, user) -> None:
     if document_studio_available(user):
-        send_list_picker(
-            wa_id,
-            header=t(user, "home_service_header"),
-            body=t(user, "home_menu"),
-            section_title=t(user, "home_service_section"),
-            rows=document_home_rows(user, t),
-        )
+        send_compiled_menu(wa_id, user, "document_home")
         return
-    send_buttons(
-        wa_id,
-        t(user, "home_menu"),
-        home_buttons(user),
-    )
-
+    send_compiled_menu(wa_id, user, "home")
 
 def send_more_options(wa_id, user) -> None:
-    send_list_picker(
-        wa_id,
-        header=t(user, "more_menu_header"),
-        body=t(user, "more_menu_body"),
-        section_title=t(user, "more_menu_section"),
-        rows=more_menu_rows(user),
-    )
-
+    send_compiled_menu(wa_id, user, "more_options")
 
 def send_document_studio_home(wa_id, user) -> None:
     send_list_picker(
@@ -1218,7 +1761,6 @@ def send_document_studio_home(wa_id, user) -> None:
         rows=document_landing_rows(user, t),
     )
 
-
 def send_document_question(wa_id, user, order) -> None:
     question = current_document_question(order)
     send_buttons(
@@ -1232,7 +1774,6 @@ def send_document_question(wa_id, user, order) -> None:
         ],
     )
 
-
 def send_document_review(wa_id, user, order) -> None:
     send_buttons(
         wa_id,
@@ -1253,7 +1794,6 @@ def send_document_review(wa_id, user, order) -> None:
         ],
     )
 
-
 def send_language_picker(wa_id, user) -> None:
     send_buttons(
         wa_id,
@@ -1265,7 +1805,6 @@ def send_language_picker(wa_id, user) -> None:
         ],
     )
 
-
 def begin_ai_consent(db, user, wa_id) -> None:
     user.ai_enabled = False
     user.flow_state = ASK_AI_CONSENT
@@ -1284,7 +1823,6 @@ def begin_ai_consent(db, user, wa_id) -> None:
         ],
     )
 
-
 def record_user_consent(
     db,
     user,
@@ -1315,7 +1853,6 @@ def record_user_consent(
     db.flush()
     return consent
 
-
 _CASE_BRIEF_DOCUMENTS = {
     "1": "Notice or legal letter",
     "2": "Agreement or contract",
@@ -1325,7 +1862,6 @@ _CASE_BRIEF_DOCUMENTS = {
     "6": "Other relevant document",
 }
 
-
 def _latest_unattached_case_brief(db, user) -> CaseBrief | None:
     return (
         db.query(CaseBrief)
@@ -1338,7 +1874,6 @@ def _latest_unattached_case_brief(db, user) -> CaseBrief | None:
         .first()
     )
 
-
 def _cancel_unattached_case_briefs(db, user) -> None:
     briefs = (
         db.query(CaseBrief)
@@ -1352,7 +1887,6 @@ def _cancel_unattached_case_briefs(db, user) -> None:
     for brief in briefs:
         brief.status = "CANCELLED"
 
-
 def begin_case_brief(db, user, wa_id) -> CaseBrief:
     _cancel_unattached_case_briefs(db, user)
     brief = CaseBrief(
@@ -1367,7 +1901,6 @@ def begin_case_brief(db, user, wa_id) -> CaseBrief:
     send_text(wa_id, t(user, "brief_summary_prompt"))
     return brief
 
-
 def send_case_brief_stage(db, user, wa_id, brief) -> None:
     user.flow_state = ASK_BRIEF_STAGE
     db.commit()
@@ -1407,7 +1940,6 @@ def send_case_brief_stage(db, user, wa_id, brief) -> None:
         ],
     )
 
-
 def send_case_brief_urgency(db, user, wa_id) -> None:
     user.flow_state = ASK_BRIEF_URGENCY
     db.commit()
@@ -1430,7 +1962,6 @@ def send_case_brief_urgency(db, user, wa_id) -> None:
         ],
     )
 
-
 def _case_brief_documents(brief) -> list[str]:
     try:
         values = json.loads(brief.documents_json or "[]")
@@ -1438,7 +1969,6 @@ def _case_brief_documents(brief) -> list[str]:
         values = []
     return [str(value) for value in values] if isinstance(values, list) else []
 
-
 def send_case_brief_review(db, user, wa_id, brief) -> None:
     user.flow_state = REVIEW_CASE_BRIEF
     db.commit()
@@ -1482,7 +2012,6 @@ def send_case_brief_review(db, user, wa_id, brief) -> None:
         ],
     )
 
-
 def _parse_case_brief_documents(value: str) -> list[str] | None:
     normalized = re.sub(r"\s+", "", str(value or ""))
     if normalized == "0":
@@ -1492,7 +2021,6 @@ def _parse_case_brief_documents(value: str) -> list[str] | None:
     choices = list(dict.fromkeys(normalized.split(",")))
     return [_CASE_BRIEF_DOCUMENTS[choice] for choice in choices]
 
-
 def _attach_confirmed_case_brief(db, user, booking) -> None:
     brief = (
         db.query(CaseBrief)
@@ -1509,7 +2037,6 @@ def _attach_confirmed_case_brief(db, user, booking) -> None:
         brief.updated_at = utc_now()
         db.flush()
 
-
 def begin_booking_scope_review(db, user, wa_id) -> None:
     user.ai_enabled = False
     _cancel_unattached_case_briefs(db, user)
@@ -1531,7 +2058,6 @@ def begin_booking_scope_review(db, user, wa_id) -> None:
         ],
     )
 
-
 def send_booking_review(db, user, wa_id) -> None:
     user.flow_state = REVIEW_BOOKING
     db.commit()
@@ -1563,7 +2089,6 @@ def send_booking_review(db, user, wa_id) -> None:
         ],
     )
 
-
 def send_pending_payment_options(user, wa_id, booking=None) -> None:
     """Keep a pending payer oriented without discarding their payment link."""
 
@@ -1608,7 +2133,6 @@ def send_pending_payment_options(user, wa_id, booking=None) -> None:
             f"💳 {t(user, 'payment_link_text')}\n{payment_link}",
         )
 
-
 def send_available_dates(db, user, wa_id) -> bool:
     rows = generate_dates_calendar(skip_today=False, db=db)
     if not rows:
@@ -1623,7 +2147,6 @@ def send_available_dates(db, user, wa_id) -> bool:
     )
     return True
 
-
 def send_available_slots(db, user, wa_id, date_str: str) -> bool:
     rows = generate_slots_calendar(date_str, db=db)
     if not rows:
@@ -1641,7 +2164,6 @@ def send_available_slots(db, user, wa_id, date_str: str) -> bool:
     )
     return True
 
-
 def feedback_rows(user) -> list[dict[str, str]]:
     labels = {
         5: "5 ⭐ Excellent",
@@ -1664,21 +2186,7 @@ def feedback_rows(user) -> list[dict[str, str]]:
 # =================================================
 
 def send_category_list(wa_id, user):
-    rows = [
-        {
-            "id": f"cat_{category.lower().replace(' ', '_').replace('&', 'and')}",
-            "title": get_category_label(category, user),
-        }
-        for category in CATEGORY_SUBCATEGORIES.keys()
-    ]
-
-    send_list_picker(
-        wa_id,
-        header=t(user, "select_category"),
-        body=t(user, "choose_category"),
-        section_title=t(user, "select_category"),
-        rows=rows,
-    )
+    send_compiled_menu(wa_id, user, "categories")
 
 def send_subcategory_list(db, wa_id, user, category):
     """
@@ -1804,8 +2312,19 @@ def send_payment_receipt_again(db, wa_id):
         send_text(wa_id, "❌ No completed payment found.")
         return
 
+    # Rendering and uploading the PDF wait until this message commits, so
+    # neither holds its transaction open.
+    _after_replies(
+        db,
+        partial(_resend_payment_receipt, booking.id, wa_id),
+        {"operation": "receipt", "to": wa_id, "booking_id": booking.id},
+    )
+
+def _resend_payment_receipt(booking_id: int, wa_id: str) -> None:
+    db = get_db()
     pdf_path = None
     try:
+        booking = db.get(Booking, booking_id)
         pdf_path = generate_pdf_receipt(booking)
         send_payment_receipt_pdf(
             booking.whatsapp_id,
@@ -1818,7 +2337,7 @@ def send_payment_receipt_again(db, wa_id):
 
     except Exception:
         db.rollback()
-        logger.exception("Receipt resend failed | booking_id=%s", booking.id)
+        logger.exception("Receipt resend failed | booking_id=%s", booking_id)
         send_text(
             wa_id,
             "⚠️ Unable to resend receipt right now. Please try later."
@@ -1830,8 +2349,9 @@ def send_payment_receipt_again(db, wa_id):
             except OSError:
                 logger.warning(
                     "Temporary receipt cleanup failed | booking_id=%s",
-                    booking.id,
+                    booking_id,
                 )
+        db.close()
 
 def send_verification_screen(db, user, wa_id):
     save_state(db, user, FLOW_VERIFY_DETAILS)
@@ -1894,7 +2414,6 @@ def get_booking_window(booking):
     
     return booking_start, booking_end
 
-
 def close_completed_consultation(db, user, wa_id) -> bool:
     """Request feedback only after an operator records actual fulfilment."""
 
@@ -1983,14 +2502,12 @@ def safe_header(text: str) -> str:
         .replace("~", "")
     )
 
-
 _EMAIL_PATTERN = re.compile(
     r"^[A-Za-z0-9.!#$%&'*+/=?^_`{|}~-]{1,64}@"
     r"(?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+"
     r"[A-Za-z]{2,63}$"
 )
 
-
 def _valid_email(value: str) -> bool:
     normalized = str(value or "").strip()
     local_part = normalized.partition("@")[0]
@@ -2004,7 +2521,6 @@ def _valid_email(value: str) -> bool:
         and ".." not in local_part
     )
 
-
 def _valid_ses_region(value: str) -> bool:
     """Accept standard AWS-style region identifiers without hard-coding one."""
 
@@ -2015,14 +2531,12 @@ def _valid_ses_region(value: str) -> bool:
         )
     )
 
-
 def _valid_ses_configuration_set(value: str) -> bool:
     normalized = str(value or "").strip()
     return not normalized or bool(
         re.fullmatch(r"[A-Za-z0-9_-]{1,64}", normalized)
     )
 
-
 def _valid_https_url(value: str) -> bool:
     try:
         parsed = urlsplit(str(value or "").strip())
@@ -2035,7 +2549,6 @@ def _valid_https_url(value: str) -> bool:
         and parsed.password is None
     )
 
-
 def _valid_legal_review_date(value: str) -> bool:
     normalized = str(value or "").strip()
     if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", normalized):
@@ -2046,7 +2559,6 @@ def _valid_legal_review_date(value: str) -> bool:
         return False
     return reviewed_on <= datetime.now(IST).date()
 
-
 def _deployment_configuration_is_valid(
     *,
     payment_mode: str,
@@ -2161,7 +2673,6 @@ def _deployment_configuration_is_valid(
         and legal_review_ok
     )
 
-
 def _production_configuration_is_valid() -> bool:
     # The current Document Studio implementation is a synthetic-data UAT
     # harness.  It must never be exposed by a production-labelled service.
@@ -2171,7 +2682,6 @@ def _production_configuration_is_valid() -> bool:
         require_legal_review=True,
     )
 
-
 def _staging_configuration_is_valid() -> bool:
     document_studio_ok = bool(
         not DOCUMENT_STUDIO_ENABLED
@@ -2193,7 +2703,6 @@ def _staging_configuration_is_valid() -> bool:
         require_legal_review=False,
     )
 
-
 # ===============================
 # ROUTES
 # ===============================
@@ -2207,12 +2716,10 @@ def service_info():
         }
     )
 
-
 @app.get("/health/live")
 def health_live():
     return jsonify({"ok": True, "service": "nyaysetu-bot"}), 200
 
-
 @app.get("/health/ready")
 def health_ready():
     database = get_db_health()
@@ -2261,7 +2768,6 @@ def health_ready():
         200 if ready else 503,
     )
 
-
 @app.route("/webhook", methods=["GET"])
 def verify():
     supplied_token = request.args.get("hub.verify_token", "")
@@ -2281,7 +2787,11 @@ def webhook():
     signature_required = not (
         ALLOW_INSECURE_WEBHOOKS and ENV in {"development", "test"}
     )
-    if signature_required and not verify_whatsapp_signature():
+    with request_timing.timed_phase("signature"):
+        signature_valid = (
+            not signature_required or verify_whatsapp_signature()
+        )
+    if not signature_valid:
         logger.warning("Invalid WhatsApp signature | request_id=%s", g.request_id)
         return "Forbidden", 403
 
@@ -2302,15 +2812,36 @@ def webhook():
         # sender before it can create inbox/user rows or trigger a reply.
         return jsonify({"error": "invalid_message_envelope"}), 400
 
+    if WHATSAPP_ASYNC_INGESTION:
+        db = get_db()
+        try:
+            senders = record_inbound_messages(db, envelopes)
+        except IntegrityError:
+            # A concurrent delivery of the same batch won the insert. Meta's
+            # retry finds every row already recorded.
+            db.rollback()
+            return jsonify({"status": "retry"}), 503
+        except Exception:
+            db.rollback()
+            logger.exception(
+                "Inbound message could not be queued | request_id=%s",
+                g.request_id,
+            )
+            return jsonify({"status": "retry"}), 503
+        finally:
+            db.close()
+        for sender in senders:
+            submit_inbound_drain(sender)
+        return (
+            jsonify({"status": "queued" if senders else "duplicate_ignored"}),
+            200,
+        )
+
     db = get_db()
-    wa_id = "UNKNOWN"
-    message_id = None
-    processing_lock = None
     try:
-        # Expiration uses the same caller-owned session and is bounded to one
-        # indexed UPDATE.
-        expire_old_pending_bookings(db)
-
+        # Stale PENDING bookings are not expired here. Capacity already ignores
+        # them, maintenance expires them in bulk, and the branches that show a
+        # booking expire it lazily.
         candidate_ids = [
             message["id"]
             for _, message, _ in envelopes
@@ -2337,11 +2868,56 @@ def webhook():
         if not pending_envelopes:
             return jsonify({"status": "duplicate_ignored"}), 200
 
-        value, message, wa_id = pending_envelopes[0]
-        message_id = message.get("id")
-        g.whatsapp_batch_has_more = len(pending_envelopes) > 1
+        # Meta delivers a batch in conversation order and retries it as a
+        # whole. Every message is claimed and finished individually, so a
+        # retry after a mid-batch failure resumes at the first unfinished one.
+        responses = []
+        for _, message, wa_id in pending_envelopes:
+            response = _handle_inbound_envelope(db, message, wa_id)
+            if response.status_code >= 500:
+                return response
+            responses.append(response)
+
+        if len(responses) == 1:
+            return responses[0]
+        return (
+            jsonify(
+                {
+                    "status": "batch_processed",
+                    "results": [
+                        (item.get_json(silent=True) or {}).get("status")
+                        for item in responses
+                    ],
+                }
+            ),
+            200,
+        )
+    finally:
+        db.close()
+
+def _handle_inbound_envelope(db, message: dict, wa_id: str):
+    """Run one message and record its terminal inbox state."""
+
+    g.inbound_message_claimed = False
+    response = app.make_response(_process_inbound_message(db, message, wa_id))
+    g.inbound_message_claimed = False
+    return response
+
+def _process_inbound_message(db, message: dict, wa_id: str):
+    """Claim, serialize, and handle one inbound WhatsApp message.
+
+    The claim commits on its own because it is the retry lease. Everything
+    after it is one unit of work: conversation state, side records, and the
+    DONE inbox state commit together, before the per-user lock is released.
+    Replies are sent only after that commit, in order, or queued as one
+    outbox job when async delivery is enabled.
+    """
 
-        claim_result = claim_inbound_message(db, message_id)
+    message_id = message.get("id")
+    processing_lock = None
+    try:
+        with request_timing.timed_phase("claim"):
+            claim_result = claim_inbound_message(db, message_id)
         if claim_result == "DONE":
             return jsonify({"status": "duplicate_ignored"}), 200
         if claim_result == "BUSY":
@@ -2349,649 +2925,263 @@ def webhook():
         g.inbound_message_id = message_id
         g.inbound_message_claimed = bool(message_id)
 
-        processing_lock = _acquire_user_processing_lock(wa_id)
+        with request_timing.timed_phase("lock_wait"):
+            processing_lock = _acquire_user_processing_lock(wa_id)
         if processing_lock is None:
             fail_inbound_message(message_id, "UserProcessingLockTimeout")
             return jsonify({"status": "user_processing_busy"}), 503
 
-        # =================================================
-        # GLOBAL MAINTENANCE MODE (SAFE & EARLY EXIT)
-        # =================================================
-        if MAINTENANCE_MODE and message.get("type") in ("text", "interactive"):
-            if MAINTENANCE_ADMIN_BYPASS and wa_id == MAINTENANCE_ADMIN_BYPASS:
-                logger.info(
-                    "Maintenance bypass used | user=%s",
-                    masked_identifier(wa_id),
-                )
+        with unit_of_work(db):
+            if WHATSAPP_ASYNC_DELIVERY:
+                g.outbound_replies = []
             else:
-                now_ts = time_module.time()
-                if not should_send_maintenance_notice(wa_id, now_ts):
-                    return jsonify({"status": "maintenance_duplicate"}), 200
-
-                send_text(
-                    wa_id,
-                    (
-                        "⚙️ *NyaySetu is temporarily under maintenance.*\n\n"
-                        "We are upgrading the service. Please try again later. "
-                        "If anyone is in immediate danger, contact the appropriate "
-                        "local emergency service."
-                    ),
-                )
-                return jsonify({"status": "maintenance"}), 200
-
-        user = get_or_create_user(db, wa_id)
-
-        # Apply abuse controls before any menu, support, paid-session, or media
-        # branch can trigger database or external-message work. Check the
-        # per-user budget first so one sender cannot consume the global budget
-        # with traffic that should already have been rejected locally.
-        if is_user_rate_limited(wa_id):
-            if should_send_rate_limit_notice(
-                "user",
-                wa_id,
-                USER_MSG_WINDOW,
-            ):
-                send_text(wa_id, t(user, "rate_limit_exceeded"))
-            return jsonify({"status": "rate_limited"}), 200
-        if is_global_rate_limited():
-            if should_send_rate_limit_notice(
-                "global",
-                wa_id,
-                GLOBAL_REQ_WINDOW,
-            ):
-                send_text(wa_id, t(user, "service_busy"))
-            return jsonify({"status": "rate_limited"}), 200
-
-        text_body = ""
-        interactive_id = None
-
-        if message.get("type") == "text":
-            text_body = str((message.get("text") or {}).get("body") or "")
-        elif message.get("type") == "interactive":
-            interactive = message.get("interactive") or {}
-            itype = interactive.get("type")
-            selected = interactive.get(itype) if itype else None
-            interactive_id = (
-                str(selected.get("id"))
-                if isinstance(selected, dict) and selected.get("id")
-                else None
+                g.deferred_sends = []
+            g.coalesce_replies = WHATSAPP_COALESCE_REPLIES
+            response = app.make_response(
+                _handle_claimed_message(db, message, wa_id)
             )
-            text_body = interactive_id
-        else:
-            send_text(wa_id, t(user, "unsupported_message_type"))
-            return jsonify({"status": "unsupported_message_type"}), 200
-
-        text_body = text_body or ""
-        lower_text = text_body.lower().strip()
-
-        advocate_intake = (
-            parse_advocate_intake(text_body)
-            if interactive_id is None
-            else None
-        )
-        advocate_intake_candidate = (
-            interactive_id is None
-            and unicodedata.normalize("NFKC", text_body)
-            .replace("\r\n", "\n")
-            .replace("\r", "\n")
-            .strip()
-            .casefold()
-            .startswith(ADVOCATE_INTAKE_PREFIX.casefold())
+            flush_replies()
+            g.coalesce_replies = False
+            _enqueue_outbound_replies(db, message_id, wa_id)
+            if (
+                response.status_code < 500
+                and g.inbound_message_claimed
+                and not finish_inbound_message(db, message_id)
+            ):
+                # Do not acknowledge an event whose terminal state could not
+                # be recorded. Its lease makes a later retry recoverable.
+                response.status_code = 503
+        g.inbound_message_claimed = False
+        _send_committed_replies(g.pop("deferred_sends", None) or [])
+        return response
+    except WhatsAppDeliveryError as exc:
+        completed, job_id = complete_inbound_after_delivery_failure(
+            db,
+            message_id,
+            exc,
+            wa_id,
         )
-        if advocate_intake:
-            duplicate_cutoff = utc_now() - timedelta(minutes=10)
-            support_request = (
-                db.query(SupportRequest)
-                .filter(
-                    SupportRequest.user_id == user.id,
-                    SupportRequest.request_type == "ADVOCATE_INTAKE",
-                    SupportRequest.message == advocate_intake["message"],
-                    SupportRequest.created_at >= duplicate_cutoff,
-                )
-                .order_by(SupportRequest.id.desc())
-                .first()
-            )
-            job = None
-            created = support_request is None
-            if created:
-                support_request = SupportRequest(
-                    user_id=user.id,
-                    case_id=user.case_id,
-                    request_type="ADVOCATE_INTAKE",
-                    subject=(
-                        f"Advocate intake: {advocate_intake['category']}"
-                    )[:160],
-                    message=advocate_intake["message"],
-                    sla_due_at=(
-                        utc_now() + timedelta(hours=SUPPORT_SLA_HOURS)
-                    ),
-                )
-                db.add(support_request)
-                db.flush()
-                if SUPPORT_NOTIFICATION_EMAILS:
-                    job = enqueue_job(
-                        db,
-                        "support_notification",
-                        {"support_request_id": support_request.id},
-                        dedupe_key=(
-                            f"support:{support_request.id}:notification"
-                        ),
-                    )
-
-            user.language = advocate_intake["language"]
-            user.welcome_sent = True
-            preserve_payment_flow = user.flow_state in {
-                WAITING_PAYMENT,
-                PAYMENT_CONFIRMED,
-            }
-            if not preserve_payment_flow:
-                user.flow_state = NORMAL
-            db.commit()
-
-            ticket_id = f"NSH-{support_request.id:06d}"
-            send_text(
-                wa_id,
-                t(user, "advocate_intake_saved", ticket_id=ticket_id),
+        if completed:
+            # after_request must not overwrite the delivery outcome or perform
+            # a second terminal-state transaction.
+            g.inbound_message_claimed = False
+            if job_id is not None:
+                submit_outbox_job(job_id)
+            logger.warning(
+                "Inbound business state preserved after outbound failure | "
+                "request_id=%s | retry_queued=%s | ambiguous=%s",
+                g.request_id,
+                job_id is not None,
+                exc.ambiguous,
             )
-            if created:
-                record_event(
-                    "advocate_intake_created",
+            return (
+                jsonify(
                     {
-                        "category": advocate_intake["category"],
-                        "timing": advocate_intake["timing"],
-                    },
-                    user_id=user.id,
-                )
-            if job:
-                submit_outbox_job(job.id)
-            if not preserve_payment_flow:
-                send_home(wa_id, user)
-            return jsonify(
-                {
-                    "status": (
-                        "advocate_intake_recorded"
-                        if created
-                        else "advocate_intake_already_recorded"
-                    )
-                }
-            ), 200
-
-        if advocate_intake_candidate:
-            # Do not silently reinterpret a malformed website hand-off as a
-            # normal legal question. No support record is created here.
-            send_text(wa_id, t(user, "advocate_intake_invalid"))
-            send_home(wa_id, user)
-            return jsonify({"status": "advocate_intake_invalid"}), 200
-
-        if close_completed_consultation(db, user, wa_id):
-            return jsonify({"status": "ok"}), 200
+                        "status": (
+                            "delivery_queued"
+                            if job_id is not None
+                            else "delivery_not_retried"
+                        )
+                    }
+                ),
+                200,
+            )
 
-        # =================================================
-        # PERSISTENT HOME & SELF-SERVICE NAVIGATION
-        # =================================================
-        if user.welcome_sent and lower_text in HOME_KEYWORDS:
-            if user.flow_state in {
-                DOCUMENT_STUDIO_QUESTION,
-                DOCUMENT_STUDIO_REVIEW,
-            }:
-                # Keep the draft resumable but leave its active conversation
-                # state when the user explicitly returns home.
-                user.flow_state = NORMAL
-                db.commit()
-            send_home(wa_id, user)
-            return jsonify({"status": "ok"}), 200
-
-        if (
-            interactive_id == HOME_BUTTON_IDS["documents"]
-            or lower_text in DOCUMENT_STUDIO_KEYWORDS
-        ):
-            if not document_studio_available(user):
-                send_text(wa_id, t(user, "document_studio_unavailable"))
-                send_home(wa_id, user)
-                return jsonify({"status": "document_studio_unavailable"}), 200
-            user.flow_state = NORMAL
-            db.commit()
-            send_document_studio_home(wa_id, user)
-            record_event("document_studio_uat_opened", user_id=user.id)
-            return jsonify({"status": "ok"}), 200
-
-        if interactive_id == DOCUMENT_STUDIO_IDS["back"]:
-            user.flow_state = NORMAL
-            db.commit()
-            send_home(wa_id, user)
-            return jsonify({"status": "ok"}), 200
-
-        if interactive_id == DOCUMENT_STUDIO_IDS["create"]:
-            if not document_studio_available(user):
-                send_text(wa_id, t(user, "document_studio_unavailable"))
-                return jsonify({"status": "document_studio_unavailable"}), 200
-            send_list_picker(
-                wa_id,
-                header=t(user, "document_product_header"),
-                body=t(user, "document_product_body"),
-                section_title=t(user, "document_product_section"),
-                rows=document_product_rows(user, t),
-            )
-            return jsonify({"status": "ok"}), 200
-
-        selected_document_product = parse_product_id(interactive_id)
-        if selected_document_product:
-            if not document_studio_available(user):
-                send_text(wa_id, t(user, "document_studio_unavailable"))
-                return jsonify({"status": "document_studio_unavailable"}), 200
-            send_buttons(
-                wa_id,
-                t(user, "document_uat_overview"),
-                [
-                    {
-                        "id": (
-                            f"{DOCUMENT_START_ID_PREFIX}"
-                            f"{selected_document_product}"
-                        ),
-                        "title": t(user, "document_start_uat")[:20],
-                    },
-                    {
-                        "id": DOCUMENT_STUDIO_IDS["back"],
-                        "title": t(user, "document_back_home")[:20],
-                    },
-                ],
-            )
-            return jsonify({"status": "ok"}), 200
-
-        started_document_product = parse_product_id(
-            interactive_id,
-            start=True,
+        db.rollback()
+        fail_inbound_message(message_id, "OutboundDeliveryPersistenceError")
+        logger.exception(
+            "Failed outbound delivery could not be persisted | request_id=%s",
+            g.request_id,
         )
-        if started_document_product:
-            if not document_studio_available(user):
-                send_text(wa_id, t(user, "document_studio_unavailable"))
-                return jsonify({"status": "document_studio_unavailable"}), 200
-            order = create_or_resume_uat_order(db, user.id)
-            user.flow_state = (
-                DOCUMENT_STUDIO_REVIEW
-                if order.current_step == "review"
-                else DOCUMENT_STUDIO_QUESTION
-            )
-            db.commit()
-            if user.flow_state == DOCUMENT_STUDIO_REVIEW:
-                send_document_review(wa_id, user, order)
-            else:
-                send_document_question(wa_id, user, order)
-            record_event(
-                "document_studio_uat_started",
-                {"product_code": started_document_product},
-                user_id=user.id,
-            )
-            return jsonify({"status": "ok"}), 200
+        return jsonify({"status": "retry"}), 503
+    except Exception:
+        # Roll back partial work and fail the lease-aware claim. Meta can retry
+        # a transient failure instead of the event being lost forever.
+        try:
+            db.rollback()
+        except Exception:
+            pass
 
-        if interactive_id == DOCUMENT_STUDIO_IDS["continue"]:
-            if not document_studio_available(user):
-                send_text(wa_id, t(user, "document_studio_unavailable"))
-                return jsonify({"status": "document_studio_unavailable"}), 200
-            order = latest_document_draft(db, user.id)
-            if not order:
-                send_text(wa_id, t(user, "document_uat_no_draft"))
-                send_document_studio_home(wa_id, user)
-                return jsonify({"status": "ok"}), 200
-            user.flow_state = (
-                DOCUMENT_STUDIO_REVIEW
-                if order.current_step == "review"
-                else DOCUMENT_STUDIO_QUESTION
-            )
-            db.commit()
-            if user.flow_state == DOCUMENT_STUDIO_REVIEW:
-                send_document_review(wa_id, user, order)
+        fail_inbound_message(message_id, "InboundProcessingError")
+    
+        try:
+            if wa_id and wa_id != "UNKNOWN":
+                safe_wa_id = wa_id[:5] + "*****" + wa_id[-2:]
             else:
-                send_document_question(wa_id, user, order)
-            return jsonify({"status": "ok"}), 200
-
-        if interactive_id == DOCUMENT_STUDIO_IDS["mine"]:
-            if not document_studio_available(user):
-                send_text(wa_id, t(user, "document_studio_unavailable"))
-                return jsonify({"status": "document_studio_unavailable"}), 200
-            send_text(wa_id, recent_orders_message(db, user.id))
-            return jsonify({"status": "ok"}), 200
-
-        if interactive_id == DOCUMENT_STUDIO_IDS["help"]:
-            if not document_studio_available(user):
-                send_text(wa_id, t(user, "document_studio_unavailable"))
-                return jsonify({"status": "document_studio_unavailable"}), 200
-            send_text(wa_id, t(user, "document_uat_help_text"))
-            return jsonify({"status": "ok"}), 200
-
-        if user.flow_state in {
-            DOCUMENT_STUDIO_QUESTION,
-            DOCUMENT_STUDIO_REVIEW,
-        } and interactive_id in set(HOME_BUTTON_IDS.values()):
-            # Home selections always win over an unfinished UAT draft. The
-            # draft remains available through Continue Test.
-            user.flow_state = NORMAL
-            db.commit()
+                safe_wa_id = "UNKNOWN"
+        except Exception:
+            safe_wa_id = "UNKNOWN"
+    
+        logger.exception(
+            "Webhook processing failed; provider retry requested | wa_id=%s",
+            safe_wa_id,
+        )
+        return jsonify({"status": "retry"}), 503
+    finally:
+        g.pop("outbound_replies", None)
+        g.pop("deferred_sends", None)
+        g.pop("coalesce_replies", None)
+        g.pop("pending_text", None)
+        _release_user_processing_lock(wa_id, processing_lock)
 
-        if user.flow_state == DOCUMENT_STUDIO_QUESTION:
-            if not document_studio_available(user):
-                user.flow_state = NORMAL
-                db.commit()
-                send_text(wa_id, t(user, "document_studio_unavailable"))
-                send_home(wa_id, user)
-                return jsonify({"status": "document_studio_unavailable"}), 200
-            order = latest_document_draft(db, user.id)
-            if not order:
-                user.flow_state = NORMAL
-                db.commit()
-                send_text(wa_id, t(user, "document_uat_no_draft"))
-                send_home(wa_id, user)
-                return jsonify({"status": "ok"}), 200
-            if (
-                interactive_id == DOCUMENT_STUDIO_IDS["cancel"]
-                or lower_text in RESTART_KEYWORDS
-            ):
-                cancel_document_order(db, order)
-                user.flow_state = NORMAL
-                db.commit()
-                send_text(wa_id, t(user, "document_uat_cancelled"))
-                send_home(wa_id, user)
-                return jsonify({"status": "ok"}), 200
-            if interactive_id:
-                send_text(wa_id, t(user, "document_uat_answer_invalid"))
-                send_document_question(wa_id, user, order)
-                return jsonify({"status": "ok"}), 200
-            question = current_document_question(order)
-            answer = validate_document_answer(question["key"], text_body)
-            if answer is None:
-                send_text(wa_id, t(user, "document_uat_answer_invalid"))
-                send_document_question(wa_id, user, order)
-                return jsonify({"status": "ok"}), 200
-            review_ready = save_document_answer(order, answer)
-            user.flow_state = (
-                DOCUMENT_STUDIO_REVIEW
-                if review_ready
-                else DOCUMENT_STUDIO_QUESTION
-            )
-            db.commit()
-            if review_ready:
-                send_document_review(wa_id, user, order)
-            else:
-                send_document_question(wa_id, user, order)
-            return jsonify({"status": "ok"}), 200
 
-        if user.flow_state == DOCUMENT_STUDIO_REVIEW:
-            if not document_studio_available(user):
-                user.flow_state = NORMAL
-                db.commit()
-                send_text(wa_id, t(user, "document_studio_unavailable"))
-                send_home(wa_id, user)
-                return jsonify({"status": "document_studio_unavailable"}), 200
-            order = latest_document_draft(db, user.id)
-            if not order:
-                user.flow_state = NORMAL
-                db.commit()
-                send_text(wa_id, t(user, "document_uat_no_draft"))
-                send_home(wa_id, user)
-                return jsonify({"status": "ok"}), 200
-            if interactive_id == DOCUMENT_STUDIO_IDS["confirm"]:
-                confirm_document_answers(db, order)
-                user.flow_state = NORMAL
-                reference = order.public_ref
-                db.commit()
-                send_text(
-                    wa_id,
-                    t(user, "document_uat_completed", reference=reference),
-                )
-                record_event(
-                    "document_studio_uat_answers_confirmed",
-                    {"product_code": order.product_code},
-                    user_id=user.id,
-                )
-                send_home(wa_id, user)
-                return jsonify({"status": "ok"}), 200
-            if interactive_id == DOCUMENT_STUDIO_IDS["edit"]:
-                reset_document_for_edit(order)
-                user.flow_state = DOCUMENT_STUDIO_QUESTION
-                db.commit()
-                send_document_question(wa_id, user, order)
-                return jsonify({"status": "ok"}), 200
-            if (
-                interactive_id == DOCUMENT_STUDIO_IDS["cancel"]
-                or lower_text in RESTART_KEYWORDS
-            ):
-                cancel_document_order(db, order)
-                user.flow_state = NORMAL
-                db.commit()
-                send_text(wa_id, t(user, "document_uat_cancelled"))
-                send_home(wa_id, user)
-                return jsonify({"status": "ok"}), 200
-            send_document_review(wa_id, user, order)
-            return jsonify({"status": "ok"}), 200
+def _enqueue_outbound_replies(db, message_id: str | None, wa_id: str) -> None:
+    """Persist collected replies as one job that commits with the message."""
 
-        if interactive_id in {
-            HOME_BUTTON_IDS["more"],
-            "home_more",
-        }:
-            send_more_options(wa_id, user)
-            record_event("more_menu_opened", user_id=user.id)
-            return jsonify({"status": "ok"}), 200
+    replies = g.pop("outbound_replies", None)
+    if not replies:
+        return
+    digest = hashlib.sha256(
+        (message_id or uuid.uuid4().hex).encode()
+    ).hexdigest()
+    job = enqueue_job(
+        db,
+        CONVERSATION_DELIVERY_KIND,
+        {"deliveries": replies},
+        dedupe_key=f"inbound-replies:{digest}",
+        ordering_key=recipient_ordering_key(wa_id),
+    )
+    after_commit(db, partial(submit_outbound_delivery, wa_id, job.id))
 
-        if interactive_id == MORE_MENU_IDS["status"]:
-            booking = latest_booking(db, wa_id)
-            send_text(wa_id, booking_status_message(user, booking))
-            if (
-                booking
-                and booking.status == BookingStatus.PENDING
-                and user.last_payment_link
-            ):
-                send_text(
-                    wa_id,
-                    f"💳 {t(user, 'payment_link_text')}\n{user.last_payment_link}",
-                )
-            record_event(
-                "appointment_status_viewed",
-                {"booking_status": getattr(booking, "status", None)},
-                user_id=user.id,
-            )
-            return jsonify({"status": "ok"}), 200
 
-        if interactive_id == MORE_MENU_IDS["prepare"]:
-            booking = latest_booking(db, wa_id)
-            send_text(wa_id, preparation_message(user, booking))
-            record_event(
-                "consultation_checklist_viewed",
-                {"category": getattr(booking, "category", user.category)},
-                user_id=user.id,
-            )
-            return jsonify({"status": "ok"}), 200
+def _handle_claimed_message(db, message: dict, wa_id: str):
+    """Handle one claimed message inside the caller's unit of work."""
 
-        if interactive_id == MORE_MENU_IDS["guides"]:
-            send_list_picker(
-                wa_id,
-                header=legal_ui(user, "guide_categories"),
-                body=legal_ui(user, "guide_categories_body"),
-                section_title=legal_ui(user, "guide_categories"),
-                rows=legal_guide_rows(user),
+    # =================================================
+    # GLOBAL MAINTENANCE MODE (SAFE & EARLY EXIT)
+    # =================================================
+    if MAINTENANCE_MODE and message.get("type") in ("text", "interactive"):
+        if MAINTENANCE_ADMIN_BYPASS and wa_id == MAINTENANCE_ADMIN_BYPASS:
+            logger.info(
+                "Maintenance bypass used | user=%s",
+                masked_identifier(wa_id),
             )
-            record_event("legal_guides_opened", user_id=user.id)
-            return jsonify({"status": "ok"}), 200
+        else:
+            now_ts = time_module.time()
+            if not should_send_maintenance_notice(wa_id, now_ts):
+                return jsonify({"status": "maintenance_duplicate"}), 200
 
-        if interactive_id and interactive_id.startswith("guidecat::"):
-            category_key = interactive_id.split("::", 1)[1]
-            rows = legal_guide_subcategory_rows(user, category_key)
-            if not rows:
-                send_text(wa_id, t(user, "invalid_selection"))
-                return jsonify({"status": "ok"}), 200
-            send_list_picker(
+            send_text(
                 wa_id,
-                header=legal_ui(user, "guide_issues"),
-                body=legal_ui(user, "guide_issues_body"),
-                section_title=legal_ui(user, "guide_issues"),
-                rows=rows,
-            )
-            record_event(
-                "legal_guide_category_viewed",
-                {"category": category_key},
-                user_id=user.id,
+                (
+                    "⚙️ *NyaySetu is temporarily under maintenance.*\n\n"
+                    "We are upgrading the service. Please try again later. "
+                    "If anyone is in immediate danger, contact the appropriate "
+                    "local emergency service."
+                ),
             )
-            return jsonify({"status": "ok"}), 200
+            return jsonify({"status": "maintenance"}), 200
 
-        if interactive_id and interactive_id.startswith("guide::"):
-            guide_category, guide_subcategory = parse_guide_id(interactive_id)
-            if guide_category and guide_subcategory:
-                send_text(
-                    wa_id,
-                    legal_guide_message(
-                        user,
-                        guide_category,
-                        guide_subcategory,
-                    ),
-                )
-                send_buttons(
-                    wa_id,
-                    legal_ui(user, "helpful"),
-                    guide_feedback_buttons(
-                        user,
-                        guide_category,
-                        guide_subcategory,
-                    ),
-                )
-                record_event(
-                    "legal_guide_viewed",
-                    {
-                        "category": guide_category,
-                        "subcategory": guide_subcategory,
-                    },
-                    user_id=user.id,
-                )
-            else:
-                send_text(wa_id, t(user, "invalid_selection"))
-            return jsonify({"status": "ok"}), 200
+    with request_timing.timed_phase("user"):
+        user = get_or_create_user(db, wa_id)
+    request_timing.note_flow_state(user.flow_state)
+    with request_timing.timed_phase("handler"):
+        return _handle_conversation(db, user, message, wa_id)
 
-        if interactive_id and interactive_id.startswith("guidefb::"):
-            helpful, guide_category, guide_subcategory = (
-                parse_guide_feedback_id(interactive_id)
-            )
-            if not helpful:
-                send_text(wa_id, t(user, "invalid_selection"))
-                return jsonify({"status": "ok"}), 200
 
-            record_event(
-                "legal_guide_feedback",
-                {
-                    "helpful": helpful == "yes",
-                    "category": guide_category,
-                    "subcategory": guide_subcategory,
-                },
-                user_id=user.id,
-            )
-            if helpful == "yes":
-                send_buttons(
-                    wa_id,
-                    legal_ui(user, "thanks"),
-                    [
-                        {
-                            "id": MORE_MENU_IDS["guides"],
-                            "title": legal_ui(user, "guide_categories")[:20],
-                        },
-                        {
-                            "id": "book_now",
-                            "title": legal_ui(user, "book")[:20],
-                        },
-                    ],
-                )
-            else:
-                send_buttons(
-                    wa_id,
-                    legal_ui(user, "more_help"),
-                    [
-                        {
-                            "id": MORE_MENU_IDS["guides"],
-                            "title": legal_ui(user, "guide_categories")[:20],
-                        },
-                        {
-                            "id": MORE_MENU_IDS["support"],
-                            "title": legal_ui(user, "support")[:20],
-                        },
-                        {
-                            "id": "book_now",
-                            "title": legal_ui(user, "book")[:20],
-                        },
-                    ],
-                )
-            return jsonify({"status": "ok"}), 200
+def _handle_conversation(db, user: User, message: dict, wa_id: str):
+    """Apply abuse controls, then dispatch the message through the tables."""
 
-        if interactive_id == MORE_MENU_IDS["privacy"]:
-            send_text(wa_id, privacy_message(user))
-            record_event("privacy_notice_viewed", user_id=user.id)
-            return jsonify({"status": "ok"}), 200
+    message_id = message.get("id")
 
-        if interactive_id == MORE_MENU_IDS["language"]:
-            user.flow_state = ASK_LANGUAGE
-            db.commit()
-            send_language_picker(wa_id, user)
-            return jsonify({"status": "ok"}), 200
+    # Apply abuse controls before any menu, support, paid-session, or media
+    # branch can trigger database or external-message work. Check the
+    # per-user budget first so one sender cannot consume the global budget
+    # with traffic that should already have been rejected locally.
+    if is_user_rate_limited(wa_id):
+        if should_send_rate_limit_notice(
+            "user",
+            wa_id,
+            USER_MSG_WINDOW,
+        ):
+            send_text(wa_id, t(user, "rate_limit_exceeded"))
+        return jsonify({"status": "rate_limited"}), 200
+    if is_global_rate_limited():
+        if should_send_rate_limit_notice(
+            "global",
+            wa_id,
+            GLOBAL_REQ_WINDOW,
+        ):
+            send_text(wa_id, t(user, "service_busy"))
+        return jsonify({"status": "rate_limited"}), 200
+
+    text_body = ""
+    interactive_id = None
+
+    if message.get("type") == "text":
+        text_body = str((message.get("text") or {}).get("body") or "")
+    elif message.get("type") == "interactive":
+        interactive = message.get("interactive") or {}
+        itype = interactive.get("type")
+        selected = interactive.get(itype) if itype else None
+        interactive_id = (
+            str(selected.get("id"))
+            if isinstance(selected, dict) and selected.get("id")
+            else None
+        )
+        text_body = interactive_id
+    else:
+        send_text(wa_id, t(user, "unsupported_message_type"))
+        return jsonify({"status": "unsupported_message_type"}), 200
+
+    text_body = text_body or ""
+    lower_text = text_body.lower().strip()
+    keywords = message_keywords(lower_text)
+    ctx = InboundContext(
+        db=db,
+        user=user,
+        wa_id=wa_id,
+        message_id=message_id,
+        text_body=text_body,
+        lower_text=lower_text,
+        interactive_id=interactive_id,
+        keywords=keywords,
+    )
 
-        if interactive_id in {
-            MORE_MENU_IDS["support"],
-            "payment_help",
-        }:
-            user.flow_state = ASK_SUPPORT_MESSAGE
-            db.commit()
-            latest_support = (
-                db.query(SupportRequest)
-                .filter(SupportRequest.user_id == user.id)
-                .order_by(SupportRequest.id.desc())
-                .first()
-            )
-            if latest_support:
-                send_text(
-                    wa_id,
-                    t(
-                        user,
-                        "support_latest_status",
-                        ticket_id=f"NSH-{latest_support.id:06d}",
-                        status=latest_support.status,
-                    ),
-                )
-            send_buttons(
-                wa_id,
-                support_contact_message(user),
-                [
-                    {
-                        "id": BTN_SUPPORT_CANCEL,
-                        "title": t(user, "support_cancel"),
-                    }
-                ],
+    advocate_intake = (
+        parse_advocate_intake(text_body)
+        if interactive_id is None
+        else None
+    )
+    advocate_intake_candidate = (
+        interactive_id is None
+        and unicodedata.normalize("NFKC", text_body)
+        .replace("\r\n", "\n")
+        .replace("\r", "\n")
+        .strip()
+        .casefold()
+        .startswith(ADVOCATE_INTAKE_PREFIX.casefold())
+    )
+    if advocate_intake:
+        duplicate_cutoff = utc_now() - timedelta(minutes=10)
+        support_request = (
+            db.query(SupportRequest)
+            .filter(
+                SupportRequest.user_id == user.id,
+                SupportRequest.request_type == "ADVOCATE_INTAKE",
+                SupportRequest.message == advocate_intake["message"],
+                SupportRequest.created_at >= duplicate_cutoff,
             )
-            return jsonify({"status": "ok"}), 200
-
-        if user.flow_state == ASK_SUPPORT_MESSAGE:
-            if (
-                interactive_id == BTN_SUPPORT_CANCEL
-                or lower_text in RESTART_KEYWORDS
-            ):
-                user.flow_state = NORMAL
-                db.commit()
-                send_home(wa_id, user)
-                return jsonify({"status": "ok"}), 200
-
-            support_message = text_body.strip()
-            if (
-                interactive_id
-                or len(support_message) < 5
-                or len(support_message) > 2_000
-            ):
-                send_text(wa_id, t(user, "support_request_retry"))
-                return jsonify({"status": "ok"}), 200
-
+            .order_by(SupportRequest.id.desc())
+            .first()
+        )
+        job = None
+        created = support_request is None
+        if created:
             support_request = SupportRequest(
                 user_id=user.id,
                 case_id=user.case_id,
-                request_type="PAYMENT" if "payment" in lower_text else "GENERAL",
-                subject=support_message[:120],
-                message=support_message,
-                sla_due_at=utc_now() + timedelta(hours=SUPPORT_SLA_HOURS),
+                request_type="ADVOCATE_INTAKE",
+                subject=(
+                    f"Advocate intake: {advocate_intake['category']}"
+                )[:160],
+                message=advocate_intake["message"],
+                sla_due_at=(
+                    utc_now() + timedelta(hours=SUPPORT_SLA_HOURS)
+                ),
             )
             db.add(support_request)
             db.flush()
-            job = None
             if SUPPORT_NOTIFICATION_EMAILS:
                 job = enqueue_job(
                     db,
@@ -3001,1318 +3191,2087 @@ def webhook():
                         f"support:{support_request.id}:notification"
                     ),
                 )
+
+        user.language = advocate_intake["language"]
+        user.welcome_sent = True
+        preserve_payment_flow = user.flow_state in {
+            WAITING_PAYMENT,
+            PAYMENT_CONFIRMED,
+        }
+        if not preserve_payment_flow:
             user.flow_state = NORMAL
-            db.commit()
-            send_text(
-                wa_id,
-                t(
-                    user,
-                    "support_request_saved",
-                    ticket_id=f"NSH-{support_request.id:06d}",
-                ),
-            )
+        db.commit()
+
+        ticket_id = f"NSH-{support_request.id:06d}"
+        send_text(
+            wa_id,
+            t(user, "advocate_intake_saved", ticket_id=ticket_id),
+        )
+        if created:
             record_event(
-                "support_request_created",
-                {"request_type": support_request.request_type},
+                "advocate_intake_created",
+                {
+                    "category": advocate_intake["category"],
+                    "timing": advocate_intake["timing"],
+                },
                 user_id=user.id,
             )
-            if job:
-                submit_outbox_job(job.id)
+        if job:
+            after_commit(db, partial(submit_outbox_job, job.id))
+        if not preserve_payment_flow:
             send_home(wa_id, user)
-            return jsonify({"status": "ok"}), 200
-
-        # =================================================
-        # PRIVATE POST-CONSULTATION FEEDBACK
-        # =================================================
-        if user.flow_state == ASK_FEEDBACK_RATING:
-            if interactive_id and interactive_id.startswith("feedback::"):
-                try:
-                    rating = int(interactive_id.split("::", 1)[1])
-                except (TypeError, ValueError):
-                    rating = 0
-                if rating not in range(1, 6):
-                    send_text(wa_id, t(user, "invalid_selection"))
-                    return jsonify({"status": "ok"}), 200
-
-                booking = latest_booking_with_statuses(
-                    db,
-                    wa_id,
-                    (BookingStatus.COMPLETED,),
-                )
-                feedback = Feedback(
-                    user_id=user.id,
-                    rating=rating,
-                    context_json=json.dumps(
-                        {"booking_id": getattr(booking, "id", None)},
-                        separators=(",", ":"),
-                    ),
-                )
-                db.add(feedback)
-                user.flow_state = ASK_FEEDBACK_COMMENT
-                db.commit()
-                send_buttons(
-                    wa_id,
-                    t(user, "feedback_comment_prompt"),
-                    [
-                        {
-                            "id": "feedback_skip",
-                            "title": t(user, "feedback_skip"),
-                        }
-                    ],
+        return jsonify(
+            {
+                "status": (
+                    "advocate_intake_recorded"
+                    if created
+                    else "advocate_intake_already_recorded"
                 )
-                return jsonify({"status": "ok"}), 200
-
-            send_list_picker(
-                wa_id,
-                header=t(user, "feedback_header"),
-                body=t(user, "feedback_body"),
-                section_title=t(user, "feedback_section"),
-                rows=feedback_rows(user),
-            )
-            return jsonify({"status": "ok"}), 200
-
-        if user.flow_state == ASK_FEEDBACK_COMMENT:
-            feedback = (
-                db.query(Feedback)
-                .filter(Feedback.user_id == user.id)
-                .order_by(Feedback.id.desc())
-                .first()
-            )
-            if feedback and interactive_id != "feedback_skip":
-                comment = text_body.strip()
-                if comment:
-                    feedback.comment = comment[:1_000]
-            if feedback:
-                feedback.status = "COMPLETED"
+            }
+        ), 200
+
+    if advocate_intake_candidate:
+        # Do not silently reinterpret a malformed website hand-off as a
+        # normal legal question. No support record is created here.
+        send_text(wa_id, t(user, "advocate_intake_invalid"))
+        send_home(wa_id, user)
+        return jsonify({"status": "advocate_intake_invalid"}), 200
+
+    if close_completed_consultation(db, user, wa_id):
+        return jsonify({"status": "ok"}), 200
+
+    # =================================================
+    # PERSISTENT HOME & SELF-SERVICE NAVIGATION
+    # =================================================
+    if user.welcome_sent and "home" in keywords:
+        if user.flow_state in {
+            DOCUMENT_STUDIO_QUESTION,
+            DOCUMENT_STUDIO_REVIEW,
+        }:
+            # Keep the draft resumable but leave its active conversation
+            # state when the user explicitly returns home.
             user.flow_state = NORMAL
             db.commit()
-            send_text(wa_id, t(user, "feedback_thanks"))
-            record_event(
-                "consultation_feedback_submitted",
-                {"rating": getattr(feedback, "rating", None)},
-                user_id=user.id,
-            )
-            send_home(wa_id, user)
-            return jsonify({"status": "ok"}), 200
+        send_home(wa_id, user)
+        return jsonify({"status": "ok"}), 200
 
-        if interactive_id in {
-            HOME_BUTTON_IDS["ask_ai"],
-            BTN_ASK_AI,
-        }:
-            pending_booking = latest_booking_with_statuses(
-                db,
-                wa_id,
-                (BookingStatus.PENDING,),
-            )
-            if pending_booking:
-                user.flow_state = WAITING_PAYMENT
-                db.commit()
-                send_pending_payment_options(user, wa_id, pending_booking)
-                return jsonify({"status": "ok"}), 200
-            begin_ai_consent(db, user, wa_id)
-            return jsonify({"status": "ok"}), 200
-
-        if interactive_id in {
-            HOME_BUTTON_IDS["book"],
-            BTN_BOOK_CONSULT,
-            "book_now",
-        }:
-            active_paid_booking = latest_booking_with_statuses(
-                db,
-                wa_id,
-                (BookingStatus.PAID,),
-            )
-            _, paid_booking_end = get_booking_window(active_paid_booking)
-            if paid_booking_end and datetime.now(IST) <= paid_booking_end:
-                user.flow_state = PAYMENT_CONFIRMED
-                db.commit()
-                send_text(
-                    wa_id,
-                    booking_status_message(user, active_paid_booking),
-                )
-                send_text(wa_id, t(user, "post_payment_ai_start"))
-                return jsonify({"status": "ok"}), 200
-
-            pending_booking = latest_booking_with_statuses(
-                db,
-                wa_id,
-                (BookingStatus.PENDING,),
-            )
-            if pending_booking:
-                user.flow_state = WAITING_PAYMENT
-                db.commit()
-                send_pending_payment_options(user, wa_id, pending_booking)
-                return jsonify({"status": "ok"}), 200
-            begin_booking_scope_review(db, user, wa_id)
-            return jsonify({"status": "ok"}), 200
-
-        if user.flow_state == ASK_AI_CONSENT:
-            if interactive_id == BTN_AI_CONSENT:
-                paid_booking = latest_booking_with_statuses(
-                    db,
-                    wa_id,
-                    (BookingStatus.PAID,),
-                )
-                _, paid_booking_end = get_booking_window(paid_booking)
-                paid_session_active = bool(
-                    paid_booking_end
-                    and datetime.now(IST) <= paid_booking_end
-                )
-                user.ai_enabled = True
-                user.flow_state = (
-                    PAYMENT_CONFIRMED if paid_session_active else NORMAL
-                )
-                record_user_consent(
-                    db,
-                    user,
-                    purpose="AI_PROCESSING",
-                    policy_version=AI_CONSENT_VERSION,
-                )
-                db.commit()
-                record_event(
-                    "ai_consent_granted",
-                    {"context": "paid" if paid_session_active else "free"},
-                    user_id=user.id,
-                )
-                send_text(
-                    wa_id,
-                    t(
-                        user,
-                        (
-                            "post_payment_ai_start"
-                            if paid_session_active
-                            else "ask_ai_prompt"
-                        ),
-                    ),
-                )
-                return jsonify({"status": "ok"}), 200
+    if (
+        interactive_id == HOME_BUTTON_IDS["documents"]
+        or "documents" in keywords
+    ):
+        if not document_studio_available(user):
+            send_text(wa_id, t(user, "document_studio_unavailable"))
+            send_home(wa_id, user)
+            return jsonify({"status": "document_studio_unavailable"}), 200
+        user.flow_state = NORMAL
+        db.commit()
+        send_document_studio_home(wa_id, user)
+        record_event("document_studio_uat_opened", user_id=user.id)
+        return jsonify({"status": "ok"}), 200
+
+    response = _route_interactive(_DOCUMENT_ROUTES, ctx)
+    if response is not None:
+        return response
+
+    if user.flow_state in {
+        DOCUMENT_STUDIO_QUESTION,
+        DOCUMENT_STUDIO_REVIEW,
+    } and interactive_id in set(HOME_BUTTON_IDS.values()):
+        # Home selections always win over an unfinished UAT draft. The
+        # draft remains available through Continue Test.
+        user.flow_state = NORMAL
+        db.commit()
 
-            if interactive_id == BTN_AI_DECLINE:
-                user.ai_enabled = False
-                user.flow_state = NORMAL
-                db.commit()
-                record_event("ai_consent_declined", user_id=user.id)
-                send_home(wa_id, user)
-                return jsonify({"status": "ok"}), 200
+    response = _dispatch_flow_state(_DOCUMENT_FLOW_HANDLERS, ctx)
+    if response is not None:
+        return response
 
-            begin_ai_consent(db, user, wa_id)
-            return jsonify({"status": "ok"}), 200
+    response = _route_interactive(_MENU_ROUTES, ctx)
+    if response is not None:
+        return response
 
-        if user.flow_state == REVIEW_SERVICE:
-            if interactive_id == BTN_BOOKING_SCOPE_CONTINUE:
-                record_event("booking_started", user_id=user.id)
-                if user.name and user.state_name and user.district_name:
-                    send_verification_screen(db, user, wa_id)
-                else:
-                    user.flow_state = ASK_NAME
-                    db.commit()
-                    send_text(wa_id, t(user, "ask_name"))
-                return jsonify({"status": "ok"}), 200
+    response = _dispatch_flow_state(_SUPPORT_FLOW_HANDLERS, ctx)
+    if response is not None:
+        return response
 
-            if interactive_id == BTN_BOOKING_SCOPE_CANCEL:
-                user.flow_state = NORMAL
-                db.commit()
-                send_home(wa_id, user)
-                return jsonify({"status": "ok"}), 200
+    response = _route_interactive(_HOME_ACTION_ROUTES, ctx)
+    if response is not None:
+        return response
 
-            begin_booking_scope_review(db, user, wa_id)
-            return jsonify({"status": "ok"}), 200
+    response = _dispatch_flow_state(_CONSENT_FLOW_HANDLERS, ctx)
+    if response is not None:
+        return response
 
-        # =================================================
-        # POST-PAYMENT SESSION CONTROL (CRITICAL)
-        # =================================================
-        paid_booking = None
+    # =================================================
+    # POST-PAYMENT SESSION CONTROL (CRITICAL)
+    # =================================================
+    paid_booking = None
 
-        if user.flow_state in (WAITING_PAYMENT, PAYMENT_CONFIRMED):
-            current_booking = latest_booking(db, wa_id)
-            if (
-                current_booking
-                and current_booking.status == BookingStatus.PAID
-            ):
-                paid_booking = current_booking
+    if user.flow_state in (WAITING_PAYMENT, PAYMENT_CONFIRMED):
+        current_booking = latest_booking(db, wa_id)
+        if (
+            current_booking
+            and current_booking.status == BookingStatus.PAID
+        ):
+            paid_booking = current_booking
 
-        if paid_booking:
-            logger.debug(
-                "POST_PAYMENT_BLOCK_ENTER | wa_id=%s | booking_id=%s | state=%s",
-                masked_identifier(wa_id),
+    if paid_booking:
+        logger.debug(
+            "POST_PAYMENT_BLOCK_ENTER | wa_id=%s | booking_id=%s | state=%s",
+            masked_identifier(wa_id),
+            paid_booking.id,
+            user.flow_state,
+        )
+        # -------------------------------
+        # DEFENSIVE GUARD — NEVER CRASH
+        # -------------------------------
+        if not paid_booking.date or not paid_booking.slot_code:
+            logger.warning(
+                "Incomplete paid booking | booking_id=%s | date=%s | slot=%s",
                 paid_booking.id,
-                user.flow_state,
+                paid_booking.date,
+                paid_booking.slot_code,
             )
-            # -------------------------------
-            # DEFENSIVE GUARD — NEVER CRASH
-            # -------------------------------
-            if not paid_booking.date or not paid_booking.slot_code:
-                logger.warning(
-                    "Incomplete paid booking | booking_id=%s | date=%s | slot=%s",
-                    paid_booking.id,
-                    paid_booking.date,
-                    paid_booking.slot_code,
-                )
-                return jsonify({"status": "ignored"}), 200
+            return jsonify({"status": "ignored"}), 200
 
-            # -------------------------------
-            # SAFE booking window (single source of truth)
-            # -------------------------------
-            booking_start, booking_end = get_booking_window(paid_booking)
-            
-            if not booking_start or not booking_end:
-                logger.error(
-                    "Invalid booking window | booking_id=%s | date=%s | slot=%s",
-                    paid_booking.id,
-                    paid_booking.date,
-                    paid_booking.slot_code,
-                )
-                return jsonify({"status": "ignored"}), 200
-            
-            now = datetime.now(IST)
-
-            # =================================================
-            # 🔒 HARD GUARD: POST-PAYMENT SESSION (TIME-BOUND)
-            # =================================================
-            if now <= booking_end:
-                logger.debug(
-                    "POST_PAYMENT_ACTIVE | wa_id=%s | now=%s | booking_end=%s | state_before=%s",
-                    masked_identifier(wa_id),
-                    now,
-                    booking_end,
-                    user.flow_state,
-                )
-                
-                # 🔒 Ensure state is aligned (webhook race-safe)
-                if user.flow_state != PAYMENT_CONFIRMED:
-                    set_flow_state(db, user, PAYMENT_CONFIRMED)
+        # -------------------------------
+        # SAFE booking window (single source of truth)
+        # -------------------------------
+        booking_start, booking_end = get_booking_window(paid_booking)
+        
+        if not booking_start or not booking_end:
+            logger.error(
+                "Invalid booking window | booking_id=%s | date=%s | slot=%s",
+                paid_booking.id,
+                paid_booking.date,
+                paid_booking.slot_code,
+            )
+            return jsonify({"status": "ignored"}), 200
+        
+        now = datetime.now(IST)
 
-                message = (text_body or "").strip().lower()
-            
-                if message == "receipt":
-                    send_payment_receipt_again(db, wa_id)
-                    return jsonify({"status": "ok"}), 200
-
-                if not user.ai_enabled:
-                    begin_ai_consent(db, user, wa_id)
-                    return jsonify({"status": "ok"}), 200
-
-               
-                # -------------------------------------------------
-                # AI RATE LIMITING (POST-PAYMENT PROTECTION)
-                # -------------------------------------------------
-                if is_ai_rate_limited(wa_id):
-                    send_text(
-                        wa_id,
-                        t(user, "ai_post_payment_cooldown")
-                    )
-                    return jsonify({"status": "ok"}), 200
-                
-                send_typing_on(wa_id)
-                
-                try:
-                    reply = ai_reply_router(
-                        message,
-                        user,
-                        context="post_payment"
-                    )
-                finally:
-                    send_typing_off(wa_id)
-                
-                send_text(
-                    wa_id,
-                    f"🤖 {t(user, 'consultation_assistant_header')}\n\n{reply}"
-                )
-                
-                return jsonify({"status": "ok"}), 200
-            
-        # ===============================
-        # RESTART (BLOCKED AFTER PAYMENT)
-        # ===============================
-        if lower_text in RESTART_KEYWORDS:
+        # =================================================
+        # 🔒 HARD GUARD: POST-PAYMENT SESSION (TIME-BOUND)
+        # =================================================
+        if now <= booking_end:
             logger.debug(
-                "RESTART_ATTEMPT | wa_id=%s | state=%s",
+                "POST_PAYMENT_ACTIVE | wa_id=%s | now=%s | booking_end=%s | state_before=%s",
                 masked_identifier(wa_id),
+                now,
+                booking_end,
                 user.flow_state,
             )
-            # 🔒 Never allow restart after payment
-            if user.flow_state == PAYMENT_CONFIRMED:
-                send_text(
-                    wa_id,
-                    t(user, "consultation_already_confirmed")
-                )
-                return jsonify({"status": "ok"}), 200
-        
-            if user.flow_state == WAITING_PAYMENT:
-                send_text(wa_id, t(user, "payment_in_progress"))
-                return jsonify({"status": "ok"}), 200
-        
-            set_flow_state(db, user, NORMAL)
-            user.ai_enabled = False
-            user.temp_date = None
-            user.temp_slot = None
-            user.last_payment_link = None
-            db.commit()
-        
-            send_text(wa_id, t(user, "restart"))
-            return jsonify({"status": "ok"}), 200
             
-        # ===============================
-        # RETURNING USER HOME
-        # ===============================
-        if (
-            user.flow_state == NORMAL
-            and user.welcome_sent
-            and has_completed_consultation(db, wa_id)
-            and not user.ai_enabled
-            and user.free_ai_count == 0
-            and lower_text in WELCOME_KEYWORDS
-        ):
-            send_buttons(
-                wa_id,
-                t(user, "welcome_back", name=user.name),
-                [
-                    {"id": BTN_ASK_AI, "title": f"🤖 {t(user, 'ask_ai')}"},
-                    {"id": BTN_BOOK_CONSULT, "title": f"📅 {t(user, 'book_consult')}"},
-                ],
-            )
-            return jsonify({"status": "ok"}), 200
+            # 🔒 Ensure state is aligned (webhook race-safe)
+            if user.flow_state != PAYMENT_CONFIRMED:
+                set_flow_state(db, user, PAYMENT_CONFIRMED)
 
-        # ===============================
-        # WELCOME (ONE-TIME ONLY)
-        # ===============================
-        logger.debug(
-            "WELCOME_CHECK | wa_id=%s | state=%s | welcome_sent=%s",
-            masked_identifier(wa_id),
-            user.flow_state,
-            user.welcome_sent,
-        )
-        # ===============================
-        # WELCOME (ONE-TIME ONLY — RACE SAFE)
-        # ===============================
-        if (
-            user.flow_state == NORMAL
-            and not user.welcome_sent
-        ):
-        
-            # 🔒 LOCK FIRST (atomic update before sending)
-            user.welcome_sent = True
-            user.flow_state = ASK_LANGUAGE
-            db.commit()
-        
-            send_language_picker(wa_id, user)
-            record_event("onboarding_started", user_id=user.id)
-        
-            return jsonify({"status": "ok"}), 200
-            
-        # ===============================
-        # LANGUAGE SELECTION
-        # ===============================
-        if user.flow_state == ASK_LANGUAGE:
-            if interactive_id in ("lang_en", "lang_hi", "lang_mr"):
-                user.language = interactive_id.replace("lang_", "")
-                db.commit()
-        
-                # ✅ Marathi (Greetings)
-                #if user.language == "mr":
-                
-                #    if not getattr(user, "marathi_greeted", False):
-                #        send_text(
-                #            wa_id,
-                #           "🙏 जय महाराष्ट्र! 🇮🇳\nआपण NyaySetu मध्ये स्वागत आहे ⚖️"
-                #        )
-                #        user.marathi_greeted = True
-                
-                #    db.commit()
-                        
-                save_state(db, user, ASK_AI_OR_BOOK)
+            message = (text_body or "").strip().lower()
         
-                send_buttons(
-                    wa_id,
-                    t(user, "ask_ai_or_book"),
-                    [
-                        {"id": "opt_ai", "title": t(user, "ask_ai")},
-                        {"id": "opt_book", "title": t(user, "book_consult")},
-                    ],
-                )
-            else:
-                send_language_picker(wa_id, user)
-
-            return jsonify({"status": "ok"}), 200       
-
-        # ===============================
-        # AI OR BOOK
-        # ===============================
-        if user.flow_state == ASK_AI_OR_BOOK:
-            if interactive_id == "opt_book" or is_booking_intent(lower_text):
-                begin_booking_scope_review(db, user, wa_id)
+            if message == "receipt":
+                send_payment_receipt_again(db, wa_id)
                 return jsonify({"status": "ok"}), 200
 
-            if interactive_id == "opt_ai" or (
-                interactive_id is None and bool(lower_text)
-            ):
+            if not user.ai_enabled:
                 begin_ai_consent(db, user, wa_id)
                 return jsonify({"status": "ok"}), 200
 
-        # ===============================
-        # BOOKING KEYWORD (GLOBAL)
-        # ===============================
-        if (
-            is_booking_intent(lower_text)
-            or interactive_id == "book_now"
-        ) and user.flow_state == NORMAL:    
-            begin_booking_scope_review(db, user, wa_id)
-            return jsonify({"status": "ok"}), 200
-
-        # ===============================
-        # FREE AI CHAT
-        # ===============================
-        if user.flow_state == NORMAL and user.ai_enabled:
-        
-            if not text_body:
-                return jsonify({"status": "ignored"}), 200
-        
             # -------------------------------------------------
-            # FREE LIMIT CHECK
-            # -------------------------------------------------
-            if user.free_ai_count >= FREE_AI_LIMIT:
-                send_buttons(
-                    wa_id,
-                    t(user, "free_limit_reached"),
-                    [{"id": "book_now", "title": t(user, "book_consult")}],
-                )
-                return jsonify({"status": "ok"}), 200
-        
-            # -------------------------------------------------
-            # AI RATE LIMITING
+            # AI RATE LIMITING (POST-PAYMENT PROTECTION)
             # -------------------------------------------------
             if is_ai_rate_limited(wa_id):
-                send_text(wa_id, t(user, "ai_cooldown"))
-                return jsonify({"status": "ok"}), 200
-        
-            send_typing_on(wa_id)
-        
-            try:
-                reply = ai_reply_router(text_body, user)
-            finally:
-                send_typing_off(wa_id)
-        
-            user.free_ai_count += 1
-            db.commit()
-        
-            # -------------------------------------------------
-            # SOFT BOOKING PROMPT (WITH BUTTON)
-            # -------------------------------------------------
-            if user.free_ai_count == FREE_AI_SOFT_PROMPT_AT:
-            
-                send_text(wa_id, reply)            
-                send_buttons(
+                send_text(
                     wa_id,
-                    t(user, "soft_booking_prompt"),
-                    [
-                        {"id": "book_now", "title": t(user, "book_consult")}
-                    ],
+                    t(user, "ai_post_payment_cooldown")
                 )
-            
                 return jsonify({"status": "ok"}), 200
             
-            # Normal reply
-            send_text(wa_id, reply)
-            return jsonify({"status": "ok"}), 200
-
-        # =================================================
-        # BOOKING FLOW CONTINUATION
-        # =================================================     
-        if (
-            user.flow_state == FLOW_VERIFY_DETAILS
-            and interactive_id == BTN_DETAILS_OK
-        ):
-            save_state(db, user, ASK_CATEGORY)
-            send_category_list(wa_id, user)
-            return jsonify({"status": "ok"}), 200
-        if (
-            user.flow_state == FLOW_VERIFY_DETAILS
-            and interactive_id == BTN_DETAILS_EDIT
-        ):
-            save_state(db, user, ASK_NAME)
-            send_text(wa_id, t(user, "ask_name"))
-            return jsonify({"status": "ok"}), 200
-
-        # -------------------------------
-        # Ask Name
-        # -------------------------------
-        if user.flow_state == ASK_NAME:
-            if not text_body or len(text_body.strip()) < 2:
-                send_text(wa_id, t(user, "ask_name_retry"))
-                return jsonify({"status": "ok"}), 200
-        
-            clean_name = normalize_name(text_body)
+            # Keep no transaction open across the provider call.
+            commit_now(db)
+            send_typing_on(wa_id)
             
-            if not clean_name:
-                send_text(
-                    wa_id,
-                    t(user, "name_invalid")
+            try:
+                reply = ai_reply_router(
+                    message,
+                    user,
+                    context="post_payment"
                 )
-                return jsonify({"status": "ok"}), 200
+            finally:
+                send_typing_off(wa_id)
             
-            user.name = clean_name
-            db.commit()        
-        
-            # ✅ ALL users → ask DISTRICT directly
-            save_state(db, user, ASK_DISTRICT)
-        
             send_text(
                 wa_id,
-                t(user, "ask_district_text")            
+                f"🤖 {t(user, 'consultation_assistant_header')}\n\n{reply}"
             )
-        
+            
             return jsonify({"status": "ok"}), 200
-
-        # -------------------------------
-        # Ask District (SMART FLOW)
-        # -------------------------------
-        if user.flow_state == ASK_DISTRICT:
-            if interactive_id and interactive_id.startswith("loc::"):
-                parts = interactive_id.split("::", 2)
-                if len(parts) == 3 and all(parts[1:]):
-                    user.temp_district = parts[1]
-                    user.temp_state = parts[2]
-                    user.flow_state = CONFIRM_LOCATION
-                    db.commit()
-                    send_buttons(
-                        wa_id,
-                        (
-                            f"{t(user, 'location_found')}\n"
-                            f"*{parts[1]}, {parts[2]}*\n\n"
-                            f"{t(user, 'confirm_location')}"
-                        ),
-                        [
-                            {
-                                "id": "loc_yes",
-                                "title": f"✅ {t(user, 'confirm_yes')}",
-                            },
-                            {
-                                "id": "loc_change",
-                                "title": f"✏️ {t(user, 'confirm_change')}",
-                            },
-                        ],
-                    )
-                    return jsonify({"status": "ok"}), 200
-
-            if not text_body:
-                send_text(
-                    wa_id,
-                    t(user, "ask_district_text")            
-                )
-                return jsonify({"status": "ok"}), 200
-        
-            district, state, confidence = detect_district_and_state(text_body)
-        
-            # -------------------------------
-            # HIGH CONFIDENCE
-            # -------------------------------
-            if confidence == "HIGH":
-                user.temp_district = district
-                user.temp_state = state
-                db.commit()
-        
-                save_state(db, user, CONFIRM_LOCATION)
-        
-                msg = (
-                    f"{t(user, 'location_found')}\n"
-                    f"*{district}, {state}*\n\n"
-                    f"{t(user, 'confirm_location')}"
-                )
-                
-                send_buttons(
-                    wa_id,
-                    msg,
-                    [
-                        {"id": "loc_yes", "title": f"✅ {t(user, 'confirm_yes')}"},
-                        {"id": "loc_change", "title": f"✏️ {t(user, 'confirm_change')}"},
-                    ],
-                )
-
-                return jsonify({"status": "ok"}), 200
         
-            # -------------------------------
-            # MULTIPLE MATCHES
-            # -------------------------------
-            if confidence == "MULTIPLE":
-                rows = [
-                    {
-                        "id": f"loc::{match_district}::{match_state}",
-                        "title": match_district,
-                        "description": match_state,
-                    }
-                    for _, match_district, match_state in district[:10]
-                ]
-                send_list_picker(
-                    wa_id,
-                    header=t(user, "choose_district"),
-                    body=t(user, "district_multiple_matches"),
-                    section_title=t(user, "choose_district"),
-                    rows=rows,
-                )
-                return jsonify({"status": "ok"}), 200
-        
-            # -------------------------------
-            # LOW CONFIDENCE
-            # -------------------------------
+    # ===============================
+    # RESTART (BLOCKED AFTER PAYMENT)
+    # ===============================
+    if "restart" in keywords:
+        logger.debug(
+            "RESTART_ATTEMPT | wa_id=%s | state=%s",
+            masked_identifier(wa_id),
+            user.flow_state,
+        )
+        # 🔒 Never allow restart after payment
+        if user.flow_state == PAYMENT_CONFIRMED:
             send_text(
                 wa_id,
-                t(user, "district_not_identified")
+                t(user, "consultation_already_confirmed")
             )
             return jsonify({"status": "ok"}), 200
-
-        # -------------------------------
-        # Confirm Location
-        # -------------------------------
-        if user.flow_state == CONFIRM_LOCATION:
-        
-            if interactive_id == "loc_yes":
-                user.district_name = user.temp_district
-                user.state_name = user.temp_state
-        
-                user.temp_district = None
-                user.temp_state = None
-                db.commit()
-        
-                save_state(db, user, ASK_CATEGORY)
-                send_category_list(wa_id, user)
-                return jsonify({"status": "ok"}), 200
-        
-            if interactive_id == "loc_change":
-                user.temp_district = None
-                user.temp_state = None
-                db.commit()
-        
-                save_state(db, user, ASK_DISTRICT)
-                send_text(
-                    wa_id,
-                    t(user, "district_retry")
-                )
-                return jsonify({"status": "ok"}), 200        
-
-            if user.temp_district and user.temp_state:
-                send_buttons(
-                    wa_id,
-                    (
-                        f"{t(user, 'location_found')}\n"
-                        f"*{user.temp_district}, {user.temp_state}*\n\n"
-                        f"{t(user, 'confirm_location')}"
-                    ),
-                    [
-                        {"id": "loc_yes", "title": f"✅ {t(user, 'confirm_yes')}"},
-                        {
-                            "id": "loc_change",
-                            "title": f"✏️ {t(user, 'confirm_change')}",
-                        },
-                    ],
-                )
-            else:
-                user.flow_state = ASK_DISTRICT
-                db.commit()
-                send_text(wa_id, t(user, "district_retry"))
+    
+        if user.flow_state == WAITING_PAYMENT:
+            send_text(wa_id, t(user, "payment_in_progress"))
             return jsonify({"status": "ok"}), 200
+    
+        set_flow_state(db, user, NORMAL)
+        user.ai_enabled = False
+        user.temp_date = None
+        user.temp_slot = None
+        user.last_payment_link = None
+        db.commit()
+    
+        send_text(wa_id, t(user, "restart"))
+        return jsonify({"status": "ok"}), 200
         
-        # -------------------------------
-        # Category (STRICT & SAFE)
-        # -------------------------------
-        if user.flow_state == ASK_CATEGORY:
-            category = None
-        
-            # ---------------------------------
-            # Category selected from list
-            # ---------------------------------
-            if interactive_id and interactive_id.startswith("cat_"):
-                category = interactive_id.replace("cat_", "")
-        
-            # ---------------------------------
-            # Ignore empty / status events
-            # ---------------------------------
-            if not category and not text_body:
-                return jsonify({"status": "ignored"}), 200
-        
-            # ---------------------------------
-            # Still invalid → ask again
-            # ---------------------------------
-            if not category:
-                send_text(wa_id, t(user, "category_retry"))
-                send_category_list(wa_id, user)
-                return jsonify({"status": "ok"}), 200
-        
-            # ---------------------------------
-            # Save category & move forward
-            # ---------------------------------
-            
-            user.category = category
-            db.commit()
-            
-            save_state(db, user, ASK_SUBCATEGORY)
-            
-            # category is already normalized key
-            send_subcategory_list(
-                db,
-                wa_id,
+    # ===============================
+    # RETURNING USER HOME
+    # ===============================
+    if (
+        user.flow_state == NORMAL
+        and user.welcome_sent
+        and has_completed_consultation(db, wa_id)
+        and not user.ai_enabled
+        and user.free_ai_count == 0
+        and "welcome" in keywords
+    ):
+        send_buttons(
+            wa_id,
+            t(user, "welcome_back", name=user.name),
+            [
+                {"id": BTN_ASK_AI, "title": f"🤖 {t(user, 'ask_ai')}"},
+                {"id": BTN_BOOK_CONSULT, "title": f"📅 {t(user, 'book_consult')}"},
+            ],
+        )
+        return jsonify({"status": "ok"}), 200
+
+    # ===============================
+    # WELCOME (ONE-TIME ONLY)
+    # ===============================
+    logger.debug(
+        "WELCOME_CHECK | wa_id=%s | state=%s | welcome_sent=%s",
+        masked_identifier(wa_id),
+        user.flow_state,
+        user.welcome_sent,
+    )
+    # ===============================
+    # WELCOME (ONE-TIME ONLY — RACE SAFE)
+    # ===============================
+    if (
+        user.flow_state == NORMAL
+        and not user.welcome_sent
+    ):
+    
+        # 🔒 LOCK FIRST (atomic update before sending)
+        user.welcome_sent = True
+        user.flow_state = ASK_LANGUAGE
+        db.commit()
+    
+        send_language_picker(wa_id, user)
+        record_event("onboarding_started", user_id=user.id)
+    
+        return jsonify({"status": "ok"}), 200
+        
+    response = _dispatch_flow_state(FLOW_STATE_HANDLERS, ctx)
+    if response is not None:
+        return response
+
+    return jsonify({"status": "ignored"}), 200
+# ===============================
+# CONVERSATION DISPATCH TABLES
+# ===============================
+@dataclass(frozen=True, slots=True)
+class InboundContext:
+    """Everything a conversation handler needs about one inbound message."""
+
+    db: Any
+    user: User
+    wa_id: str
+    message_id: str | None
+    text_body: str
+    lower_text: str
+    interactive_id: str | None
+    keywords: frozenset[str]
+
+
+def _route_interactive(routes: dict, ctx: InboundContext):
+    """Dispatch on an exact interactive ID, then on its ``prefix::``."""
+
+    interactive_id = ctx.interactive_id
+    if not interactive_id:
+        return None
+    handler = routes.get(interactive_id)
+    if handler is None:
+        prefix, separator, _ = interactive_id.partition("::")
+        if separator:
+            handler = routes.get(prefix + separator)
+    return handler(ctx) if handler is not None else None
+
+
+def _dispatch_flow_state(handlers: dict, ctx: InboundContext):
+    handler = handlers.get(ctx.user.flow_state)
+    return handler(ctx) if handler is not None else None
+
+
+def _route_document_back(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    user.flow_state = NORMAL
+    db.commit()
+    send_home(wa_id, user)
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_document_create(ctx: InboundContext):
+    user = ctx.user
+    wa_id = ctx.wa_id
+    if not document_studio_available(user):
+        send_text(wa_id, t(user, "document_studio_unavailable"))
+        return jsonify({"status": "document_studio_unavailable"}), 200
+    send_list_picker(
+        wa_id,
+        header=t(user, "document_product_header"),
+        body=t(user, "document_product_body"),
+        section_title=t(user, "document_product_section"),
+        rows=document_product_rows(user, t),
+    )
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_document_product(ctx: InboundContext):
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    selected_document_product = parse_product_id(interactive_id)
+    if not selected_document_product:
+        return None
+
+    if not document_studio_available(user):
+        send_text(wa_id, t(user, "document_studio_unavailable"))
+        return jsonify({"status": "document_studio_unavailable"}), 200
+    send_buttons(
+        wa_id,
+        t(user, "document_uat_overview"),
+        [
+            {
+                "id": (
+                    f"{DOCUMENT_START_ID_PREFIX}"
+                    f"{selected_document_product}"
+                ),
+                "title": t(user, "document_start_uat")[:20],
+            },
+            {
+                "id": DOCUMENT_STUDIO_IDS["back"],
+                "title": t(user, "document_back_home")[:20],
+            },
+        ],
+    )
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_document_start(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    started_document_product = parse_product_id(
+        interactive_id,
+        start=True,
+    )
+    if not started_document_product:
+        return None
+
+    if not document_studio_available(user):
+        send_text(wa_id, t(user, "document_studio_unavailable"))
+        return jsonify({"status": "document_studio_unavailable"}), 200
+    order = create_or_resume_uat_order(db, user.id)
+    user.flow_state = (
+        DOCUMENT_STUDIO_REVIEW
+        if order.current_step == "review"
+        else DOCUMENT_STUDIO_QUESTION
+    )
+    db.commit()
+    if user.flow_state == DOCUMENT_STUDIO_REVIEW:
+        send_document_review(wa_id, user, order)
+    else:
+        send_document_question(wa_id, user, order)
+    record_event(
+        "document_studio_uat_started",
+        {"product_code": started_document_product},
+        user_id=user.id,
+    )
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_document_continue(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    if not document_studio_available(user):
+        send_text(wa_id, t(user, "document_studio_unavailable"))
+        return jsonify({"status": "document_studio_unavailable"}), 200
+    order = latest_document_draft(db, user.id)
+    if not order:
+        send_text(wa_id, t(user, "document_uat_no_draft"))
+        send_document_studio_home(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+    user.flow_state = (
+        DOCUMENT_STUDIO_REVIEW
+        if order.current_step == "review"
+        else DOCUMENT_STUDIO_QUESTION
+    )
+    db.commit()
+    if user.flow_state == DOCUMENT_STUDIO_REVIEW:
+        send_document_review(wa_id, user, order)
+    else:
+        send_document_question(wa_id, user, order)
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_document_mine(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    if not document_studio_available(user):
+        send_text(wa_id, t(user, "document_studio_unavailable"))
+        return jsonify({"status": "document_studio_unavailable"}), 200
+    send_text(wa_id, recent_orders_message(db, user.id))
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_document_help(ctx: InboundContext):
+    user = ctx.user
+    wa_id = ctx.wa_id
+    if not document_studio_available(user):
+        send_text(wa_id, t(user, "document_studio_unavailable"))
+        return jsonify({"status": "document_studio_unavailable"}), 200
+    send_text(wa_id, t(user, "document_uat_help_text"))
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_document_question(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    interactive_id = ctx.interactive_id
+    keywords = ctx.keywords
+    if not document_studio_available(user):
+        user.flow_state = NORMAL
+        db.commit()
+        send_text(wa_id, t(user, "document_studio_unavailable"))
+        send_home(wa_id, user)
+        return jsonify({"status": "document_studio_unavailable"}), 200
+    order = latest_document_draft(db, user.id)
+    if not order:
+        user.flow_state = NORMAL
+        db.commit()
+        send_text(wa_id, t(user, "document_uat_no_draft"))
+        send_home(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+    if (
+        interactive_id == DOCUMENT_STUDIO_IDS["cancel"]
+        or "restart" in keywords
+    ):
+        cancel_document_order(db, order)
+        user.flow_state = NORMAL
+        db.commit()
+        send_text(wa_id, t(user, "document_uat_cancelled"))
+        send_home(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id:
+        send_text(wa_id, t(user, "document_uat_answer_invalid"))
+        send_document_question(wa_id, user, order)
+        return jsonify({"status": "ok"}), 200
+    question = current_document_question(order)
+    answer = validate_document_answer(question["key"], text_body)
+    if answer is None:
+        send_text(wa_id, t(user, "document_uat_answer_invalid"))
+        send_document_question(wa_id, user, order)
+        return jsonify({"status": "ok"}), 200
+    review_ready = save_document_answer(order, answer)
+    user.flow_state = (
+        DOCUMENT_STUDIO_REVIEW
+        if review_ready
+        else DOCUMENT_STUDIO_QUESTION
+    )
+    db.commit()
+    if review_ready:
+        send_document_review(wa_id, user, order)
+    else:
+        send_document_question(wa_id, user, order)
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_document_review(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    keywords = ctx.keywords
+    if not document_studio_available(user):
+        user.flow_state = NORMAL
+        db.commit()
+        send_text(wa_id, t(user, "document_studio_unavailable"))
+        send_home(wa_id, user)
+        return jsonify({"status": "document_studio_unavailable"}), 200
+    order = latest_document_draft(db, user.id)
+    if not order:
+        user.flow_state = NORMAL
+        db.commit()
+        send_text(wa_id, t(user, "document_uat_no_draft"))
+        send_home(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id == DOCUMENT_STUDIO_IDS["confirm"]:
+        confirm_document_answers(db, order)
+        user.flow_state = NORMAL
+        reference = order.public_ref
+        db.commit()
+        send_text(
+            wa_id,
+            t(user, "document_uat_completed", reference=reference),
+        )
+        record_event(
+            "document_studio_uat_answers_confirmed",
+            {"product_code": order.product_code},
+            user_id=user.id,
+        )
+        send_home(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id == DOCUMENT_STUDIO_IDS["edit"]:
+        reset_document_for_edit(order)
+        user.flow_state = DOCUMENT_STUDIO_QUESTION
+        db.commit()
+        send_document_question(wa_id, user, order)
+        return jsonify({"status": "ok"}), 200
+    if (
+        interactive_id == DOCUMENT_STUDIO_IDS["cancel"]
+        or "restart" in keywords
+    ):
+        cancel_document_order(db, order)
+        user.flow_state = NORMAL
+        db.commit()
+        send_text(wa_id, t(user, "document_uat_cancelled"))
+        send_home(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+    send_document_review(wa_id, user, order)
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_more_menu(ctx: InboundContext):
+    user = ctx.user
+    wa_id = ctx.wa_id
+    send_more_options(wa_id, user)
+    record_event("more_menu_opened", user_id=user.id)
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_appointment_status(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    booking = expire_pending_booking_if_stale(
+        db,
+        latest_booking(db, wa_id),
+    )
+    send_text(wa_id, booking_status_message(user, booking))
+    if (
+        booking
+        and booking.status == BookingStatus.PENDING
+        and user.last_payment_link
+    ):
+        send_text(
+            wa_id,
+            f"💳 {t(user, 'payment_link_text')}\n{user.last_payment_link}",
+        )
+    record_event(
+        "appointment_status_viewed",
+        {"booking_status": getattr(booking, "status", None)},
+        user_id=user.id,
+    )
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_consultation_checklist(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    booking = latest_booking(db, wa_id)
+    send_text(wa_id, preparation_message(user, booking))
+    record_event(
+        "consultation_checklist_viewed",
+        {"category": getattr(booking, "category", user.category)},
+        user_id=user.id,
+    )
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_legal_guides(ctx: InboundContext):
+    user = ctx.user
+    wa_id = ctx.wa_id
+    send_compiled_menu(wa_id, user, "legal_guides")
+    record_event("legal_guides_opened", user_id=user.id)
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_legal_guide_category(ctx: InboundContext):
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    category_key = interactive_id.split("::", 1)[1]
+    rows = legal_guide_subcategory_rows(user, category_key)
+    if not rows:
+        send_text(wa_id, t(user, "invalid_selection"))
+        return jsonify({"status": "ok"}), 200
+    send_list_picker(
+        wa_id,
+        header=legal_ui(user, "guide_issues"),
+        body=legal_ui(user, "guide_issues_body"),
+        section_title=legal_ui(user, "guide_issues"),
+        rows=rows,
+    )
+    record_event(
+        "legal_guide_category_viewed",
+        {"category": category_key},
+        user_id=user.id,
+    )
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_legal_guide(ctx: InboundContext):
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    guide_category, guide_subcategory = parse_guide_id(interactive_id)
+    if guide_category and guide_subcategory:
+        send_text(
+            wa_id,
+            legal_guide_message(
                 user,
-                user.category
-            )
+                guide_category,
+                guide_subcategory,
+            ),
+        )
+        send_buttons(
+            wa_id,
+            legal_ui(user, "helpful"),
+            guide_feedback_buttons(
+                user,
+                guide_category,
+                guide_subcategory,
+            ),
+        )
+        record_event(
+            "legal_guide_viewed",
+            {
+                "category": guide_category,
+                "subcategory": guide_subcategory,
+            },
+            user_id=user.id,
+        )
+    else:
+        send_text(wa_id, t(user, "invalid_selection"))
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_legal_guide_feedback(ctx: InboundContext):
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    helpful, guide_category, guide_subcategory = (
+        parse_guide_feedback_id(interactive_id)
+    )
+    if not helpful:
+        send_text(wa_id, t(user, "invalid_selection"))
+        return jsonify({"status": "ok"}), 200
+
+    record_event(
+        "legal_guide_feedback",
+        {
+            "helpful": helpful == "yes",
+            "category": guide_category,
+            "subcategory": guide_subcategory,
+        },
+        user_id=user.id,
+    )
+    if helpful == "yes":
+        send_buttons(
+            wa_id,
+            legal_ui(user, "thanks"),
+            [
+                {
+                    "id": MORE_MENU_IDS["guides"],
+                    "title": legal_ui(user, "guide_categories")[:20],
+                },
+                {
+                    "id": "book_now",
+                    "title": legal_ui(user, "book")[:20],
+                },
+            ],
+        )
+    else:
+        send_buttons(
+            wa_id,
+            legal_ui(user, "more_help"),
+            [
+                {
+                    "id": MORE_MENU_IDS["guides"],
+                    "title": legal_ui(user, "guide_categories")[:20],
+                },
+                {
+                    "id": MORE_MENU_IDS["support"],
+                    "title": legal_ui(user, "support")[:20],
+                },
+                {
+                    "id": "book_now",
+                    "title": legal_ui(user, "book")[:20],
+                },
+            ],
+        )
+    return jsonify({"status": "ok"}), 200
 
+
+def _route_privacy_notice(ctx: InboundContext):
+    user = ctx.user
+    wa_id = ctx.wa_id
+    send_text(wa_id, privacy_message(user))
+    record_event("privacy_notice_viewed", user_id=user.id)
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_change_language(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    user.flow_state = ASK_LANGUAGE
+    db.commit()
+    send_language_picker(wa_id, user)
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_support(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    user.flow_state = ASK_SUPPORT_MESSAGE
+    db.commit()
+    latest_support = (
+        db.query(SupportRequest)
+        .filter(SupportRequest.user_id == user.id)
+        .order_by(SupportRequest.id.desc())
+        .first()
+    )
+    if latest_support:
+        send_text(
+            wa_id,
+            t(
+                user,
+                "support_latest_status",
+                ticket_id=f"NSH-{latest_support.id:06d}",
+                status=latest_support.status,
+            ),
+        )
+    send_buttons(
+        wa_id,
+        support_contact_message(user),
+        [
+            {
+                "id": BTN_SUPPORT_CANCEL,
+                "title": t(user, "support_cancel"),
+            }
+        ],
+    )
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_support_message(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    lower_text = ctx.lower_text
+    interactive_id = ctx.interactive_id
+    keywords = ctx.keywords
+    if (
+        interactive_id == BTN_SUPPORT_CANCEL
+        or "restart" in keywords
+    ):
+        user.flow_state = NORMAL
+        db.commit()
+        send_home(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+
+    support_message = text_body.strip()
+    if (
+        interactive_id
+        or len(support_message) < 5
+        or len(support_message) > 2_000
+    ):
+        send_text(wa_id, t(user, "support_request_retry"))
+        return jsonify({"status": "ok"}), 200
+
+    support_request = SupportRequest(
+        user_id=user.id,
+        case_id=user.case_id,
+        request_type="PAYMENT" if "payment" in lower_text else "GENERAL",
+        subject=support_message[:120],
+        message=support_message,
+        sla_due_at=utc_now() + timedelta(hours=SUPPORT_SLA_HOURS),
+    )
+    db.add(support_request)
+    db.flush()
+    job = None
+    if SUPPORT_NOTIFICATION_EMAILS:
+        job = enqueue_job(
+            db,
+            "support_notification",
+            {"support_request_id": support_request.id},
+            dedupe_key=(
+                f"support:{support_request.id}:notification"
+            ),
+        )
+    user.flow_state = NORMAL
+    db.commit()
+    send_text(
+        wa_id,
+        t(
+            user,
+            "support_request_saved",
+            ticket_id=f"NSH-{support_request.id:06d}",
+        ),
+    )
+    record_event(
+        "support_request_created",
+        {"request_type": support_request.request_type},
+        user_id=user.id,
+    )
+    if job:
+        after_commit(db, partial(submit_outbox_job, job.id))
+    send_home(wa_id, user)
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_feedback_rating(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    if interactive_id and interactive_id.startswith("feedback::"):
+        try:
+            rating = int(interactive_id.split("::", 1)[1])
+        except (TypeError, ValueError):
+            rating = 0
+        if rating not in range(1, 6):
+            send_text(wa_id, t(user, "invalid_selection"))
             return jsonify({"status": "ok"}), 200
 
-        # -------------------------------
-        # Sub Category (STRICT & SAFE)
-        # -------------------------------
-        if user.flow_state == ASK_SUBCATEGORY:
-        
-            if not interactive_id:
-                send_text(wa_id, t(user, "subcategory_retry"))
-                send_subcategory_list(db, wa_id, user, user.category)
-                return jsonify({"status": "ok"}), 200
-        
-            if not interactive_id.startswith("subcat::"):
-                logger.info(
-                    "Invalid subcategory input | wa_id=%s | id=%s",
-                    masked_identifier(wa_id),
-                    interactive_id,
-                )
-                send_text(wa_id, t(user, "subcategory_retry"))
-                send_subcategory_list(db, wa_id, user, user.category)
-                return jsonify({"status": "ok"}), 200
-        
-            # Parse ID
-            parsed_category, subcategory = parse_subcategory_id(interactive_id)
-            expected_category = user.category
-        
-            if not expected_category:
-                logger.error(
-                    "Category missing during ASK_SUBCATEGORY | wa_id=%s",
-                    masked_identifier(wa_id),
-                )
-                save_state(db, user, ASK_CATEGORY)
-                send_category_list(wa_id, user)
-                return jsonify({"status": "ok"}), 200
-        
-            if not parsed_category or parsed_category != expected_category:
-                send_text(wa_id, t(user, "subcategory_mismatch"))
-                send_subcategory_list(db, wa_id, user, expected_category)
-                return jsonify({"status": "ok"}), 200
-        
-            # Save subcategory
-            user.subcategory = subcategory
+        booking = latest_booking_with_statuses(
+            db,
+            wa_id,
+            (BookingStatus.COMPLETED,),
+        )
+        feedback = Feedback(
+            user_id=user.id,
+            rating=rating,
+            context_json=json.dumps(
+                {"booking_id": getattr(booking, "id", None)},
+                separators=(",", ":"),
+            ),
+        )
+        db.add(feedback)
+        user.flow_state = ASK_FEEDBACK_COMMENT
+        db.commit()
+        send_buttons(
+            wa_id,
+            t(user, "feedback_comment_prompt"),
+            [
+                {
+                    "id": "feedback_skip",
+                    "title": t(user, "feedback_skip"),
+                }
+            ],
+        )
+        return jsonify({"status": "ok"}), 200
+
+    send_list_picker(
+        wa_id,
+        header=t(user, "feedback_header"),
+        body=t(user, "feedback_body"),
+        section_title=t(user, "feedback_section"),
+        rows=feedback_rows(user),
+    )
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_feedback_comment(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    interactive_id = ctx.interactive_id
+    feedback = (
+        db.query(Feedback)
+        .filter(Feedback.user_id == user.id)
+        .order_by(Feedback.id.desc())
+        .first()
+    )
+    if feedback and interactive_id != "feedback_skip":
+        comment = text_body.strip()
+        if comment:
+            feedback.comment = comment[:1_000]
+    if feedback:
+        feedback.status = "COMPLETED"
+    user.flow_state = NORMAL
+    db.commit()
+    send_text(wa_id, t(user, "feedback_thanks"))
+    record_event(
+        "consultation_feedback_submitted",
+        {"rating": getattr(feedback, "rating", None)},
+        user_id=user.id,
+    )
+    send_home(wa_id, user)
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_ask_ai(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    pending_booking = expire_pending_booking_if_stale(
+        db,
+        latest_booking_with_statuses(
+            db,
+            wa_id,
+            (BookingStatus.PENDING,),
+        ),
+    )
+    if (
+        pending_booking
+        and pending_booking.status == BookingStatus.PENDING
+    ):
+        user.flow_state = WAITING_PAYMENT
+        db.commit()
+        send_pending_payment_options(user, wa_id, pending_booking)
+        return jsonify({"status": "ok"}), 200
+    begin_ai_consent(db, user, wa_id)
+    return jsonify({"status": "ok"}), 200
+
+
+def _route_book_consultation(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    active_paid_booking = latest_booking_with_statuses(
+        db,
+        wa_id,
+        (BookingStatus.PAID,),
+    )
+    _, paid_booking_end = get_booking_window(active_paid_booking)
+    if paid_booking_end and datetime.now(IST) <= paid_booking_end:
+        user.flow_state = PAYMENT_CONFIRMED
+        db.commit()
+        send_text(
+            wa_id,
+            booking_status_message(user, active_paid_booking),
+        )
+        send_text(wa_id, t(user, "post_payment_ai_start"))
+        return jsonify({"status": "ok"}), 200
+
+    pending_booking = expire_pending_booking_if_stale(
+        db,
+        latest_booking_with_statuses(
+            db,
+            wa_id,
+            (BookingStatus.PENDING,),
+        ),
+    )
+    if (
+        pending_booking
+        and pending_booking.status == BookingStatus.PENDING
+    ):
+        user.flow_state = WAITING_PAYMENT
+        db.commit()
+        send_pending_payment_options(user, wa_id, pending_booking)
+        return jsonify({"status": "ok"}), 200
+    begin_booking_scope_review(db, user, wa_id)
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_ai_consent(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    if interactive_id == BTN_AI_CONSENT:
+        paid_booking = latest_booking_with_statuses(
+            db,
+            wa_id,
+            (BookingStatus.PAID,),
+        )
+        _, paid_booking_end = get_booking_window(paid_booking)
+        paid_session_active = bool(
+            paid_booking_end
+            and datetime.now(IST) <= paid_booking_end
+        )
+        user.ai_enabled = True
+        user.flow_state = (
+            PAYMENT_CONFIRMED if paid_session_active else NORMAL
+        )
+        record_user_consent(
+            db,
+            user,
+            purpose="AI_PROCESSING",
+            policy_version=AI_CONSENT_VERSION,
+        )
+        db.commit()
+        record_event(
+            "ai_consent_granted",
+            {"context": "paid" if paid_session_active else "free"},
+            user_id=user.id,
+        )
+        send_text(
+            wa_id,
+            t(
+                user,
+                (
+                    "post_payment_ai_start"
+                    if paid_session_active
+                    else "ask_ai_prompt"
+                ),
+            ),
+        )
+        return jsonify({"status": "ok"}), 200
+
+    if interactive_id == BTN_AI_DECLINE:
+        user.ai_enabled = False
+        user.flow_state = NORMAL
+        db.commit()
+        record_event("ai_consent_declined", user_id=user.id)
+        send_home(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+
+    begin_ai_consent(db, user, wa_id)
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_review_service(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    if interactive_id == BTN_BOOKING_SCOPE_CONTINUE:
+        record_event("booking_started", user_id=user.id)
+        if user.name and user.state_name and user.district_name:
+            send_verification_screen(db, user, wa_id)
+        else:
+            user.flow_state = ASK_NAME
             db.commit()
-        
-            # Analytics
-            record = (
-                db.query(CategoryAnalytics)
-                .filter_by(category=parsed_category, subcategory=subcategory)
-                .first()
+            send_text(wa_id, t(user, "ask_name"))
+        return jsonify({"status": "ok"}), 200
+
+    if interactive_id == BTN_BOOKING_SCOPE_CANCEL:
+        user.flow_state = NORMAL
+        db.commit()
+        send_home(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+
+    begin_booking_scope_review(db, user, wa_id)
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_language(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    if interactive_id in ("lang_en", "lang_hi", "lang_mr"):
+        user.language = interactive_id.replace("lang_", "")
+        db.commit()
+
+        # ✅ Marathi (Greetings)
+        #if user.language == "mr":
+
+        #    if not getattr(user, "marathi_greeted", False):
+        #        send_text(
+        #            wa_id,
+        #           "🙏 जय महाराष्ट्र! 🇮🇳\nआपण NyaySetu मध्ये स्वागत आहे ⚖️"
+        #        )
+        #        user.marathi_greeted = True
+
+        #    db.commit()
+
+        save_state(db, user, ASK_AI_OR_BOOK)
+
+        send_buttons(
+            wa_id,
+            t(user, "ask_ai_or_book"),
+            [
+                {"id": "opt_ai", "title": t(user, "ask_ai")},
+                {"id": "opt_book", "title": t(user, "book_consult")},
+            ],
+        )
+    else:
+        send_language_picker(wa_id, user)
+
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_ai_or_book(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    lower_text = ctx.lower_text
+    interactive_id = ctx.interactive_id
+    keywords = ctx.keywords
+    if interactive_id == "opt_book" or "booking" in keywords:
+        begin_booking_scope_review(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+
+    if interactive_id == "opt_ai" or (
+        interactive_id is None and bool(lower_text)
+    ):
+        begin_ai_consent(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+
+
+def _handle_normal(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    interactive_id = ctx.interactive_id
+    keywords = ctx.keywords
+    if "booking" in keywords or interactive_id == "book_now":
+        begin_booking_scope_review(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+
+
+    if user.ai_enabled:
+
+        if not text_body:
+            return jsonify({"status": "ignored"}), 200
+
+        # -------------------------------------------------
+        # FREE LIMIT CHECK
+        # -------------------------------------------------
+        if user.free_ai_count >= FREE_AI_LIMIT:
+            send_buttons(
+                wa_id,
+                t(user, "free_limit_reached"),
+                [{"id": "book_now", "title": t(user, "book_consult")}],
             )
-        
-            if record:
-                record.count += 1
-            else:
-                db.add(CategoryAnalytics(
-                    category=parsed_category,
-                    subcategory=subcategory,
-                    count=1,
-                ))
-        
-            db.commit()
-        
-            begin_case_brief(db, user, wa_id)
-        
             return jsonify({"status": "ok"}), 200
 
-        # -------------------------------
-        # Structured case brief
-        # -------------------------------
-        if user.flow_state == ASK_BRIEF_SUMMARY:
-            brief = _latest_unattached_case_brief(db, user)
-            summary = (text_body or "").strip()
-            if not brief:
-                begin_case_brief(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
-            if interactive_id or not 20 <= len(summary) <= 700:
-                send_text(wa_id, t(user, "brief_summary_retry"))
-                return jsonify({"status": "ok"}), 200
-            brief.issue_summary = summary
-            send_case_brief_stage(db, user, wa_id, brief)
+        # -------------------------------------------------
+        # AI RATE LIMITING
+        # -------------------------------------------------
+        if is_ai_rate_limited(wa_id):
+            send_text(wa_id, t(user, "ai_cooldown"))
             return jsonify({"status": "ok"}), 200
 
-        if user.flow_state == ASK_BRIEF_STAGE:
-            brief = _latest_unattached_case_brief(db, user)
-            if not brief:
-                begin_case_brief(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
-            stage_values = {
-                "notice": "Notice or demand received",
-                "pre_litigation": "Before court or formal filing",
-                "court": "Court or authority proceeding",
-                "appeal": "Appeal or post-order stage",
-                "other": "Other or unsure",
-            }
-            stage_key = (
-                interactive_id.removeprefix("brief_stage::")
-                if interactive_id
-                and interactive_id.startswith("brief_stage::")
-                else ""
+        # Keep no transaction open across the provider call.
+        commit_now(db)
+        send_typing_on(wa_id)
+
+        try:
+            reply = ai_reply_router(text_body, user)
+        finally:
+            send_typing_off(wa_id)
+
+        user.free_ai_count += 1
+        db.commit()
+
+        # -------------------------------------------------
+        # SOFT BOOKING PROMPT (WITH BUTTON)
+        # -------------------------------------------------
+        if user.free_ai_count == FREE_AI_SOFT_PROMPT_AT:
+
+            send_text(wa_id, reply)            
+            send_buttons(
+                wa_id,
+                t(user, "soft_booking_prompt"),
+                [
+                    {"id": "book_now", "title": t(user, "book_consult")}
+                ],
             )
-            if stage_key not in stage_values:
-                send_text(wa_id, t(user, "brief_stage_retry"))
-                send_case_brief_stage(db, user, wa_id, brief)
-                return jsonify({"status": "ok"}), 200
-            brief.legal_stage = stage_values[stage_key]
-            user.flow_state = ASK_BRIEF_DATES
-            db.commit()
-            send_text(wa_id, t(user, "brief_dates_prompt"))
+
             return jsonify({"status": "ok"}), 200
 
-        if user.flow_state == ASK_BRIEF_DATES:
-            brief = _latest_unattached_case_brief(db, user)
-            value = (text_body or "").strip()
-            if not brief:
-                begin_case_brief(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
-            if interactive_id or not 2 <= len(value) <= 300:
-                send_text(wa_id, t(user, "brief_dates_retry"))
-                return jsonify({"status": "ok"}), 200
-            brief.important_dates = value
-            user.flow_state = ASK_BRIEF_OUTCOME
+        # Normal reply
+        send_text(wa_id, reply)
+        return jsonify({"status": "ok"}), 200
+
+
+    if text_body:
+        send_text(wa_id, t(user, "recovery_menu"))
+        send_home(wa_id, user)
+        return jsonify({"status": "recovery_menu_sent"}), 200
+
+
+    return None
+
+
+def _handle_verify_details(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    if interactive_id == BTN_DETAILS_OK:
+        save_state(db, user, ASK_CATEGORY)
+        send_category_list(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id == BTN_DETAILS_EDIT:
+        save_state(db, user, ASK_NAME)
+        send_text(wa_id, t(user, "ask_name"))
+        return jsonify({"status": "ok"}), 200
+
+    return None
+
+
+def _handle_ask_name(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    if not text_body or len(text_body.strip()) < 2:
+        send_text(wa_id, t(user, "ask_name_retry"))
+        return jsonify({"status": "ok"}), 200
+
+    clean_name = normalize_name(text_body)
+
+    if not clean_name:
+        send_text(
+            wa_id,
+            t(user, "name_invalid")
+        )
+        return jsonify({"status": "ok"}), 200
+
+    user.name = clean_name
+    db.commit()        
+
+    # ✅ ALL users → ask DISTRICT directly
+    save_state(db, user, ASK_DISTRICT)
+
+    send_text(
+        wa_id,
+        t(user, "ask_district_text")            
+    )
+
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_district(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    interactive_id = ctx.interactive_id
+    if interactive_id and interactive_id.startswith("loc::"):
+        parts = interactive_id.split("::", 2)
+        if len(parts) == 3 and all(parts[1:]):
+            user.temp_district = parts[1]
+            user.temp_state = parts[2]
+            user.flow_state = CONFIRM_LOCATION
             db.commit()
-            send_text(wa_id, t(user, "brief_outcome_prompt"))
+            send_buttons(
+                wa_id,
+                (
+                    f"{t(user, 'location_found')}\n"
+                    f"*{parts[1]}, {parts[2]}*\n\n"
+                    f"{t(user, 'confirm_location')}"
+                ),
+                [
+                    {
+                        "id": "loc_yes",
+                        "title": f"✅ {t(user, 'confirm_yes')}",
+                    },
+                    {
+                        "id": "loc_change",
+                        "title": f"✏️ {t(user, 'confirm_change')}",
+                    },
+                ],
+            )
             return jsonify({"status": "ok"}), 200
 
-        if user.flow_state == ASK_BRIEF_OUTCOME:
-            brief = _latest_unattached_case_brief(db, user)
-            value = (text_body or "").strip()
-            if not brief:
-                begin_case_brief(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
-            if interactive_id or not 10 <= len(value) <= 500:
-                send_text(wa_id, t(user, "brief_outcome_retry"))
-                return jsonify({"status": "ok"}), 200
-            brief.desired_outcome = value
-            send_case_brief_urgency(db, user, wa_id)
-            return jsonify({"status": "ok"}), 200
+    if not text_body:
+        send_text(
+            wa_id,
+            t(user, "ask_district_text")            
+        )
+        return jsonify({"status": "ok"}), 200
+
+    district, state, confidence = detect_district_and_state(text_body)
+
+    # -------------------------------
+    # HIGH CONFIDENCE
+    # -------------------------------
+    if confidence == "HIGH":
+        user.temp_district = district
+        user.temp_state = state
+        db.commit()
+
+        save_state(db, user, CONFIRM_LOCATION)
+
+        msg = (
+            f"{t(user, 'location_found')}\n"
+            f"*{district}, {state}*\n\n"
+            f"{t(user, 'confirm_location')}"
+        )
+
+        send_buttons(
+            wa_id,
+            msg,
+            [
+                {"id": "loc_yes", "title": f"✅ {t(user, 'confirm_yes')}"},
+                {"id": "loc_change", "title": f"✏️ {t(user, 'confirm_change')}"},
+            ],
+        )
+
+        return jsonify({"status": "ok"}), 200
+
+    # -------------------------------
+    # MULTIPLE MATCHES
+    # -------------------------------
+    if confidence == "MULTIPLE":
+        rows = [
+            {
+                "id": f"loc::{match_district}::{match_state}",
+                "title": match_district,
+                "description": match_state,
+            }
+            for _, match_district, match_state in district[:10]
+        ]
+        send_list_picker(
+            wa_id,
+            header=t(user, "choose_district"),
+            body=t(user, "district_multiple_matches"),
+            section_title=t(user, "choose_district"),
+            rows=rows,
+        )
+        return jsonify({"status": "ok"}), 200
+
+    # -------------------------------
+    # LOW CONFIDENCE
+    # -------------------------------
+    send_text(
+        wa_id,
+        t(user, "district_not_identified")
+    )
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_confirm_location(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+
+    if interactive_id == "loc_yes":
+        user.district_name = user.temp_district
+        user.state_name = user.temp_state
+
+        user.temp_district = None
+        user.temp_state = None
+        db.commit()
+
+        save_state(db, user, ASK_CATEGORY)
+        send_category_list(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+
+    if interactive_id == "loc_change":
+        user.temp_district = None
+        user.temp_state = None
+        db.commit()
+
+        save_state(db, user, ASK_DISTRICT)
+        send_text(
+            wa_id,
+            t(user, "district_retry")
+        )
+        return jsonify({"status": "ok"}), 200        
+
+    if user.temp_district and user.temp_state:
+        send_buttons(
+            wa_id,
+            (
+                f"{t(user, 'location_found')}\n"
+                f"*{user.temp_district}, {user.temp_state}*\n\n"
+                f"{t(user, 'confirm_location')}"
+            ),
+            [
+                {"id": "loc_yes", "title": f"✅ {t(user, 'confirm_yes')}"},
+                {
+                    "id": "loc_change",
+                    "title": f"✏️ {t(user, 'confirm_change')}",
+                },
+            ],
+        )
+    else:
+        user.flow_state = ASK_DISTRICT
+        db.commit()
+        send_text(wa_id, t(user, "district_retry"))
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_category(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    interactive_id = ctx.interactive_id
+    category = None
+
+    # ---------------------------------
+    # Category selected from list
+    # ---------------------------------
+    if interactive_id and interactive_id.startswith("cat_"):
+        category = interactive_id.replace("cat_", "")
+
+    # ---------------------------------
+    # Ignore empty / status events
+    # ---------------------------------
+    if not category and not text_body:
+        return jsonify({"status": "ignored"}), 200
+
+    # ---------------------------------
+    # Still invalid → ask again
+    # ---------------------------------
+    if not category:
+        send_text(wa_id, t(user, "category_retry"))
+        send_category_list(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+
+    # ---------------------------------
+    # Save category & move forward
+    # ---------------------------------
+
+    user.category = category
+    db.commit()
+
+    save_state(db, user, ASK_SUBCATEGORY)
+
+    # category is already normalized key
+    send_subcategory_list(
+        db,
+        wa_id,
+        user,
+        user.category
+    )
+
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_subcategory(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+
+    if not interactive_id:
+        send_text(wa_id, t(user, "subcategory_retry"))
+        send_subcategory_list(db, wa_id, user, user.category)
+        return jsonify({"status": "ok"}), 200
+
+    if not interactive_id.startswith("subcat::"):
+        logger.info(
+            "Invalid subcategory input | wa_id=%s | id=%s",
+            masked_identifier(wa_id),
+            interactive_id,
+        )
+        send_text(wa_id, t(user, "subcategory_retry"))
+        send_subcategory_list(db, wa_id, user, user.category)
+        return jsonify({"status": "ok"}), 200
+
+    # Parse ID
+    parsed_category, subcategory = parse_subcategory_id(interactive_id)
+    expected_category = user.category
+
+    if not expected_category:
+        logger.error(
+            "Category missing during ASK_SUBCATEGORY | wa_id=%s",
+            masked_identifier(wa_id),
+        )
+        save_state(db, user, ASK_CATEGORY)
+        send_category_list(wa_id, user)
+        return jsonify({"status": "ok"}), 200
 
-        if user.flow_state == ASK_BRIEF_URGENCY:
-            brief = _latest_unattached_case_brief(db, user)
-            if not brief:
-                begin_case_brief(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
-            urgency_values = {
-                "standard": "Standard",
-                "time_sensitive": "Time-sensitive",
-                "immediate_safety": "Immediate safety concern",
-            }
-            urgency_key = (
-                interactive_id.removeprefix("brief_urgency::")
-                if interactive_id
-                and interactive_id.startswith("brief_urgency::")
-                else ""
-            )
-            if urgency_key not in urgency_values:
-                send_case_brief_urgency(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
-            brief.urgency = urgency_values[urgency_key]
-            if urgency_key == "immediate_safety":
-                user.flow_state = ASK_BRIEF_SAFETY
-                db.commit()
-                send_text(wa_id, t(user, "brief_safety_prompt"))
-            else:
-                brief.safety_concerns = "None disclosed"
-                user.flow_state = ASK_BRIEF_DOCUMENTS
-                db.commit()
-                send_text(wa_id, t(user, "brief_documents_prompt"))
-            return jsonify({"status": "ok"}), 200
+    if not parsed_category or parsed_category != expected_category:
+        send_text(wa_id, t(user, "subcategory_mismatch"))
+        send_subcategory_list(db, wa_id, user, expected_category)
+        return jsonify({"status": "ok"}), 200
 
-        if user.flow_state == ASK_BRIEF_SAFETY:
-            brief = _latest_unattached_case_brief(db, user)
-            value = (text_body or "").strip()
-            if not brief:
-                begin_case_brief(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
-            if interactive_id or not 10 <= len(value) <= 500:
-                send_text(wa_id, t(user, "brief_safety_retry"))
-                return jsonify({"status": "ok"}), 200
-            brief.safety_concerns = value
-            user.flow_state = ASK_BRIEF_DOCUMENTS
-            db.commit()
-            send_text(wa_id, t(user, "brief_documents_prompt"))
-            return jsonify({"status": "ok"}), 200
+    # Save subcategory
+    user.subcategory = subcategory
+    category_tally.add(
+        db,
+        category=parsed_category,
+        subcategory=subcategory,
+    )
+    db.commit()
 
-        if user.flow_state == ASK_BRIEF_DOCUMENTS:
-            brief = _latest_unattached_case_brief(db, user)
-            documents = _parse_case_brief_documents(text_body or "")
-            if not brief:
-                begin_case_brief(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
-            if interactive_id or documents is None:
-                send_text(wa_id, t(user, "brief_documents_retry"))
-                return jsonify({"status": "ok"}), 200
-            brief.documents_json = json.dumps(documents, ensure_ascii=False)
-            user.flow_state = ASK_BRIEF_OPPOSING_PARTY
-            db.commit()
-            send_text(wa_id, t(user, "brief_opposing_prompt"))
-            return jsonify({"status": "ok"}), 200
+    begin_case_brief(db, user, wa_id)
+
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_brief_summary(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    interactive_id = ctx.interactive_id
+    brief = _latest_unattached_case_brief(db, user)
+    summary = (text_body or "").strip()
+    if not brief:
+        begin_case_brief(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id or not 20 <= len(summary) <= 700:
+        send_text(wa_id, t(user, "brief_summary_retry"))
+        return jsonify({"status": "ok"}), 200
+    brief.issue_summary = summary
+    send_case_brief_stage(db, user, wa_id, brief)
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_brief_stage(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    brief = _latest_unattached_case_brief(db, user)
+    if not brief:
+        begin_case_brief(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+    stage_values = {
+        "notice": "Notice or demand received",
+        "pre_litigation": "Before court or formal filing",
+        "court": "Court or authority proceeding",
+        "appeal": "Appeal or post-order stage",
+        "other": "Other or unsure",
+    }
+    stage_key = (
+        interactive_id.removeprefix("brief_stage::")
+        if interactive_id
+        and interactive_id.startswith("brief_stage::")
+        else ""
+    )
+    if stage_key not in stage_values:
+        send_text(wa_id, t(user, "brief_stage_retry"))
+        send_case_brief_stage(db, user, wa_id, brief)
+        return jsonify({"status": "ok"}), 200
+    brief.legal_stage = stage_values[stage_key]
+    user.flow_state = ASK_BRIEF_DATES
+    db.commit()
+    send_text(wa_id, t(user, "brief_dates_prompt"))
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_brief_dates(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    interactive_id = ctx.interactive_id
+    brief = _latest_unattached_case_brief(db, user)
+    value = (text_body or "").strip()
+    if not brief:
+        begin_case_brief(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id or not 2 <= len(value) <= 300:
+        send_text(wa_id, t(user, "brief_dates_retry"))
+        return jsonify({"status": "ok"}), 200
+    brief.important_dates = value
+    user.flow_state = ASK_BRIEF_OUTCOME
+    db.commit()
+    send_text(wa_id, t(user, "brief_outcome_prompt"))
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_brief_outcome(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    interactive_id = ctx.interactive_id
+    brief = _latest_unattached_case_brief(db, user)
+    value = (text_body or "").strip()
+    if not brief:
+        begin_case_brief(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id or not 10 <= len(value) <= 500:
+        send_text(wa_id, t(user, "brief_outcome_retry"))
+        return jsonify({"status": "ok"}), 200
+    brief.desired_outcome = value
+    send_case_brief_urgency(db, user, wa_id)
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_brief_urgency(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    brief = _latest_unattached_case_brief(db, user)
+    if not brief:
+        begin_case_brief(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+    urgency_values = {
+        "standard": "Standard",
+        "time_sensitive": "Time-sensitive",
+        "immediate_safety": "Immediate safety concern",
+    }
+    urgency_key = (
+        interactive_id.removeprefix("brief_urgency::")
+        if interactive_id
+        and interactive_id.startswith("brief_urgency::")
+        else ""
+    )
+    if urgency_key not in urgency_values:
+        send_case_brief_urgency(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+    brief.urgency = urgency_values[urgency_key]
+    if urgency_key == "immediate_safety":
+        user.flow_state = ASK_BRIEF_SAFETY
+        db.commit()
+        send_text(wa_id, t(user, "brief_safety_prompt"))
+    else:
+        brief.safety_concerns = "None disclosed"
+        user.flow_state = ASK_BRIEF_DOCUMENTS
+        db.commit()
+        send_text(wa_id, t(user, "brief_documents_prompt"))
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_brief_safety(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    interactive_id = ctx.interactive_id
+    brief = _latest_unattached_case_brief(db, user)
+    value = (text_body or "").strip()
+    if not brief:
+        begin_case_brief(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id or not 10 <= len(value) <= 500:
+        send_text(wa_id, t(user, "brief_safety_retry"))
+        return jsonify({"status": "ok"}), 200
+    brief.safety_concerns = value
+    user.flow_state = ASK_BRIEF_DOCUMENTS
+    db.commit()
+    send_text(wa_id, t(user, "brief_documents_prompt"))
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_brief_documents(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    interactive_id = ctx.interactive_id
+    brief = _latest_unattached_case_brief(db, user)
+    documents = _parse_case_brief_documents(text_body or "")
+    if not brief:
+        begin_case_brief(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id or documents is None:
+        send_text(wa_id, t(user, "brief_documents_retry"))
+        return jsonify({"status": "ok"}), 200
+    brief.documents_json = json.dumps(documents, ensure_ascii=False)
+    user.flow_state = ASK_BRIEF_OPPOSING_PARTY
+    db.commit()
+    send_text(wa_id, t(user, "brief_opposing_prompt"))
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_brief_opposing_party(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
+    interactive_id = ctx.interactive_id
+    brief = _latest_unattached_case_brief(db, user)
+    value = (text_body or "").strip()
+    if not brief:
+        begin_case_brief(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id or not 2 <= len(value) <= 240:
+        send_text(wa_id, t(user, "brief_opposing_retry"))
+        return jsonify({"status": "ok"}), 200
+    if value.casefold() in {
+        "skip", "none", "na", "n/a", "nahi", "नाही", "नहीं"
+    }:
+        value = "None disclosed"
+    brief.opposing_party = value
+    send_case_brief_review(db, user, wa_id, brief)
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_review_case_brief(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    brief = _latest_unattached_case_brief(db, user)
+    if not brief:
+        begin_case_brief(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id == BTN_BRIEF_EDIT:
+        brief.issue_summary = None
+        brief.legal_stage = None
+        brief.important_dates = None
+        brief.desired_outcome = None
+        brief.urgency = None
+        brief.safety_concerns = None
+        brief.opposing_party = None
+        brief.documents_json = "[]"
+        user.flow_state = ASK_BRIEF_SUMMARY
+        db.commit()
+        send_text(wa_id, t(user, "brief_summary_prompt"))
+        return jsonify({"status": "ok"}), 200
+    if interactive_id == BTN_BRIEF_CANCEL:
+        brief.status = "CANCELLED"
+        clear_booking_draft(user)
+        user.flow_state = NORMAL
+        db.commit()
+        send_text(wa_id, t(user, "brief_cancelled"))
+        send_home(wa_id, user)
+        return jsonify({"status": "ok"}), 200
+    if interactive_id != BTN_BRIEF_CONFIRM:
+        send_case_brief_review(db, user, wa_id, brief)
+        return jsonify({"status": "ok"}), 200
+    now = utc_now()
+    brief.status = "CONFIRMED"
+    brief.consent_version = CASE_BRIEF_CONSENT_VERSION
+    brief.consented_at = now
+    brief.confirmed_at = now
+    record_user_consent(
+        db,
+        user,
+        purpose="ADVOCATE_CASE_BRIEF_SHARING",
+        policy_version=CASE_BRIEF_CONSENT_VERSION,
+    )
+    user.flow_state = ASK_DATE
+    db.commit()
+    send_text(wa_id, t(user, "brief_confirmed"))
+    send_available_dates(db, user, wa_id)
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_date(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    # ---------------------------------
+    # Ignore empty / status events
+    # ---------------------------------
+    if not interactive_id:
+        send_text(wa_id, t(user, "select_date_retry"))
+        send_available_dates(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
+
+    # ---------------------------------
+    # Date selected from list
+    # ---------------------------------
+    if not interactive_id.startswith("date_"):
+        send_text(wa_id, t(user, "select_date_retry"))
+        return jsonify({"status": "ok"}), 200
+
+    date_str = interactive_id.replace("date_", "").strip()
+
+    # ---------------------------------
+    # Validate date format
+    # ---------------------------------
 
-        if user.flow_state == ASK_BRIEF_OPPOSING_PARTY:
-            brief = _latest_unattached_case_brief(db, user)
-            value = (text_body or "").strip()
-            if not brief:
-                begin_case_brief(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
-            if interactive_id or not 2 <= len(value) <= 240:
-                send_text(wa_id, t(user, "brief_opposing_retry"))
-                return jsonify({"status": "ok"}), 200
-            if value.casefold() in {
-                "skip", "none", "na", "n/a", "nahi", "नाही", "नहीं"
-            }:
-                value = "None disclosed"
-            brief.opposing_party = value
-            send_case_brief_review(db, user, wa_id, brief)
-            return jsonify({"status": "ok"}), 200
+    try:
+        selected_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+        today = datetime.now(IST).date()
 
-        if user.flow_state == REVIEW_CASE_BRIEF:
-            brief = _latest_unattached_case_brief(db, user)
-            if not brief:
-                begin_case_brief(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
-            if interactive_id == BTN_BRIEF_EDIT:
-                brief.issue_summary = None
-                brief.legal_stage = None
-                brief.important_dates = None
-                brief.desired_outcome = None
-                brief.urgency = None
-                brief.safety_concerns = None
-                brief.opposing_party = None
-                brief.documents_json = "[]"
-                user.flow_state = ASK_BRIEF_SUMMARY
-                db.commit()
-                send_text(wa_id, t(user, "brief_summary_prompt"))
-                return jsonify({"status": "ok"}), 200
-            if interactive_id == BTN_BRIEF_CANCEL:
-                brief.status = "CANCELLED"
-                clear_booking_draft(user)
-                user.flow_state = NORMAL
-                db.commit()
-                send_text(wa_id, t(user, "brief_cancelled"))
-                send_home(wa_id, user)
-                return jsonify({"status": "ok"}), 200
-            if interactive_id != BTN_BRIEF_CONFIRM:
-                send_case_brief_review(db, user, wa_id, brief)
-                return jsonify({"status": "ok"}), 200
-            now = utc_now()
-            brief.status = "CONFIRMED"
-            brief.consent_version = CASE_BRIEF_CONSENT_VERSION
-            brief.consented_at = now
-            brief.confirmed_at = now
-            record_user_consent(
-                db,
-                user,
-                purpose="ADVOCATE_CASE_BRIEF_SHARING",
-                policy_version=CASE_BRIEF_CONSENT_VERSION,
-            )
-            user.flow_state = ASK_DATE
-            db.commit()
-            send_text(wa_id, t(user, "brief_confirmed"))
+        if selected_date < today:
+            send_text(wa_id, t(user, "past_date_error"))
             send_available_dates(db, user, wa_id)
             return jsonify({"status": "ok"}), 200
 
-        
-        # -------------------------------
-        # Date (STRICT & SAFE)
-        # -------------------------------
-        if user.flow_state == ASK_DATE:
-            # ---------------------------------
-            # Ignore empty / status events
-            # ---------------------------------
-            if not interactive_id:
-                send_text(wa_id, t(user, "select_date_retry"))
-                send_available_dates(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
-        
-            # ---------------------------------
-            # Date selected from list
-            # ---------------------------------
-            if not interactive_id.startswith("date_"):
-                send_text(wa_id, t(user, "select_date_retry"))
-                return jsonify({"status": "ok"}), 200
-        
-            date_str = interactive_id.replace("date_", "").strip()
-        
-            # ---------------------------------
-            # Validate date format
-            # ---------------------------------
-        
-            try:
-                selected_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-                today = datetime.now(IST).date()
-            
-                if selected_date < today:
-                    send_text(wa_id, t(user, "past_date_error"))
-                    send_available_dates(db, user, wa_id)
-                    return jsonify({"status": "ok"}), 200
-            
-            except ValueError:
-                send_text(wa_id, t(user, "invalid_date"))
-                return jsonify({"status": "ok"}), 200
-            # ---------------------------------
-            # Save date & move forward
-            # ---------------------------------
-            
-            user.temp_date = date_str
-            user.flow_state = ASK_SLOT
-            db.commit()
-            if not send_available_slots(db, user, wa_id, date_str):
-                user.flow_state = ASK_DATE
-                db.commit()
-                send_available_dates(db, user, wa_id)
-        
-            return jsonify({"status": "ok"}), 200
-            
-        # -------------------------------
-        # Slot (STRICT & SAFE)
-        # -------------------------------
-        if user.flow_state == ASK_SLOT:
-            # ---------------------------------
-            # Ignore empty / status events
-            # ---------------------------------
-            if not interactive_id:
-                send_text(wa_id, t(user, "slot_retry"))
-                send_available_slots(db, user, wa_id, user.temp_date)
-                return jsonify({"status": "ok"}), 200
+    except ValueError:
+        send_text(wa_id, t(user, "invalid_date"))
+        return jsonify({"status": "ok"}), 200
+    # ---------------------------------
+    # Save date & move forward
+    # ---------------------------------
+
+    user.temp_date = date_str
+    user.flow_state = ASK_SLOT
+    db.commit()
+    if not send_available_slots(db, user, wa_id, date_str):
+        user.flow_state = ASK_DATE
+        db.commit()
+        send_available_dates(db, user, wa_id)
+
+    return jsonify({"status": "ok"}), 200
+
+
+def _handle_ask_slot(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    # ---------------------------------
+    # Ignore empty / status events
+    # ---------------------------------
+    if not interactive_id:
+        send_text(wa_id, t(user, "slot_retry"))
+        send_available_slots(db, user, wa_id, user.temp_date)
+        return jsonify({"status": "ok"}), 200
+
+    # ---------------------------------
+    # SAFETY: User clicked a DATE again
+    # ---------------------------------
+    if interactive_id.startswith("date_"):
+        save_state(db, user, ASK_DATE)
+        return jsonify({"status": "ok"}), 200
+
+    # ---------------------------------
+    # Validate slot selection
+    # ---------------------------------
+    if not interactive_id.startswith("slot_"):
+        send_text(wa_id, t(user, "slot_retry"))
+        return jsonify({"status": "ok"}), 200
+
+    slot_code = interactive_id.replace("slot_", "").strip()
+
+    # ---------------------------------
+    # Validate slot exists
+    # ---------------------------------
+    if slot_code not in SLOT_MAP:
+        send_text(wa_id, t(user, "invalid_slot"))
+        send_available_slots(db, user, wa_id, user.temp_date)
+        return jsonify({"status": "ok"}), 200
+
+    required_fields = [
+        user.name,
+        user.state_name,
+        user.district_name,
+        user.category,
+        user.temp_date,
+    ]
+    if not all(required_fields):
+        user.flow_state = ASK_NAME
+        db.commit()
+        send_text(wa_id, t(user, "booking_missing"))
+        return jsonify({"status": "ok"}), 200
 
-            # ---------------------------------
-            # SAFETY: User clicked a DATE again
-            # ---------------------------------
-            if interactive_id.startswith("date_"):
-                save_state(db, user, ASK_DATE)
-                return jsonify({"status": "ok"}), 200
-        
-            # ---------------------------------
-            # Validate slot selection
-            # ---------------------------------
-            if not interactive_id.startswith("slot_"):
-                send_text(wa_id, t(user, "slot_retry"))
-                return jsonify({"status": "ok"}), 200
-        
-            slot_code = interactive_id.replace("slot_", "").strip()
-        
-            # ---------------------------------
-            # Validate slot exists
-            # ---------------------------------
-            if slot_code not in SLOT_MAP:
-                send_text(wa_id, t(user, "invalid_slot"))
-                send_available_slots(db, user, wa_id, user.temp_date)
-                return jsonify({"status": "ok"}), 200
-        
-            required_fields = [
-                user.name,
-                user.state_name,
-                user.district_name,
-                user.category,
-                user.temp_date,
-            ]
-            if not all(required_fields):
-                user.flow_state = ASK_NAME
-                db.commit()
-                send_text(wa_id, t(user, "booking_missing"))
-                return jsonify({"status": "ok"}), 200
+    user.temp_slot = slot_code
+    db.commit()
+    send_booking_review(db, user, wa_id)
+    record_event(
+        "booking_review_viewed",
+        {
+            "category": user.category,
+            "date": user.temp_date,
+            "slot": slot_code,
+        },
+        user_id=user.id,
+    )
+    return jsonify({"status": "ok"}), 200
 
-            user.temp_slot = slot_code
-            db.commit()
-            send_booking_review(db, user, wa_id)
-            record_event(
-                "booking_review_viewed",
-                {
-                    "category": user.category,
-                    "date": user.temp_date,
-                    "slot": slot_code,
-                },
-                user_id=user.id,
-            )
-            return jsonify({"status": "ok"}), 200
 
-        # -------------------------------
-        # Review before creating payment link
-        # -------------------------------
-        if user.flow_state == REVIEW_BOOKING:
-            if interactive_id == BTN_REVIEW_CHANGE_TIME:
-                user.temp_slot = None
-                user.flow_state = ASK_DATE
-                db.commit()
-                send_available_dates(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
+def _handle_review_booking(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    interactive_id = ctx.interactive_id
+    if interactive_id == BTN_REVIEW_CHANGE_TIME:
+        user.temp_slot = None
+        user.flow_state = ASK_DATE
+        db.commit()
+        send_available_dates(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
 
-            if interactive_id == BTN_REVIEW_CANCEL:
-                _cancel_unattached_case_briefs(db, user)
-                clear_booking_draft(user)
-                user.flow_state = NORMAL
-                db.commit()
-                send_text(wa_id, t(user, "booking_cancelled_before_payment"))
-                send_home(wa_id, user)
-                record_event("booking_cancelled_before_payment", user_id=user.id)
-                return jsonify({"status": "ok"}), 200
+    if interactive_id == BTN_REVIEW_CANCEL:
+        _cancel_unattached_case_briefs(db, user)
+        clear_booking_draft(user)
+        user.flow_state = NORMAL
+        db.commit()
+        send_text(wa_id, t(user, "booking_cancelled_before_payment"))
+        send_home(wa_id, user)
+        record_event("booking_cancelled_before_payment", user_id=user.id)
+        return jsonify({"status": "ok"}), 200
 
-            if interactive_id != BTN_REVIEW_PAY:
-                send_booking_review(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
+    if interactive_id != BTN_REVIEW_PAY:
+        send_booking_review(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
 
-            record_user_consent(
-                db,
-                user,
-                purpose="BOOKING_PAYMENT",
-                policy_version=BOOKING_TERMS_VERSION,
-            )
-            booking, payment_link = create_booking_temp(
-                db=db,
-                user=user,
-                name=user.name,
-                state=user.state_name,
-                district=user.district_name,
-                category=user.category,
-                subcategory=user.subcategory,
-                date=user.temp_date,
-                slot_code=user.temp_slot,
-            )
+    record_user_consent(
+        db,
+        user,
+        purpose="BOOKING_PAYMENT",
+        policy_version=BOOKING_TERMS_VERSION,
+    )
+    booking, payment_link = create_booking_temp(
+        db=db,
+        user=user,
+        name=user.name,
+        state=user.state_name,
+        district=user.district_name,
+        category=user.category,
+        subcategory=user.subcategory,
+        date=user.temp_date,
+        slot_code=user.temp_slot,
+    )
 
-            if not booking:
-                user.temp_slot = None
-                user.flow_state = ASK_DATE
-                db.commit()
-                send_text(wa_id, f"⚠️ {payment_link}")
-                send_available_dates(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
+    if not booking:
+        user.temp_slot = None
+        user.flow_state = ASK_DATE
+        db.commit()
+        send_text(wa_id, f"⚠️ {payment_link}")
+        send_available_dates(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
 
-            _attach_confirmed_case_brief(db, user, booking)
-            user.last_payment_link = payment_link
-            user.flow_state = WAITING_PAYMENT
-            db.commit()
-            send_buttons(
-                wa_id,
-                t(user, "payment_waiting_help"),
-                [
-                    {
-                        "id": MORE_MENU_IDS["status"],
-                        "title": t(user, "check_payment_status"),
-                    },
-                    {
-                        "id": "payment_help",
-                        "title": t(user, "payment_help"),
-                    },
-                ],
-            )
-            send_text(
-                wa_id,
-                f"💳 {t(user, 'payment_link_text')}\n{payment_link}",
-            )
-            record_event(
-                "payment_link_created",
-                {
-                    "booking_id": booking.id,
-                    "category": booking.category,
-                    "amount": booking.amount,
-                },
-                user_id=user.id,
-            )
-            return jsonify({"status": "ok"}), 200
+    _attach_confirmed_case_brief(db, user, booking)
+    user.last_payment_link = payment_link
+    user.flow_state = WAITING_PAYMENT
+    db.commit()
+    send_buttons(
+        wa_id,
+        t(user, "payment_waiting_help"),
+        [
+            {
+                "id": MORE_MENU_IDS["status"],
+                "title": t(user, "check_payment_status"),
+            },
+            {
+                "id": "payment_help",
+                "title": t(user, "payment_help"),
+            },
+        ],
+    )
+    send_text(
+        wa_id,
+        f"💳 {t(user, 'payment_link_text')}\n{payment_link}",
+    )
+    record_event(
+        "payment_link_created",
+        {
+            "booking_id": booking.id,
+            "category": booking.category,
+            "amount": booking.amount,
+        },
+        user_id=user.id,
+    )
+    return jsonify({"status": "ok"}), 200
 
-        # ===============================
-        # WAITING PAYMENT (SAFE MODE)
-        # ===============================
-        if user.flow_state == WAITING_PAYMENT:
-        
-            # Ignore delivery/status callbacks
-            if not text_body:
-                return jsonify({"status": "ignored"}), 200
-        
-            booking = latest_booking(db, wa_id)
-            if booking and booking.status == BookingStatus.EXPIRED:
-                clear_booking_draft(user)
-                user.flow_state = ASK_DATE
-                db.commit()
-                send_text(wa_id, t(user, "booking_status_expired"))
-                send_available_dates(db, user, wa_id)
-                return jsonify({"status": "ok"}), 200
 
-            # Resend payment options without trapping the user away from help.
-            send_pending_payment_options(user, wa_id, booking)
+def _handle_waiting_payment(ctx: InboundContext):
+    db = ctx.db
+    user = ctx.user
+    wa_id = ctx.wa_id
+    text_body = ctx.text_body
 
-            return jsonify({"status": "ok"}), 200
+    # Ignore delivery/status callbacks
+    if not text_body:
+        return jsonify({"status": "ignored"}), 200
 
-                
-        # -------------------------------
-        # Default fallback (safe)
-        # -------------------------------
-        if user.flow_state == NORMAL and text_body:
-            send_text(wa_id, t(user, "recovery_menu"))
-            send_home(wa_id, user)
-            return jsonify({"status": "recovery_menu_sent"}), 200
+    booking = expire_pending_booking_if_stale(
+        db,
+        latest_booking(db, wa_id),
+    )
+    if booking and booking.status == BookingStatus.EXPIRED:
+        clear_booking_draft(user)
+        user.flow_state = ASK_DATE
+        db.commit()
+        send_text(wa_id, t(user, "booking_status_expired"))
+        send_available_dates(db, user, wa_id)
+        return jsonify({"status": "ok"}), 200
 
-        return jsonify({"status": "ignored"}), 200
-    except WhatsAppDeliveryError as exc:
-        completed, job_id = complete_inbound_after_delivery_failure(
-            db,
-            message_id,
-            exc,
-        )
-        if completed:
-            # after_request must not overwrite the delivery outcome or perform
-            # a second terminal-state transaction.
-            g.inbound_message_claimed = False
-            if job_id is not None:
-                submit_outbox_job(job_id)
-            logger.warning(
-                "Inbound business state preserved after outbound failure | "
-                "request_id=%s | retry_queued=%s | ambiguous=%s",
-                g.request_id,
-                job_id is not None,
-                exc.ambiguous,
-            )
-            return (
-                jsonify(
-                    {
-                        "status": (
-                            "delivery_queued"
-                            if job_id is not None
-                            else "delivery_not_retried"
-                        )
-                    }
-                ),
-                200,
-            )
+    # Resend payment options without trapping the user away from help.
+    send_pending_payment_options(user, wa_id, booking)
 
-        db.rollback()
-        fail_inbound_message(message_id, "OutboundDeliveryPersistenceError")
-        logger.exception(
-            "Failed outbound delivery could not be persisted | request_id=%s",
-            g.request_id,
-        )
-        return jsonify({"status": "retry"}), 503
-    except Exception:
-        # Roll back partial work and fail the lease-aware claim. Meta can retry
-        # a transient failure instead of the event being lost forever.
-        try:
-            db.rollback()
-        except Exception:
-            pass
+    return jsonify({"status": "ok"}), 200
+
+
+_DOCUMENT_ROUTES = {
+    DOCUMENT_STUDIO_IDS["back"]: _route_document_back,
+    DOCUMENT_STUDIO_IDS["create"]: _route_document_create,
+    DOCUMENT_PRODUCT_ID_PREFIX: _route_document_product,
+    DOCUMENT_START_ID_PREFIX: _route_document_start,
+    DOCUMENT_STUDIO_IDS["continue"]: _route_document_continue,
+    DOCUMENT_STUDIO_IDS["mine"]: _route_document_mine,
+    DOCUMENT_STUDIO_IDS["help"]: _route_document_help,
+}
+_DOCUMENT_FLOW_HANDLERS = {
+    DOCUMENT_STUDIO_QUESTION: _handle_document_question,
+    DOCUMENT_STUDIO_REVIEW: _handle_document_review,
+}
+_MENU_ROUTES = {
+    HOME_BUTTON_IDS["more"]: _route_more_menu,
+    "home_more": _route_more_menu,
+    MORE_MENU_IDS["status"]: _route_appointment_status,
+    MORE_MENU_IDS["prepare"]: _route_consultation_checklist,
+    MORE_MENU_IDS["guides"]: _route_legal_guides,
+    "guidecat::": _route_legal_guide_category,
+    "guide::": _route_legal_guide,
+    "guidefb::": _route_legal_guide_feedback,
+    MORE_MENU_IDS["privacy"]: _route_privacy_notice,
+    MORE_MENU_IDS["language"]: _route_change_language,
+    MORE_MENU_IDS["support"]: _route_support,
+    "payment_help": _route_support,
+}
+_SUPPORT_FLOW_HANDLERS = {
+    ASK_SUPPORT_MESSAGE: _handle_ask_support_message,
+    ASK_FEEDBACK_RATING: _handle_ask_feedback_rating,
+    ASK_FEEDBACK_COMMENT: _handle_ask_feedback_comment,
+}
+_HOME_ACTION_ROUTES = {
+    HOME_BUTTON_IDS["ask_ai"]: _route_ask_ai,
+    BTN_ASK_AI: _route_ask_ai,
+    HOME_BUTTON_IDS["book"]: _route_book_consultation,
+    BTN_BOOK_CONSULT: _route_book_consultation,
+    "book_now": _route_book_consultation,
+}
+_CONSENT_FLOW_HANDLERS = {
+    ASK_AI_CONSENT: _handle_ask_ai_consent,
+    REVIEW_SERVICE: _handle_review_service,
+}
+FLOW_STATE_HANDLERS = {
+    ASK_LANGUAGE: _handle_ask_language,
+    ASK_AI_OR_BOOK: _handle_ask_ai_or_book,
+    NORMAL: _handle_normal,
+    FLOW_VERIFY_DETAILS: _handle_verify_details,
+    ASK_NAME: _handle_ask_name,
+    ASK_DISTRICT: _handle_ask_district,
+    CONFIRM_LOCATION: _handle_confirm_location,
+    ASK_CATEGORY: _handle_ask_category,
+    ASK_SUBCATEGORY: _handle_ask_subcategory,
+    ASK_BRIEF_SUMMARY: _handle_ask_brief_summary,
+    ASK_BRIEF_STAGE: _handle_ask_brief_stage,
+    ASK_BRIEF_DATES: _handle_ask_brief_dates,
+    ASK_BRIEF_OUTCOME: _handle_ask_brief_outcome,
+    ASK_BRIEF_URGENCY: _handle_ask_brief_urgency,
+    ASK_BRIEF_SAFETY: _handle_ask_brief_safety,
+    ASK_BRIEF_DOCUMENTS: _handle_ask_brief_documents,
+    ASK_BRIEF_OPPOSING_PARTY: _handle_ask_brief_opposing_party,
+    REVIEW_CASE_BRIEF: _handle_review_case_brief,
+    ASK_DATE: _handle_ask_date,
+    ASK_SLOT: _handle_ask_slot,
+    REVIEW_BOOKING: _handle_review_booking,
+    WAITING_PAYMENT: _handle_waiting_payment,
+}
 
-        fail_inbound_message(message_id, "InboundProcessingError")
-    
-        try:
-            if wa_id and wa_id != "UNKNOWN":
-                safe_wa_id = wa_id[:5] + "*****" + wa_id[-2:]
-            else:
-                safe_wa_id = "UNKNOWN"
-        except Exception:
-            safe_wa_id = "UNKNOWN"
-    
-        logger.exception(
-            "Webhook processing failed; provider retry requested | wa_id=%s",
-            safe_wa_id,
-        )
-        return jsonify({"status": "retry"}), 503
-    finally:
-        _release_user_processing_lock(wa_id, processing_lock)
-        db.close()
 
 _CLOSED_PAYMENT_RECONCILIATION_STATUSES = frozenset(
     {
@@ -4336,7 +5295,6 @@ _RAZORPAY_PAYMENT_LINK_ID_PATTERN = re.compile(
     r"plink_[A-Za-z0-9]{1,249}"
 )
 
-
 def _find_manual_payment_disposition(
     db,
     *,
@@ -4357,7 +5315,6 @@ def _find_manual_payment_disposition(
         None,
     )
 
-
 def _persist_manual_disposition_event(
     db,
     *,
@@ -4397,7 +5354,6 @@ def _persist_manual_disposition_event(
     event.expires_at = None
     db.commit()
 
-
 def _upsert_payment_reconciliation(
     db,
     *,
@@ -4463,7 +5419,6 @@ def _upsert_payment_reconciliation(
     db.flush()
     return reconciliation
 
-
 def _persist_payment_review(
     db,
     *,
@@ -4526,7 +5481,6 @@ def _persist_payment_review(
     db.commit()
     return reconciliation
 
-
 def _ensure_booking_fulfillment(
     db,
     booking,
@@ -4539,7 +5493,6 @@ def _ensure_booking_fulfillment(
         capacity_conflict=capacity_conflict,
     )
 
-
 # ===============================
 # PAYMENT WEBHOOK
 # ===============================
@@ -5124,4 +6077,4 @@ def payment_webhook():
 
     finally:
         db.close()
-        
+        
\ No newline at end of file
@@ -280,6 +280,45 @@ WHATSAPP_API_URL = (
     if WHATSAPP_PHONE_ID
     else ""
 )
+# Meta keeps uploaded media for 30 days. Identical document bytes reuse their
+# earlier media ID for this many days instead of re-uploading; 0 disables.
+WHATSAPP_MEDIA_CACHE_DAYS = env_int(
+    "WHATSAPP_MEDIA_CACHE_DAYS",
+    25,
+    minimum=0,
+    maximum=29,
+)
+# Outbound pacing, per process. Sends share a token bucket at this rate
+# (Meta's base tier is 80 messages/s per number; divide by worker processes),
+# halved on 429 or throttling codes down to the minimum and regained
+# gradually. A recipient gets a burst of WHATSAPP_PAIR_BURST messages, then
+# one per interval, mirroring Meta's pair rate limit. A send that finds no
+# slot within the wait fails as retryable `whatsapp_throttled`.
+WHATSAPP_SEND_RATE_PER_SECOND = env_float(
+    "WHATSAPP_SEND_RATE_PER_SECOND",
+    80.0,
+    minimum=1.0,
+    maximum=1_000.0,
+)
+WHATSAPP_SEND_MIN_RATE_PER_SECOND = env_float(
+    "WHATSAPP_SEND_MIN_RATE_PER_SECOND",
+    1.0,
+    minimum=0.1,
+    maximum=1_000.0,
+)
+WHATSAPP_PAIR_BURST = env_int("WHATSAPP_PAIR_BURST", 45, minimum=1, maximum=100)
+WHATSAPP_PAIR_INTERVAL_SECONDS = env_float(
+    "WHATSAPP_PAIR_INTERVAL_SECONDS",
+    6.0,
+    minimum=0.0,
+    maximum=60.0,
+)
+WHATSAPP_SEND_MAX_WAIT_SECONDS = env_float(
+    "WHATSAPP_SEND_MAX_WAIT_SECONDS",
+    5.0,
+    minimum=0.0,
+    maximum=60.0,
+)
 WHATSAPP_VERIFY_TOKEN = env_str("WHATSAPP_VERIFY_TOKEN")
 WHATSAPP_APP_SECRET = env_str("WHATSAPP_APP_SECRET")
 WHATSAPP_APP_SECRET_PREVIOUS = env_str("WHATSAPP_APP_SECRET_PREVIOUS")
@@ -386,6 +425,61 @@ INBOUND_USER_LOCK_TIMEOUT_SECONDS = env_int(
     minimum=1,
     maximum=55,
 )
+# Fast-ack ingestion records each signed message durably, returns 200, and
+# lets a bounded in-process worker pool run the conversation handler in
+# per-sender order. Disabled keeps the synchronous webhook behaviour.
+WHATSAPP_ASYNC_INGESTION = env_bool("WHATSAPP_ASYNC_INGESTION", False)
+INBOUND_WORKER_THREADS = env_int(
+    "INBOUND_WORKER_THREADS",
+    4,
+    minimum=1,
+    maximum=32,
+)
+INBOUND_MAX_ATTEMPTS = env_int(
+    "INBOUND_MAX_ATTEMPTS",
+    5,
+    minimum=1,
+    maximum=20,
+)
+# A sender whose oldest queued message failed or was busy is drained again
+# after this delay, doubling per round up to the maximum. 0 leaves the retry
+# to the sender's next message and `python -m jobs.process_inbound`.
+INBOUND_RETRY_BASE_SECONDS = env_float(
+    "INBOUND_RETRY_BASE_SECONDS",
+    2.0,
+    minimum=0.0,
+    maximum=60.0,
+)
+INBOUND_RETRY_MAX_SECONDS = env_float(
+    "INBOUND_RETRY_MAX_SECONDS",
+    60.0,
+    minimum=1.0,
+    maximum=900.0,
+)
+# Async delivery persists each message's text/button/list replies as one outbox
+# job in the message's unit of work and hands it to a sender pool that keeps
+# per-recipient order. Disabled sends inline from the handler.
+WHATSAPP_ASYNC_DELIVERY = env_bool("WHATSAPP_ASYNC_DELIVERY", False)
+WHATSAPP_SENDER_THREADS = env_int(
+    "WHATSAPP_SENDER_THREADS",
+    4,
+    minimum=1,
+    maximum=32,
+)
+# Hold a conversation text reply until the handler's next send. When that is
+# a button or list reply to the same user and the combined body fits Meta's
+# interactive limit, both go out as one message instead of two.
+WHATSAPP_COALESCE_REPLIES = env_bool("WHATSAPP_COALESCE_REPLIES", True)
+# Per-request phase timing (log line, admin histograms, and a Server-Timing
+# header outside production). Off by default; the disabled path is one flag
+# check per hook.
+REQUEST_TIMING_ENABLED = env_bool("REQUEST_TIMING_ENABLED", False)
+REQUEST_TIMING_WINDOW = env_int(
+    "REQUEST_TIMING_WINDOW",
+    1_024,
+    minimum=64,
+    maximum=100_000,
+)
 USER_MESSAGE_LIMIT = env_int(
     "USER_MESSAGE_LIMIT",
     10,
@@ -416,6 +510,29 @@ GLOBAL_REQUEST_WINDOW_SECONDS = env_int(
     minimum=1,
     maximum=3_600,
 )
+# Where sliding-window hits are counted. `memory` is process-local and only
+# correct for one Gunicorn worker; `database` and `redis` share each budget
+# across every worker process.
+RATE_LIMIT_BACKEND = env_str(
+    "RATE_LIMIT_BACKEND",
+    "memory",
+    allow_empty=False,
+).lower()
+_ALLOWED_RATE_LIMIT_BACKENDS = frozenset({"memory", "database", "redis"})
+if RATE_LIMIT_BACKEND not in _ALLOWED_RATE_LIMIT_BACKENDS:
+    raise ValueError(
+        "RATE_LIMIT_BACKEND must be one of: "
+        f"{', '.join(sorted(_ALLOWED_RATE_LIMIT_BACKENDS))}"
+    )
+RATE_LIMIT_REDIS_URL = env_str("RATE_LIMIT_REDIS_URL")
+if RATE_LIMIT_BACKEND == "redis" and not RATE_LIMIT_REDIS_URL:
+    raise ValueError("RATE_LIMIT_REDIS_URL is required for the redis backend")
+RATE_LIMIT_REDIS_TIMEOUT_SECONDS = env_float(
+    "RATE_LIMIT_REDIS_TIMEOUT_SECONDS",
+    0.5,
+    minimum=0.05,
+    maximum=5.0,
+)
 
 # AI providers.
 OPENAI_API_KEY = env_str("OPENAI_API_KEY")
@@ -430,6 +547,73 @@ AI_RESPONSE_CACHE_TTL_SECONDS = env_int(
     20,
     minimum=0,
 )
+# Hedged AI requests: when the first remote provider has not answered within
+# this delay (set it near that provider's p90 latency), the remaining providers
+# are started in the background so a failing first provider is replaced by an
+# answer already in flight. 0 keeps the strictly sequential provider order.
+AI_HEDGE_DELAY_MS = env_int("AI_HEDGE_DELAY_MS", 0, minimum=0, maximum=30_000)
+# Hedges that may run at once per worker, including losing calls still waiting
+# on their provider timeout. Requests beyond it are not hedged.
+AI_HEDGE_MAX_IN_FLIGHT = env_int(
+    "AI_HEDGE_MAX_IN_FLIGHT",
+    4,
+    minimum=1,
+    maximum=32,
+)
+# Answers to generic questions (nothing removed by PII scrubbing) are shared
+# across users through the database for this many hours, keyed on the prompt,
+# language, legal content version, and context. 0 disables the shared cache.
+AI_SHARED_CACHE_TTL_HOURS = env_int(
+    "AI_SHARED_CACHE_TTL_HOURS",
+    24,
+    minimum=0,
+    maximum=24 * 30,
+)
+AI_SHARED_CACHE_MAX_ENTRIES = env_int(
+    "AI_SHARED_CACHE_MAX_ENTRIES",
+    5_000,
+    minimum=1,
+    maximum=1_000_000,
+)
+# Each remote AI provider's circuit breaker opens after this many 5xx or
+# transport failures within the window, stays open for AI_BREAKER_OPEN_SECONDS,
+# then lets one probe request through. A rate limit opens it at once for the
+# provider's *_BREAKER_MINUTES.
+AI_BREAKER_FAILURE_THRESHOLD = env_int(
+    "AI_BREAKER_FAILURE_THRESHOLD",
+    5,
+    minimum=1,
+    maximum=100,
+)
+AI_BREAKER_WINDOW_SECONDS = env_int(
+    "AI_BREAKER_WINDOW_SECONDS",
+    60,
+    minimum=1,
+    maximum=3_600,
+)
+AI_BREAKER_OPEN_SECONDS = env_int(
+    "AI_BREAKER_OPEN_SECONDS",
+    60,
+    minimum=1,
+    maximum=3_600,
+)
+# Latency-aware routing: within AI_PROVIDER_ORDER, a provider whose circuit is
+# open, whose recent error rate exceeds AI_ROUTING_MAX_ERROR_RATE, or whose
+# average latency exceeds AI_ROUTING_SLOW_FACTOR times the fastest provider's
+# is tried after the healthy ones. Healthy providers keep the configured order.
+AI_LATENCY_ROUTING = env_bool("AI_LATENCY_ROUTING", True)
+AI_ROUTING_MAX_ERROR_RATE = env_float(
+    "AI_ROUTING_MAX_ERROR_RATE",
+    0.5,
+    minimum=0.0,
+    maximum=1.0,
+)
+AI_ROUTING_SLOW_FACTOR = env_float(
+    "AI_ROUTING_SLOW_FACTOR",
+    2.0,
+    minimum=1.0,
+    maximum=20.0,
+)
 AI_SAFETY_IDENTIFIER_SECRET = env_str("AI_SAFETY_IDENTIFIER_SECRET")
 
 # Razorpay.
@@ -531,6 +715,10 @@ AUTO_CREATE_SCHEMA = env_bool(
 DB_POOL_PRE_PING = env_bool("DB_POOL_PRE_PING", True)
 DB_POOL_SIZE = env_int("DB_POOL_SIZE", 5, minimum=1)
 DB_MAX_OVERFLOW = env_int("DB_MAX_OVERFLOW", 10, minimum=0)
+# Per-user advisory locks on PostgreSQL each pin a connection for a whole
+# message, so they use their own pool of this size (Gunicorn threads plus
+# inbound workers) instead of competing with handler sessions.
+DB_LOCK_POOL_SIZE = env_int("DB_LOCK_POOL_SIZE", 12, minimum=1, maximum=64)
 DB_POOL_RECYCLE_SECONDS = env_int(
     "DB_POOL_RECYCLE_SECONDS",
     1_800,
@@ -558,3 +746,11 @@ ANALYTICS_MAX_PROPERTY_BYTES = env_int(
     8_192,
     minimum=256,
 )
+# 0 writes each tally increment in the message transaction. A positive value
+# coalesces increments per process and upserts them in bulk at that interval.
+ANALYTICS_TALLY_FLUSH_SECONDS = env_float(
+    "ANALYTICS_TALLY_FLUSH_SECONDS",
+    0.0,
+    minimum=0.0,
+    maximum=300.0,
+)
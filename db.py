@@ -6,7 +6,9 @@ import logging
 import os
 import time
 from contextlib import contextmanager
-from typing import Any, Iterator
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Callable, Iterator
 
 from sqlalchemy import create_engine, event, text
 from sqlalchemy.engine import URL, make_url
@@ -17,10 +19,12 @@ from config import (
     AUTO_CREATE_SCHEMA,
     DATABASE_URL as CONFIG_DATABASE_URL,
     DB_CONNECT_TIMEOUT_SECONDS,
+    DB_LOCK_POOL_SIZE,
     DB_MAX_OVERFLOW,
     DB_POOL_PRE_PING,
     DB_POOL_RECYCLE_SECONDS,
     DB_POOL_SIZE,
+    INBOUND_USER_LOCK_TIMEOUT_SECONDS,
     SQLITE_BUSY_TIMEOUT_SECONDS,
     normalize_database_url,
 )
@@ -29,7 +33,7 @@ from config import (
 logger = logging.getLogger(__name__)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "nyaysetu.db")
-EXPECTED_SCHEMA_REVISION = "20260819_01"
+EXPECTED_SCHEMA_REVISION = "20261016_06"
 
 
 def _resolved_database_url(raw_url: str) -> URL:
@@ -79,6 +83,32 @@ else:
     )
 
 engine = create_engine(_engine_url, **_engine_options)
+_lock_engine = None
+_lock_engine_guard = Lock()
+
+
+def lock_engine():
+    """Return the autocommit pool reserved for session-level advisory locks.
+
+    A lock holder also needs a handler session from the main pool. Keeping the
+    two pools apart means lock holders can never exhaust the pool their own
+    handlers wait on. Checkout waits at most the user-lock timeout.
+    """
+
+    global _lock_engine
+    with _lock_engine_guard:
+        if _lock_engine is None:
+            _lock_engine = create_engine(
+                _engine_url,
+                isolation_level="AUTOCOMMIT",
+                pool_pre_ping=DB_POOL_PRE_PING,
+                pool_size=DB_LOCK_POOL_SIZE,
+                max_overflow=0,
+                pool_timeout=INBOUND_USER_LOCK_TIMEOUT_SECONDS,
+                pool_recycle=DB_POOL_RECYCLE_SECONDS,
+                connect_args={"connect_timeout": DB_CONNECT_TIMEOUT_SECONDS},
+            )
+        return _lock_engine
 
 
 if _is_sqlite:
@@ -99,7 +129,37 @@ if _is_sqlite:
             cursor.close()
 
 
+_UNIT_OF_WORK_KEY = "unit_of_work"
+_AFTER_COMMIT_KEY = "after_commit_callbacks"
+_active_unit_of_work: ContextVar[Session | None] = ContextVar(
+    "active_unit_of_work",
+    default=None,
+)
+
+
+class UnitOfWorkSession(Session):
+    """Session whose ``commit()`` only flushes inside :func:`unit_of_work`.
+
+    Conversation helpers and services commit after each step. Inside a unit of
+    work those steps share one transaction, and the unit commits once.
+    """
+
+    def commit(self) -> None:
+        if self.info.get(_UNIT_OF_WORK_KEY):
+            self.flush()
+            return
+        super().commit()
+        callbacks = self.info.pop(_AFTER_COMMIT_KEY, [])
+        for callback in callbacks:
+            callback()
+
+    def rollback(self) -> None:
+        self.info.pop(_AFTER_COMMIT_KEY, None)
+        super().rollback()
+
+
 SessionLocal = sessionmaker(
+    class_=UnitOfWorkSession,
     autocommit=False,
     autoflush=False,
     bind=engine,
@@ -123,6 +183,92 @@ def session_scope() -> Iterator[Session]:
         session.close()
 
 
+@contextmanager
+def unit_of_work(session: Session) -> Iterator[Session]:
+    """Commit everything ``session`` does in the block exactly once.
+
+    An exception leaves the open transaction to the caller, which either
+    rolls it back or keeps the work with :func:`commit_now`.
+    """
+
+    session.info[_UNIT_OF_WORK_KEY] = True
+    token = _active_unit_of_work.set(session)
+    try:
+        yield session
+    finally:
+        session.info.pop(_UNIT_OF_WORK_KEY, None)
+        _active_unit_of_work.reset(token)
+    session.commit()
+
+
+def active_unit_of_work() -> Session | None:
+    """Return the session of the unit of work open in this context, if any."""
+
+    return _active_unit_of_work.get()
+
+
+def commit_now(session: Session) -> None:
+    """Commit immediately, even inside a unit of work.
+
+    Reserved for state that must be durable before an irreversible external
+    effect, such as a payment link the user is about to receive.
+    """
+
+    active = session.info.pop(_UNIT_OF_WORK_KEY, None)
+    try:
+        session.commit()
+    finally:
+        if active:
+            session.info[_UNIT_OF_WORK_KEY] = active
+
+
+def after_commit(session: Session, callback: Callable[[], Any]) -> None:
+    """Run ``callback`` once the unit of work commits, or now outside one.
+
+    A rollback discards pending callbacks, so work such as an outbox kick never
+    points at a row that was not committed.
+    """
+
+    if session.info.get(_UNIT_OF_WORK_KEY):
+        session.info.setdefault(_AFTER_COMMIT_KEY, []).append(callback)
+        return
+    callback()
+
+
+@contextmanager
+def joined_session_scope(session_factory=None) -> Iterator[Session]:
+    """Provide a commit boundary for a helper's own small write.
+
+    SQLite has a single writer, so inside a unit of work a second session
+    would wait on the unit's uncommitted rows until the busy timeout. There
+    the helper joins the unit through a savepoint and commits with it. Other
+    backends, and callers outside a unit, get their own transaction exactly
+    as with :func:`session_scope`.
+    """
+
+    factory = session_factory or SessionLocal
+    unit = _active_unit_of_work.get()
+    if (
+        unit is not None
+        and unit.info.get(_UNIT_OF_WORK_KEY)
+        and unit.get_bind().dialect.name == "sqlite"
+        and unit.get_bind() is getattr(factory, "kw", {}).get("bind")
+    ):
+        with unit.begin_nested():
+            yield unit
+        return
+
+    session = factory()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
 def check_db_health() -> bool:
     """Return whether the configured database can execute a trivial query."""
 
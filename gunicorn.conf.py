@@ -1,9 +1,9 @@
 """Production Gunicorn policy for the NyaySetu webhook service.
 
 Keep process topology here rather than duplicating flags across deployment
-surfaces. NyaySetu still has process-local ordering and rate-limit safeguards,
-so increasing the worker count is unsafe until those controls move to shared
-infrastructure.
+surfaces. Per-user ordering and rate limits are only shared between processes
+on PostgreSQL with a shared rate-limit backend, so any other deployment must
+keep exactly one worker.
 """
 
 from __future__ import annotations
@@ -13,8 +13,9 @@ import os
 
 bind = f"0.0.0.0:{os.getenv('PORT', '10000')}"
 
-# One process is an intentional correctness constraint. Threads retain bounded
-# I/O concurrency for Meta, Razorpay, and AI provider requests.
+# One process remains the default. Threads retain bounded I/O concurrency for
+# Meta, Razorpay, and AI provider requests. More workers are accepted only when
+# `_shared_coordination_configured()` holds; see `on_starting`.
 workers = 1
 worker_class = "gthread"
 threads = 8
@@ -43,14 +44,38 @@ access_log_format = (
 )
 
 
+def _shared_coordination_configured() -> bool:
+    """Whether ordering locks and rate limits span worker processes."""
+
+    database_url = os.getenv("DATABASE_URL", "").strip()
+    rate_limit_backend = os.getenv("RATE_LIMIT_BACKEND", "memory").strip().lower()
+    return (
+        database_url.startswith(("postgres://", "postgresql://", "postgresql+"))
+        and rate_limit_backend in {"database", "redis"}
+    )
+
+
 def on_starting(server) -> None:
-    """Refuse an accidental multi-process override."""
+    """Refuse a multi-process override without shared coordination."""
 
     configured_workers = server.cfg.workers
     if hasattr(configured_workers, "value"):
         configured_workers = configured_workers.value
-    if int(configured_workers) != 1:
+    if int(configured_workers) != 1 and not _shared_coordination_configured():
         raise RuntimeError(
-            "NyaySetu requires exactly one Gunicorn worker until all "
-            "process-local coordination is moved to shared infrastructure."
+            "NyaySetu requires exactly one Gunicorn worker unless "
+            "DATABASE_URL is PostgreSQL and RATE_LIMIT_BACKEND is database "
+            "or redis."
         )
+
+
+def post_fork(server, worker) -> None:
+    """Warm the local Ollama model once per worker, off the import path.
+
+    A no-op unless LOCAL_AI_PROVIDER=ollama, so cron jobs and tests that
+    import the app never start a network thread.
+    """
+
+    from services.local_ai_service import warm_up_ollama
+
+    warm_up_ollama()
@@ -0,0 +1,647 @@
+"""Benchmark the signed WhatsApp webhook against stubbed providers.
+
+Each scenario puts a fresh sender in the flow state it exercises, then times
+one signed Meta payload through ``app.test_client()``. Graph, Razorpay and
+OpenAI calls are answered in-process after a configurable delay, so the
+report reflects webhook and database cost plus the injected provider latency
+and never reaches a real network endpoint.
+
+The JSON report is written with sorted keys and rounded values so two runs
+on different commits can be compared with an ordinary diff.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import hmac
+import json
+import math
+import os
+import tempfile
+import time
+from collections.abc import Callable, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import count
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+from sqlalchemy import event
+
+
+DEFAULT_ITERATIONS = 50
+MAX_ITERATIONS = 5_000
+_SENDER_PREFIX = "9170"
+_AI_QUESTION = "What documents should I keep ready for a cheque bounce complaint"
+_CASE_SUMMARY = (
+    "My landlord has kept the security deposit for three months after I "
+    "vacated the flat."
+)
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """One timed inbound message and the flow state it should leave behind."""
+
+    name: str
+    prepare: Callable
+    expected_state: str
+
+
+def _user(app_module, db, wa_id: str, flow_state: str, **overrides):
+    values = {
+        "whatsapp_id": wa_id,
+        "case_id": f"NS-BENCH-{wa_id[-8:]}",
+        "language": "en",
+        "name": "Benchmark User",
+        "flow_state": flow_state,
+        "welcome_sent": True,
+    }
+    values.update(overrides)
+    user = app_module.User(**values)
+    db.add(user)
+    db.flush()
+    return user
+
+
+def _bookable_slot(app_module, db) -> tuple[str, str]:
+    from services.booking_service import SLOT_MAP, validate_slot
+
+    for row in app_module.generate_dates_calendar(skip_today=True, db=db):
+        date_str = row["id"].removeprefix("date_")
+        for slot_code in SLOT_MAP:
+            if validate_slot(date_str, slot_code, db=db)[0]:
+                return date_str, slot_code
+    raise RuntimeError("No bookable slot is available for the benchmark")
+
+
+def _booking_draft(app_module, db) -> dict:
+    date_str, slot_code = _bookable_slot(app_module, db)
+    return {
+        "state_name": "Maharashtra",
+        "district_name": "Pune",
+        "category": "family",
+        "subcategory": "divorce",
+        "temp_date": date_str,
+        "temp_slot": slot_code,
+    }
+
+
+def _prepare_greeting(app_module, db, wa_id):
+    return {"text": "hi"}
+
+
+def _prepare_language_picker(app_module, db, wa_id):
+    _user(
+        app_module,
+        db,
+        wa_id,
+        app_module.ASK_LANGUAGE,
+        language=None,
+    )
+    return {"interactive_id": "lang_en"}
+
+
+def _prepare_category_list(app_module, db, wa_id):
+    _user(app_module, db, wa_id, app_module.FLOW_VERIFY_DETAILS)
+    return {"interactive_id": app_module.BTN_DETAILS_OK}
+
+
+def _prepare_subcategory_list(app_module, db, wa_id):
+    _user(app_module, db, wa_id, app_module.ASK_CATEGORY)
+    return {"interactive_id": "cat_family"}
+
+
+def _prepare_district_detection(app_module, db, wa_id):
+    _user(app_module, db, wa_id, app_module.ASK_DISTRICT)
+    return {"text": "Pune"}
+
+
+def _prepare_case_brief(app_module, db, wa_id):
+    user = _user(app_module, db, wa_id, app_module.ASK_BRIEF_SUMMARY)
+    db.add(
+        app_module.CaseBrief(
+            user_id=user.id,
+            status="DRAFT",
+            preferred_language="en",
+            documents_json="[]",
+        )
+    )
+    return {"text": _CASE_SUMMARY}
+
+
+def _prepare_date_selection(app_module, db, wa_id):
+    draft = _booking_draft(app_module, db)
+    date_str = draft.pop("temp_date")
+    draft.pop("temp_slot")
+    _user(app_module, db, wa_id, app_module.ASK_DATE, **draft)
+    return {"interactive_id": f"date_{date_str}"}
+
+
+def _prepare_slot_selection(app_module, db, wa_id):
+    draft = _booking_draft(app_module, db)
+    slot_code = draft.pop("temp_slot")
+    _user(app_module, db, wa_id, app_module.ASK_SLOT, **draft)
+    return {"interactive_id": f"slot_{slot_code}"}
+
+
+def _prepare_payment_link(app_module, db, wa_id):
+    # Earlier iterations would otherwise fill the only bookable slot.
+    db.query(app_module.Booking).delete(synchronize_session=False)
+    _user(
+        app_module,
+        db,
+        wa_id,
+        app_module.REVIEW_BOOKING,
+        **_booking_draft(app_module, db),
+    )
+    return {"interactive_id": app_module.BTN_REVIEW_PAY}
+
+
+def _prepare_ai_question(app_module, db, wa_id):
+    _user(
+        app_module,
+        db,
+        wa_id,
+        app_module.NORMAL,
+        ai_enabled=True,
+        free_ai_count=0,
+    )
+    # A distinct prompt per sender keeps the reply cache out of the timing.
+    return {"text": f"{_AI_QUESTION} {wa_id[-4:]}?"}
+
+
+SCENARIOS = (
+    Scenario("greeting", _prepare_greeting, "ASK_LANGUAGE"),
+    Scenario("language_picker", _prepare_language_picker, "ASK_AI_OR_BOOK"),
+    Scenario("category_list", _prepare_category_list, "ASK_CATEGORY"),
+    Scenario("subcategory_list", _prepare_subcategory_list, "ASK_SUBCATEGORY"),
+    Scenario(
+        "district_detection",
+        _prepare_district_detection,
+        "CONFIRM_LOCATION",
+    ),
+    Scenario("case_brief", _prepare_case_brief, "ASK_BRIEF_STAGE"),
+    Scenario("date_selection", _prepare_date_selection, "ASK_SLOT"),
+    Scenario("slot_selection", _prepare_slot_selection, "REVIEW_BOOKING"),
+    Scenario("payment_link", _prepare_payment_link, "WAITING_PAYMENT"),
+    Scenario("ai_question", _prepare_ai_question, "NORMAL"),
+)
+SCENARIO_NAMES = tuple(scenario.name for scenario in SCENARIOS)
+
+
+def whatsapp_payload(
+    wa_id: str,
+    message_id: str,
+    *,
+    text: str | None = None,
+    interactive_id: str | None = None,
+) -> dict:
+    """Build the Meta webhook envelope for one text or list-reply message."""
+
+    if interactive_id is not None:
+        message = {
+            "from": wa_id,
+            "id": message_id,
+            "type": "interactive",
+            "interactive": {
+                "type": "list_reply",
+                "list_reply": {"id": interactive_id, "title": "Selected"},
+            },
+        }
+    else:
+        message = {
+            "from": wa_id,
+            "id": message_id,
+            "type": "text",
+            "text": {"body": text or ""},
+        }
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {
+                "changes": [
+                    {
+                        "field": "messages",
+                        "value": {
+                            "contacts": [{"wa_id": wa_id}],
+                            "messages": [message],
+                        },
+                    }
+                ]
+            }
+        ],
+    }
+
+
+def _percentile(sorted_values: list[float], percentile: float) -> float:
+    """Nearest-rank percentile, which stays stable for small samples."""
+
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percentile / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class _ProviderStubs:
+    """In-process Graph, Razorpay and OpenAI endpoints with fixed latency."""
+
+    def __init__(
+        self,
+        *,
+        graph_latency_ms: float,
+        razorpay_latency_ms: float,
+        ai_latency_ms: float,
+    ) -> None:
+        self.latency = {
+            "graph": graph_latency_ms / 1000,
+            "razorpay": razorpay_latency_ms / 1000,
+            "ai": ai_latency_ms / 1000,
+        }
+        self.calls = {"graph": 0, "razorpay": 0, "ai": 0}
+        self._ids = count(1)
+
+    def _respond(self, provider: str, body: dict) -> httpx.Response:
+        self.calls[provider] += 1
+        if self.latency[provider]:
+            time.sleep(self.latency[provider])
+        return httpx.Response(200, json=body)
+
+    def graph(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/media"):
+            return self._respond("graph", {"id": f"media.{next(self._ids)}"})
+        return self._respond(
+            "graph",
+            {"messages": [{"id": f"wamid.bench.{next(self._ids)}"}]},
+        )
+
+    def razorpay(self, request: httpx.Request) -> httpx.Response:
+        link_id = f"plink_Bench{next(self._ids):010d}"
+        return self._respond(
+            "razorpay",
+            {
+                "id": link_id,
+                "short_url": f"https://rzp.io/i/{link_id[-10:]}",
+                "status": "created",
+            },
+        )
+
+    def openai(self, request: httpx.Request) -> httpx.Response:
+        return self._respond(
+            "ai",
+            {
+                "choices": [
+                    {
+                        "message": {
+                            "content": (
+                                "Keep the cheque, the return memo and the "
+                                "demand notice ready."
+                            )
+                        }
+                    }
+                ]
+            },
+        )
+
+
+@contextmanager
+def stubbed_providers(stubs: _ProviderStubs):
+    """Route every outbound provider call to ``stubs`` until exit."""
+
+    from services import booking_service, openai_service, whatsapp_service
+
+    graph_client = httpx.Client(transport=httpx.MockTransport(stubs.graph))
+    openai_client = httpx.Client(transport=httpx.MockTransport(stubs.openai))
+    razorpay_http = httpx.Client(
+        base_url="https://api.razorpay.com",
+        transport=httpx.MockTransport(stubs.razorpay),
+    )
+    razorpay_client = SimpleNamespace(
+        payment_link=booking_service._PaymentLinkAPI(razorpay_http),
+        close=razorpay_http.close,
+    )
+    try:
+        with (
+            mock.patch.object(whatsapp_service, "_HTTP_CLIENT", graph_client),
+            mock.patch.object(openai_service, "_HTTP_CLIENT", openai_client),
+            mock.patch.object(
+                booking_service,
+                "_razorpay_client",
+                razorpay_client,
+            ),
+            mock.patch.dict(
+                os.environ,
+                {"AI_PROVIDER": "openai", "OPENAI_API_KEY": "sk-benchmark"},
+            ),
+        ):
+            yield stubs
+    finally:
+        graph_client.close()
+        openai_client.close()
+        razorpay_http.close()
+
+
+def _signed_post(client, secret: str, payload: dict):
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return client.post(
+        "/webhook",
+        data=body,
+        content_type="application/json",
+        headers={"X-Hub-Signature-256": f"sha256={signature}"},
+    )
+
+
+def run_scenario(
+    app_module,
+    session_factory,
+    engine,
+    scenario: Scenario,
+    *,
+    iterations: int,
+    stubs: _ProviderStubs,
+    sender_ids,
+) -> dict:
+    """Time ``iterations`` webhook deliveries of one scenario."""
+
+    client = app_module.app.test_client()
+    secret = app_module.WHATSAPP_APP_SECRET
+    statements = {"count": 0}
+
+    def count_statement(*_args, **_kwargs):
+        statements["count"] += 1
+
+    latencies: list[float] = []
+    statement_counts: list[int] = []
+    errors = 0
+    unexpected = 0
+    calls_before = dict(stubs.calls)
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    try:
+        for _ in range(iterations):
+            wa_id = f"{_SENDER_PREFIX}{next(sender_ids):08d}"
+            db = session_factory()
+            try:
+                message = scenario.prepare(app_module, db, wa_id)
+                db.commit()
+            finally:
+                db.close()
+            payload = whatsapp_payload(
+                wa_id,
+                f"wamid.bench.{scenario.name}.{wa_id}",
+                **message,
+            )
+
+            # Only the webhook's own work counts; setup runs above.
+            app_module.rate_limit_store.clear()
+            statements["count"] = 0
+            started = time.perf_counter()
+            response = _signed_post(client, secret, payload)
+            latencies.append(time.perf_counter() - started)
+            statement_counts.append(statements["count"])
+
+            if response.status_code >= 400:
+                errors += 1
+            db = session_factory()
+            try:
+                user = (
+                    db.query(app_module.User)
+                    .filter_by(whatsapp_id=wa_id)
+                    .first()
+                )
+                if user is None or user.flow_state != scenario.expected_state:
+                    unexpected += 1
+            finally:
+                db.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", count_statement)
+
+    ordered = sorted(latencies)
+    elapsed = sum(latencies)
+    return {
+        "requests": iterations,
+        "errors": errors,
+        "unexpected_flow_state": unexpected,
+        "latency_ms": {
+            "p50": round(_percentile(ordered, 50) * 1000, 3),
+            "p95": round(_percentile(ordered, 95) * 1000, 3),
+            "p99": round(_percentile(ordered, 99) * 1000, 3),
+            "max": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        },
+        "requests_per_second": (
+            round(iterations / elapsed, 2) if elapsed else 0.0
+        ),
+        "db_statements": {
+            "mean": (
+                round(sum(statement_counts) / iterations, 2)
+                if iterations
+                else 0.0
+            ),
+            "max": max(statement_counts, default=0),
+        },
+        "provider_calls_per_request": {
+            provider: (
+                round(
+                    (stubs.calls[provider] - calls_before[provider])
+                    / iterations,
+                    2,
+                )
+                if iterations
+                else 0.0
+            )
+            for provider in stubs.calls
+        },
+    }
+
+
+def run_benchmark(
+    app_module,
+    session_factory,
+    engine,
+    *,
+    scenarios: Sequence[str] = SCENARIO_NAMES,
+    iterations: int = DEFAULT_ITERATIONS,
+    warmup: int = 2,
+    graph_latency_ms: float = 0.0,
+    razorpay_latency_ms: float = 0.0,
+    ai_latency_ms: float = 0.0,
+) -> dict:
+    """Run the selected scenarios in order and return the JSON report."""
+
+    selected = [scenario for scenario in SCENARIOS if scenario.name in scenarios]
+    stubs = _ProviderStubs(
+        graph_latency_ms=graph_latency_ms,
+        razorpay_latency_ms=razorpay_latency_ms,
+        ai_latency_ms=ai_latency_ms,
+    )
+    sender_ids = count(1)
+    report = {
+        "config": {
+            "ai_latency_ms": ai_latency_ms,
+            "database": engine.dialect.name,
+            "graph_latency_ms": graph_latency_ms,
+            "iterations": iterations,
+            "razorpay_latency_ms": razorpay_latency_ms,
+            "warmup": warmup,
+        },
+        "scenarios": {},
+    }
+    with stubbed_providers(stubs):
+        for scenario in selected:
+            if warmup:
+                run_scenario(
+                    app_module,
+                    session_factory,
+                    engine,
+                    scenario,
+                    iterations=warmup,
+                    stubs=stubs,
+                    sender_ids=sender_ids,
+                )
+            report["scenarios"][scenario.name] = run_scenario(
+                app_module,
+                session_factory,
+                engine,
+                scenario,
+                iterations=iterations,
+                stubs=stubs,
+                sender_ids=sender_ids,
+            )
+    return report
+
+
+def _iterations(value: str) -> int:
+    try:
+        parsed = int(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError("iterations must be an integer") from exc
+    if not 1 <= parsed <= MAX_ITERATIONS:
+        raise argparse.ArgumentTypeError(
+            f"iterations must be between 1 and {MAX_ITERATIONS}"
+        )
+    return parsed
+
+
+def _latency(value: str) -> float:
+    try:
+        parsed = float(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError("latency must be a number") from exc
+    if not 0 <= parsed <= 10_000:
+        raise argparse.ArgumentTypeError(
+            "latency must be between 0 and 10000 ms"
+        )
+    return parsed
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark signed WhatsApp webhooks against stubbed Graph, "
+            "Razorpay and OpenAI endpoints."
+        ),
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=SCENARIO_NAMES,
+        help="Scenario to run; repeat to select several (default: all).",
+    )
+    parser.add_argument(
+        "--iterations",
+        type=_iterations,
+        default=DEFAULT_ITERATIONS,
+        help=f"Timed requests per scenario (default: {DEFAULT_ITERATIONS}).",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=2,
+        help="Untimed requests per scenario before measuring (default: 2).",
+    )
+    parser.add_argument(
+        "--graph-latency-ms",
+        type=_latency,
+        default=0.0,
+        help="Delay added to every WhatsApp Graph API call.",
+    )
+    parser.add_argument(
+        "--razorpay-latency-ms",
+        type=_latency,
+        default=0.0,
+        help="Delay added to every Razorpay API call.",
+    )
+    parser.add_argument(
+        "--ai-latency-ms",
+        type=_latency,
+        default=0.0,
+        help="Delay added to every OpenAI API call.",
+    )
+    parser.add_argument(
+        "--output",
+        help="Write the JSON report to this file instead of stdout.",
+    )
+    return parser
+
+
+def _configure_environment(database_path: str) -> None:
+    """Point the app at a throwaway database before it is imported."""
+
+    os.environ.update(
+        {
+            "ENV": "test",
+            "DATABASE_URL": f"sqlite:///{database_path}",
+            "ALLOW_INSECURE_WEBHOOKS": "false",
+            "MAINTENANCE_MODE": "false",
+            "WHATSAPP_APP_SECRET": "benchmark-whatsapp-secret",
+            "WHATSAPP_PHONE_ID": "benchmark-phone-id",
+            "WHATSAPP_TOKEN": "benchmark-whatsapp-token",
+            "WHATSAPP_ASYNC_INGESTION": "false",
+            "RAZORPAY_KEY_ID": "rzp_test_benchmark",
+            "RAZORPAY_KEY_SECRET": "benchmark-razorpay-secret",
+            "RAZORPAY_MODE": "test",
+            "RATE_LIMIT_BACKEND": "memory",
+        }
+    )
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="nyaysetu-bench-") as directory:
+        _configure_environment(os.path.join(directory, "benchmark.db"))
+
+        import app as app_module
+        from db import Base, SessionLocal, engine
+
+        Base.metadata.create_all(engine)
+        report = run_benchmark(
+            app_module,
+            SessionLocal,
+            engine,
+            scenarios=args.scenario or SCENARIO_NAMES,
+            iterations=args.iterations,
+            warmup=max(0, args.warmup),
+            graph_latency_ms=args.graph_latency_ms,
+            razorpay_latency_ms=args.razorpay_latency_ms,
+            ai_latency_ms=args.ai_latency_ms,
+        )
+        engine.dispose()
+
+    rendered = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(rendered + "\n")
+    else:
+        print(rendered)
+    unhealthy = any(
+        result["errors"] or result["unexpected_flow_state"]
+        for result in report["scenarios"].values()
+    )
+    return 1 if unhealthy else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
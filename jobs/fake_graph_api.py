@@ -0,0 +1,282 @@
+"""Local WhatsApp Cloud API stand-in with latency and fault injection.
+
+``FakeGraphAPI`` serves ``POST .../messages`` and ``POST .../media`` on a
+loopback port with the response shapes ``services.whatsapp_service`` expects.
+Message bodies are checked for the fields Meta requires per type (text,
+interactive, template, document) and every request is recorded. Latency,
+429 and 5xx responses, and read timeouts are drawn from a seeded generator,
+so a run with the same profile injects the same faults in the same order.
+
+Because it is a real HTTP server, the retry, ``Retry-After`` and
+ambiguous-timeout paths run through the real ``httpx`` transport.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+_MESSAGE_TYPES = {"text", "interactive", "template", "document"}
+
+
+@dataclass(frozen=True)
+class FaultProfile:
+    """Per-request fault rates; the three rates must sum to at most 1."""
+
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    timeout_rate: float = 0.0
+    # A timed-out request is held this long, then closed without a response.
+    timeout_hold_seconds: float = 2.0
+    retry_after_seconds: float | None = None
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        rates = (self.rate_429, self.rate_5xx, self.timeout_rate)
+        if any(rate < 0 for rate in rates) or sum(rates) > 1:
+            raise ValueError("fault rates must be non-negative and sum to <= 1")
+
+
+@dataclass(frozen=True)
+class RecordedRequest:
+    endpoint: str
+    message_type: str | None
+    status: int | None
+    fault: str | None
+
+
+def message_errors(payload) -> list[str]:
+    """Return why Meta would reject ``payload``; empty when it is well formed."""
+
+    if not isinstance(payload, dict):
+        return ["payload must be an object"]
+    errors = []
+    if payload.get("messaging_product") != "whatsapp":
+        errors.append("messaging_product must be whatsapp")
+    recipient = str(payload.get("to") or "")
+    if not recipient.isdigit() or len(recipient) > 32:
+        errors.append("to must be a phone number")
+    message_type = payload.get("type")
+    body = payload.get(message_type) if message_type in _MESSAGE_TYPES else None
+    if not isinstance(body, dict):
+        return errors + [f"unsupported or missing type: {message_type}"]
+
+    if message_type == "text":
+        if not str(body.get("body") or "").strip():
+            errors.append("text.body is required")
+    elif message_type == "interactive":
+        action = body.get("action") or {}
+        if not str((body.get("body") or {}).get("text") or "").strip():
+            errors.append("interactive.body.text is required")
+        if body.get("type") == "button":
+            if not 1 <= len(action.get("buttons") or []) <= 3:
+                errors.append("interactive buttons must number 1-3")
+        elif body.get("type") == "list":
+            rows = [
+                row
+                for section in action.get("sections") or []
+                for row in section.get("rows") or []
+            ]
+            if not action.get("button") or not 1 <= len(rows) <= 10:
+                errors.append("interactive list needs a button and 1-10 rows")
+        else:
+            errors.append("interactive.type must be button or list")
+    elif message_type == "template":
+        if not body.get("name") or not (body.get("language") or {}).get("code"):
+            errors.append("template name and language.code are required")
+    elif not body.get("id"):
+        errors.append("document.id is required")
+    return errors
+
+
+class FakeGraphAPI:
+    """Threaded loopback server; use as a context manager or start/stop."""
+
+    def __init__(
+        self,
+        faults: FaultProfile | None = None,
+        *,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.faults = faults or FaultProfile()
+        self.requests: list[RecordedRequest] = []
+        self._random = random.Random(self.faults.seed)
+        self._lock = threading.Lock()
+        self._media_ids = 0
+        self._message_ids = 0
+        self._server = ThreadingHTTPServer((host, port), _GraphHandler)
+        self._server.daemon_threads = True
+        self._server.graph = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def messages_url(self) -> str:
+        return f"{self.base_url}/v24.0/fake-phone-id/messages"
+
+    def start(self) -> FakeGraphAPI:
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            name="fake-graph-api",
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> FakeGraphAPI:
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def counts(self) -> dict[str, int]:
+        """Requests per endpoint and outcome, e.g. ``messages:200``."""
+
+        with self._lock:
+            recorded = list(self.requests)
+        counts: dict[str, int] = {}
+        for item in recorded:
+            outcome = item.fault or str(item.status)
+            key = f"{item.endpoint}:{outcome}"
+            counts[key] = counts.get(key, 0) + 1
+        return dict(sorted(counts.items()))
+
+    def _draw(self) -> tuple[str | None, float]:
+        faults = self.faults
+        with self._lock:
+            roll = self._random.random()
+            jitter = self._random.uniform(0, faults.jitter_ms)
+        delay = (faults.latency_ms + jitter) / 1000
+        if roll < faults.timeout_rate:
+            return "timeout", delay
+        roll -= faults.timeout_rate
+        if roll < faults.rate_429:
+            return "429", delay
+        roll -= faults.rate_429
+        if roll < faults.rate_5xx:
+            return "5xx", delay
+        return None, delay
+
+    def _record(self, *args) -> None:
+        with self._lock:
+            self.requests.append(RecordedRequest(*args))
+
+    def _next_id(self, endpoint: str) -> str:
+        with self._lock:
+            if endpoint == "media":
+                self._media_ids += 1
+                return f"fake-media-{self._media_ids}"
+            self._message_ids += 1
+            return f"wamid.fake.{self._message_ids}"
+
+
+class _GraphHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, Nagle plus
+    # delayed ACKs add ~40 ms to every keep-alive response.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args) -> None:  # noqa: A002
+        return
+
+    def _reply(self, status: int, body: dict, headers: dict | None = None) -> None:
+        encoded = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def _error(self, status: int, code: int, message: str, headers=None) -> None:
+        self._reply(
+            status,
+            {"error": {"message": message, "type": "OAuthException", "code": code}},
+            headers,
+        )
+
+    def do_POST(self) -> None:  # noqa: N802
+        graph: FakeGraphAPI = self.server.graph
+        endpoint = self.path.rstrip("/").rsplit("/", 1)[-1]
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if endpoint not in {"messages", "media"}:
+            graph._record(endpoint, None, 404, None)
+            self._error(404, 100, "Unknown path")
+            return
+
+        message_type = None
+        if endpoint == "messages":
+            try:
+                payload = json.loads(raw or b"null")
+            except ValueError:
+                payload = None
+            message_type = payload.get("type") if isinstance(payload, dict) else None
+
+        fault, delay = graph._draw()
+        if delay:
+            time.sleep(delay)
+        if fault == "timeout":
+            graph._record(endpoint, message_type, None, fault)
+            time.sleep(graph.faults.timeout_hold_seconds)
+            self.close_connection = True
+            return
+        if fault == "429":
+            graph._record(endpoint, message_type, 429, fault)
+            headers = {}
+            if graph.faults.retry_after_seconds is not None:
+                headers["Retry-After"] = str(graph.faults.retry_after_seconds)
+            self._error(429, 130429, "Rate limit hit", headers)
+            return
+        if fault == "5xx":
+            graph._record(endpoint, message_type, 503, fault)
+            self._error(503, 2, "Service temporarily unavailable")
+            return
+
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            graph._record(endpoint, message_type, 401, None)
+            self._error(401, 190, "Invalid OAuth access token")
+            return
+
+        if endpoint == "media":
+            content_type = self.headers.get("Content-Type", "")
+            if "multipart/form-data" not in content_type or b'name="file"' not in raw:
+                graph._record(endpoint, None, 400, None)
+                self._error(400, 100, "file is required")
+                return
+            graph._record(endpoint, None, 200, None)
+            self._reply(200, {"id": graph._next_id("media")})
+            return
+
+        errors = message_errors(payload)
+        if errors:
+            graph._record(endpoint, message_type, 400, None)
+            self._error(400, 100, "; ".join(errors))
+            return
+        graph._record(endpoint, message_type, 200, None)
+        self._reply(
+            200,
+            {
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": payload["to"], "wa_id": payload["to"]}],
+                "messages": [{"id": graph._next_id("messages")}],
+            },
+        )
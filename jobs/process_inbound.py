@@ -0,0 +1,16 @@
+"""Recover WhatsApp messages queued by fast-ack ingestion."""
+
+from app import drain_pending_inbound_messages
+
+
+def main() -> int:
+    senders, processed = drain_pending_inbound_messages()
+    print(
+        f"inbound_senders={senders} "
+        f"inbound_processed={processed}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
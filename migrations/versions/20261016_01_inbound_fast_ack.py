@@ -0,0 +1,62 @@
+"""Record the sender and payload of fast-ack inbound messages.
+
+Revision ID: 20261016_01
+Revises: 20260819_01
+Create Date: 2026-10-16
+"""
+
+from __future__ import annotations
+
+from typing import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20261016_01"
+down_revision: str | Sequence[str] | None = "20260819_01"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def _column_names(bind, table_name: str) -> set[str]:
+    inspector = sa.inspect(bind)
+    if table_name not in inspector.get_table_names():
+        return set()
+    return {column["name"] for column in inspector.get_columns(table_name)}
+
+
+def _index_names(bind, table_name: str) -> set[str]:
+    inspector = sa.inspect(bind)
+    if table_name not in inspector.get_table_names():
+        return set()
+    return {index["name"] for index in inspector.get_indexes(table_name)}
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inbound_columns = _column_names(bind, "inbound_message_events")
+    if not inbound_columns:
+        return
+
+    with op.batch_alter_table("inbound_message_events") as batch:
+        if "wa_id" not in inbound_columns:
+            batch.add_column(sa.Column("wa_id", sa.String(32)))
+        if "payload" not in inbound_columns:
+            batch.add_column(sa.Column("payload", sa.Text()))
+
+    if "idx_inbound_wa_status" not in _index_names(
+        bind,
+        "inbound_message_events",
+    ):
+        op.create_index(
+            "idx_inbound_wa_status",
+            "inbound_message_events",
+            ["wa_id", "status", "id"],
+        )
+
+
+def downgrade() -> None:
+    # Queued messages may still be waiting for a worker. The previous code
+    # ignores both nullable columns, so keep them during application rollback.
+    pass
@@ -0,0 +1,33 @@
+"""Add the shared sliding-window rate-limit table.
+
+Revision ID: 20261016_02
+Revises: 20261016_01
+Create Date: 2026-10-16
+"""
+
+from __future__ import annotations
+
+from typing import Sequence
+
+from alembic import op
+
+from models import RateLimitHit
+
+
+revision: str = "20261016_02"
+down_revision: str | Sequence[str] | None = "20261016_01"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    RateLimitHit.__table__.create(bind, checkfirst=True)
+    if bind.dialect.name == "postgresql":
+        # Counters are disposable. Skipping WAL keeps the per-message write
+        # cheap; a crash only empties the table and resets budgets.
+        op.execute("ALTER TABLE rate_limit_hits SET UNLOGGED")
+
+
+def downgrade() -> None:
+    op.drop_table("rate_limit_hits")
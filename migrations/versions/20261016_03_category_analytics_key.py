@@ -0,0 +1,77 @@
+"""Make category tallies unique per category and subcategory.
+
+Revision ID: 20261016_03
+Revises: 20261016_02
+Create Date: 2026-10-16
+"""
+
+from __future__ import annotations
+
+from typing import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20261016_03"
+down_revision: str | Sequence[str] | None = "20261016_02"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "category_analytics" not in inspector.get_table_names():
+        return
+    if "uq_category_analytics_key" in {
+        index["name"] for index in inspector.get_indexes("category_analytics")
+    }:
+        return
+
+    # The read-modify-write increment could race and create duplicate rows.
+    # Fold each duplicate group into its oldest row before adding the key.
+    op.execute(
+        """
+        UPDATE category_analytics
+        SET count = (
+            SELECT SUM(COALESCE(duplicate.count, 0))
+            FROM category_analytics AS duplicate
+            WHERE duplicate.category = category_analytics.category
+              AND duplicate.subcategory = category_analytics.subcategory
+        )
+        WHERE id IN (
+            SELECT MIN(id)
+            FROM category_analytics
+            WHERE category IS NOT NULL AND subcategory IS NOT NULL
+            GROUP BY category, subcategory
+            HAVING COUNT(*) > 1
+        )
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM category_analytics
+        WHERE category IS NOT NULL
+          AND subcategory IS NOT NULL
+          AND id NOT IN (
+              SELECT MIN(id)
+              FROM category_analytics
+              WHERE category IS NOT NULL AND subcategory IS NOT NULL
+              GROUP BY category, subcategory
+          )
+        """
+    )
+    op.create_index(
+        "uq_category_analytics_key",
+        "category_analytics",
+        ["category", "subcategory"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "uq_category_analytics_key",
+        table_name="category_analytics",
+    )
@@ -0,0 +1,28 @@
+"""Add the reusable WhatsApp media upload table.
+
+Revision ID: 20261016_04
+Revises: 20261016_03
+Create Date: 2026-10-16
+"""
+
+from __future__ import annotations
+
+from typing import Sequence
+
+from alembic import op
+
+from models import WhatsAppMediaUpload
+
+
+revision: str = "20261016_04"
+down_revision: str | Sequence[str] | None = "20261016_03"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    WhatsAppMediaUpload.__table__.create(op.get_bind(), checkfirst=True)
+
+
+def downgrade() -> None:
+    op.drop_table("whatsapp_media_uploads")
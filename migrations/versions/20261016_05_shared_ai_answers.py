@@ -0,0 +1,28 @@
+"""Add the cross-user shared AI answer cache table.
+
+Revision ID: 20261016_05
+Revises: 20261016_04
+Create Date: 2026-10-16
+"""
+
+from __future__ import annotations
+
+from typing import Sequence
+
+from alembic import op
+
+from models import SharedAIAnswer
+
+
+revision: str = "20261016_05"
+down_revision: str | Sequence[str] | None = "20261016_04"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    SharedAIAnswer.__table__.create(op.get_bind(), checkfirst=True)
+
+
+def downgrade() -> None:
+    op.drop_table("shared_ai_answers")
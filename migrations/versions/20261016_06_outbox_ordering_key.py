@@ -0,0 +1,47 @@
+"""Order outbox jobs that deliver to the same recipient.
+
+Revision ID: 20261016_06
+Revises: 20261016_05
+Create Date: 2026-10-16
+"""
+
+from __future__ import annotations
+
+from typing import Sequence
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20261016_06"
+down_revision: str | Sequence[str] | None = "20261016_05"
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if "outbox_jobs" not in inspector.get_table_names():
+        return
+
+    if "ordering_key" not in {
+        column["name"] for column in inspector.get_columns("outbox_jobs")
+    }:
+        with op.batch_alter_table("outbox_jobs") as batch:
+            batch.add_column(sa.Column("ordering_key", sa.String(64)))
+
+    if "idx_outbox_ordering_key" not in {
+        index["name"] for index in inspector.get_indexes("outbox_jobs")
+    }:
+        op.create_index(
+            "idx_outbox_ordering_key",
+            "outbox_jobs",
+            ["ordering_key", "id"],
+        )
+
+
+def downgrade() -> None:
+    # Jobs queued before a rollback may still carry a key. The previous code
+    # ignores the nullable column, so keep it during application rollback.
+    pass
@@ -1,6 +1,7 @@
 from sqlalchemy import (
     Column,
     Integer,
+    Float,
     String,
     Text,
     DateTime,
@@ -175,6 +176,15 @@ class Booking(Base):
 
 class CategoryAnalytics(Base):
     __tablename__ = "category_analytics"
+    # Tally increments upsert against this key.
+    __table_args__ = (
+        Index(
+            "uq_category_analytics_key",
+            "category",
+            "subcategory",
+            unique=True,
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
     category = Column(String, index=True)
@@ -248,6 +258,7 @@ class InboundMessageEvent(Base):
     __table_args__ = (
         Index("idx_inbound_status_lease", "status", "lease_expires_at"),
         Index("idx_inbound_expires_at", "expires_at"),
+        Index("idx_inbound_wa_status", "wa_id", "status", "id"),
     )
 
     id = Column(Integer, primary_key=True)
@@ -255,12 +266,32 @@ class InboundMessageEvent(Base):
     status = Column(String(32), nullable=False, default="RECEIVED")
     attempts = Column(Integer, nullable=False, default=0)
     last_error = Column(String(500), nullable=True)
+    # Populated only by fast-ack ingestion. The raw message is cleared once
+    # the event is terminal so the inbox does not retain conversation text.
+    wa_id = Column(String(32), nullable=True)
+    payload = Column(Text, nullable=True)
     received_at = Column(DateTime, nullable=False, default=utc_now)
     lease_expires_at = Column(DateTime, nullable=True)
     processed_at = Column(DateTime, nullable=True)
     expires_at = Column(DateTime, nullable=True)
 
 
+class RateLimitHit(Base):
+    """Accepted sliding-window hit shared by every web worker process."""
+
+    __tablename__ = "rate_limit_hits"
+
+    __table_args__ = (
+        Index("idx_rate_limit_hits_key_at", "bucket_key", "hit_at"),
+        Index("idx_rate_limit_hits_at", "hit_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    bucket_key = Column(String(128), nullable=False)
+    # Epoch seconds from the recording worker's clock.
+    hit_at = Column(Float, nullable=False)
+
+
 # =========================================================
 # USER FEEDBACK (ADDITIVE / STANDALONE)
 # =========================================================
@@ -553,11 +584,19 @@ class OutboxJob(Base):
             "status",
             "available_at",
         ),
+        Index(
+            "idx_outbox_ordering_key",
+            "ordering_key",
+            "id",
+        ),
     )
 
     id = Column(Integer, primary_key=True)
     kind = Column(String(80), nullable=False, index=True)
     dedupe_key = Column(String(255), nullable=True, unique=True, index=True)
+    # Jobs sharing a key are delivered strictly in id order. Conversation
+    # replies use a digest of the recipient so terminal rows keep no number.
+    ordering_key = Column(String(64), nullable=True)
     payload_json = Column(Text, nullable=False, default="{}")
     status = Column(String(32), nullable=False, default="PENDING")
     attempts = Column(Integer, nullable=False, default=0)
@@ -572,6 +611,42 @@ class OutboxJob(Base):
     )
 
 
+class WhatsAppMediaUpload(Base):
+    """Meta media ID reused for identical document bytes until it expires."""
+
+    __tablename__ = "whatsapp_media_uploads"
+
+    __table_args__ = (
+        Index("idx_whatsapp_media_expires_at", "expires_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    content_sha256 = Column(String(64), unique=True, nullable=False)
+    media_id = Column(String(256), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=utc_now)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class SharedAIAnswer(Base):
+    """AI answer to a PII-free question, shared across users until evicted."""
+
+    __tablename__ = "shared_ai_answers"
+
+    __table_args__ = (
+        Index("idx_shared_ai_answers_expires_at", "expires_at"),
+        Index("idx_shared_ai_answers_last_used_at", "last_used_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    # SHA-256 of the normalised prompt, language, content version, and context.
+    cache_key = Column(String(64), unique=True, nullable=False)
+    answer = Column(Text, nullable=False)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=utc_now)
+    last_used_at = Column(DateTime, nullable=False, default=utc_now)
+    expires_at = Column(DateTime, nullable=False)
+
+
 # =========================================================
 # CONSULTATION FULFILMENT AND PAYMENT RECONCILIATION
 # =========================================================
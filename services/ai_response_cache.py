@@ -0,0 +1,52 @@
+"""Short-lived per-user cache of remote AI answers.
+
+Both remote providers read and fill the same cache, keyed by the user's
+safety identifier and a digest of the normalised, already-scrubbed prompt.
+It absorbs a user repeating the same question within
+``AI_RESPONSE_CACHE_TTL_SECONDS`` whichever provider answered first.
+Post-payment replies are never cached.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+
+from config import AI_RESPONSE_CACHE_TTL_SECONDS
+from services.ttl_cache import TTLCache
+
+
+AI_CACHE_TTL = AI_RESPONSE_CACHE_TTL_SECONDS
+AI_CACHE_MAX_ENTRIES = 1_000
+# Keyed by (safety identifier, prompt digest).
+AI_RESPONSE_CACHE = TTLCache(
+    max_entries=AI_CACHE_MAX_ENTRIES,
+    ttl_seconds=AI_CACHE_TTL,
+    name="ai_responses",
+)
+
+_UNCACHED_CONTEXTS = frozenset({"post_payment"})
+
+
+def _normalize_prompt(prompt: str) -> str:
+    return " ".join(str(prompt or "").lower().strip().split())
+
+
+def _prompt_digest(prompt: str) -> str:
+    return hashlib.sha256(_normalize_prompt(prompt).encode("utf-8")).hexdigest()
+
+
+def cached_reply(user_key: str, prompt: str, context: str) -> str | None:
+    if AI_CACHE_TTL <= 0 or context in _UNCACHED_CONTEXTS:
+        return None
+
+    key = (user_key, _prompt_digest(prompt))
+    return AI_RESPONSE_CACHE.get(key, now=time.time())
+
+
+def remember_reply(user_key: str, prompt: str, context: str, reply: str) -> None:
+    if context in _UNCACHED_CONTEXTS:
+        return
+
+    key = (user_key, _prompt_digest(prompt))
+    AI_RESPONSE_CACHE.set(key, reply, ttl_seconds=AI_CACHE_TTL, now=time.time())
@@ -1,31 +1,84 @@
-"""Configurable, privacy-preserving AI provider router."""
+"""Configurable, privacy-preserving AI provider router.
+
+The guardrail and PII scrubbing run once here. Providers receive only the
+screened message, so a hedged second request never repeats either step.
+Remote answers to PII-free questions are shared across users through
+``services.shared_answer_cache``. Within the configured order, providers that
+``services.provider_health`` scores as unhealthy are tried last.
+
+With ``AI_HEDGE_DELAY_MS`` set, the first remote provider runs on the
+caller's thread and, if it has not answered within the delay, the remaining
+providers are tried on a small hedge pool. A primary that answers wins; one
+that fails hands over to the hedge already in flight instead of starting the
+next provider from scratch. Blocking HTTP calls cannot be cancelled, so a
+losing hedge keeps its slot until its own timeout. At most
+``AI_HEDGE_MAX_IN_FLIGHT`` hedges run at once and a request that finds every
+slot taken is not hedged, so abandoned calls never queue new work.
+"""
 
 from __future__ import annotations
 
+import atexit
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import BoundedSemaphore, Event, Lock
 
-from services.ai_safety import guardrail_response, safety_identifier, scrub_pii
+from config import AI_HEDGE_DELAY_MS, AI_HEDGE_MAX_IN_FLIGHT
+from services.ai_safety import (
+    guardrail_response,
+    pii_was_scrubbed,
+    safety_identifier,
+    scrub_pii,
+)
+from services.provider_health import rank_providers, routing_report
+from services.shared_answer_cache import (
+    cached_answer,
+    remember_answer,
+    shared_cache_key,
+)
 
 
 logger = logging.getLogger("services.ai_router")
 
 _SUPPORTED_PROVIDERS = {"claude", "openai", "local"}
+_PROVIDER_KEYS = {"claude": "ANTHROPIC_API_KEY", "openai": "OPENAI_API_KEY"}
+_PROVIDER_ERRORS = {"ClaudeProviderError", "OpenAIProviderError"}
+
+# Hedges only: a slot is taken before submitting, so the pool never queues.
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=AI_HEDGE_MAX_IN_FLIGHT,
+    thread_name_prefix="nyaysetu-ai-hedge",
+)
+atexit.register(_hedge_executor.shutdown, wait=False, cancel_futures=True)
+_hedge_slots = BoundedSemaphore(AI_HEDGE_MAX_IN_FLIGHT)
+_hedge_counters = {
+    "hedged_requests": 0,
+    "hedge_wins": 0,
+    "hedge_losses": 0,
+    "hedges_skipped": 0,
+}
+_hedge_counters_guard = Lock()
 
 
 def _provider_order():
-    selected = os.getenv("AI_PROVIDER", "auto").strip().lower()
+    return _parse_provider_order(
+        os.getenv("AI_PROVIDER", "auto"),
+        os.getenv("AI_PROVIDER_ORDER", "claude,openai,local"),
+    )
+
+
+@lru_cache(maxsize=8)
+def _parse_provider_order(selected, configured):
+    selected = selected.strip().lower()
     if selected in {"anthropic", "claude"}:
-        return ["claude", "local"]
+        return ("claude", "local")
     if selected in {"openai"}:
-        return ["openai", "local"]
+        return ("openai", "local")
     if selected in {"local", "offline", "none"}:
-        return ["local"]
+        return ("local",)
 
-    configured = os.getenv(
-        "AI_PROVIDER_ORDER",
-        "claude,openai,local",
-    )
     order = []
     for raw_provider in configured.split(","):
         provider = raw_provider.strip().lower()
@@ -35,15 +88,228 @@ def _provider_order():
             order.append(provider)
     if "local" not in order:
         order.append("local")
-    return order
+    return tuple(order)
+
+
+def _remote_providers(order):
+    remote = []
+    for provider in order:
+        if provider == "local":
+            break
+        remote.append(provider)
+    return remote
+
+
+def provider_routing_report() -> dict:
+    """Return each remote provider's health and the order it is tried in."""
 
+    return routing_report(_remote_providers(_provider_order()))
 
-def _local_reply(message, user, context):
+
+def _local_reply(provider_message, user, context):
     from services.local_ai_service import local_ai_reply
 
-    # LOCAL_AI_PROVIDER may point to an Ollama host, so redact before this
-    # boundary as well.
-    return local_ai_reply(scrub_pii(message), user, context)
+    # LOCAL_AI_PROVIDER may point to an Ollama host, so it too receives only
+    # the scrubbed message.
+    return local_ai_reply(provider_message, user, context)
+
+
+def _remote_reply(provider, provider_message, user, context, pii_scrubbed):
+    if provider == "claude":
+        from services.claude_service import claude_reply_screened
+
+        return claude_reply_screened(
+            provider_message,
+            user,
+            context,
+            pii_scrubbed=pii_scrubbed,
+        )
+
+    from services.openai_service import openai_reply_screened
+
+    return openai_reply_screened(
+        provider_message,
+        user,
+        context,
+        pii_scrubbed=pii_scrubbed,
+    )
+
+
+def _log_failure(provider, user_ref, exc) -> None:
+    reason = (
+        str(exc)
+        if exc.__class__.__name__ in _PROVIDER_ERRORS
+        else type(exc).__name__
+    )
+    logger.warning(
+        "AI_PROVIDER_FAILED | provider=%s | user_ref=%s | reason=%s",
+        provider,
+        user_ref,
+        reason,
+    )
+
+
+def _count(name: str) -> None:
+    with _hedge_counters_guard:
+        _hedge_counters[name] += 1
+
+
+def hedge_metrics() -> dict:
+    with _hedge_counters_guard:
+        counters = dict(_hedge_counters)
+    return {
+        "hedge_delay_ms": AI_HEDGE_DELAY_MS,
+        "hedge_max_in_flight": AI_HEDGE_MAX_IN_FLIGHT,
+        **counters,
+    }
+
+
+def _sequential_reply(remote, provider_message, user, context, pii_scrubbed, user_ref):
+    for provider in remote:
+        try:
+            return _remote_reply(
+                provider,
+                provider_message,
+                user,
+                context,
+                pii_scrubbed,
+            )
+        except Exception as exc:
+            _log_failure(provider, user_ref, exc)
+    return None
+
+
+def _run_hedge(
+    slots,
+    hedge,
+    remote,
+    provider_message,
+    user,
+    context,
+    pii_scrubbed,
+    user_ref,
+):
+    """Try ``remote`` in order unless the primary settles within the delay."""
+
+    try:
+        if hedge["primary_done"].wait(AI_HEDGE_DELAY_MS / 1000):
+            return None
+        hedge["started"].set()
+        _count("hedged_requests")
+        logger.info(
+            "AI_HEDGE_STARTED | provider=%s | user_ref=%s",
+            remote[0],
+            user_ref,
+        )
+        return _sequential_reply(
+            remote,
+            provider_message,
+            user,
+            context,
+            pii_scrubbed,
+            user_ref,
+        )
+    finally:
+        slots.release()
+
+
+def _submit_hedge(
+    hedge,
+    remote,
+    provider_message,
+    user,
+    context,
+    pii_scrubbed,
+    user_ref,
+):
+    """Start a hedge on a free slot, or return None when every slot is taken."""
+
+    slots = _hedge_slots
+    if not slots.acquire(blocking=False):
+        return None
+    try:
+        return _hedge_executor.submit(
+            _run_hedge,
+            slots,
+            hedge,
+            remote,
+            provider_message,
+            user,
+            context,
+            pii_scrubbed,
+            user_ref,
+        )
+    except RuntimeError:
+        # The executor is shutting down with the process.
+        slots.release()
+        return None
+
+
+def _hedged_reply(remote, provider_message, user, context, pii_scrubbed, user_ref):
+    """Answer from the primary on this thread, hedging the rest after a delay."""
+
+    primary, fallbacks = remote[0], remote[1:]
+    hedge = {"primary_done": Event(), "started": Event()}
+    future = _submit_hedge(
+        hedge,
+        fallbacks,
+        provider_message,
+        user,
+        context,
+        pii_scrubbed,
+        user_ref,
+    )
+    if future is None:
+        _count("hedges_skipped")
+        logger.info("AI_HEDGE_SKIPPED | reason=pool_full | user_ref=%s", user_ref)
+        return _sequential_reply(
+            remote,
+            provider_message,
+            user,
+            context,
+            pii_scrubbed,
+            user_ref,
+        )
+
+    try:
+        answer = _remote_reply(
+            primary,
+            provider_message,
+            user,
+            context,
+            pii_scrubbed,
+        )
+    except Exception as exc:
+        _log_failure(primary, user_ref, exc)
+        answer = None
+    finally:
+        hedge["primary_done"].set()
+
+    if answer is not None:
+        if hedge["started"].is_set():
+            # The hedge keeps its slot until it finishes; its answer is dropped.
+            _count("hedge_losses")
+        return answer
+
+    hedge_answer = future.result()
+    if not hedge["started"].is_set():
+        # The primary failed before the delay: try the rest on this thread.
+        return _sequential_reply(
+            fallbacks,
+            provider_message,
+            user,
+            context,
+            pii_scrubbed,
+            user_ref,
+        )
+    if hedge_answer is not None:
+        _count("hedge_wins")
+        logger.info(
+            "AI_HEDGE_RESULT | winner=%s | user_ref=%s",
+            "/".join(fallbacks),
+            user_ref,
+        )
+    return hedge_answer
 
 
 def ai_reply_router(message, user, context="general"):
@@ -53,50 +319,48 @@ def ai_reply_router(message, user, context="general"):
     if guarded:
         return guarded
 
+    provider_message = scrub_pii(message)
+    pii_scrubbed = pii_was_scrubbed(message, provider_message)
     user_ref = safety_identifier(user)
-    for provider in _provider_order():
-        if provider == "local":
-            return _local_reply(message, user, context)
-
-        if provider == "claude":
-            if not os.getenv("ANTHROPIC_API_KEY"):
-                continue
-            try:
-                from services.claude_service import claude_reply_external
-
-                return claude_reply_external(message, user, context)
-            except Exception as exc:
-                reason = (
-                    str(exc)
-                    if exc.__class__.__name__ == "ClaudeProviderError"
-                    else type(exc).__name__
-                )
-                logger.warning(
-                    "AI_PROVIDER_FAILED | provider=claude | user_ref=%s | reason=%s",
-                    user_ref,
-                    reason,
-                )
-                continue
-
-        if provider == "openai":
-            if not os.getenv("OPENAI_API_KEY"):
-                continue
-            try:
-                from services.openai_service import openai_reply_external
-
-                return openai_reply_external(message, user, context)
-            except Exception as exc:
-                reason = (
-                    str(exc)
-                    if exc.__class__.__name__ == "OpenAIProviderError"
-                    else type(exc).__name__
-                )
-                logger.warning(
-                    "AI_PROVIDER_FAILED | provider=openai | user_ref=%s | reason=%s",
-                    user_ref,
-                    reason,
-                )
-                continue
-
-    # Defensive fallback if an invalid provider order somehow becomes empty.
-    return _local_reply(message, user, context)
+    cache_key = shared_cache_key(
+        provider_message,
+        user,
+        context,
+        pii_scrubbed=pii_scrubbed,
+    )
+    if cache_key:
+        cached = cached_answer(cache_key)
+        if cached:
+            logger.info("AI_SHARED_CACHE_HIT | user_ref=%s", user_ref)
+            return cached
+
+    remote = rank_providers(
+        [
+            provider
+            for provider in _remote_providers(_provider_order())
+            if os.getenv(_PROVIDER_KEYS[provider])
+        ]
+    )
+
+    reply = None
+    if remote:
+        strategy = (
+            _hedged_reply
+            if AI_HEDGE_DELAY_MS > 0 and len(remote) > 1
+            else _sequential_reply
+        )
+        reply = strategy(
+            remote,
+            provider_message,
+            user,
+            context,
+            pii_scrubbed,
+            user_ref,
+        )
+    if reply is not None:
+        # Local answers are cheap and must not outlive a provider outage, so
+        # only remote answers are shared.
+        if cache_key:
+            remember_answer(cache_key, reply)
+        return reply
+    return _local_reply(provider_message, user, context)
@@ -2,15 +2,21 @@
 
 from __future__ import annotations
 
+import atexit
 import enum
 import json
 import logging
+import time
+from collections import Counter
 from collections.abc import Mapping, Sequence
 from datetime import date, datetime
+from threading import Lock
 from typing import Any
 
+from sqlalchemy.dialects import postgresql, sqlite
+
 from config import ANALYTICS_MAX_PROPERTY_BYTES
-from db import session_scope
+from db import SessionLocal, active_unit_of_work, session_scope
 from models import AnalyticsEvent
 
 
@@ -115,6 +121,13 @@ def record_event(
             session_id=(session_id or "").strip()[:128] or None,
             properties_json=_compact_properties(properties),
         )
+        unit = active_unit_of_work()
+        if unit is not None:
+            # Join the inbound message's transaction. The savepoint keeps a
+            # failed analytics insert from aborting the business work.
+            with unit.begin_nested():
+                unit.add(event)
+            return True
         with session_scope() as session:
             session.add(event)
         return True
@@ -128,6 +141,136 @@ def record_event(
         return False
 
 
+
+def increment_tallies(
+    db,
+    model,
+    key_columns: Sequence[str],
+    increments: Mapping[tuple, int],
+    *,
+    count_column: str = "count",
+) -> None:
+    """Add each amount to its tally row with one atomic upsert statement.
+
+    ``key_columns`` must be covered by a unique index on ``model``. PostgreSQL
+    and SQLite run ``INSERT ... ON CONFLICT DO UPDATE``, so concurrent
+    increments neither lose updates nor hold a row lock across a read.
+    """
+
+    rows = [
+        {**dict(zip(key_columns, key)), count_column: amount}
+        for key, amount in increments.items()
+        if amount
+    ]
+    if not rows:
+        return
+
+    table = model.__table__
+    dialect_name = db.get_bind().dialect.name
+    if dialect_name in {"postgresql", "sqlite"}:
+        insert = (
+            postgresql.insert
+            if dialect_name == "postgresql"
+            else sqlite.insert
+        )(table).values(rows)
+        db.execute(
+            insert.on_conflict_do_update(
+                index_elements=list(key_columns),
+                set_={
+                    count_column: (
+                        table.c[count_column]
+                        + insert.excluded[count_column]
+                    )
+                },
+            )
+        )
+        return
+
+    # Other dialects are not deployed; keep them correct, if not single-trip.
+    for row in rows:
+        updated = db.execute(
+            table.update()
+            .where(*(table.c[name] == row[name] for name in key_columns))
+            .values({count_column: table.c[count_column] + row[count_column]})
+        ).rowcount
+        if not updated:
+            db.execute(table.insert().values(row))
+
+
+class Tally:
+    """Per-key counter table such as ``CategoryAnalytics``.
+
+    With no flush interval each increment joins the caller's transaction. A
+    positive interval coalesces increments in process memory and writes them
+    in one bulk upsert once the interval has passed and at exit, so a crash
+    loses at most that many seconds of counts.
+    """
+
+    def __init__(
+        self,
+        model,
+        key_columns: Sequence[str],
+        *,
+        flush_interval_seconds: float = 0.0,
+        session_factory=SessionLocal,
+    ) -> None:
+        self.model = model
+        self.key_columns = tuple(key_columns)
+        self.flush_interval_seconds = flush_interval_seconds
+        self._session_factory = session_factory
+        self._pending: Counter[tuple] = Counter()
+        self._last_flush = time.monotonic()
+        self._lock = Lock()
+        if flush_interval_seconds > 0:
+            atexit.register(self.flush)
+
+    def add(self, db, amount: int = 1, **keys) -> None:
+        key = tuple(keys[name] for name in self.key_columns)
+        if self.flush_interval_seconds <= 0:
+            increment_tallies(db, self.model, self.key_columns, {key: amount})
+            return
+
+        with self._lock:
+            self._pending[key] += amount
+            due = (
+                time.monotonic() - self._last_flush
+                >= self.flush_interval_seconds
+            )
+        if due:
+            self.flush()
+
+    def pending(self) -> dict[tuple, int]:
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self) -> int:
+        """Write buffered increments in their own transaction; return rows."""
+
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            db = self._session_factory()
+            try:
+                increment_tallies(db, self.model, self.key_columns, pending)
+                db.commit()
+            finally:
+                db.close()
+        except Exception as exc:
+            # Put the counts back so the next flush retries them.
+            with self._lock:
+                self._pending.update(pending)
+            logger.warning(
+                "Tally flush failed | table=%s | error_type=%s",
+                self.model.__tablename__,
+                type(exc).__name__,
+            )
+            return 0
+        return len(pending)
+
+
 # Friendly aliases for callers that prefer product-analytics terminology.
 track_event = record_event
 record_analytics_event = record_event
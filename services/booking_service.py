@@ -31,7 +31,7 @@ from config import (
     RAZORPAY_KEY_ID,
     RAZORPAY_KEY_SECRET,
 )
-from db import SessionLocal
+from db import SessionLocal, commit_now
 from models import (
     Booking,
     BookingBlackout,
@@ -699,7 +699,12 @@ def create_booking_temp(
 
     payment_link_id = None
     razorpay_client = None
+    savepoint = None
     try:
+        # A savepoint, not a rollback, undoes this booking on failure, so the
+        # caller's earlier work in the same unit of work, such as its consent
+        # record, survives.
+        savepoint = db.begin_nested()
         _acquire_capacity_lock(db, booking_date)
         capacity_error = _capacity_error(
             db,
@@ -708,9 +713,7 @@ def create_booking_temp(
             lock=True,
         )
         if capacity_error:
-            # Release any row locks acquired by the capacity check before the
-            # caller performs network I/O to notify the user.
-            db.rollback()
+            savepoint.rollback()
             return None, capacity_error
 
         token = create_token()
@@ -768,12 +771,18 @@ def create_booking_temp(
             raise RuntimeError("Razorpay response is missing id or short_url")
 
         booking.razorpay_payment_link_id = payment_link_id
-        db.commit()
+        savepoint.commit()
+        # The user is about to receive this link, so the booking must survive
+        # even if the rest of the caller's unit of work does not.
+        commit_now(db)
         db.refresh(booking)
         return booking, short_url
 
     except Exception:
-        db.rollback()
+        if savepoint is not None and savepoint.is_active:
+            savepoint.rollback()
+        else:
+            db.rollback()
         _cancel_payment_link_safely(razorpay_client, payment_link_id)
         logger.exception(
             "Booking/payment-link creation failed | user_id=%s",
@@ -953,6 +962,36 @@ def mark_booking_as_paid(
 # =========================================================
 # AUTO EXPIRE OLD PENDING BOOKINGS
 # =========================================================
+def expire_pending_booking_if_stale(db, booking: Booking | None):
+    """Expire one stale PENDING booking the conversation is about to read.
+
+    Capacity already ignores stale PENDING rows and maintenance expires them
+    in bulk, so the webhook only pays for a transition it is about to show.
+    A fresh or non-pending booking costs no database statement.
+    """
+    if booking is None or booking.status != BookingStatus.PENDING:
+        return booking
+    if _as_utc_naive(booking.created_at) >= _payment_expiry_cutoff():
+        return booking
+
+    expired = (
+        db.query(Booking)
+        .filter(
+            Booking.id == booking.id,
+            Booking.status == BookingStatus.PENDING,
+        )
+        .update(
+            {"status": BookingStatus.EXPIRED},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    db.refresh(booking)
+    if expired:
+        logger.info("Expired stale pending booking | booking_id=%s", booking.id)
+    return booking
+
+
 def expire_old_pending_bookings(db):
     """Expire stale pending bookings using, but never closing, `db`."""
     try:
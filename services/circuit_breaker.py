@@ -0,0 +1,180 @@
+"""Provider-agnostic circuit breakers for remote AI providers.
+
+Each provider has one breaker per process. It opens when the provider rate
+limits us (for a provider-specific cool-down) or after a burst of 5xx and
+transport failures inside ``AI_BREAKER_WINDOW_SECONDS``. Once the open period
+ends the breaker goes half-open and lets exactly one probe request through:
+its success closes the breaker, its failure opens it again. While open, the
+router moves straight to the next provider instead of waiting on a degraded
+one.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections import deque
+from collections.abc import Callable
+from threading import Lock
+
+from config import (
+    AI_BREAKER_FAILURE_THRESHOLD,
+    AI_BREAKER_OPEN_SECONDS,
+    AI_BREAKER_WINDOW_SECONDS,
+)
+
+
+logger = logging.getLogger("services.circuit_breaker")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker with a sliding failure window."""
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_threshold: int,
+        window_seconds: float,
+        open_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self._failures: deque[float] = deque()
+            self._open_until = 0.0
+            self._probe_in_flight = False
+            self.opened_count = 0
+            self.rejected_count = 0
+
+    def allow(self) -> bool:
+        """Return whether a request may be sent now.
+
+        A ``True`` result must be followed by ``record_success`` or
+        ``record_failure`` so a half-open probe is always settled.
+        """
+
+        now = self._clock()
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and now >= self._open_until:
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+                logger.info("AI_BREAKER_HALF_OPEN | provider=%s", self.name)
+            if self.state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected_count += 1
+            return False
+
+    def is_open(self) -> bool:
+        """Return whether requests are still being refused.
+
+        An open breaker whose period has ended counts as closed here: the
+        next ``allow()`` turns it half-open and lets a probe through.
+        """
+
+        with self._lock:
+            return self.state == OPEN and self._clock() < self._open_until
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info("AI_BREAKER_CLOSED | provider=%s", self.name)
+            self.state = CLOSED
+            self._failures.clear()
+            self._probe_in_flight = False
+
+    def record_failure(self, *, open_seconds: float | None = None) -> None:
+        """Count a 5xx/transport failure, or open at once for ``open_seconds``.
+
+        Callers pass ``open_seconds`` for a rate limit, which needs no burst
+        to prove the provider wants us to back off.
+        """
+
+        now = self._clock()
+        with self._lock:
+            self._failures.append(now)
+            while self._failures and self._failures[0] <= now - self.window_seconds:
+                self._failures.popleft()
+            if (
+                open_seconds is None
+                and self.state == CLOSED
+                and len(self._failures) < self.failure_threshold
+            ):
+                return
+            self._open(now, self.open_seconds if open_seconds is None else open_seconds)
+
+    def snapshot(self) -> dict:
+        now = self._clock()
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_failures": len(self._failures),
+                "open_for_seconds": (
+                    round(max(0.0, self._open_until - now), 1)
+                    if self.state == OPEN
+                    else 0.0
+                ),
+                "opened": self.opened_count,
+                "rejected": self.rejected_count,
+            }
+
+    def _open(self, now: float, open_seconds: float) -> None:
+        """Open the breaker; caller holds ``_lock``."""
+
+        self.state = OPEN
+        self._open_until = max(self._open_until, now + open_seconds)
+        self._probe_in_flight = False
+        self._failures.clear()
+        self.opened_count += 1
+        logger.warning(
+            "AI_BREAKER_OPEN | provider=%s | seconds=%s",
+            self.name,
+            round(self._open_until - now, 1),
+        )
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_guard = Lock()
+
+
+def breaker_for(provider: str) -> CircuitBreaker:
+    with _breakers_guard:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                provider,
+                failure_threshold=AI_BREAKER_FAILURE_THRESHOLD,
+                window_seconds=AI_BREAKER_WINDOW_SECONDS,
+                open_seconds=AI_BREAKER_OPEN_SECONDS,
+            )
+            _breakers[provider] = breaker
+        return breaker
+
+
+def breaker_snapshots() -> dict:
+    with _breakers_guard:
+        breakers = dict(_breakers)
+    return {name: breaker.snapshot() for name, breaker in sorted(breakers.items())}
+
+
+def reset_breakers() -> None:
+    with _breakers_guard:
+        breakers = list(_breakers.values())
+    for breaker in breakers:
+        breaker.reset()
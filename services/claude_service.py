@@ -2,10 +2,14 @@
 
 from __future__ import annotations
 
+import atexit
 import logging
 import os
 import re
+import time
+from threading import Lock
 
+from services.ai_response_cache import cached_reply, remember_reply
 from services.ai_safety import (
     guardrail_response,
     language_code,
@@ -13,6 +17,8 @@ from services.ai_safety import (
     safety_identifier,
     scrub_pii,
 )
+from services.circuit_breaker import breaker_for
+from services.provider_health import record_call, record_usage
 
 
 logger = logging.getLogger("services.claude_service")
@@ -63,12 +69,11 @@ def _language_instruction(user) -> str:
     return "Reply in concise, respectful English."
 
 
-def _system_prompt(user) -> str:
-    return f"""
+# Byte-identical for every user so Anthropic can serve it from its prompt
+# cache; the per-user language line goes in a separate block after it.
+_STATIC_SYSTEM_PROMPT = """
 You are NyaySetu, an Indian legal information assistant, not a lawyer.
 
-{_language_instruction(user)}
-
 Rules:
 - Provide general Indian legal information only.
 - Explain lawful processes, documents, and possible next steps.
@@ -86,6 +91,17 @@ Rules:
 """.strip()
 
 
+def _system_blocks(user) -> list[dict]:
+    return [
+        {
+            "type": "text",
+            "text": _STATIC_SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"},
+        },
+        {"type": "text", "text": _language_instruction(user)},
+    ]
+
+
 def _model_supports_temperature(model: str) -> bool:
     """Return whether the selected Claude model accepts sampling temperature.
 
@@ -117,7 +133,7 @@ def _message_request(model: str, provider_message: str, user, user_ref: str) ->
     request = {
         "model": model,
         "max_tokens": _env_int("ANTHROPIC_MAX_TOKENS", 400, 100, 1000),
-        "system": _system_prompt(user),
+        "system": _system_blocks(user),
         "metadata": {"user_id": user_ref},
         "messages": [{"role": "user", "content": provider_message}],
     }
@@ -126,6 +142,69 @@ def _message_request(model: str, provider_message: str, user, user_ref: str) ->
     return request
 
 
+# One client per process: it is thread-safe and keeps its connection pool, so
+# answers after the first skip the TCP and TLS handshake. It is rebuilt only
+# when the key or timeout changes.
+_client = None
+_client_settings = None
+_client_guard = Lock()
+
+
+def _anthropic_client(api_key: str):
+    global _client, _client_settings
+
+    from anthropic import Anthropic
+
+    timeout = _env_float("ANTHROPIC_TIMEOUT_SECONDS", 15.0, 2.0, 60.0)
+    settings = (api_key, timeout)
+    with _client_guard:
+        if _client is None or _client_settings != settings:
+            _client = Anthropic(api_key=api_key, max_retries=0, timeout=timeout)
+            _client_settings = settings
+        return _client
+
+
+def _close_client() -> None:
+    close = getattr(_client, "close", None)
+    if close:
+        close()
+
+
+atexit.register(_close_client)
+
+
+def _record_failure(breaker, exc: Exception, elapsed: float) -> None:
+    status = getattr(exc, "status_code", None)
+    if status == 429:
+        breaker.record_failure(
+            open_seconds=60 * _env_int("ANTHROPIC_BREAKER_MINUTES", 30, 1, 120)
+        )
+    elif status is None or status >= 500:
+        breaker.record_failure()
+    else:
+        # A 4xx about this request shows the provider itself is up.
+        breaker.record_success()
+        record_call("claude", elapsed, ok=True)
+        return
+    record_call("claude", elapsed, ok=False)
+
+
+def _record_prompt_usage(usage) -> None:
+    """Record prompt tokens; Anthropic reports cache reads and writes apart."""
+
+    if usage is None:
+        return
+    uncached = getattr(usage, "input_tokens", None) or 0
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    record_usage(
+        "claude",
+        prompt_tokens=uncached + cache_read + cache_write,
+        cached_tokens=cache_read,
+        cache_write_tokens=cache_write,
+    )
+
+
 def _local_fallback(message: str, user, context: str) -> str:
     from services.local_ai_service import local_ai_reply
 
@@ -135,13 +214,31 @@ def _local_fallback(message: str, user, context: str) -> str:
 def claude_reply_external(message, user, context="general"):
     """Call Anthropic or raise ``ClaudeProviderError`` for router fallback."""
 
-    if not message:
-        return "Please ask a legal question."
-
     guarded = guardrail_response(message, user)
     if guarded:
         return guarded
 
+    provider_message = scrub_pii(message)
+    return claude_reply_screened(
+        provider_message,
+        user,
+        context,
+        pii_scrubbed=pii_was_scrubbed(message, provider_message),
+    )
+
+
+def claude_reply_screened(
+    provider_message: str,
+    user,
+    context: str = "general",
+    *,
+    pii_scrubbed: bool = False,
+) -> str:
+    """Call Anthropic with a message the caller already guarded and scrubbed."""
+
+    if not provider_message:
+        return "Please ask a legal question."
+
     api_key = os.getenv("ANTHROPIC_API_KEY", "")
     if not api_key:
         raise ClaudeProviderError("missing_api_key")
@@ -152,27 +249,30 @@ def claude_reply_external(message, user, context="general"):
         # current model instead of silently using a retired identifier.
         raise ClaudeProviderError("missing_model")
 
-    provider_message = scrub_pii(message)
     user_ref = safety_identifier(user)
+    cached = cached_reply(user_ref, provider_message, context)
+    if cached:
+        logger.debug("AI_CACHE_HIT | provider=claude | user_ref=%s", user_ref)
+        return cached
+
     logger.info(
         "AI_CALL | provider=claude | user_ref=%s | context=%s | pii_scrubbed=%s",
         user_ref,
         context,
-        pii_was_scrubbed(message, provider_message),
+        pii_scrubbed,
     )
 
     try:
-        from anthropic import Anthropic
+        import anthropic  # noqa: F401
     except ImportError as exc:
         raise ClaudeProviderError("anthropic_package_unavailable") from exc
 
+    breaker = breaker_for("claude")
+    if not breaker.allow():
+        raise ClaudeProviderError("circuit_breaker_open")
+    started = time.monotonic()
     try:
-        client = Anthropic(
-            api_key=api_key,
-            max_retries=0,
-            timeout=_env_float("ANTHROPIC_TIMEOUT_SECONDS", 15.0, 2.0, 60.0),
-        )
-        response = client.messages.create(
+        response = _anthropic_client(api_key).messages.create(
             **_message_request(
                 model,
                 provider_message,
@@ -180,15 +280,23 @@ def claude_reply_external(message, user, context="general"):
                 user_ref,
             )
         )
-        answer = response.content[0].text.strip()
     except Exception as exc:
+        _record_failure(breaker, exc, time.monotonic() - started)
         raise ClaudeProviderError(type(exc).__name__) from exc
+    breaker.record_success()
+    record_call("claude", time.monotonic() - started, ok=True)
+    _record_prompt_usage(getattr(response, "usage", None))
 
+    try:
+        answer = response.content[0].text.strip()
+    except (AttributeError, IndexError, TypeError) as exc:
+        raise ClaudeProviderError("malformed_response") from exc
     if not answer:
         raise ClaudeProviderError("empty_response")
 
-    answer = scrub_pii(answer)
-    return answer + DISCLAIMER[language_code(user)]
+    answer = scrub_pii(answer) + DISCLAIMER[language_code(user)]
+    remember_reply(user_ref, provider_message, context, answer)
+    return answer
 
 
 def claude_reply(message, user, context="general"):
@@ -0,0 +1,77 @@
+"""Compiled payloads for interactive menus that depend only on language.
+
+Menus such as the home buttons or the legal-guide list are rebuilt from the
+same translations on every send. ``MenuCache`` builds each one once per
+``(menu, language, content version)``, validates it once, and keeps both the
+wrapper arguments (used for async queueing and deferred retries) and the
+ready-to-send Graph payload. Cached values are shared and must not be mutated.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from threading import Lock
+from types import SimpleNamespace
+from typing import Any, Callable
+
+from services.legal_knowledge import language_code
+from services.whatsapp_service import button_message, list_message, prepare_message
+
+
+MenuBuilder = Callable[[Any], dict]
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledMenu:
+    operation: str
+    fields: dict
+    message: dict
+
+
+def _compile(operation: str, fields: dict) -> CompiledMenu:
+    if operation == "buttons":
+        message = button_message("0", fields["body"], fields["buttons"])
+    elif operation == "list":
+        message = list_message(
+            "0",
+            fields["header"],
+            fields["body"],
+            fields["rows"],
+            fields["section_title"],
+        )
+    else:
+        raise ValueError(f"unsupported menu operation: {operation}")
+    return CompiledMenu(operation, fields, prepare_message(message))
+
+
+class MenuCache:
+    """Lazily compiled menus keyed by name, language, and content version."""
+
+    def __init__(
+        self,
+        builders: dict[str, tuple[str, MenuBuilder]],
+        *,
+        version: str,
+    ) -> None:
+        self._builders = builders
+        self.version = version
+        self._compiled: dict[tuple[str, str, str], CompiledMenu] = {}
+        self._lock = Lock()
+
+    def get(self, name: str, user: Any) -> CompiledMenu:
+        language = language_code(user)
+        key = (name, language, self.version)
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            return compiled
+
+        operation, builder = self._builders[name]
+        # Builders see only the language, so nothing user-specific can leak
+        # into a payload that other users will receive.
+        compiled = _compile(operation, builder(SimpleNamespace(language=language)))
+        with self._lock:
+            return self._compiled.setdefault(key, compiled)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._compiled.clear()
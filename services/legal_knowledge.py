@@ -15,6 +15,8 @@ from __future__ import annotations
 
 import re
 import unicodedata
+from functools import lru_cache
+from types import SimpleNamespace
 from typing import Any, Optional
 
 from category_labels import CATEGORY_LABELS
@@ -1476,6 +1478,12 @@ def find_guide(message: str) -> tuple[str, str]:
     return "Other", "Not Sure"
 
 
+def content_revision() -> tuple[str, str]:
+    """Return the (version, review date) that rendered guides depend on."""
+
+    return LEGAL_CONTENT_VERSION, LEGAL_CONTENT_REVIEWED_ON
+
+
 def guide_message(
     user: Any,
     category: str,
@@ -1491,8 +1499,28 @@ def guide_message(
         or subcategory
         or "Not Sure"
     )
+    return _rendered_guide(
+        language_code(user),
+        resolved_category,
+        resolved_subcategory,
+        include_feedback_prompt,
+        *content_revision(),
+    )
 
-    lang = language_code(user)
+
+# Guides depend only on these arguments, so each combination is rendered once.
+# The content version and review date are part of the key: a new revision
+# renders afresh and stale entries age out of the bounded cache.
+@lru_cache(maxsize=1_024)
+def _rendered_guide(
+    lang: str,
+    resolved_category: str,
+    resolved_subcategory: str,
+    include_feedback_prompt: bool,
+    content_version: str,
+    reviewed_on: str,
+) -> str:
+    user = SimpleNamespace(language=lang)
     content = _GUIDES[resolved_category].get(
         lang,
         _GUIDES[resolved_category]["en"],
@@ -1505,8 +1533,8 @@ def guide_message(
         return "\n".join(f"• {item}" for item in items)
 
     review_status = (
-        f"{ui(user, 'reviewed')}: {LEGAL_CONTENT_REVIEWED_ON}"
-        if LEGAL_CONTENT_REVIEWED_ON
+        f"{ui(user, 'reviewed')}: {reviewed_on}"
+        if reviewed_on
         else ui(user, "review_pending")
     )
     parts = [
@@ -1521,7 +1549,7 @@ def guide_message(
         ui(user, "location"),
         f"⚠️ {ui(user, 'disclaimer')}",
         (
-            f"{ui(user, 'version')}: {LEGAL_CONTENT_VERSION}\n"
+            f"{ui(user, 'version')}: {content_version}\n"
             f"{review_status}"
         ),
     ]
@@ -3,17 +3,33 @@
 The default path does not call any third-party AI service. It routes a question
 to versioned, lawyer-reviewable guidance in English, Hinglish, or Marathi.
 Ollama is optional; any failure falls back to the same deterministic guide.
+Rendered guides and fallback answers are memoized per language, guide, and
+content revision, so the no-model path is a dictionary lookup.
+
+Ollama calls share one keep-alive HTTP client. At most
+``OLLAMA_MAX_CONCURRENCY`` generations run at once; a request that cannot get
+a slot within ``OLLAMA_QUEUE_WAIT_SECONDS`` gets the deterministic guide
+instead of queueing behind CPU-bound inference. Answers are streamed and the
+stream is closed once the word budget is reached.
 """
 
 from __future__ import annotations
 
+import atexit
 import json
+import logging
 import os
-import urllib.error
-import urllib.request
+import re
+import time
+from functools import lru_cache
+from threading import BoundedSemaphore, Thread
+from types import SimpleNamespace
 from typing import Any, Optional
 
+import httpx
+
 from services.legal_knowledge import (
+    content_revision,
     find_guide,
     guide_message,
     language_code,
@@ -21,29 +37,155 @@ from services.legal_knowledge import (
 )
 
 
+logger = logging.getLogger("services.local_ai_service")
+
+
+def _env_int(name: str, default: int, minimum: int, maximum: int) -> int:
+    try:
+        value = int(os.getenv(name, str(default)))
+    except (TypeError, ValueError):
+        value = default
+    return max(minimum, min(maximum, value))
+
+
+def _env_float(name: str, default: float, minimum: float, maximum: float) -> float:
+    try:
+        value = float(os.getenv(name, str(default)))
+    except (TypeError, ValueError):
+        value = default
+    return max(minimum, min(maximum, value))
+
+
+# Matches the limit stated in the prompt; generation stops once it is reached.
+_WORD_BUDGET = 220
+_SENTENCE_END = re.compile(r"[.!?।](?=\s|$)")
+
+_OLLAMA_TIMEOUT_SECONDS = _env_float("OLLAMA_TIMEOUT_SECONDS", 45.0, 5.0, 300.0)
+_HTTP_CLIENT = httpx.Client(
+    # Read timeout applies between streamed chunks; the total is checked
+    # separately against the same budget.
+    timeout=httpx.Timeout(_OLLAMA_TIMEOUT_SECONDS, connect=5.0),
+    limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+)
+atexit.register(_HTTP_CLIENT.close)
+_generation_slots = BoundedSemaphore(
+    _env_int("OLLAMA_MAX_CONCURRENCY", 2, 1, 32)
+)
+
+
+def _ollama_settings() -> tuple[str, str, str]:
+    return (
+        os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/"),
+        os.getenv("OLLAMA_MODEL", "llama3.1:8b"),
+        os.getenv("OLLAMA_KEEP_ALIVE", "30m"),
+    )
+
+
+def _within_word_budget(text: str) -> str:
+    """Trim to the word budget, preferring the last complete sentence."""
+
+    words = text.split()
+    if len(words) <= _WORD_BUDGET:
+        return text.strip()
+    trimmed = " ".join(words[:_WORD_BUDGET])
+    sentence_ends = [match.end() for match in _SENTENCE_END.finditer(trimmed)]
+    if sentence_ends and sentence_ends[-1] >= len(trimmed) // 2:
+        return trimmed[: sentence_ends[-1]]
+    return trimmed + "…"
+
+
+def _stream_generation(base_url: str, payload: dict) -> str:
+    deadline = time.monotonic() + _OLLAMA_TIMEOUT_SECONDS
+    text = ""
+    with _HTTP_CLIENT.stream(
+        "POST",
+        f"{base_url}/api/generate",
+        json=payload,
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            text += chunk.get("response") or ""
+            # Leaving the block closes the connection, which stops Ollama
+            # generating tokens nobody will read. Tokens are often word
+            # pieces, so words are counted on the joined text.
+            if chunk.get("done") or len(text.split()) > _WORD_BUDGET:
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError("ollama_generation_deadline")
+    return _within_word_budget(text)
+
+
+def warm_up_ollama() -> None:
+    """Load the Ollama model in the background so the first user is not slowed.
+
+    An empty prompt makes Ollama load the model and keep it resident for
+    ``OLLAMA_KEEP_ALIVE`` without generating anything.
+    """
+
+    if os.getenv("LOCAL_AI_PROVIDER", "").lower().strip() != "ollama":
+        return
+
+    def warm_up() -> None:
+        base_url, model, keep_alive = _ollama_settings()
+        try:
+            response = _HTTP_CLIENT.post(
+                f"{base_url}/api/generate",
+                json={"model": model, "prompt": "", "keep_alive": keep_alive},
+            )
+            response.raise_for_status()
+        except httpx.HTTPError as exc:
+            logger.warning("OLLAMA_WARM_UP_FAILED | reason=%s", type(exc).__name__)
+            return
+        logger.info("OLLAMA_WARM_UP_DONE | model=%s", model)
+
+    Thread(target=warm_up, name="nyaysetu-ollama-warm-up", daemon=True).start()
+
+
+_BOOKING_PROMPTS = {
+    "en": "For advice on your facts, you can book a lawyer consultation.",
+    "hi": "Apne specific facts par advice ke liye lawyer consultation book kar sakte hain.",
+    "mr": "आपल्या विशिष्ट तथ्यांवरील सल्ल्यासाठी वकिलांची सल्लामसलत बुक करू शकता.",
+}
+
+
 def _fallback_reply(message: str, user: Any, context: str) -> str:
     category, subcategory = find_guide(message)
+    return _fallback_answer(
+        language_code(user),
+        category,
+        subcategory,
+        context != "post_payment",
+        *content_revision(),
+    )
+
+
+# The fallback depends only on these arguments, so every answer is rendered
+# once per content revision and then served from memory.
+@lru_cache(maxsize=512)
+def _fallback_answer(
+    lang: str,
+    category: str,
+    subcategory: str,
+    with_booking_prompt: bool,
+    content_version: str,
+    reviewed_on: str,
+) -> str:
     answer = guide_message(
-        user,
+        SimpleNamespace(language=lang),
         category,
         subcategory,
         include_feedback_prompt=False,
     )
-    if context != "post_payment":
-        answer += (
-            "\n\n"
-            + {
-                "en": "For advice on your facts, you can book a lawyer consultation.",
-                "hi": "Apne specific facts par advice ke liye lawyer consultation book kar sakte hain.",
-                "mr": "आपल्या विशिष्ट तथ्यांवरील सल्ल्यासाठी वकिलांची सल्लामसलत बुक करू शकता.",
-            }[language_code(user)]
-        )
+    if with_booking_prompt:
+        answer += "\n\n" + _BOOKING_PROMPTS[lang]
     return answer
 
 
 def _ollama_reply(message: str, user: Any, context: str) -> Optional[str]:
-    base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
-    model = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
+    base_url, model, keep_alive = _ollama_settings()
     category, subcategory = find_guide(message)
     knowledge = guide_message(
         user,
@@ -78,39 +220,37 @@ User question:
     payload = {
         "model": model,
         "prompt": prompt,
-        "stream": False,
+        "stream": True,
+        "keep_alive": keep_alive,
         "options": {
             "temperature": 0.1,
             "num_predict": 280,
         },
     }
-    request = urllib.request.Request(
-        f"{base_url}/api/generate",
-        data=json.dumps(payload).encode("utf-8"),
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
 
+    wait_seconds = _env_float("OLLAMA_QUEUE_WAIT_SECONDS", 0.0, 0.0, 30.0)
+    if not _generation_slots.acquire(timeout=wait_seconds):
+        logger.info("OLLAMA_BUSY | model=%s", model)
+        return None
     try:
-        with urllib.request.urlopen(request, timeout=45) as response:
-            data = json.loads(response.read().decode("utf-8"))
-    except (urllib.error.URLError, TimeoutError, json.JSONDecodeError, OSError):
+        reply = _stream_generation(base_url, payload)
+    except (
+        httpx.HTTPError,
+        TimeoutError,
+        json.JSONDecodeError,
+        AttributeError,
+    ) as exc:
+        logger.warning("OLLAMA_FAILED | reason=%s", type(exc).__name__)
         return None
+    finally:
+        _generation_slots.release()
 
-    reply = (data.get("response") or "").strip()
     if not reply:
         return None
 
     reply += f"\n\n⚠️ {ui(user, 'disclaimer')}"
     if context != "post_payment":
-        reply += (
-            "\n\n"
-            + {
-                "en": "For advice on your facts, you can book a lawyer consultation.",
-                "hi": "Apne specific facts par advice ke liye lawyer consultation book kar sakte hain.",
-                "mr": "आपल्या विशिष्ट तथ्यांवरील सल्ल्यासाठी वकिलांची सल्लामसलत बुक करू शकता.",
-            }[lang]
-        )
+        reply += "\n\n" + _BOOKING_PROMPTS[lang]
     return reply
 
 
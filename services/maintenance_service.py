@@ -34,6 +34,7 @@ from models import (
     ProcessedMessage,
     SupportRequest,
     WebhookEvent,
+    WhatsAppMediaUpload,
     utc_now,
 )
 
@@ -448,6 +449,38 @@ def run_maintenance(
             retention_source="OUTBOX_COMPLETED_TTL_DAYS",
         )
 
+        media_query = (
+            db.query(WhatsAppMediaUpload)
+            .filter(WhatsAppMediaUpload.expires_at <= current)
+            .order_by(
+                WhatsAppMediaUpload.expires_at.asc(),
+                WhatsAppMediaUpload.id.asc(),
+            )
+        )
+        media_ids, media_more = _bounded_ids(
+            media_query,
+            WhatsAppMediaUpload.id,
+            batch_size,
+        )
+        media_affected = 0
+        if media_ids and not dry_run:
+            media_affected = (
+                db.query(WhatsAppMediaUpload)
+                .filter(
+                    WhatsAppMediaUpload.id.in_(media_ids),
+                    WhatsAppMediaUpload.expires_at <= current,
+                )
+                .delete(synchronize_session=False)
+            )
+        categories["expired_media_uploads"] = _category_report(
+            eligible_ids=media_ids,
+            more_remaining=media_more,
+            dry_run=dry_run,
+            affected=media_affected,
+            action="delete",
+            retention_source="WHATSAPP_MEDIA_CACHE_DAYS/expires_at",
+        )
+
         risks = _operational_risks(db, current)
         if dry_run:
             db.rollback()
@@ -3,22 +3,18 @@
 from __future__ import annotations
 
 import atexit
-from datetime import datetime, timedelta, timezone
-import hashlib
 import logging
 import os
-from threading import Lock
 import time
-from typing import Dict, Tuple
 
 import httpx
 
 from config import (
-    AI_RESPONSE_CACHE_TTL_SECONDS,
     OPENAI_API_KEY as CONFIG_OPENAI_API_KEY,
     OPENAI_FALLBACK_MODEL as CONFIG_OPENAI_FALLBACK_MODEL,
     OPENAI_MODEL as CONFIG_OPENAI_MODEL,
 )
+from services.ai_response_cache import cached_reply, remember_reply
 from services.ai_safety import (
     guardrail_response,
     language_code,
@@ -26,6 +22,8 @@ from services.ai_safety import (
     safety_identifier,
     scrub_pii,
 )
+from services.circuit_breaker import breaker_for
+from services.provider_health import record_call, record_usage
 from translations import TRANSLATIONS
 
 
@@ -36,10 +34,6 @@ class OpenAIProviderError(RuntimeError):
     """Raised internally so the router can try another configured provider."""
 
 
-# Kept as a module-level value because app.py imports it today.
-AI_DISABLED_UNTIL = None
-
-
 ADMIN_DISCLAIMERS = {
     "en": "\n\n⚠️ Disclaimer: This is general legal information, not a substitute for professional legal advice.",
     "hi": "\n\n⚠️ Disclaimer: Yeh general legal information hai, professional legal advice ka replacement nahi hai.",
@@ -53,11 +47,6 @@ BOOKING_CTA = {
 }
 
 
-AI_RESPONSE_CACHE: Dict[Tuple[str, str], Tuple[float, str]] = {}
-AI_CACHE_TTL = AI_RESPONSE_CACHE_TTL_SECONDS
-AI_CACHE_MAX_ENTRIES = 1_000
-_AI_STATE_LOCK = Lock()
-
 _MODEL_FALLBACK_STATUSES = frozenset({400, 403, 404, 422})
 _MODEL_ERROR_CODES = frozenset(
     {
@@ -81,10 +70,6 @@ _MODEL_ERROR_MESSAGE_MARKERS = (
 )
 
 
-def _utc_now_naive() -> datetime:
-    return datetime.now(timezone.utc).replace(tzinfo=None)
-
-
 def _env_int(name: str, default: int, minimum: int, maximum: int) -> int:
     try:
         value = int(os.getenv(name, str(default)))
@@ -157,67 +142,11 @@ def _t(user, key):
     )
 
 
-def _normalize_prompt(prompt: str) -> str:
-    return " ".join(str(prompt or "").lower().strip().split())
-
-
-def _prompt_digest(prompt: str) -> str:
-    return hashlib.sha256(_normalize_prompt(prompt).encode("utf-8")).hexdigest()
-
-
-def _get_cached_reply(cache_user_key: str, prompt: str):
-    if AI_CACHE_TTL <= 0:
-        return None
-
-    key = (cache_user_key, _prompt_digest(prompt))
-    with _AI_STATE_LOCK:
-        cached = AI_RESPONSE_CACHE.get(key)
-        if not cached:
-            return None
-
-        timestamp, reply = cached
-        if time.time() - timestamp > AI_CACHE_TTL:
-            AI_RESPONSE_CACHE.pop(key, None)
-            return None
-        return reply
-
-
-def _set_cached_reply(cache_user_key: str, prompt: str, reply: str):
-    if AI_CACHE_TTL <= 0:
-        return
-
-    now = time.time()
-    key = (cache_user_key, _prompt_digest(prompt))
-
-    with _AI_STATE_LOCK:
-        expired = [
-            cache_key
-            for cache_key, (timestamp, _) in AI_RESPONSE_CACHE.items()
-            if now - timestamp > AI_CACHE_TTL
-        ]
-        for cache_key in expired:
-            AI_RESPONSE_CACHE.pop(cache_key, None)
-
-        if (
-            key not in AI_RESPONSE_CACHE
-            and len(AI_RESPONSE_CACHE) >= AI_CACHE_MAX_ENTRIES
-        ):
-            oldest_key = min(
-                AI_RESPONSE_CACHE,
-                key=lambda cache_key: AI_RESPONSE_CACHE[cache_key][0],
-            )
-            AI_RESPONSE_CACHE.pop(oldest_key, None)
-        AI_RESPONSE_CACHE[key] = (now, reply)
-
-
-def _system_prompt(user) -> str:
-    return f"""
+# OpenAI caches the longest previously seen prompt prefix automatically, so
+# the rules come first and stay byte-identical; per-user lines follow them.
+_STATIC_SYSTEM_PROMPT = """
 You are NyaySetu, an Indian legal information assistant, not a lawyer.
 
-{_language_instruction(user)}
-{_tone_instruction(user)}
-{_length_instruction(user)}
-
 Rules:
 - Give general Indian legal information only.
 - Explain concepts, lawful processes, documents, and possible next steps.
@@ -236,10 +165,32 @@ Rules:
 """.strip()
 
 
+def _system_prompt(user) -> str:
+    return (
+        f"{_STATIC_SYSTEM_PROMPT}\n\n"
+        f"{_language_instruction(user)}\n"
+        f"{_tone_instruction(user)}\n"
+        f"{_length_instruction(user)}"
+    )
+
+
 def _openai_key() -> str:
     return os.getenv("OPENAI_API_KEY", "") or CONFIG_OPENAI_API_KEY
 
 
+def _record_prompt_usage(usage) -> None:
+    """Record prompt tokens; ``cached_tokens`` is part of ``prompt_tokens``."""
+
+    if not isinstance(usage, dict):
+        return
+    details = usage.get("prompt_tokens_details") or {}
+    record_usage(
+        "openai",
+        prompt_tokens=usage.get("prompt_tokens") or 0,
+        cached_tokens=details.get("cached_tokens") or 0,
+    )
+
+
 def _local_fallback(prompt: str, user, context: str) -> str:
     from services.local_ai_service import local_ai_reply
 
@@ -340,38 +291,51 @@ def _request_data(model: str, provider_prompt: str, user, user_key: str) -> dict
 def openai_reply_external(prompt: str, user, context: str = "default") -> str:
     """Call OpenAI or raise ``OpenAIProviderError`` for router fallback."""
 
-    global AI_DISABLED_UNTIL
-
-    if not prompt:
-        return "Hi — tell me your legal question and I'll try to help."
-
     guarded = guardrail_response(prompt, user)
     if guarded:
         return guarded
 
-    with _AI_STATE_LOCK:
-        disabled_until = AI_DISABLED_UNTIL
-    if disabled_until and _utc_now_naive() < disabled_until:
-        raise OpenAIProviderError("circuit_breaker_open")
+    provider_prompt = scrub_pii(prompt)
+    return openai_reply_screened(
+        provider_prompt,
+        user,
+        context,
+        pii_scrubbed=pii_was_scrubbed(prompt, provider_prompt),
+    )
+
+
+def openai_reply_screened(
+    provider_prompt: str,
+    user,
+    context: str = "default",
+    *,
+    pii_scrubbed: bool = False,
+) -> str:
+    """Call OpenAI with a prompt the caller already guarded and scrubbed."""
+
+    if not provider_prompt:
+        return "Hi — tell me your legal question and I'll try to help."
 
     api_key = _openai_key()
     if not api_key:
         raise OpenAIProviderError("missing_api_key")
 
-    provider_prompt = scrub_pii(prompt)
     user_key = safety_identifier(user)
 
-    if context != "post_payment":
-        cached = _get_cached_reply(user_key, provider_prompt)
-        if cached:
-            logger.debug("AI_CACHE_HIT | user_ref=%s", user_key)
-            return cached
+    cached = cached_reply(user_key, provider_prompt, context)
+    if cached:
+        logger.debug("AI_CACHE_HIT | provider=openai | user_ref=%s", user_key)
+        return cached
+
+    breaker = breaker_for("openai")
+    if not breaker.allow():
+        raise OpenAIProviderError("circuit_breaker_open")
 
     logger.info(
         "AI_CALL | provider=openai | user_ref=%s | context=%s | pii_scrubbed=%s",
         user_key,
         context,
-        pii_was_scrubbed(prompt, provider_prompt),
+        pii_scrubbed,
     )
 
     url = os.getenv(
@@ -382,31 +346,44 @@ def openai_reply_external(prompt: str, user, context: str = "default") -> str:
     data = _request_data(model, provider_prompt, user, user_key)
     headers = {"Authorization": f"Bearer {api_key}"}
 
-    response = _post_openai(url, headers, data)
-    if fallback_model and _is_model_fallback_error(response):
-        logger.warning(
-            "AI_MODEL_FALLBACK | provider=openai | user_ref=%s | status=%s",
-            user_key,
-            response.status_code,
-        )
-        data = _request_data(
-            fallback_model,
-            provider_prompt,
-            user,
-            user_key,
-        )
+    started = time.monotonic()
+    try:
         response = _post_openai(url, headers, data)
-
-    if response.status_code == 429:
-        with _AI_STATE_LOCK:
-            AI_DISABLED_UNTIL = _utc_now_naive() + timedelta(
-                minutes=_env_int("OPENAI_BREAKER_MINUTES", 30, 1, 120)
+        if fallback_model and _is_model_fallback_error(response):
+            logger.warning(
+                "AI_MODEL_FALLBACK | provider=openai | user_ref=%s | status=%s",
+                user_key,
+                response.status_code,
+            )
+            data = _request_data(
+                fallback_model,
+                provider_prompt,
+                user,
+                user_key,
             )
+            response = _post_openai(url, headers, data)
+    except Exception:
+        breaker.record_failure()
+        record_call("openai", time.monotonic() - started, ok=False)
+        raise
+
+    degraded = response.status_code == 429 or response.status_code >= 500
+    record_call("openai", time.monotonic() - started, ok=not degraded)
+    if response.status_code == 429:
+        breaker.record_failure(
+            open_seconds=60 * _env_int("OPENAI_BREAKER_MINUTES", 30, 1, 120)
+        )
         logger.warning(
             "AI_PROVIDER_RATE_LIMIT | provider=openai | user_ref=%s",
             user_key,
         )
         raise OpenAIProviderError("rate_limited")
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        # Any other answer, including a 4xx about this request, shows the
+        # provider is up.
+        breaker.record_success()
 
     if response.status_code < 200 or response.status_code >= 300:
         logger.warning(
@@ -421,6 +398,7 @@ def openai_reply_external(prompt: str, user, context: str = "default") -> str:
         reply = payload["choices"][0]["message"]["content"].strip()
     except (KeyError, IndexError, TypeError, ValueError) as exc:
         raise OpenAIProviderError("malformed_response") from exc
+    _record_prompt_usage(payload.get("usage"))
 
     if not reply:
         raise OpenAIProviderError("empty_response")
@@ -430,8 +408,7 @@ def openai_reply_external(prompt: str, user, context: str = "default") -> str:
         reply += "\n\n" + _booking_cta(user)
     reply += _disclaimer_text(user)
 
-    if context != "post_payment":
-        _set_cached_reply(user_key, provider_prompt, reply)
+    remember_reply(user_key, provider_prompt, context, reply)
     return reply
 
 
@@ -8,6 +8,7 @@ each accepted side effect.
 
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import os
@@ -47,6 +48,7 @@ from services.email_service import (
     send_support_request_email,
 )
 from services.receipt_service import generate_pdf_receipt
+from services.send_governor import send_priority
 from services.whatsapp_service import (
     WhatsAppValidationError,
     is_ambiguous_delivery_failure,
@@ -93,6 +95,13 @@ _PERMANENT_ERROR_CODES = frozenset(
         "conversation_delivery_rejected",
     }
 )
+# The send governor had no slot, so nothing was sent. Such a retry does not
+# count toward OUTBOX_MAX_ATTEMPTS.
+_THROTTLED_ERROR_CODE = "whatsapp_throttled"
+_SEND_PRIORITIES = {
+    CONVERSATION_DELIVERY_KIND: "conversation",
+    "consultation_reminder": "reminder",
+}
 
 
 class DeliveryFailure(RuntimeError):
@@ -140,11 +149,17 @@ def _mark_step_completed(
 def _require_whatsapp_success(result: Any, code: str) -> dict[str, Any]:
     """Accept only the structured success contract from WhatsApp transport."""
 
+    _raise_if_throttled(result)
     if not isinstance(result, dict) or result.get("ok") is not True:
         raise DeliveryFailure(code)
     return result
 
 
+def _raise_if_throttled(result: Any) -> None:
+    if isinstance(result, dict) and result.get("error") == _THROTTLED_ERROR_CODE:
+        raise DeliveryFailure(_THROTTLED_ERROR_CODE)
+
+
 def _get_paid_booking(db, payload: dict[str, Any]) -> Booking:
     try:
         booking_id = int(payload["booking_id"])
@@ -159,14 +174,25 @@ def _get_paid_booking(db, payload: dict[str, Any]) -> Booking:
     return booking
 
 
+def recipient_ordering_key(wa_id: str) -> str:
+    """Return the ordering key shared by every reply job for ``wa_id``."""
+
+    return hashlib.sha256(f"whatsapp:{wa_id}".encode()).hexdigest()
+
+
 def enqueue_job(
     db,
     kind: str,
     payload: dict[str, Any],
     *,
     dedupe_key: str | None = None,
+    ordering_key: str | None = None,
 ) -> OutboxJob:
-    """Add a job to the caller's transaction and flush its generated ID."""
+    """Add a job to the caller's transaction and flush its generated ID.
+
+    Jobs with the same ``ordering_key`` run strictly in id order: a job waits
+    while an older one with its key is still pending or running.
+    """
 
     normalized_dedupe_key = (
         str(dedupe_key).strip()[:255] if dedupe_key else None
@@ -183,6 +209,7 @@ def enqueue_job(
     job = OutboxJob(
         kind=kind[:80],
         dedupe_key=normalized_dedupe_key,
+        ordering_key=ordering_key,
         payload_json=_dump_payload(payload),
         status=PENDING,
         available_at=_utc_now(),
@@ -444,52 +471,102 @@ def _handle_consultation_reminder(
     _mark_step_completed(db, job, payload, step)
 
 
-def _handle_whatsapp_conversation_delivery(
-    db,
-    payload: dict[str, Any],
-    job: OutboxJob,
-) -> None:
-    """Retry one failed inbound reply without replaying its business logic."""
+def _send_conversation_receipt(db, booking_id: Any) -> Any:
+    """Send a receipt the user asked for again, in line with their replies."""
 
-    if _step_completed(payload, _CONVERSATION_DELIVERY_STEP):
-        return
+    booking = _get_paid_booking(db, {"booking_id": booking_id})
+    pdf_path = None
+    try:
+        pdf_path = generate_pdf_receipt(booking)
+        result = send_payment_receipt_pdf(
+            booking.whatsapp_id,
+            pdf_path,
+            booking_id=booking.id,
+        )
+        if isinstance(result, dict) and result.get("ok") is True:
+            # Committed with the job's progress once the send is recorded.
+            booking.receipt_sent = True
+        return result
+    finally:
+        _remove_receipt(pdf_path, booking.id)
+
+
+def _send_conversation_reply(db, delivery: Any) -> Any:
+    """Send one queued text, button, list, or receipt reply; return its result."""
 
     try:
-        operation = str(payload["operation"])
-        recipient = str(payload["to"])
+        operation = str(delivery["operation"])
+        recipient = str(delivery["to"])
+        if operation == "receipt":
+            return _send_conversation_receipt(db, delivery["booking_id"])
         if operation == "text":
-            result = send_text(recipient, str(payload["body"]))
-        elif operation == "buttons":
-            buttons = payload["buttons"]
+            return send_text(recipient, str(delivery["body"]))
+        if operation == "buttons":
+            buttons = delivery["buttons"]
             if not isinstance(buttons, list):
                 raise ValueError("buttons must be a list")
-            result = send_buttons(
+            return send_buttons(
                 recipient,
-                str(payload["body"]),
+                str(delivery["body"]),
                 buttons,
             )
-        elif operation == "list":
-            rows = payload["rows"]
+        if operation == "list":
+            rows = delivery["rows"]
             if not isinstance(rows, list):
                 raise ValueError("rows must be a list")
-            result = send_list_picker(
+            return send_list_picker(
                 recipient,
-                header=str(payload["header"]),
-                body=str(payload["body"]),
+                header=str(delivery["header"]),
+                body=str(delivery["body"]),
                 rows=rows,
-                section_title=str(payload["section_title"]),
+                section_title=str(delivery["section_title"]),
             )
-        else:
-            raise ValueError("unsupported conversation delivery operation")
+        raise ValueError("unsupported conversation delivery operation")
     except (KeyError, TypeError, ValueError) as exc:
         raise DeliveryFailure("invalid_conversation_delivery_payload") from exc
 
-    if is_ambiguous_delivery_failure(result):
-        raise DeliveryFailure("conversation_delivery_ambiguous")
-    if not isinstance(result, dict) or result.get("ok") is not True:
-        if is_retryable_delivery_failure(result):
-            raise DeliveryFailure("conversation_delivery_not_sent")
-        raise DeliveryFailure("conversation_delivery_rejected")
+
+def _handle_whatsapp_conversation_delivery(
+    db,
+    payload: dict[str, Any],
+    job: OutboxJob,
+) -> None:
+    """Deliver queued inbound replies without replaying their business logic.
+
+    A job holds either one reply whose inline send failed, or every reply of
+    one message under ``deliveries`` when async delivery is enabled. Each
+    accepted reply of a sequence is removed and committed before the next
+    send, so a retry resumes at the first reply Meta has not accepted.
+    """
+
+    if _step_completed(payload, _CONVERSATION_DELIVERY_STEP):
+        return
+
+    deliveries = payload.get("deliveries")
+    if deliveries is None:
+        deliveries = [payload]
+        sequence = False
+    elif isinstance(deliveries, list):
+        sequence = True
+    else:
+        raise DeliveryFailure("invalid_conversation_delivery_payload")
+
+    while deliveries:
+        result = _send_conversation_reply(db, deliveries[0])
+        _raise_if_throttled(result)
+        if is_ambiguous_delivery_failure(result):
+            raise DeliveryFailure("conversation_delivery_ambiguous")
+        if not isinstance(result, dict) or result.get("ok") is not True:
+            if is_retryable_delivery_failure(result):
+                raise DeliveryFailure("conversation_delivery_not_sent")
+            raise DeliveryFailure("conversation_delivery_rejected")
+        if not sequence:
+            break
+        deliveries.pop(0)
+        if deliveries:
+            job.payload_json = _dump_payload(payload)
+            job.updated_at = _utc_now()
+            db.commit()
 
     # The response body and recipient are needed only until Meta accepts the
     # send. Scrub both before the job becomes terminal so retained operational
@@ -519,11 +596,40 @@ def _safe_error_code(exc: Exception) -> str:
     return type(exc).__name__[:500]
 
 
+def _waits_for_older_job(db, job_id: int) -> bool:
+    """Return whether an older job with the same ordering key is unfinished.
+
+    A retryable failure leaves a reply PENDING with a backoff. Sending the
+    recipient's next reply meanwhile would deliver the two out of order, so
+    the later job is left PENDING for a worker to pick up after the first.
+    """
+
+    ordering_key = (
+        db.query(OutboxJob.ordering_key).filter(OutboxJob.id == job_id).scalar()
+    )
+    if ordering_key is None:
+        return False
+    return (
+        db.query(OutboxJob.id)
+        .filter(
+            OutboxJob.ordering_key == ordering_key,
+            OutboxJob.id < job_id,
+            OutboxJob.status.in_((PENDING, RUNNING)),
+        )
+        .first()
+        is not None
+    )
+
+
 def process_job(job_id: int) -> bool:
     """Claim and process one job. Return True only after explicit success."""
 
     db = SessionLocal()
     try:
+        if _waits_for_older_job(db, job_id):
+            logger.info("Outbox job waits for an older job | job_id=%s", job_id)
+            return False
+
         now = _utc_now()
         claimed = (
             db.query(OutboxJob)
@@ -556,7 +662,8 @@ def process_job(job_id: int) -> bool:
             payload = json.loads(job.payload_json)
             if not isinstance(payload, dict):
                 raise DeliveryFailure("invalid_job_payload")
-            handler(db, payload, job)
+            with send_priority(_SEND_PRIORITIES.get(job.kind, "notification")):
+                handler(db, payload, job)
         except Exception as exc:
             db.rollback()
             job = db.get(OutboxJob, job_id)
@@ -565,7 +672,13 @@ def process_job(job_id: int) -> bool:
 
             error_code = _safe_error_code(exc)
             job.last_error = error_code
-            if (
+            if error_code == _THROTTLED_ERROR_CODE:
+                job.attempts = max(job.attempts - 1, 0)
+                job.status = PENDING
+                job.available_at = _utc_now() + timedelta(
+                    seconds=OUTBOX_RETRY_BASE_SECONDS
+                )
+            elif (
                 error_code in _PERMANENT_ERROR_CODES
                 or job.attempts >= OUTBOX_MAX_ATTEMPTS
             ):
@@ -668,7 +781,9 @@ def process_pending_jobs(limit: int = 25) -> tuple[int, int]:
     finally:
         db.close()
 
-    completed = sum(1 for job_id in job_ids if process_job(job_id))
+    # Run the batch oldest first so a job never waits on an older job that
+    # this same batch is about to send.
+    completed = sum(1 for job_id in sorted(job_ids) if process_job(job_id))
     return completed, len(job_ids) - completed
 
 
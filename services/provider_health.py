@@ -0,0 +1,202 @@
+"""Per-process health scores for remote AI providers.
+
+Provider modules record every real API call: its latency and whether it
+failed in a way that says the provider is degraded (rate limit, 5xx, or a
+transport error). Each provider keeps an EWMA of its latency and its
+outcomes over a sliding window. ``rank_providers`` moves a provider behind
+the healthy ones when its circuit is open, its error rate is above
+``AI_ROUTING_MAX_ERROR_RATE``, or its EWMA latency is more than
+``AI_ROUTING_SLOW_FACTOR`` times the fastest candidate's. Demotions expire:
+latency and error rate need ``_MIN_SAMPLES`` calls inside the window, and a
+breaker whose open period has ended is eligible for its probe again.
+Everything else keeps the configured order, so routing is predictable while
+all providers are healthy.
+
+Providers also report prompt token usage, so the share of prompt tokens
+served from the provider's prompt cache shows up next to the health scores.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import deque
+from collections.abc import Callable, Sequence
+from threading import Lock
+
+from config import (
+    AI_LATENCY_ROUTING,
+    AI_ROUTING_MAX_ERROR_RATE,
+    AI_ROUTING_SLOW_FACTOR,
+)
+from services.circuit_breaker import breaker_for
+
+
+_EWMA_ALPHA = 0.2
+_WINDOW_SECONDS = 300.0
+# Fewer outcomes than this are not evidence enough to demote a provider.
+_MIN_SAMPLES = 5
+_OUTCOMES_MAX = 1_000
+
+
+class ProviderHealth:
+    """Latency EWMA and windowed error rate for one provider."""
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        self._clock = clock
+        self._lock = Lock()
+        self.ewma_latency_ms: float | None = None
+        self._outcomes: deque[tuple[float, bool]] = deque(maxlen=_OUTCOMES_MAX)
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.cache_write_tokens = 0
+
+    def record(self, latency_seconds: float, *, ok: bool) -> None:
+        now = self._clock()
+        latency_ms = max(0.0, latency_seconds * 1000)
+        with self._lock:
+            # Failures are often timeouts, so they count towards latency too.
+            if self.ewma_latency_ms is None:
+                self.ewma_latency_ms = latency_ms
+            else:
+                self.ewma_latency_ms += _EWMA_ALPHA * (
+                    latency_ms - self.ewma_latency_ms
+                )
+            self._outcomes.append((now, ok))
+
+    def record_usage(
+        self,
+        *,
+        prompt_tokens: int,
+        cached_tokens: int,
+        cache_write_tokens: int = 0,
+    ) -> None:
+        with self._lock:
+            self.prompt_tokens += prompt_tokens
+            self.cached_prompt_tokens += cached_tokens
+            self.cache_write_tokens += cache_write_tokens
+
+    def snapshot(self) -> dict:
+        now = self._clock()
+        with self._lock:
+            while self._outcomes and self._outcomes[0][0] <= now - _WINDOW_SECONDS:
+                self._outcomes.popleft()
+            samples = len(self._outcomes)
+            errors = sum(1 for _at, ok in self._outcomes if not ok)
+            latency = self.ewma_latency_ms
+            prompt_tokens = self.prompt_tokens
+            cached_tokens = self.cached_prompt_tokens
+            cache_write_tokens = self.cache_write_tokens
+        return {
+            "ewma_latency_ms": None if latency is None else round(latency, 1),
+            "samples": samples,
+            "error_rate": round(errors / samples, 3) if samples else 0.0,
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_tokens,
+            "cache_write_tokens": cache_write_tokens,
+            "prompt_cache_ratio": (
+                round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0
+            ),
+        }
+
+
+_health: dict[str, ProviderHealth] = {}
+_health_guard = Lock()
+
+
+def health_for(provider: str) -> ProviderHealth:
+    with _health_guard:
+        health = _health.get(provider)
+        if health is None:
+            health = _health[provider] = ProviderHealth()
+        return health
+
+
+def record_call(provider: str, latency_seconds: float, *, ok: bool) -> None:
+    health_for(provider).record(latency_seconds, ok=ok)
+
+
+def record_usage(
+    provider: str,
+    *,
+    prompt_tokens: int,
+    cached_tokens: int,
+    cache_write_tokens: int = 0,
+) -> None:
+    health_for(provider).record_usage(
+        prompt_tokens=prompt_tokens,
+        cached_tokens=cached_tokens,
+        cache_write_tokens=cache_write_tokens,
+    )
+
+
+def reset_health() -> None:
+    with _health_guard:
+        _health.clear()
+
+
+def _demotion_reasons(providers: Sequence[str]) -> dict[str, str | None]:
+    snapshots = {provider: health_for(provider).snapshot() for provider in providers}
+    # A demoted provider gets no traffic, so its EWMA stops moving. Latency
+    # counts only while the window still holds enough recent calls; once they
+    # age out the provider is tried in its configured place again.
+    latencies = {
+        provider: snapshot["ewma_latency_ms"]
+        for provider, snapshot in snapshots.items()
+        if snapshot["ewma_latency_ms"] is not None
+        and snapshot["samples"] >= _MIN_SAMPLES
+    }
+    fastest = min(latencies.values()) if latencies else None
+    reasons = {}
+    for provider, snapshot in snapshots.items():
+        reason = None
+        if breaker_for(provider).is_open():
+            reason = "circuit_open"
+        elif (
+            snapshot["samples"] >= _MIN_SAMPLES
+            and snapshot["error_rate"] > AI_ROUTING_MAX_ERROR_RATE
+        ):
+            reason = "error_rate"
+        elif (
+            fastest
+            and provider in latencies
+            and latencies[provider] > fastest * AI_ROUTING_SLOW_FACTOR
+        ):
+            reason = "slow"
+        reasons[provider] = reason
+    return reasons
+
+
+# Lower ranks are tried first; configured position breaks ties.
+_REASON_RANK = {None: 0, "slow": 1, "error_rate": 2, "circuit_open": 3}
+
+
+def rank_providers(providers: Sequence[str]) -> list[str]:
+    """Return ``providers`` with unhealthy ones moved behind healthy ones."""
+
+    if not AI_LATENCY_ROUTING or len(providers) < 2:
+        return list(providers)
+    reasons = _demotion_reasons(providers)
+    return sorted(
+        providers,
+        key=lambda provider: (
+            _REASON_RANK[reasons[provider]],
+            providers.index(provider),
+        ),
+    )
+
+
+def routing_report(providers: Sequence[str]) -> dict:
+    reasons = _demotion_reasons(providers)
+    return {
+        "latency_routing": AI_LATENCY_ROUTING,
+        "configured_order": list(providers),
+        "effective_order": rank_providers(providers),
+        "providers": {
+            provider: {
+                **health_for(provider).snapshot(),
+                "circuit": breaker_for(provider).snapshot(),
+                "demoted": reasons[provider],
+            }
+            for provider in providers
+        },
+    }
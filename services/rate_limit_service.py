@@ -0,0 +1,394 @@
+"""Sliding-window rate-limit stores shared by the webhook abuse controls.
+
+Every backend implements the same operation: record a hit for a key unless
+``limit`` earlier hits already fall inside the trailing window, and report
+whether the caller is limited. A hit belongs to the window while
+``hit_at > now - window_seconds``. Rejected attempts are never recorded, so a
+sender who keeps retrying is released once their accepted hits age out.
+
+The in-memory store keeps the single-process behaviour. The database and
+Redis stores let every Gunicorn worker share one budget per key.
+"""
+
+from __future__ import annotations
+
+import math
+import socket
+import ssl
+import threading
+import time
+import uuid
+import zlib
+from collections import deque
+from threading import Lock
+from typing import Protocol
+from urllib.parse import unquote, urlsplit
+
+from sqlalchemy import func, or_, text
+
+from db import SessionLocal, joined_session_scope
+from models import RateLimitHit
+from services.ttl_cache import TTLCache
+
+
+# A hit recorded further in the future than this is treated as left behind by
+# a clock that moved backwards. Discarding it prevents a multi-hour lockout.
+CLOCK_SKEW_TOLERANCE_SECONDS = 1.0
+
+_ADVISORY_LOCK_NAMESPACE = 0x524C  # "RL"
+
+
+class RateLimitStore(Protocol):
+    def hit(self, key: str, limit: int, window_seconds: float) -> bool:
+        """Record one hit unless the window is full; return True if limited."""
+
+    def clear(self) -> None:
+        """Forget every recorded hit."""
+
+
+class MemoryRateLimitStore:
+    """Process-local store bounded by key count; idle keys expire lazily.
+
+    Each key's hits expire together once its newest hit leaves the window, and
+    the least recently used keys beyond ``max_keys`` are evicted first.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_keys: int = 100_000,
+        cache_name: str | None = None,
+    ) -> None:
+        self.max_keys = max_keys
+        self._hits = TTLCache(
+            max_entries=max_keys,
+            ttl_seconds=0.0,
+            name=cache_name,
+        )
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+    def keys(self) -> set[str]:
+        return set(self._hits.live_keys(now=time.time()))
+
+    def clear(self) -> None:
+        self._hits.clear()
+
+    def stats(self) -> dict:
+        return self._hits.stats()
+
+    def hit(self, key: str, limit: int, window_seconds: float) -> bool:
+        if window_seconds <= 0:
+            return False
+
+        now = time.time()
+        with self._lock:
+            hits = self._hits.get(key, now=now)
+            if hits is None:
+                hits = deque()
+            self._expire(hits, now, window_seconds)
+            if len(hits) >= limit:
+                return True
+
+            hits.append(now)
+            self._hits.set(key, hits, ttl_seconds=window_seconds, now=now)
+            return False
+
+    @staticmethod
+    def _expire(hits: deque[float], now: float, window_seconds: float) -> None:
+        """Keep only hits inside the window, as the shared stores do.
+
+        After the clock moves backwards the deque is no longer ordered, so
+        the hits left in the future are filtered out individually rather than
+        discarding the whole key.
+        """
+
+        cutoff = now - window_seconds
+        horizon = now + CLOCK_SKEW_TOLERANCE_SECONDS
+        if any(not cutoff < hit_at <= horizon for hit_at in hits):
+            kept = [hit_at for hit_at in hits if cutoff < hit_at <= horizon]
+            hits.clear()
+            hits.extend(kept)
+
+
+class DatabaseRateLimitStore:
+    """Shared store backed by the ``rate_limit_hits`` table.
+
+    PostgreSQL serializes each key with a transaction-scoped advisory lock,
+    and the table is UNLOGGED there because losing counters on a crash only
+    resets budgets. On SQLite the first DELETE takes the database write lock;
+    a hit made inside a message's unit of work joins that unit instead, so it
+    commits with the message and is rolled back if the message fails.
+    """
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        *,
+        cleanup_interval_seconds: float = 300.0,
+    ) -> None:
+        self._session_factory = session_factory
+        self.cleanup_interval_seconds = cleanup_interval_seconds
+        self._longest_window = 0.0
+        self._last_cleanup = 0.0
+        self._cleanup_guard = Lock()
+
+    def clear(self) -> None:
+        with joined_session_scope(self._session_factory) as db:
+            db.query(RateLimitHit).delete(synchronize_session=False)
+
+    def hit(self, key: str, limit: int, window_seconds: float) -> bool:
+        if window_seconds <= 0:
+            return False
+
+        now = time.time()
+        with joined_session_scope(self._session_factory) as db:
+            if db.get_bind().dialect.name == "postgresql":
+                lock_key = (_ADVISORY_LOCK_NAMESPACE << 32) | zlib.crc32(
+                    key.encode()
+                )
+                db.execute(
+                    text("SELECT pg_advisory_xact_lock(:lock_key)"),
+                    {"lock_key": lock_key},
+                )
+            db.query(RateLimitHit).filter(
+                RateLimitHit.bucket_key == key,
+                or_(
+                    RateLimitHit.hit_at <= now - window_seconds,
+                    RateLimitHit.hit_at > now + CLOCK_SKEW_TOLERANCE_SECONDS,
+                ),
+            ).delete(synchronize_session=False)
+            count = (
+                db.query(func.count(RateLimitHit.id))
+                .filter(RateLimitHit.bucket_key == key)
+                .scalar()
+            )
+            if count >= limit:
+                return True
+
+            db.add(RateLimitHit(bucket_key=key, hit_at=now))
+            self._prune(db, now, window_seconds)
+            return False
+
+    def _prune(self, db, now: float, window_seconds: float) -> None:
+        """Delete hits of idle keys that no later call would expire."""
+
+        with self._cleanup_guard:
+            self._longest_window = max(self._longest_window, window_seconds)
+            if 0 <= now - self._last_cleanup < self.cleanup_interval_seconds:
+                return
+            self._last_cleanup = now
+            cutoff = now - self._longest_window
+        db.query(RateLimitHit).filter(
+            RateLimitHit.hit_at <= cutoff,
+        ).delete(synchronize_session=False)
+
+
+class RedisError(RuntimeError):
+    """Error reply or protocol failure from a Redis-compatible server."""
+
+
+class _RedisConnection:
+    """Minimal RESP2 client; one instance is used by one thread at a time."""
+
+    def __init__(self, url: str, timeout_seconds: float) -> None:
+        parsed = urlsplit(url)
+        if parsed.scheme not in {"redis", "rediss"}:
+            raise ValueError("Redis URL must use redis:// or rediss://")
+        self._host = parsed.hostname or "localhost"
+        self._port = parsed.port or 6379
+        self._tls = parsed.scheme == "rediss"
+        self._username = unquote(parsed.username) if parsed.username else ""
+        self._password = unquote(parsed.password) if parsed.password else ""
+        self._database = int(parsed.path.lstrip("/") or 0)
+        self._timeout_seconds = timeout_seconds
+        self._socket = None
+        self._reader = None
+
+    def close(self) -> None:
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+        self._reader = None
+
+    def execute(self, *commands: tuple) -> list:
+        if self._socket is None:
+            self._connect()
+        try:
+            return self._round_trip(commands)
+        except (OSError, RedisError):
+            self.close()
+            raise
+
+    def _connect(self) -> None:
+        sock = socket.create_connection(
+            (self._host, self._port),
+            timeout=self._timeout_seconds,
+        )
+        if self._tls:
+            sock = ssl.create_default_context().wrap_socket(
+                sock,
+                server_hostname=self._host,
+            )
+        self._socket = sock
+        self._reader = sock.makefile("rb")
+        setup = []
+        if self._password:
+            setup.append(
+                ("AUTH", self._username, self._password)
+                if self._username
+                else ("AUTH", self._password)
+            )
+        if self._database:
+            setup.append(("SELECT", self._database))
+        if setup:
+            try:
+                self._round_trip(setup)
+            except (OSError, RedisError):
+                self.close()
+                raise
+
+    def _round_trip(self, commands) -> list:
+        self._socket.sendall(b"".join(_encode_command(c) for c in commands))
+        replies = [self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+        return replies
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise RedisError("connection closed")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode()
+        if prefix == b"-":
+            return RedisError(body.decode(errors="replace"))
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            return self._reader.read(length + 2)[:-2]
+        if prefix == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise RedisError("unexpected reply")
+
+
+def _encode_command(command: tuple) -> bytes:
+    parts = [b"*%d\r\n" % len(command)]
+    for argument in command:
+        value = (
+            argument
+            if isinstance(argument, bytes)
+            else str(argument).encode()
+        )
+        parts.append(b"$%d\r\n%s\r\n" % (len(value), value))
+    return b"".join(parts)
+
+
+class RedisRateLimitStore:
+    """Shared store using one sorted set of hit timestamps per key.
+
+    A hit is added optimistically inside MULTI/EXEC and removed again when it
+    overflowed the window, so concurrent workers never admit more than
+    ``limit`` hits without needing server-side scripting.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        timeout_seconds: float = 0.5,
+        key_prefix: str = "nyaysetu:ratelimit:",
+    ) -> None:
+        self._url = url
+        self._timeout_seconds = timeout_seconds
+        self._key_prefix = key_prefix
+        self._local = threading.local()
+        _RedisConnection(url, timeout_seconds)  # Validate the URL eagerly.
+
+    def _connection(self) -> _RedisConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = _RedisConnection(self._url, self._timeout_seconds)
+            self._local.connection = connection
+        return connection
+
+    def clear(self) -> None:
+        connection = self._connection()
+        cursor = b"0"
+        while True:
+            (reply,) = connection.execute(
+                ("SCAN", cursor, "MATCH", f"{self._key_prefix}*", "COUNT", 500)
+            )
+            cursor, keys = reply
+            if keys:
+                connection.execute(("DEL", *keys))
+            if cursor in {b"0", "0"}:
+                return
+
+    def hit(self, key: str, limit: int, window_seconds: float) -> bool:
+        if window_seconds <= 0:
+            return False
+
+        now = time.time()
+        redis_key = f"{self._key_prefix}{key}"
+        member = f"{now!r}:{uuid.uuid4().hex}"
+        replies = self._connection().execute(
+            ("MULTI",),
+            ("ZREMRANGEBYSCORE", redis_key, "-inf", repr(now - window_seconds)),
+            (
+                "ZREMRANGEBYSCORE",
+                redis_key,
+                f"({now + CLOCK_SKEW_TOLERANCE_SECONDS!r}",
+                "+inf",
+            ),
+            ("ZADD", redis_key, repr(now), member),
+            ("ZCARD", redis_key),
+            ("PEXPIRE", redis_key, max(1, math.ceil(window_seconds * 1000))),
+            ("EXEC",),
+        )
+        transaction = replies[-1]
+        if not isinstance(transaction, list):
+            raise RedisError("rate-limit transaction was aborted")
+        for reply in transaction:
+            if isinstance(reply, RedisError):
+                raise reply
+        if transaction[3] <= limit:
+            return False
+
+        self._connection().execute(("ZREM", redis_key, member))
+        return True
+
+
+def build_rate_limit_store(
+    backend: str,
+    *,
+    redis_url: str = "",
+    redis_timeout_seconds: float = 0.5,
+    max_memory_keys: int = 100_000,
+) -> RateLimitStore:
+    if backend == "database":
+        return DatabaseRateLimitStore()
+    if backend == "redis":
+        return RedisRateLimitStore(
+            redis_url,
+            timeout_seconds=redis_timeout_seconds,
+        )
+    if backend == "memory":
+        return MemoryRateLimitStore(
+            max_keys=max_memory_keys,
+            cache_name="rate_limits",
+        )
+    raise ValueError(f"Unsupported rate-limit backend: {backend}")
@@ -15,7 +15,7 @@ from typing import Any
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 
-from db import SessionLocal
+from db import SessionLocal, joined_session_scope
 from models import Booking
 from utils.date_utils import format_date_readable
 
@@ -96,9 +96,10 @@ def generate_pdf_receipt(booking):
     """
 
     file_path = _create_private_temp_path()
-    db = None
     try:
-        receipt = canvas.Canvas(file_path, pagesize=A4)
+        # Invariant output keeps identical receipts byte-identical, so a resend
+        # can reuse the media ID uploaded for the first one.
+        receipt = canvas.Canvas(file_path, pagesize=A4, invariant=1)
         receipt.setTitle("NyaySetu Payment Receipt")
         receipt.setAuthor("NyaySetu")
 
@@ -129,24 +130,18 @@ def generate_pdf_receipt(booking):
 
         # Update only the receipt flag. Merging a detached Booking can overwrite
         # newer payment/status fields from another transaction.
-        db = SessionLocal()
-        updated = (
-            db.query(Booking)
-            .filter(Booking.id == booking.id)
-            .update(
-                {Booking.receipt_generated: True},
-                synchronize_session=False,
+        with joined_session_scope(SessionLocal) as db:
+            updated = (
+                db.query(Booking)
+                .filter(Booking.id == booking.id)
+                .update(
+                    {Booking.receipt_generated: True},
+                    synchronize_session=False,
+                )
             )
-        )
-        if updated != 1:
-            raise LookupError("booking_not_found")
-        db.commit()
+            if updated != 1:
+                raise LookupError("booking_not_found")
         return file_path
     except Exception:
-        if db is not None:
-            db.rollback()
         _remove_temp_receipt(file_path)
         raise
-    finally:
-        if db is not None:
-            db.close()
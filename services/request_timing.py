@@ -0,0 +1,230 @@
+"""Opt-in phase timing for inbound requests.
+
+When ``REQUEST_TIMING_ENABLED`` is set, each Flask request carries a
+``RequestTiming`` on ``g`` and the webhook marks its phases: signature check,
+inbound claim, user-lock wait, user lookup, flow handler, DB commits and
+outbound WhatsApp sends. Phases may nest (the handler includes the commits
+and sends it performs) and repeated phases accumulate.
+
+Disabled, every hook returns after one module-level flag check and no
+SQLAlchemy listener is installed.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from config import REQUEST_TIMING_ENABLED, REQUEST_TIMING_WINDOW
+
+
+logger = logging.getLogger("services.request_timing")
+
+_BUCKET_BOUNDS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+_COMMIT_STARTED_KEY = "request_timing_commit_started"
+
+
+class RequestTiming:
+    """Accumulated phase durations for one request."""
+
+    __slots__ = ("started", "phases", "flow_state")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.flow_state: str | None = None
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total_seconds: float) -> str:
+        entries = [
+            f"{phase};dur={seconds * 1000:.1f}"
+            for phase, seconds in self.phases.items()
+        ]
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+
+class PhaseHistograms:
+    """Rolling window of recent durations per (group, key)."""
+
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self._samples: dict[tuple[str, str], deque[float]] = {}
+        self._lock = Lock()
+
+    def observe(self, group: str, key: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get((group, key))
+            if samples is None:
+                samples = self._samples[(group, key)] = deque(
+                    maxlen=self.window
+                )
+            samples.append(seconds * 1000)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+    def snapshot(self) -> dict[str, dict[str, dict]]:
+        with self._lock:
+            copied = {
+                name: sorted(samples)
+                for name, samples in self._samples.items()
+            }
+
+        report: dict[str, dict[str, dict]] = {}
+        for (group, key), ordered in sorted(copied.items()):
+            buckets = {}
+            for bound in _BUCKET_BOUNDS_MS:
+                buckets[f"le_{bound}ms"] = sum(
+                    1 for value in ordered if value <= bound
+                )
+            buckets["le_inf"] = len(ordered)
+            report.setdefault(group, {})[key] = {
+                "count": len(ordered),
+                "p50_ms": round(_percentile(ordered, 50), 3),
+                "p95_ms": round(_percentile(ordered, 95), 3),
+                "p99_ms": round(_percentile(ordered, 99), 3),
+                "max_ms": round(ordered[-1], 3),
+                "buckets": buckets,
+            }
+        return report
+
+
+def _percentile(ordered: list[float], percentile: float) -> float:
+    rank = max(1, math.ceil(percentile / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+histograms = PhaseHistograms(REQUEST_TIMING_WINDOW)
+_listener_guard = Lock()
+_listeners_installed = False
+
+
+def _install_commit_listeners() -> None:
+    global _listeners_installed
+
+    with _listener_guard:
+        if _listeners_installed:
+            return
+        event.listen(Session, "before_commit", _before_commit)
+        event.listen(Session, "after_commit", _after_commit)
+        event.listen(Session, "after_rollback", _after_rollback)
+        _listeners_installed = True
+
+
+def _before_commit(session) -> None:
+    started = start_phase()
+    if started is not None:
+        session.info[_COMMIT_STARTED_KEY] = started
+
+
+def _after_commit(session) -> None:
+    end_phase("commit", session.info.pop(_COMMIT_STARTED_KEY, None))
+
+
+def _after_rollback(session) -> None:
+    session.info.pop(_COMMIT_STARTED_KEY, None)
+
+
+def begin_request() -> None:
+    if not REQUEST_TIMING_ENABLED:
+        return
+    _install_commit_listeners()
+    g.request_timing = RequestTiming()
+
+
+def current() -> RequestTiming | None:
+    if not REQUEST_TIMING_ENABLED or not has_app_context():
+        return None
+    return g.get("request_timing")
+
+
+def start_phase() -> float | None:
+    """Return a start mark, or None when this request is not being timed."""
+
+    if not REQUEST_TIMING_ENABLED:
+        return None
+    return time.perf_counter() if current() is not None else None
+
+
+def end_phase(phase: str, started: float | None) -> None:
+    if started is None:
+        return
+    timing = current()
+    if timing is not None:
+        timing.add(phase, time.perf_counter() - started)
+
+
+@contextmanager
+def timed_phase(phase: str):
+    started = start_phase()
+    try:
+        yield
+    finally:
+        end_phase(phase, started)
+
+
+def note_flow_state(flow_state: str | None) -> None:
+    timing = current()
+    if timing is not None and timing.flow_state is None:
+        timing.flow_state = str(flow_state or "NONE")
+
+
+def finish_request(
+    timing: RequestTiming,
+    *,
+    request_id: str,
+    endpoint: str | None,
+    status_code: int,
+) -> float:
+    """Log the request breakdown, feed the histograms and return the total."""
+
+    total = timing.elapsed()
+    endpoint = endpoint or "unmatched"
+    histograms.observe("endpoint", endpoint, total)
+    for phase, seconds in timing.phases.items():
+        histograms.observe("phase", phase, seconds)
+    if timing.flow_state is not None and "handler" in timing.phases:
+        histograms.observe(
+            "flow_state",
+            timing.flow_state,
+            timing.phases["handler"],
+        )
+
+    logger.info(
+        "REQUEST_TIMING | request_id=%s | endpoint=%s | status=%s | "
+        "flow_state=%s | total_ms=%.1f | %s",
+        request_id,
+        endpoint,
+        status_code,
+        timing.flow_state or "-",
+        total * 1000,
+        " | ".join(
+            f"{phase}_ms={seconds * 1000:.1f}"
+            for phase, seconds in timing.phases.items()
+        )
+        or "phases=none",
+    )
+    return total
+
+
+def performance_report() -> dict:
+    return {
+        "enabled": REQUEST_TIMING_ENABLED,
+        "window": histograms.window,
+        **histograms.snapshot(),
+    }
@@ -0,0 +1,244 @@
+"""Process-wide pacing for outbound WhatsApp messages.
+
+Every Graph ``/messages`` request, from the webhook, the sender pool, or an
+outbox handler, takes a slot from ``governor`` first:
+
+* a global token bucket refilled at the current send rate, which starts at
+  the configured messaging tier;
+* a per-recipient bucket that mirrors Meta's pair rate limit (a burst, then
+  one message per interval to the same user);
+* additive-increase/multiplicative-decrease of the send rate: a 429 or a
+  throttling error code halves it (at most once per second), and each
+  second of accepted sends adds back a twentieth of the tier;
+* priority classes. While a higher class waits for the global bucket, lower
+  classes do not take tokens, so conversational replies go ahead of queued
+  reminders and notifications.
+
+A send that cannot get a slot within ``WHATSAPP_SEND_MAX_WAIT_SECONDS`` is
+never attempted, so callers can safely retry it later. The state is per
+process, so divide the tier by the number of worker processes.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Condition
+
+from config import (
+    WHATSAPP_PAIR_BURST,
+    WHATSAPP_PAIR_INTERVAL_SECONDS,
+    WHATSAPP_SEND_MAX_WAIT_SECONDS,
+    WHATSAPP_SEND_MIN_RATE_PER_SECOND,
+    WHATSAPP_SEND_RATE_PER_SECOND,
+)
+
+
+logger = logging.getLogger("services.send_governor")
+
+# Highest priority first.
+PRIORITIES = ("conversation", "notification", "reminder")
+
+# Meta error codes that signal throughput throttling rather than a bad message:
+# app, account and phone-number throughput limits, and spam-rate limiting.
+THROTTLING_ERROR_CODES = frozenset({4, 80007, 130429, 131048})
+PAIR_RATE_ERROR_CODE = 131056
+
+_PAIR_ENTRIES_MAX = 10_000
+_ADJUST_INTERVAL_SECONDS = 1.0
+_INCREASE_FRACTION = 0.05
+
+_current_priority: ContextVar[str] = ContextVar(
+    "whatsapp_send_priority",
+    default=PRIORITIES[0],
+)
+
+
+@contextmanager
+def send_priority(priority: str):
+    """Run sends made inside the block at ``priority``."""
+
+    if priority not in PRIORITIES:
+        raise ValueError(f"unknown send priority: {priority}")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class SendGovernor:
+    def __init__(
+        self,
+        *,
+        rate: float,
+        min_rate: float,
+        pair_burst: int,
+        pair_interval_seconds: float,
+        max_wait_seconds: float,
+        clock=time.monotonic,
+    ) -> None:
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.pair_burst = pair_burst
+        self.pair_interval_seconds = pair_interval_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._clock = clock
+        self._condition = Condition()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._condition:
+            now = self._clock()
+            self.rate = self.max_rate
+            self._tokens = self._capacity()
+            self._updated = now
+            self._last_decrease = -math.inf
+            self._last_adjusted = -math.inf
+            self._pairs: OrderedDict[str, tuple[float, float]] = OrderedDict()
+            self._waiting = [0] * len(PRIORITIES)
+            self._counters = {
+                "granted": 0,
+                "rejected": 0,
+                "decreases": 0,
+                "pair_penalties": 0,
+            }
+            self._condition.notify_all()
+
+    def _capacity(self) -> float:
+        # One second of sends, so a burst cannot outrun the current rate.
+        return max(1.0, self.rate)
+
+    def _refill(self, now: float) -> None:
+        elapsed = max(0.0, now - self._updated)
+        self._tokens = min(self._capacity(), self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def _pair_tokens(self, recipient: str, now: float) -> float:
+        tokens, updated = self._pairs.get(recipient, (self.pair_burst, now))
+        if self.pair_interval_seconds <= 0:
+            return float(self.pair_burst)
+        return min(
+            float(self.pair_burst),
+            tokens + (now - updated) / self.pair_interval_seconds,
+        )
+
+    def _store_pair(self, recipient: str, tokens: float, now: float) -> None:
+        self._pairs[recipient] = (tokens, now)
+        self._pairs.move_to_end(recipient)
+        while len(self._pairs) > _PAIR_ENTRIES_MAX:
+            self._pairs.popitem(last=False)
+
+    def acquire(self, recipient: str, priority: str | None = None) -> bool:
+        """Wait for a send slot; return False if none frees up in time."""
+
+        rank = PRIORITIES.index(priority or _current_priority.get())
+        deadline = self._clock() + self.max_wait_seconds
+        registered = False
+        with self._condition:
+            try:
+                while True:
+                    now = self._clock()
+                    self._refill(now)
+                    pair_tokens = self._pair_tokens(recipient, now)
+                    if pair_tokens < 1:
+                        wait = (1 - pair_tokens) * self.pair_interval_seconds
+                        if registered:
+                            self._waiting[rank] -= 1
+                            registered = False
+                            self._condition.notify_all()
+                    elif self._tokens >= 1 and not any(self._waiting[:rank]):
+                        self._tokens -= 1
+                        self._store_pair(recipient, pair_tokens - 1, now)
+                        self._counters["granted"] += 1
+                        return True
+                    else:
+                        wait = max(0.0, (1 - self._tokens) / self.rate)
+                        if not registered:
+                            self._waiting[rank] += 1
+                            registered = True
+
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._counters["rejected"] += 1
+                        return False
+                    self._condition.wait(min(remaining, max(wait, 0.001)))
+            finally:
+                if registered:
+                    self._waiting[rank] -= 1
+                    # Lower classes may have been holding back for this one.
+                    self._condition.notify_all()
+
+    def record(
+        self,
+        recipient: str,
+        *,
+        status_code: int,
+        error_code=None,
+    ) -> None:
+        """Adjust pacing from one Graph response."""
+
+        try:
+            error_code = int(error_code) if error_code is not None else None
+        except (TypeError, ValueError):
+            error_code = None
+        with self._condition:
+            now = self._clock()
+            if error_code == PAIR_RATE_ERROR_CODE:
+                self._store_pair(recipient, 0.0, now)
+                self._counters["pair_penalties"] += 1
+                return
+
+            throttled = status_code == 429 or error_code in THROTTLING_ERROR_CODES
+            if throttled:
+                if now - self._last_decrease < _ADJUST_INTERVAL_SECONDS:
+                    # Concurrent sends see the same overload; cut once.
+                    return
+                self._refill(now)
+                previous = self.rate
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._tokens = min(self._tokens, self._capacity())
+                self._last_decrease = self._last_adjusted = now
+                self._counters["decreases"] += 1
+                logger.warning(
+                    "WHATSAPP_SEND_RATE_DECREASED | from=%.1f | to=%.1f | "
+                    "status=%s | code=%s",
+                    previous,
+                    self.rate,
+                    status_code,
+                    error_code,
+                )
+            elif (
+                200 <= status_code < 300
+                and self.rate < self.max_rate
+                and now - self._last_adjusted >= _ADJUST_INTERVAL_SECONDS
+            ):
+                self._refill(now)
+                self.rate = min(
+                    self.max_rate,
+                    self.rate + self.max_rate * _INCREASE_FRACTION,
+                )
+                self._last_adjusted = now
+
+    def snapshot(self) -> dict:
+        with self._condition:
+            return {
+                "rate_per_second": round(self.rate, 2),
+                "max_rate_per_second": self.max_rate,
+                "tracked_recipients": len(self._pairs),
+                "waiting": dict(zip(PRIORITIES, self._waiting)),
+                **self._counters,
+            }
+
+
+governor = SendGovernor(
+    rate=WHATSAPP_SEND_RATE_PER_SECOND,
+    min_rate=WHATSAPP_SEND_MIN_RATE_PER_SECOND,
+    pair_burst=WHATSAPP_PAIR_BURST,
+    pair_interval_seconds=WHATSAPP_PAIR_INTERVAL_SECONDS,
+    max_wait_seconds=WHATSAPP_SEND_MAX_WAIT_SECONDS,
+)
@@ -0,0 +1,160 @@
+"""Cross-user cache of AI answers to generic legal questions.
+
+Only prompts that PII scrubbing left untouched are admitted, so a shared row
+never carries anything a user disclosed about themselves. Entries are keyed on
+the normalised prompt plus language, ``LEGAL_CONTENT_VERSION``, and context,
+live in the database so every worker and restart shares them, expire after
+``AI_SHARED_CACHE_TTL_HOURS``, and are evicted least recently used beyond
+``AI_SHARED_CACHE_MAX_ENTRIES``. Cache failures never block an answer.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from datetime import timedelta
+from threading import Lock
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import (
+    AI_SHARED_CACHE_MAX_ENTRIES,
+    AI_SHARED_CACHE_TTL_HOURS,
+    LEGAL_CONTENT_VERSION,
+)
+from db import SessionLocal, joined_session_scope
+from models import SharedAIAnswer, utc_now
+from services.ai_safety import language_code
+
+
+logger = logging.getLogger("services.shared_answer_cache")
+
+# Post-payment replies follow a specific booking and are never shared.
+_UNSHARED_CONTEXTS = frozenset({"post_payment"})
+
+_counters = {
+    "hits": 0,
+    "misses": 0,
+    "stores": 0,
+    "evictions": 0,
+    "ineligible": 0,
+    "errors": 0,
+}
+_counters_guard = Lock()
+
+
+def _count(name: str, amount: int = 1) -> None:
+    with _counters_guard:
+        _counters[name] += amount
+
+
+def _normalize_prompt(prompt: str) -> str:
+    return " ".join(str(prompt or "").lower().split()).rstrip(" ?.!")
+
+
+def shared_cache_key(
+    provider_message: str,
+    user,
+    context: str,
+    *,
+    pii_scrubbed: bool,
+) -> str | None:
+    """Return the shared key for an admissible prompt, otherwise ``None``."""
+
+    if AI_SHARED_CACHE_TTL_HOURS <= 0:
+        return None
+    normalized = _normalize_prompt(provider_message)
+    if pii_scrubbed or not normalized or context in _UNSHARED_CONTEXTS:
+        _count("ineligible")
+        return None
+
+    material = "\x1f".join(
+        (LEGAL_CONTENT_VERSION, language_code(user), context, normalized)
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def cached_answer(cache_key: str) -> str | None:
+    now = utc_now()
+    try:
+        with joined_session_scope(SessionLocal) as db:
+            row = (
+                db.query(SharedAIAnswer)
+                .filter(
+                    SharedAIAnswer.cache_key == cache_key,
+                    SharedAIAnswer.expires_at > now,
+                )
+                .first()
+            )
+            if row is None:
+                _count("misses")
+                return None
+            row.hit_count = (row.hit_count or 0) + 1
+            row.last_used_at = now
+            answer = row.answer
+    except SQLAlchemyError as exc:
+        _count("errors")
+        logger.warning("Shared AI cache lookup failed | reason=%s", type(exc).__name__)
+        return None
+
+    _count("hits")
+    return answer
+
+
+def remember_answer(cache_key: str, answer: str) -> None:
+    now = utc_now()
+    try:
+        with joined_session_scope(SessionLocal) as db:
+            row = (
+                db.query(SharedAIAnswer)
+                .filter(SharedAIAnswer.cache_key == cache_key)
+                .first()
+            )
+            if row is None:
+                row = SharedAIAnswer(cache_key=cache_key, hit_count=0)
+                db.add(row)
+            row.answer = answer
+            row.created_at = now
+            row.last_used_at = now
+            row.expires_at = now + timedelta(hours=AI_SHARED_CACHE_TTL_HOURS)
+            db.flush()
+
+            evicted = (
+                db.query(SharedAIAnswer)
+                .filter(SharedAIAnswer.expires_at <= now)
+                .delete(synchronize_session=False)
+            )
+            overflow = (
+                db.query(SharedAIAnswer).count() - AI_SHARED_CACHE_MAX_ENTRIES
+            )
+            if overflow > 0:
+                stale_ids = [
+                    stale_id
+                    for (stale_id,) in db.query(SharedAIAnswer.id)
+                    .order_by(SharedAIAnswer.last_used_at, SharedAIAnswer.id)
+                    .limit(overflow)
+                ]
+                evicted += (
+                    db.query(SharedAIAnswer)
+                    .filter(SharedAIAnswer.id.in_(stale_ids))
+                    .delete(synchronize_session=False)
+                )
+    except SQLAlchemyError as exc:
+        # Another worker may have stored the same question first; its answer
+        # is equally valid, so losing the unique-key race is harmless.
+        logger.info("Shared AI cache store skipped | reason=%s", type(exc).__name__)
+        return
+
+    _count("stores")
+    if evicted:
+        _count("evictions", evicted)
+
+
+def shared_cache_metrics() -> dict:
+    with _counters_guard:
+        counters = dict(_counters)
+    lookups = counters["hits"] + counters["misses"]
+    counters["hit_ratio"] = round(counters["hits"] / lookups, 4) if lookups else 0.0
+    counters["ttl_hours"] = AI_SHARED_CACHE_TTL_HOURS
+    counters["max_entries"] = AI_SHARED_CACHE_MAX_ENTRIES
+    return counters
@@ -0,0 +1,152 @@
+"""Bounded, thread-safe TTL/LRU cache for process-local state.
+
+Entries live in an ordered dict with the most recently used key last. Every
+operation is amortised O(1): expiry is checked lazily when a key is read, and
+each write drops expired entries from the least recently used end before
+evicting the oldest entries beyond ``max_entries``. An expired entry behind a
+live one stays until it is read, evicted, or reaches the front, so the size
+bound, not a full scan, is what keeps memory fixed.
+
+Callers that already know the time (or run against a test clock) pass
+``now``; otherwise the cache reads its own clock. Named caches report their
+counters through ``cache_stats()``.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterator
+from threading import Lock
+from typing import Any
+
+
+_MISSING = object()
+
+_named_caches: dict[str, TTLCache] = {}
+_named_caches_guard = Lock()
+
+
+class TTLCache:
+    """Least-recently-used mapping whose entries also expire after a TTL."""
+
+    def __init__(
+        self,
+        *,
+        max_entries: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+        name: str | None = None,
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if name:
+            with _named_caches_guard:
+                _named_caches[name] = self
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None, *, now: float | None = None):
+        """Return a live value and mark it most recently used."""
+
+        now = self._clock() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        *,
+        ttl_seconds: float | None = None,
+        now: float | None = None,
+    ) -> None:
+        """Store ``value`` as the most recently used entry.
+
+        A non-positive TTL stores nothing, so a zero setting disables caching.
+        """
+
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl <= 0:
+            return
+        now = self._clock() if now is None else now
+        with self._lock:
+            self._entries[key] = (now + ttl, value)
+            self._entries.move_to_end(key)
+            self._drop_expired_front(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def live_keys(self, *, now: float | None = None) -> Iterator[Hashable]:
+        """Return the unexpired keys, least recently used first (O(n))."""
+
+        now = self._clock() if now is None else now
+        with self._lock:
+            keys = [
+                key
+                for key, (expires_at, _value) in self._entries.items()
+                if expires_at > now
+            ]
+        return iter(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _drop_expired_front(self, now: float) -> None:
+        """Expire from the least recently used end; caller holds ``_lock``."""
+
+        while self._entries:
+            key, (expires_at, _value) = next(iter(self._entries.items()))
+            if expires_at > now:
+                return
+            del self._entries[key]
+            self.expirations += 1
+
+
+def cache_stats() -> dict:
+    """Return the counters of every named cache in this process."""
+
+    with _named_caches_guard:
+        caches = dict(_named_caches)
+    return {name: cache.stats() for name, cache in sorted(caches.items())}
@@ -4,20 +4,36 @@ from __future__ import annotations
 
 import atexit
 import copy
+import hashlib
 import json
 import logging
 import os
 import re
 import time
 import unicodedata
+from datetime import datetime, timedelta
+from threading import Lock
 
 import httpx
-
-from config import WHATSAPP_TOKEN, WHATSAPP_API_URL
-from db import SessionLocal
-from models import Booking, BookingFulfillment, User
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import WHATSAPP_MEDIA_CACHE_DAYS, WHATSAPP_TOKEN, WHATSAPP_API_URL
+from db import SessionLocal, joined_session_scope
+from models import (
+    Booking,
+    BookingFulfillment,
+    User,
+    WhatsAppMediaUpload,
+    utc_now,
+)
 from services.ai_safety import safety_identifier
 from services.booking_service import SLOT_MAP
+from services.request_timing import timed_phase
+from services.send_governor import (
+    PAIR_RATE_ERROR_CODE,
+    THROTTLING_ERROR_CODES,
+    governor,
+)
 from utils.date_utils import format_date_readable
 from utils.i18n import t
 
@@ -57,6 +73,10 @@ class WhatsAppValidationError(ValueError):
     """Raised before network I/O when a message cannot be sent safely."""
 
 
+class _SendThrottled(Exception):
+    """The send governor had no slot in time; nothing reached Meta."""
+
+
 def is_retryable_delivery_failure(result) -> bool:
     """Return whether another send is known not to duplicate an accepted one."""
 
@@ -64,13 +84,18 @@ def is_retryable_delivery_failure(result) -> bool:
         return False
 
     error = result.get("error")
-    if error == "no_whatsapp_config":
+    if error in {"no_whatsapp_config", "whatsapp_throttled"}:
         # No provider request was attempted. A later worker run can recover
-        # after configuration is restored.
+        # after configuration is restored or the send rate recovers.
         return True
     if error == "whatsapp_transport_error":
         return result.get("reason") in _UNAMBIGUOUS_TRANSPORT_FAILURES
     if error == "whatsapp_api_error":
+        details = result.get("details")
+        code = details.get("code") if isinstance(details, dict) else None
+        if code in THROTTLING_ERROR_CODES or code == PAIR_RATE_ERROR_CODE:
+            # Meta refused on rate grounds, so nothing was delivered.
+            return True
         try:
             status_code = int(result.get("status_code"))
         except (TypeError, ValueError):
@@ -362,10 +387,21 @@ def _retry_delay(response: httpx.Response | None, attempt: int) -> float:
     return min(1.0, 0.25 * (2**attempt))
 
 
-def _request_with_retries(method: str, url: str, operation: str, **kwargs):
+def _request_with_retries(
+    method: str,
+    url: str,
+    operation: str,
+    *,
+    recipient: str | None = None,
+    **kwargs,
+):
+    """Send with bounded retries; message sends are paced per ``recipient``."""
+
     max_retries = _env_int("WHATSAPP_HTTP_MAX_RETRIES", 1, 0, 2)
     attempt = 0
     while True:
+        if recipient is not None and not governor.acquire(recipient):
+            raise _SendThrottled
         try:
             response = _HTTP_CLIENT.request(method, url, **kwargs)
         except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as exc:
@@ -385,6 +421,16 @@ def _request_with_retries(method: str, url: str, operation: str, **kwargs):
             # the message, which could create a duplicate user-visible send.
             raise
 
+        if recipient is not None:
+            governor.record(
+                recipient,
+                status_code=response.status_code,
+                error_code=(
+                    _safe_api_error(response).get("code")
+                    if response.status_code >= 400
+                    else None
+                ),
+            )
         if response.status_code in _TRANSIENT_STATUSES and attempt < max_retries:
             logger.warning(
                 "WHATSAPP_RETRY | operation=%s | attempt=%s | status=%s",
@@ -446,12 +492,12 @@ def _response_result(response: httpx.Response) -> dict:
     }
 
 
-def _send(payload: dict):
+def _send(payload: dict, *, validated: bool = False):
     if not WHATSAPP_API_URL or not WHATSAPP_TOKEN:
         logger.warning("WhatsApp transport is not configured; send skipped")
         return {"ok": False, "error": "no_whatsapp_config"}
 
-    normalized = _validate_payload(payload)
+    normalized = payload if validated else _validate_payload(payload)
     message_type = normalized["type"]
     recipient_ref = safety_identifier(normalized["to"])
     logger.info(
@@ -461,12 +507,21 @@ def _send(payload: dict):
     )
 
     try:
-        response = _request_with_retries(
-            "POST",
-            WHATSAPP_API_URL,
-            operation=f"send_{message_type}",
-            json=normalized,
+        with timed_phase("send"):
+            response = _request_with_retries(
+                "POST",
+                WHATSAPP_API_URL,
+                operation=f"send_{message_type}",
+                recipient=normalized["to"],
+                json=normalized,
+            )
+    except _SendThrottled:
+        logger.warning(
+            "WHATSAPP_SEND_THROTTLED | type=%s | recipient_ref=%s",
+            message_type,
+            recipient_ref,
         )
+        return {"ok": False, "error": "whatsapp_throttled"}
     except httpx.RequestError as exc:
         logger.error(
             "WHATSAPP_TRANSPORT_ERROR | type=%s | recipient_ref=%s | reason=%s",
@@ -499,41 +554,104 @@ def _send(payload: dict):
     return result
 
 
-def send_text(wa_id: str, body: str):
+def text_message(wa_id: str, body: str) -> dict:
+    return {
+        "messaging_product": "whatsapp",
+        "to": wa_id,
+        "type": "text",
+        "text": {"body": body},
+    }
+
+
+def button_message(wa_id: str, body: str, buttons: list) -> dict:
+    return {
+        "messaging_product": "whatsapp",
+        "to": wa_id,
+        "type": "interactive",
+        "interactive": {
+            "type": "button",
+            "body": {"text": body},
+            "action": {
+                "buttons": [
+                    {
+                        "type": "reply",
+                        "reply": {
+                            "id": button["id"],
+                            "title": button["title"],
+                        },
+                    }
+                    for button in buttons
+                ]
+            },
+        },
+    }
+
+
+def list_message(
+    wa_id: str,
+    header: str,
+    body: str,
+    rows: list,
+    section_title: str = "Options",
+    button_title: str = "Select",
+) -> dict:
+    return {
+        "messaging_product": "whatsapp",
+        "to": wa_id,
+        "type": "interactive",
+        "interactive": {
+            "type": "list",
+            "header": {"type": "text", "text": header},
+            "body": {"text": body},
+            "action": {
+                "button": button_title,
+                "sections": [
+                    {
+                        "title": section_title,
+                        "rows": [
+                            {
+                                "id": row["id"],
+                                "title": row["title"],
+                                "description": row.get("description", ""),
+                            }
+                            for row in rows
+                        ],
+                    }
+                ],
+            },
+        },
+    }
+
+
+def validate_message(payload: dict) -> dict:
+    """Return the normalized payload, raising WhatsAppValidationError."""
+
+    return _validate_payload(payload)
+
+
+def prepare_message(message: dict) -> dict:
+    """Validate a recipient-less payload once for repeated ``send_prepared``."""
+
+    normalized = _validate_payload({**message, "to": "0"})
+    normalized.pop("to")
+    return normalized
+
+
+def send_prepared(wa_id: str, message: dict):
+    """Send a ``prepare_message`` payload; only the recipient is checked."""
+
     return _send(
-        {
-            "messaging_product": "whatsapp",
-            "to": wa_id,
-            "type": "text",
-            "text": {"body": body},
-        }
+        {**message, "to": _validate_recipient(wa_id)},
+        validated=True,
     )
 
 
+def send_text(wa_id: str, body: str):
+    return _send(text_message(wa_id, body))
+
+
 def send_buttons(wa_id: str, body: str, buttons: list):
-    return _send(
-        {
-            "messaging_product": "whatsapp",
-            "to": wa_id,
-            "type": "interactive",
-            "interactive": {
-                "type": "button",
-                "body": {"text": body},
-                "action": {
-                    "buttons": [
-                        {
-                            "type": "reply",
-                            "reply": {
-                                "id": button["id"],
-                                "title": button["title"],
-                            },
-                        }
-                        for button in buttons
-                    ]
-                },
-            },
-        }
-    )
+    return _send(button_message(wa_id, body, buttons))
 
 
 def send_typing_on(wa_id: str):
@@ -555,32 +673,7 @@ def send_list_picker(
     button_title: str = "Select",
 ):
     return _send(
-        {
-            "messaging_product": "whatsapp",
-            "to": wa_id,
-            "type": "interactive",
-            "interactive": {
-                "type": "list",
-                "header": {"type": "text", "text": header},
-                "body": {"text": body},
-                "action": {
-                    "button": button_title,
-                    "sections": [
-                        {
-                            "title": section_title,
-                            "rows": [
-                                {
-                                    "id": row["id"],
-                                    "title": row["title"],
-                                    "description": row.get("description", ""),
-                                }
-                                for row in rows
-                            ],
-                        }
-                    ],
-                },
-            },
-        }
+        list_message(wa_id, header, body, rows, section_title, button_title)
     )
 
 
@@ -665,7 +758,111 @@ def send_payment_success_message(booking):
         db.close()
 
 
+# Process-local front of the durable media table. It stays small because only
+# receipts and generated documents are uploaded.
+_MEDIA_CACHE_MAX_ENTRIES = 1_024
+_media_ids: dict[str, tuple[str, datetime]] = {}
+_media_ids_guard = Lock()
+
+
+def _cached_media_id(digest: str) -> str | None:
+    if WHATSAPP_MEDIA_CACHE_DAYS <= 0:
+        return None
+
+    now = utc_now()
+    with _media_ids_guard:
+        cached = _media_ids.get(digest)
+    if cached and cached[1] > now:
+        return cached[0]
+
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(WhatsAppMediaUpload)
+            .filter(
+                WhatsAppMediaUpload.content_sha256 == digest,
+                WhatsAppMediaUpload.expires_at > now,
+            )
+            .first()
+        )
+        if row is None:
+            return None
+        media_id, expires_at = row.media_id, row.expires_at
+    except SQLAlchemyError as exc:
+        logger.warning("Media cache lookup failed | reason=%s", type(exc).__name__)
+        return None
+    finally:
+        db.close()
+
+    _remember_media_locally(digest, media_id, expires_at)
+    return media_id
+
+
+def _remember_media_locally(
+    digest: str,
+    media_id: str,
+    expires_at: datetime,
+) -> None:
+    with _media_ids_guard:
+        _media_ids.pop(digest, None)
+        _media_ids[digest] = (media_id, expires_at)
+        while len(_media_ids) > _MEDIA_CACHE_MAX_ENTRIES:
+            _media_ids.pop(next(iter(_media_ids)))
+
+
+def _remember_media_id(digest: str, media_id: str) -> None:
+    if WHATSAPP_MEDIA_CACHE_DAYS <= 0:
+        return
+
+    now = utc_now()
+    expires_at = now + timedelta(days=WHATSAPP_MEDIA_CACHE_DAYS)
+    _remember_media_locally(digest, media_id, expires_at)
+    try:
+        with joined_session_scope(SessionLocal) as db:
+            row = (
+                db.query(WhatsAppMediaUpload)
+                .filter(WhatsAppMediaUpload.content_sha256 == digest)
+                .first()
+            )
+            if row is None:
+                row = WhatsAppMediaUpload(content_sha256=digest)
+                db.add(row)
+            row.media_id = media_id
+            row.created_at = now
+            row.expires_at = expires_at
+    except SQLAlchemyError as exc:
+        # A concurrent upload of the same bytes may win the unique key. Either
+        # media ID is valid, so losing the race is harmless.
+        logger.info("Media cache store skipped | reason=%s", type(exc).__name__)
+
+
+def _forget_media_id(digest: str) -> None:
+    with _media_ids_guard:
+        _media_ids.pop(digest, None)
+    try:
+        with joined_session_scope(SessionLocal) as db:
+            db.query(WhatsAppMediaUpload).filter(
+                WhatsAppMediaUpload.content_sha256 == digest
+            ).delete(synchronize_session=False)
+    except SQLAlchemyError as exc:
+        logger.warning("Media cache eviction failed | reason=%s", type(exc).__name__)
+
+
+def _document_message(recipient: str, media_id: str, caption: str) -> dict:
+    return {
+        "messaging_product": "whatsapp",
+        "to": recipient,
+        "type": "document",
+        "document": {
+            "id": media_id,
+            "caption": caption or "",
+        },
+    }
+
+
 def send_document(wa_id: str, file_path: str, caption: str = ""):
+    """Send a PDF, reusing the media ID of identical bytes uploaded earlier."""
+
     if not WHATSAPP_API_URL or not WHATSAPP_TOKEN:
         logger.warning("WhatsApp transport is not configured; document send skipped")
         return {"ok": False, "error": "no_whatsapp_config"}
@@ -687,6 +884,25 @@ def send_document(wa_id: str, file_path: str, caption: str = ""):
             "reason": type(exc).__name__,
         }
 
+    digest = hashlib.sha256(file_content).hexdigest()
+    media_id = _cached_media_id(digest)
+    if media_id:
+        result = _send(_document_message(recipient, media_id, caption))
+        if (
+            result.get("ok")
+            or result.get("error") != "whatsapp_api_error"
+            or is_retryable_delivery_failure(result)
+        ):
+            return result
+        # Meta rejected the reused ID, most likely because the media expired
+        # early. Nothing was delivered, so upload the bytes again.
+        logger.info(
+            "WHATSAPP_MEDIA_CACHE_REJECTED | recipient_ref=%s | status=%s",
+            safety_identifier(recipient),
+            result.get("status_code"),
+        )
+        _forget_media_id(digest)
+
     files = {
         "file": (
             os.path.basename(file_path),
@@ -736,17 +952,8 @@ def send_document(wa_id: str, file_path: str, caption: str = ""):
         )
         return {"ok": False, "error": "media_id_missing"}
 
-    return _send(
-        {
-            "messaging_product": "whatsapp",
-            "to": recipient,
-            "type": "document",
-            "document": {
-                "id": media_id,
-                "caption": caption or "",
-            },
-        }
-    )
+    _remember_media_id(digest, str(media_id))
+    return _send(_document_message(recipient, media_id, caption))
 
 
 def send_payment_receipt_pdf(
@@ -778,29 +985,21 @@ def send_payment_receipt_pdf(
     # The provider has accepted the document. A local tracking failure must not
     # turn that accepted send into an automatic duplicate. Durable outbox
     # callers also mark their exact booking in the outbox transaction.
-    db = None
     try:
-        db = SessionLocal()
-        updated = (
-            db.query(Booking)
-            .filter(
-                Booking.id == booking_id,
-                Booking.whatsapp_id == wa_id,
-            )
-            .update(
-                {Booking.receipt_sent: True},
-                synchronize_session=False,
+        with joined_session_scope(SessionLocal) as db:
+            updated = (
+                db.query(Booking)
+                .filter(
+                    Booking.id == booking_id,
+                    Booking.whatsapp_id == wa_id,
+                )
+                .update(
+                    {Booking.receipt_sent: True},
+                    synchronize_session=False,
+                )
             )
-        )
-        if updated == 1:
-            db.commit()
-            tracked_result["receipt_status_recorded"] = True
-        else:
-            db.rollback()
-            tracked_result["receipt_status_recorded"] = False
+        tracked_result["receipt_status_recorded"] = updated == 1
     except Exception as exc:
-        if db is not None:
-            db.rollback()
         # Database/provider exception strings can contain private request
         # details. The class name is sufficient for operational grouping.
         logger.error(
@@ -808,7 +1007,4 @@ def send_payment_receipt_pdf(
             type(exc).__name__,
         )
         tracked_result["receipt_status_recorded"] = False
-    finally:
-        if db is not None:
-            db.close()
     return tracked_result
@@ -41,7 +41,7 @@ def app_module():
 def isolated_app_db(monkeypatch, app_module):
     """Give every app-route test a fresh, process-local database."""
 
-    from db import Base
+    from db import Base, UnitOfWorkSession
 
     engine = create_engine(
         "sqlite://",
@@ -50,6 +50,7 @@ def isolated_app_db(monkeypatch, app_module):
     )
     Base.metadata.create_all(engine)
     testing_session = sessionmaker(
+        class_=UnitOfWorkSession,
         bind=engine,
         autoflush=False,
         expire_on_commit=False,
@@ -58,12 +59,8 @@ def isolated_app_db(monkeypatch, app_module):
     monkeypatch.setattr(app_module, "get_db", testing_session)
     monkeypatch.setattr(app_module, "record_event", lambda *args, **kwargs: None)
 
-    app_module.user_message_times.clear()
-    app_module.user_last_ai_call.clear()
-    app_module.global_request_times.clear()
-    app_module._rate_limit_notice_times.clear()
+    app_module.rate_limit_store.clear()
     app_module.maintenance_last_sent.clear()
-    app_module._rate_limit_last_cleanup = 0.0
 
     try:
         yield testing_session
@@ -72,6 +69,26 @@ def isolated_app_db(monkeypatch, app_module):
         engine.dispose()
 
 
+@pytest.fixture(autouse=True)
+def reset_send_governor():
+    """Start every test with a full send budget for every recipient."""
+
+    from services.send_governor import governor
+
+    governor.reset()
+
+
+@pytest.fixture(autouse=True)
+def reset_ai_provider_health():
+    """Start every test with closed breakers and no provider history."""
+
+    from services.circuit_breaker import reset_breakers
+    from services.provider_health import reset_health
+
+    reset_breakers()
+    reset_health()
+
+
 @pytest.fixture
 def transport_spies(monkeypatch, app_module):
     """Replace all network-facing WhatsApp operations with successful spies."""
@@ -812,3 +812,21 @@ def test_document_studio_uat_ledger_excludes_answers_and_contact_data(
     assert "Do Not Expose This Answer" not in serialized
     assert "919900009999" not in serialized
     assert "Private Synthetic User" not in serialized
+
+
+def test_ai_provider_health_endpoint_reports_routing(
+    monkeypatch,
+    client,
+    admin_db,
+):
+    monkeypatch.setenv("AI_PROVIDER", "auto")
+    monkeypatch.setenv("AI_PROVIDER_ORDER", "openai,claude,local")
+
+    response = client.get("/admin/ai-providers", headers=_headers())
+
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload["configured_order"] == ["openai", "claude"]
+    assert payload["effective_order"] == ["openai", "claude"]
+    assert payload["providers"]["claude"]["circuit"]["state"] == "closed"
+    assert payload["providers"]["openai"]["ewma_latency_ms"] is None
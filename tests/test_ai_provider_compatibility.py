@@ -6,7 +6,14 @@ from types import ModuleType, SimpleNamespace
 import pytest
 
 from config import AI_RESPONSE_CACHE_TTL_SECONDS
-from services import ai_safety, claude_service, openai_service
+from services import (
+    ai_response_cache,
+    ai_safety,
+    circuit_breaker,
+    claude_service,
+    openai_service,
+    provider_health,
+)
 
 
 class FakeOpenAIResponse:
@@ -19,55 +26,70 @@ class FakeOpenAIResponse:
 
 
 @pytest.fixture(autouse=True)
-def reset_openai_state(monkeypatch):
-    monkeypatch.setattr(openai_service, "AI_DISABLED_UNTIL", None)
-    openai_service.AI_RESPONSE_CACHE.clear()
+def reset_provider_state(monkeypatch):
+    circuit_breaker.reset_breakers()
+    monkeypatch.setattr(claude_service, "_client", None)
+    ai_response_cache.AI_RESPONSE_CACHE.clear()
     yield
-    openai_service.AI_RESPONSE_CACHE.clear()
+    circuit_breaker.reset_breakers()
+    ai_response_cache.AI_RESPONSE_CACHE.clear()
 
 
-def test_openai_cache_uses_configured_ttl_and_zero_disables_it(monkeypatch):
-    assert openai_service.AI_CACHE_TTL == AI_RESPONSE_CACHE_TTL_SECONDS
+def test_ai_response_cache_uses_configured_ttl_and_zero_disables_it(monkeypatch):
+    assert ai_response_cache.AI_CACHE_TTL == AI_RESPONSE_CACHE_TTL_SECONDS
 
     clock = {"now": 100.0}
-    monkeypatch.setattr(openai_service.time, "time", lambda: clock["now"])
-    monkeypatch.setattr(openai_service, "AI_CACHE_TTL", 5)
-
-    openai_service._set_cached_reply("user-ref", "same prompt", "cached reply")
+    monkeypatch.setattr(ai_response_cache.time, "time", lambda: clock["now"])
+    monkeypatch.setattr(ai_response_cache, "AI_CACHE_TTL", 5)
+
+    ai_response_cache.remember_reply(
+        "user-ref",
+        "same prompt",
+        "general",
+        "cached reply",
+    )
     clock["now"] = 104.9
     assert (
-        openai_service._get_cached_reply("user-ref", "same prompt")
+        ai_response_cache.cached_reply("user-ref", "same prompt", "general")
         == "cached reply"
     )
 
     clock["now"] = 105.1
-    assert openai_service._get_cached_reply("user-ref", "same prompt") is None
+    assert (
+        ai_response_cache.cached_reply("user-ref", "same prompt", "general")
+        is None
+    )
 
-    monkeypatch.setattr(openai_service, "AI_CACHE_TTL", 0)
-    openai_service._set_cached_reply("user-ref", "new prompt", "not cached")
-    assert openai_service.AI_RESPONSE_CACHE == {}
+    monkeypatch.setattr(ai_response_cache, "AI_CACHE_TTL", 0)
+    ai_response_cache.remember_reply(
+        "user-ref",
+        "new prompt",
+        "general",
+        "not cached",
+    )
+    assert len(ai_response_cache.AI_RESPONSE_CACHE) == 0
 
 
-def test_openai_cache_is_bounded_and_evicts_the_oldest_entry(monkeypatch):
+def test_ai_response_cache_is_bounded_and_evicts_the_oldest_entry(monkeypatch):
     clock = {"now": 100.0}
-    monkeypatch.setattr(openai_service.time, "time", lambda: clock["now"])
-    monkeypatch.setattr(openai_service, "AI_CACHE_TTL", 3_600)
-    monkeypatch.setattr(openai_service, "AI_CACHE_MAX_ENTRIES", 2)
+    monkeypatch.setattr(ai_response_cache.time, "time", lambda: clock["now"])
+    monkeypatch.setattr(ai_response_cache, "AI_CACHE_TTL", 3_600)
+    monkeypatch.setattr(ai_response_cache.AI_RESPONSE_CACHE, "max_entries", 2)
 
-    openai_service._set_cached_reply("user-a", "prompt-a", "reply-a")
+    ai_response_cache.remember_reply("user-a", "prompt-a", "general", "reply-a")
     clock["now"] = 101.0
-    openai_service._set_cached_reply("user-b", "prompt-b", "reply-b")
+    ai_response_cache.remember_reply("user-b", "prompt-b", "general", "reply-b")
     clock["now"] = 102.0
-    openai_service._set_cached_reply("user-c", "prompt-c", "reply-c")
+    ai_response_cache.remember_reply("user-c", "prompt-c", "general", "reply-c")
 
-    assert len(openai_service.AI_RESPONSE_CACHE) == 2
-    assert openai_service._get_cached_reply("user-a", "prompt-a") is None
+    assert len(ai_response_cache.AI_RESPONSE_CACHE) == 2
+    assert ai_response_cache.cached_reply("user-a", "prompt-a", "general") is None
     assert (
-        openai_service._get_cached_reply("user-b", "prompt-b")
+        ai_response_cache.cached_reply("user-b", "prompt-b", "general")
         == "reply-b"
     )
     assert (
-        openai_service._get_cached_reply("user-c", "prompt-c")
+        ai_response_cache.cached_reply("user-c", "prompt-c", "general")
         == "reply-c"
     )
 
@@ -329,3 +351,201 @@ def test_claude_retains_temperature_for_compatible_model():
     )
 
     assert request["temperature"] == 0.2
+
+
+class FakeAnthropicStatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def test_claude_reuses_one_client_and_shares_the_response_cache(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-anthropic-key")
+    monkeypatch.setenv("ANTHROPIC_MODEL", "claude-sonnet-test")
+    clients = []
+    outcomes = [
+        SimpleNamespace(content=[SimpleNamespace(text="First answer")]),
+        SimpleNamespace(content=[SimpleNamespace(text="Second answer")]),
+    ]
+
+    class FakeAnthropic:
+        def __init__(self, **kwargs):
+            clients.append(kwargs)
+            self.messages = SimpleNamespace(
+                create=lambda **_kwargs: outcomes.pop(0)
+            )
+
+    anthropic_module = ModuleType("anthropic")
+    anthropic_module.Anthropic = FakeAnthropic
+    monkeypatch.setitem(sys.modules, "anthropic", anthropic_module)
+    user = SimpleNamespace(language="en", whatsapp_id="919876543210")
+
+    first = claude_service.claude_reply_external("What is bail?", user)
+    repeated = claude_service.claude_reply_external("what is  BAIL?", user)
+    second = claude_service.claude_reply_external("What is a summons?", user)
+
+    assert first.startswith("First answer")
+    assert repeated == first
+    assert second.startswith("Second answer")
+    assert len(clients) == 1
+    assert clients[0]["max_retries"] == 0
+
+
+def test_claude_breaker_opens_on_server_errors_and_probes_half_open(
+    monkeypatch,
+):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-anthropic-key")
+    monkeypatch.setenv("ANTHROPIC_MODEL", "claude-sonnet-test")
+    now = [1_000.0]
+    breaker = circuit_breaker.CircuitBreaker(
+        "claude",
+        failure_threshold=2,
+        window_seconds=60,
+        open_seconds=30,
+        clock=lambda: now[0],
+    )
+    monkeypatch.setattr(claude_service, "breaker_for", lambda _name: breaker)
+    calls = []
+    outcomes = [
+        FakeAnthropicStatusError(503),
+        FakeAnthropicStatusError(529),
+        SimpleNamespace(content=[SimpleNamespace(text="Recovered answer")]),
+    ]
+
+    def create(**_kwargs):
+        calls.append(now[0])
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    class FakeAnthropic:
+        def __init__(self, **_kwargs):
+            self.messages = SimpleNamespace(create=create)
+
+    anthropic_module = ModuleType("anthropic")
+    anthropic_module.Anthropic = FakeAnthropic
+    monkeypatch.setitem(sys.modules, "anthropic", anthropic_module)
+    user = SimpleNamespace(language="en", whatsapp_id="919876543210")
+
+    for question in ("What is bail?", "What is a summons?"):
+        with pytest.raises(claude_service.ClaudeProviderError):
+            claude_service.claude_reply_external(question, user)
+    assert breaker.state == circuit_breaker.OPEN
+
+    with pytest.raises(
+        claude_service.ClaudeProviderError,
+        match="circuit_breaker_open",
+    ):
+        claude_service.claude_reply_external("What is an FIR?", user)
+    assert len(calls) == 2
+
+    now[0] += 30
+    answer = claude_service.claude_reply_external("What is an FIR?", user)
+    assert answer.startswith("Recovered answer")
+    assert breaker.state == circuit_breaker.CLOSED
+
+
+def test_rate_limit_opens_breaker_at_once_and_allows_one_probe():
+    now = [1_000.0]
+    breaker = circuit_breaker.CircuitBreaker(
+        "openai",
+        failure_threshold=5,
+        window_seconds=60,
+        open_seconds=30,
+        clock=lambda: now[0],
+    )
+
+    assert breaker.allow() is True
+    breaker.record_failure(open_seconds=600)
+    assert breaker.allow() is False
+
+    now[0] += 600
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+    breaker.record_failure()
+    assert breaker.snapshot()["state"] == circuit_breaker.OPEN
+    assert breaker.snapshot()["opened"] == 2
+
+
+def test_claude_marks_the_static_system_prefix_for_prompt_caching(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-anthropic-key")
+    monkeypatch.setenv("ANTHROPIC_MODEL", "claude-sonnet-test")
+    requests = []
+
+    def create(**kwargs):
+        requests.append(kwargs)
+        return SimpleNamespace(
+            content=[SimpleNamespace(text="General information.")],
+            usage=SimpleNamespace(
+                input_tokens=20,
+                cache_read_input_tokens=1200,
+                cache_creation_input_tokens=0,
+            ),
+        )
+
+    class FakeAnthropic:
+        def __init__(self, **kwargs):
+            self.messages = SimpleNamespace(create=create)
+
+    anthropic_module = ModuleType("anthropic")
+    anthropic_module.Anthropic = FakeAnthropic
+    monkeypatch.setitem(sys.modules, "anthropic", anthropic_module)
+
+    for language in ("en", "mr"):
+        claude_service.claude_reply_external(
+            "What is bail?",
+            SimpleNamespace(language=language, whatsapp_id=f"91987654321{language}"),
+        )
+
+    english, marathi = (request["system"] for request in requests)
+    assert english[0] == marathi[0]
+    assert english[0]["cache_control"] == {"type": "ephemeral"}
+    assert english[1] == {
+        "type": "text",
+        "text": "Reply in concise, respectful English.",
+    }
+    assert "cache_control" not in marathi[1]
+    usage = provider_health.health_for("claude").snapshot()
+    assert usage["prompt_tokens"] == 2440
+    assert usage["cached_prompt_tokens"] == 2400
+    assert usage["prompt_cache_ratio"] == 0.984
+
+
+def test_openai_keeps_a_stable_prompt_prefix_and_records_cached_tokens(
+    monkeypatch,
+):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-openai-key")
+    monkeypatch.setenv("OPENAI_MODEL", "gpt-primary-test")
+    monkeypatch.delenv("OPENAI_FALLBACK_MODEL", raising=False)
+    requests = []
+
+    def fake_post(url, headers, data):
+        requests.append(data)
+        return FakeOpenAIResponse(
+            200,
+            {
+                "choices": [{"message": {"content": "General information."}}],
+                "usage": {
+                    "prompt_tokens": 1100,
+                    "prompt_tokens_details": {"cached_tokens": 1024},
+                },
+            },
+        )
+
+    monkeypatch.setattr(openai_service, "_post_openai", fake_post)
+
+    for language in ("en", "hi"):
+        openai_service.openai_reply_external(
+            "What is bail?",
+            SimpleNamespace(language=language, whatsapp_id=f"91987654321{language}"),
+        )
+
+    english, hinglish = (data["messages"][0]["content"] for data in requests)
+    prefix = openai_service._STATIC_SYSTEM_PROMPT
+    assert english.startswith(prefix) and hinglish.startswith(prefix)
+    assert english[len(prefix):] != hinglish[len(prefix):]
+    usage = provider_health.health_for("openai").snapshot()
+    assert usage["prompt_tokens"] == 2200
+    assert usage["cached_prompt_tokens"] == 2048
+    assert usage["cache_write_tokens"] == 0
@@ -1,12 +1,28 @@
 from __future__ import annotations
 
 import re
+import threading
+from datetime import datetime
 from types import SimpleNamespace
 from unittest.mock import MagicMock
 
 import pytest
-
-from services import ai_router, ai_safety, openai_service
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from db import Base
+from models import SharedAIAnswer
+from services import (
+    ai_response_cache,
+    ai_router,
+    ai_safety,
+    circuit_breaker,
+    claude_service,
+    openai_service,
+    provider_health,
+    shared_answer_cache,
+)
 
 
 def test_scrub_pii_removes_common_high_risk_identifiers():
@@ -184,6 +200,359 @@ def test_router_short_circuits_provider_selection_for_blocked_request(
     provider_order.assert_not_called()
 
 
+def _enable_hedging(monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "auto")
+    monkeypatch.setenv("AI_PROVIDER_ORDER", "claude,openai,local")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-anthropic-key")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-openai-key")
+    monkeypatch.setattr(ai_router, "AI_HEDGE_DELAY_MS", 20)
+    monkeypatch.setattr(shared_answer_cache, "AI_SHARED_CACHE_TTL_HOURS", 0)
+
+
+def test_router_hedge_replaces_a_failing_slow_provider_and_screens_once(
+    monkeypatch,
+):
+    _enable_hedging(monkeypatch)
+    guardrail = MagicMock(wraps=ai_safety.guardrail_response)
+    scrub = MagicMock(wraps=ai_safety.scrub_pii)
+    monkeypatch.setattr(ai_router, "guardrail_response", guardrail)
+    monkeypatch.setattr(ai_router, "scrub_pii", scrub)
+    hedge_started = threading.Event()
+    events = []
+
+    def slow_failing_claude(provider_message, user, context, *, pii_scrubbed):
+        events.append(("claude", threading.current_thread().name))
+        hedge_started.wait(2)
+        events.append(("claude_failed", provider_message, pii_scrubbed))
+        raise claude_service.ClaudeProviderError("APITimeoutError")
+
+    def openai_answer(provider_message, user, context, *, pii_scrubbed):
+        events.append(("openai", provider_message, pii_scrubbed))
+        hedge_started.set()
+        return "openai answer"
+
+    monkeypatch.setattr(claude_service, "claude_reply_screened", slow_failing_claude)
+    monkeypatch.setattr(openai_service, "openai_reply_screened", openai_answer)
+    before = ai_router.hedge_metrics()
+    user = SimpleNamespace(language="en", whatsapp_id="919876543210")
+
+    response = ai_router.ai_reply_router(
+        "My landlord called 9876543210 about the deposit",
+        user,
+    )
+
+    after = ai_router.hedge_metrics()
+    assert response == "openai answer"
+    guardrail.assert_called_once()
+    scrub.assert_called_once()
+    # The primary runs on the caller's thread; the hedge started before the
+    # primary gave up and received the same screened message.
+    assert events[0] == ("claude", threading.current_thread().name)
+    assert [event[0] for event in events[1:]] == ["openai", "claude_failed"]
+    assert events[1][1:] == events[2][1:]
+    assert "9876543210" not in events[1][1]
+    assert events[1][2] is True
+    assert after["hedged_requests"] == before["hedged_requests"] + 1
+    assert after["hedge_wins"] == before["hedge_wins"] + 1
+    assert after["hedge_losses"] == before["hedge_losses"]
+
+
+def test_router_prefers_a_primary_answer_over_a_running_hedge(monkeypatch):
+    _enable_hedging(monkeypatch)
+    hedge_started = threading.Event()
+    release_hedge = threading.Event()
+
+    def slow_claude(provider_message, user, context, *, pii_scrubbed):
+        hedge_started.wait(2)
+        return "claude answer"
+
+    def stuck_openai(provider_message, user, context, *, pii_scrubbed):
+        hedge_started.set()
+        release_hedge.wait(2)
+        return "late openai answer"
+
+    monkeypatch.setattr(claude_service, "claude_reply_screened", slow_claude)
+    monkeypatch.setattr(openai_service, "openai_reply_screened", stuck_openai)
+    before = ai_router.hedge_metrics()
+    user = SimpleNamespace(language="en", whatsapp_id="919876543210")
+
+    try:
+        response = ai_router.ai_reply_router("What is a rent agreement?", user)
+    finally:
+        release_hedge.set()
+
+    after = ai_router.hedge_metrics()
+    assert response == "claude answer"
+    assert after["hedged_requests"] == before["hedged_requests"] + 1
+    assert after["hedge_losses"] == before["hedge_losses"] + 1
+    assert after["hedge_wins"] == before["hedge_wins"]
+
+
+def test_router_skips_hedging_while_every_hedge_slot_is_busy(monkeypatch):
+    _enable_hedging(monkeypatch)
+    monkeypatch.setattr(ai_router, "_hedge_slots", threading.BoundedSemaphore(1))
+    busy_hedge_running = threading.Event()
+    release = threading.Event()
+    openai_calls = []
+
+    def claude(provider_message, user, context, *, pii_scrubbed):
+        if "first" in provider_message:
+            release.wait(2)
+            return "first claude answer"
+        return "second claude answer"
+
+    def openai(provider_message, user, context, *, pii_scrubbed):
+        openai_calls.append(provider_message)
+        busy_hedge_running.set()
+        release.wait(2)
+        return "late openai answer"
+
+    monkeypatch.setattr(claude_service, "claude_reply_screened", claude)
+    monkeypatch.setattr(openai_service, "openai_reply_screened", openai)
+    user = SimpleNamespace(language="en", whatsapp_id="919876543210")
+    first = {}
+    holder = threading.Thread(
+        target=lambda: first.setdefault(
+            "reply",
+            ai_router.ai_reply_router("first rent question", user),
+        )
+    )
+    holder.start()
+    try:
+        assert busy_hedge_running.wait(2)
+        before = ai_router.hedge_metrics()
+
+        second = ai_router.ai_reply_router("second rent question", user)
+
+        after = ai_router.hedge_metrics()
+    finally:
+        release.set()
+        holder.join(2)
+
+    assert second == "second claude answer"
+    assert after["hedges_skipped"] == before["hedges_skipped"] + 1
+    assert after["hedged_requests"] == before["hedged_requests"]
+    assert openai_calls == ["first rent question"]
+    assert first["reply"] == "first claude answer"
+
+
+def test_router_without_hedge_delay_tries_providers_in_order(monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "auto")
+    monkeypatch.setenv("AI_PROVIDER_ORDER", "claude,openai,local")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-anthropic-key")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-openai-key")
+    monkeypatch.setattr(ai_router, "AI_HEDGE_DELAY_MS", 0)
+    monkeypatch.setattr(shared_answer_cache, "AI_SHARED_CACHE_TTL_HOURS", 0)
+    calls = []
+
+    def failing_claude(provider_message, user, context, *, pii_scrubbed):
+        calls.append("claude")
+        raise claude_service.ClaudeProviderError("missing_model")
+
+    def openai_answer(provider_message, user, context, *, pii_scrubbed):
+        calls.append("openai")
+        return "openai answer"
+
+    monkeypatch.setattr(claude_service, "claude_reply_screened", failing_claude)
+    monkeypatch.setattr(openai_service, "openai_reply_screened", openai_answer)
+    before = ai_router.hedge_metrics()
+    user = SimpleNamespace(language="en", whatsapp_id="919876543210")
+
+    response = ai_router.ai_reply_router("What is a rent agreement?", user)
+
+    assert response == "openai answer"
+    assert calls == ["claude", "openai"]
+    assert ai_router.hedge_metrics() == before
+
+
+def test_router_tries_unhealthy_providers_last(monkeypatch):
+    monkeypatch.setenv("AI_PROVIDER", "auto")
+    monkeypatch.setenv("AI_PROVIDER_ORDER", "claude,openai,local")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-anthropic-key")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-openai-key")
+    monkeypatch.setattr(shared_answer_cache, "AI_SHARED_CACHE_TTL_HOURS", 0)
+    calls = []
+
+    def claude_answer(provider_message, user, context, *, pii_scrubbed):
+        calls.append("claude")
+        return "claude answer"
+
+    def openai_answer(provider_message, user, context, *, pii_scrubbed):
+        calls.append("openai")
+        return "openai answer"
+
+    monkeypatch.setattr(claude_service, "claude_reply_screened", claude_answer)
+    monkeypatch.setattr(openai_service, "openai_reply_screened", openai_answer)
+    user = SimpleNamespace(language="en", whatsapp_id="919876543210")
+
+    # Similar latencies keep the configured order.
+    provider_health.record_call("claude", 1.2, ok=True)
+    provider_health.record_call("openai", 0.9, ok=True)
+    assert ai_router.ai_reply_router("What is bail?", user) == "claude answer"
+
+    for _ in range(5):
+        provider_health.record_call("claude", 1.0, ok=False)
+    report = ai_router.provider_routing_report()
+    assert report["effective_order"] == ["openai", "claude"]
+    assert report["providers"]["claude"]["demoted"] == "error_rate"
+    assert ai_router.ai_reply_router("What is bail?", user) == "openai answer"
+    assert calls == ["claude", "openai"]
+
+
+def test_slow_provider_is_demoted_behind_a_fast_one():
+    provider_health.record_call("claude", 6.0, ok=True)
+    provider_health.record_call("openai", 1.0, ok=True)
+    # One slow call is not evidence enough.
+    assert provider_health.rank_providers(["claude", "openai"]) == [
+        "claude",
+        "openai",
+    ]
+
+    for _ in range(4):
+        provider_health.record_call("claude", 6.0, ok=True)
+        provider_health.record_call("openai", 1.0, ok=True)
+    assert provider_health.rank_providers(["claude", "openai"]) == [
+        "openai",
+        "claude",
+    ]
+
+
+def test_slow_demotion_expires_once_its_calls_leave_the_window(monkeypatch):
+    now = [1_000.0]
+    for provider in ("claude", "openai"):
+        monkeypatch.setitem(
+            provider_health._health,
+            provider,
+            provider_health.ProviderHealth(clock=lambda: now[0]),
+        )
+    for _ in range(5):
+        provider_health.record_call("claude", 15.0, ok=True)
+        provider_health.record_call("openai", 1.5, ok=True)
+    assert provider_health.rank_providers(["claude", "openai"]) == [
+        "openai",
+        "claude",
+    ]
+
+    # Only OpenAI is called while Claude is demoted.
+    now[0] += 200
+    for _ in range(5):
+        provider_health.record_call("openai", 1.5, ok=True)
+    now[0] += 101
+    report = provider_health.routing_report(["claude", "openai"])
+    assert report["effective_order"] == ["claude", "openai"]
+    assert report["providers"]["claude"]["demoted"] is None
+
+
+def test_open_breaker_stops_demoting_once_its_open_period_ends(monkeypatch):
+    now = [1_000.0]
+    breaker = circuit_breaker.CircuitBreaker(
+        "claude",
+        failure_threshold=5,
+        window_seconds=60,
+        open_seconds=10,
+        clock=lambda: now[0],
+    )
+    monkeypatch.setitem(circuit_breaker._breakers, "claude", breaker)
+    breaker.record_failure(open_seconds=10)
+    assert breaker.is_open() is True
+    assert provider_health.rank_providers(["claude", "openai"]) == [
+        "openai",
+        "claude",
+    ]
+
+    now[0] += 10
+    assert breaker.is_open() is False
+    assert provider_health.rank_providers(["claude", "openai"]) == [
+        "claude",
+        "openai",
+    ]
+    assert breaker.allow() is True
+    breaker.record_success()
+    assert breaker.state == circuit_breaker.CLOSED
+
+
+@pytest.fixture
+def shared_cache_db(monkeypatch):
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine, tables=[SharedAIAnswer.__table__])
+    testing_session = sessionmaker(bind=engine, expire_on_commit=False)
+    monkeypatch.setattr(shared_answer_cache, "SessionLocal", testing_session)
+    monkeypatch.setattr(shared_answer_cache, "AI_SHARED_CACHE_TTL_HOURS", 24)
+    monkeypatch.setenv("AI_PROVIDER", "openai")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-openai-key")
+    try:
+        yield testing_session
+    finally:
+        engine.dispose()
+
+
+def test_generic_answers_are_shared_across_users(monkeypatch, shared_cache_db):
+    prompts = []
+
+    def openai_answer(provider_message, user, context, *, pii_scrubbed):
+        prompts.append(provider_message)
+        return f"answer {len(prompts)}"
+
+    monkeypatch.setattr(openai_service, "openai_reply_screened", openai_answer)
+    before = shared_answer_cache.shared_cache_metrics()
+    first = SimpleNamespace(language="en", whatsapp_id="919876543210")
+    second = SimpleNamespace(language="en", whatsapp_id="919876543211")
+    hindi = SimpleNamespace(language="hi", whatsapp_id="919876543212")
+    question = "What is the procedure for mutual consent divorce?"
+
+    assert ai_router.ai_reply_router(question, first) == "answer 1"
+    assert ai_router.ai_reply_router(f"  {question.upper()} ", second) == "answer 1"
+    assert ai_router.ai_reply_router(question, hindi) == "answer 2"
+    assert ai_router.ai_reply_router(
+        f"{question} Call me on 9876543210",
+        first,
+    ) == "answer 3"
+
+    after = shared_answer_cache.shared_cache_metrics()
+    assert len(prompts) == 3
+    assert after["hits"] - before["hits"] == 1
+    assert after["misses"] - before["misses"] == 2
+    assert after["ineligible"] - before["ineligible"] == 1
+    with shared_cache_db() as db:
+        rows = db.query(SharedAIAnswer).all()
+        assert len(rows) == 2
+        assert all("9876543210" not in row.answer for row in rows)
+
+
+def test_shared_answer_cache_evicts_least_recently_used(
+    monkeypatch,
+    shared_cache_db,
+):
+    monkeypatch.setattr(shared_answer_cache, "AI_SHARED_CACHE_MAX_ENTRIES", 2)
+    user = SimpleNamespace(language="en", whatsapp_id="919876543210")
+    keys = [
+        shared_answer_cache.shared_cache_key(
+            f"question {index}",
+            user,
+            "general",
+            pii_scrubbed=False,
+        )
+        for index in range(3)
+    ]
+
+    shared_answer_cache.remember_answer(keys[0], "first")
+    shared_answer_cache.remember_answer(keys[1], "second")
+    with shared_cache_db() as db:
+        db.query(SharedAIAnswer).filter(
+            SharedAIAnswer.cache_key == keys[0]
+        ).update({"last_used_at": datetime(2099, 1, 1)})
+        db.commit()
+    shared_answer_cache.remember_answer(keys[2], "third")
+
+    assert shared_answer_cache.cached_answer(keys[0]) == "first"
+    assert shared_answer_cache.cached_answer(keys[1]) is None
+    assert shared_answer_cache.cached_answer(keys[2]) == "third"
+
+
 def test_openai_request_uses_scrubbed_prompt_and_privacy_contract(
     monkeypatch,
 ):
@@ -198,8 +567,8 @@ def test_openai_request_uses_scrubbed_prompt_and_privacy_contract(
         "OPENAI_API_URL",
         "https://api.openai.test/v1/chat/completions",
     )
-    monkeypatch.setattr(openai_service, "AI_DISABLED_UNTIL", None)
-    openai_service.AI_RESPONSE_CACHE.clear()
+    circuit_breaker.reset_breakers()
+    ai_response_cache.AI_RESPONSE_CACHE.clear()
 
     captured = {}
 
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from db import Base
+from models import CategoryAnalytics
+from services.analytics_service import Tally, increment_tallies
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'tallies.db'}",
+        connect_args={"check_same_thread": False, "timeout": 30},
+    )
+    Base.metadata.create_all(engine)
+    try:
+        yield sessionmaker(bind=engine, autoflush=False)
+    finally:
+        engine.dispose()
+
+
+def _counts(session_factory) -> dict[tuple[str, str], int]:
+    db = session_factory()
+    try:
+        return {
+            (row.category, row.subcategory): row.count
+            for row in db.query(CategoryAnalytics).all()
+        }
+    finally:
+        db.close()
+
+
+def test_concurrent_increments_are_not_lost(session_factory):
+    tally = Tally(CategoryAnalytics, ("category", "subcategory"))
+    start = threading.Barrier(8)
+
+    def pick_subcategory():
+        start.wait()
+        for _ in range(5):
+            db = session_factory()
+            try:
+                tally.add(db, category="Family", subcategory="Divorce")
+                db.commit()
+            finally:
+                db.close()
+
+    workers = [threading.Thread(target=pick_subcategory) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert _counts(session_factory) == {("Family", "Divorce"): 40}
+
+
+def test_bulk_increment_is_one_upsert_statement(session_factory):
+    db = session_factory()
+    statements = []
+    event.listen(
+        db.get_bind(),
+        "before_cursor_execute",
+        lambda *args: statements.append(args[2]),
+    )
+    try:
+        increment_tallies(
+            db,
+            CategoryAnalytics,
+            ("category", "subcategory"),
+            {("Family", "Divorce"): 2, ("Property", "Rent"): 1},
+        )
+        increment_tallies(
+            db,
+            CategoryAnalytics,
+            ("category", "subcategory"),
+            {("Family", "Divorce"): 3, ("Labour", "Wages"): 0},
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    assert len(statements) == 2
+    assert all("ON CONFLICT" in statement for statement in statements)
+    assert _counts(session_factory) == {
+        ("Family", "Divorce"): 5,
+        ("Property", "Rent"): 1,
+    }
+
+
+def test_buffered_tally_coalesces_until_the_interval_passes(
+    monkeypatch,
+    session_factory,
+):
+    from services import analytics_service
+
+    clock = {"now": 100.0}
+    monkeypatch.setattr(
+        analytics_service.time,
+        "monotonic",
+        lambda: clock["now"],
+    )
+    monkeypatch.setattr(analytics_service.atexit, "register", lambda _: None)
+    tally = Tally(
+        CategoryAnalytics,
+        ("category", "subcategory"),
+        flush_interval_seconds=5.0,
+        session_factory=session_factory,
+    )
+
+    for _ in range(3):
+        tally.add(None, category="Family", subcategory="Divorce")
+    tally.add(None, category="Property", subcategory="Rent")
+    assert _counts(session_factory) == {}
+    assert tally.pending() == {
+        ("Family", "Divorce"): 3,
+        ("Property", "Rent"): 1,
+    }
+
+    clock["now"] += 5.0
+    tally.add(None, category="Family", subcategory="Divorce")
+
+    assert tally.pending() == {}
+    assert _counts(session_factory) == {
+        ("Family", "Divorce"): 4,
+        ("Property", "Rent"): 1,
+    }
+    assert tally.flush() == 0
+
+
+def test_failed_flush_keeps_counts_for_the_next_attempt(
+    monkeypatch,
+    session_factory,
+):
+    from services import analytics_service
+
+    monkeypatch.setattr(analytics_service.atexit, "register", lambda _: None)
+
+    def unavailable():
+        raise RuntimeError("database unavailable")
+
+    tally = Tally(
+        CategoryAnalytics,
+        ("category", "subcategory"),
+        flush_interval_seconds=60.0,
+        session_factory=unavailable,
+    )
+    tally.add(None, category="Family", subcategory="Divorce")
+
+    assert tally.flush() == 0
+    assert tally.pending() == {("Family", "Divorce"): 1}
+
+    tally._session_factory = session_factory
+    assert tally.flush() == 1
+    assert _counts(session_factory) == {("Family", "Divorce"): 1}
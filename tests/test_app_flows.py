@@ -3,9 +3,17 @@ from __future__ import annotations
 import hashlib
 import hmac
 import json
+import time
+import zlib
 from datetime import datetime, timedelta, timezone
+from functools import partial
+from types import SimpleNamespace
 from unittest.mock import MagicMock
 
+import httpx
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
 from models import (
     Booking,
     CaseBrief,
@@ -14,11 +22,13 @@ from models import (
     DocumentOrder,
     InboundMessageEvent,
     OutboxJob,
+    RateLimitHit,
     SupportRequest,
     User,
     UserConsent,
 )
-from services import outbox_service
+from services import outbox_service, request_timing, whatsapp_service
+from services.rate_limit_service import MemoryRateLimitStore
 
 
 WHATSAPP_SECRET = "test-whatsapp-secret"
@@ -157,6 +167,33 @@ def _create_user(session_factory, *, flow_state, **overrides):
         db.close()
 
 
+def _create_paid_booking(session_factory, app_module, *, payment_token):
+    """Create a paid booking whose consultation starts tomorrow."""
+
+    db = session_factory()
+    try:
+        booking = Booking(
+            whatsapp_id="919911112222",
+            name="Flow Test",
+            phone="919911112222",
+            state_name="Maharashtra",
+            district_name="Pune",
+            category="Family",
+            subcategory="Divorce",
+            date=(datetime.now(app_module.IST) + timedelta(days=1)).date(),
+            slot_readable="03:00 PM - 04:00 PM",
+            slot_code="3_4",
+            amount=499,
+            status=app_module.BookingStatus.PAID,
+            payment_token=payment_token,
+        )
+        db.add(booking)
+        db.commit()
+        return booking.id
+    finally:
+        db.close()
+
+
 def _secure_whatsapp_route(monkeypatch, app_module):
     monkeypatch.setattr(
         app_module,
@@ -196,6 +233,36 @@ def test_document_studio_home_uses_four_ordered_list_rows(
     ]
 
 
+def test_static_menus_are_validated_once_per_language(monkeypatch, app_module):
+    monkeypatch.setattr(app_module.interactive_menus, "_compiled", {})
+    monkeypatch.setattr(
+        whatsapp_service,
+        "WHATSAPP_API_URL",
+        "https://graph.facebook.test/messages",
+    )
+    monkeypatch.setattr(whatsapp_service, "WHATSAPP_TOKEN", "menu-test-token")
+    validate = MagicMock(wraps=whatsapp_service._validate_payload)
+    monkeypatch.setattr(whatsapp_service, "_validate_payload", validate)
+    request = MagicMock(
+        return_value=httpx.Response(
+            200,
+            json={"messages": [{"id": "accepted"}]},
+            request=httpx.Request("POST", "https://graph.facebook.test"),
+        )
+    )
+    monkeypatch.setattr(whatsapp_service._HTTP_CLIENT, "request", request)
+
+    recipients = ["919911110001", "919911110002", "919911110003"]
+    for wa_id, language in zip(recipients, ["en", "en", "hi"]):
+        app_module.send_more_options(wa_id, User(language=language))
+
+    assert validate.call_count == 2
+    sent = [call.kwargs["json"] for call in request.call_args_list]
+    assert [payload["to"] for payload in sent] == recipients
+    assert sent[0]["interactive"] == sent[1]["interactive"]
+    assert sent[0]["interactive"] != sent[2]["interactive"]
+
+
 def test_document_studio_uat_whatsapp_flow_confirms_answers_without_booking(
     monkeypatch,
     app_module,
@@ -695,13 +762,9 @@ def test_process_local_rate_limit_state_is_bounded_and_prunes_idle_users(
         "time",
         lambda: clock["now"],
     )
-    monkeypatch.setattr(app_module, "_RATE_LIMIT_STATE_MAX_KEYS", 3)
-    monkeypatch.setattr(
-        app_module,
-        "_RATE_LIMIT_CLEANUP_INTERVAL_SECONDS",
-        0.0,
-    )
-    app_module._rate_limit_last_cleanup = 0.0
+    monkeypatch.setattr(app_module.maintenance_last_sent, "max_entries", 3)
+    store = MemoryRateLimitStore(max_keys=3)
+    monkeypatch.setattr(app_module, "rate_limit_store", store)
 
     for index in range(10):
         clock["now"] += 1
@@ -718,16 +781,110 @@ def test_process_local_rate_limit_state_is_bounded_and_prunes_idle_users(
             clock["now"],
         )
 
-    assert len(app_module.user_message_times) <= 3
-    assert len(app_module.user_last_ai_call) <= 3
-    assert len(app_module._rate_limit_notice_times) <= 3
+    assert len(store) <= 3
     assert len(app_module.maintenance_last_sent) <= 3
 
     clock["now"] += 10_000
     assert app_module.is_user_rate_limited("919911112222") is False
-    assert set(app_module.user_message_times) == {"919911112222"}
-    assert app_module.user_last_ai_call == {}
-    assert app_module._rate_limit_notice_times == {}
+    assert store.keys() == {"user:919911112222"}
+
+
+def test_rate_limit_store_failure_fails_open(monkeypatch, app_module):
+    store = MagicMock()
+    store.hit.side_effect = OSError("store unavailable")
+    monkeypatch.setattr(app_module, "rate_limit_store", store)
+
+    with app_module.app.test_request_context("/webhook", method="POST"):
+        assert app_module.is_user_rate_limited("919911112222") is False
+        assert app_module.is_global_rate_limited() is False
+        assert app_module.should_send_rate_limit_notice(
+            "user",
+            "919911112222",
+            60,
+        )
+
+
+def test_user_processing_lock_adds_advisory_lock_on_postgresql(
+    monkeypatch,
+    app_module,
+):
+    connection = MagicMock()
+    engine = MagicMock()
+    engine.dialect.name = "postgresql"
+    lock_engine = MagicMock()
+    lock_engine.connect.return_value = connection
+    monkeypatch.setattr(app_module, "engine", engine)
+    monkeypatch.setattr(app_module, "lock_engine", lambda: lock_engine)
+
+    lease = app_module._acquire_user_processing_lock("919911112222")
+
+    assert lease.connection is connection
+    # The lock connection comes from its own pool, never the handler's.
+    engine.connect.assert_not_called()
+    statements = [str(call.args[0]) for call in connection.execute.call_args_list]
+    assert "SELECT pg_advisory_lock(:lock_key)" in statements
+    lock_key = connection.execute.call_args_list[1].args[1]["lock_key"]
+    assert lock_key == app_module._user_advisory_lock_key("919911112222")
+
+    app_module._release_user_processing_lock("919911112222", lease)
+
+    assert (
+        str(connection.execute.call_args.args[0])
+        == "SELECT pg_advisory_unlock(:lock_key)"
+    )
+    connection.close.assert_called_once_with()
+    assert "919911112222" not in app_module._user_processing_locks
+
+
+def test_user_processing_lock_times_out_when_another_worker_holds_it(
+    monkeypatch,
+    app_module,
+):
+    connection = MagicMock()
+    connection.execute.side_effect = [None, RuntimeError("lock timeout")]
+    engine = MagicMock()
+    engine.dialect.name = "postgresql"
+    lock_engine = MagicMock()
+    lock_engine.connect.return_value = connection
+    monkeypatch.setattr(app_module, "engine", engine)
+    monkeypatch.setattr(app_module, "lock_engine", lambda: lock_engine)
+
+    with app_module.app.test_request_context("/webhook", method="POST"):
+        assert app_module._acquire_user_processing_lock("919911112222") is None
+
+    connection.invalidate.assert_called_once_with()
+    assert "919911112222" not in app_module._user_processing_locks
+
+
+def test_user_processing_lock_fails_fast_when_the_lock_pool_is_exhausted(
+    monkeypatch,
+    app_module,
+):
+    engine = MagicMock()
+    engine.dialect.name = "postgresql"
+    lock_engine = MagicMock()
+    lock_engine.connect.side_effect = TimeoutError("QueuePool limit reached")
+    monkeypatch.setattr(app_module, "engine", engine)
+    monkeypatch.setattr(app_module, "lock_engine", lambda: lock_engine)
+
+    with app_module.app.test_request_context("/webhook", method="POST"):
+        assert app_module._acquire_user_processing_lock("919911112222") is None
+
+    engine.connect.assert_not_called()
+    assert "919911112222" not in app_module._user_processing_locks
+
+
+def test_user_advisory_lock_keys_use_64_bits(app_module):
+    _user_advisory_lock_key = app_module._user_advisory_lock_key
+
+    # These two strings share a CRC-32, which the lock key used to be built on.
+    assert zlib.crc32(b"plumless") == zlib.crc32(b"buckeroo")
+    assert _user_advisory_lock_key("plumless") != _user_advisory_lock_key(
+        "buckeroo"
+    )
+    key = _user_advisory_lock_key("919911112222")
+    assert -(2**63) <= key < 2**63
+    assert key == _user_advisory_lock_key("919911112222")
 
 
 def test_outbox_fast_path_is_bounded_and_releases_submission_slot(
@@ -1046,6 +1203,184 @@ def test_committed_state_is_not_replayed_when_safe_delivery_is_deferred(
     assert worker_send.call_count == 2
 
 
+def test_async_delivery_commits_replies_and_sends_them_in_order(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    monkeypatch.setattr(app_module, "WHATSAPP_ASYNC_DELIVERY", True)
+    _create_user(isolated_app_db, flow_state=app_module.NORMAL)
+    inline_sends = MagicMock(side_effect=AssertionError("sent inline"))
+    for name in ("_wa_send_text", "_wa_send_buttons", "_wa_send_list_picker"):
+        monkeypatch.setattr(app_module, name, inline_sends)
+    submitted = []
+    monkeypatch.setattr(
+        app_module,
+        "submit_outbound_delivery",
+        lambda wa_id, job_id: submitted.append((wa_id, job_id)),
+    )
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(
+            message_id="wamid.async-delivery",
+            interactive_id="guide::job::unpaid_salary",
+        ),
+    )
+
+    assert response.status_code == 200
+    assert inline_sends.call_count == 0
+    db = isolated_app_db()
+    try:
+        job = db.query(OutboxJob).one()
+        job_id = job.id
+        deliveries = json.loads(job.payload_json)["deliveries"]
+        assert job.kind == outbox_service.CONVERSATION_DELIVERY_KIND
+        assert [item["operation"] for item in deliveries] == ["text", "buttons"]
+    finally:
+        db.close()
+    assert submitted == [("919911112222", job_id)]
+
+    sent = []
+    monkeypatch.setattr(outbox_service, "SessionLocal", isolated_app_db)
+    monkeypatch.setattr(
+        outbox_service,
+        "send_text",
+        lambda to, body: sent.append("text") or {"ok": True},
+    )
+    buttons_results = [
+        {
+            "ok": False,
+            "error": "whatsapp_transport_error",
+            "reason": "ConnectError",
+        },
+        {"ok": True},
+    ]
+    monkeypatch.setattr(
+        outbox_service,
+        "send_buttons",
+        lambda to, body, buttons: sent.append("buttons")
+        or buttons_results.pop(0),
+    )
+
+    assert outbox_service.process_job(job_id) is False
+    db = isolated_app_db()
+    try:
+        job = db.get(OutboxJob, job_id)
+        remaining = json.loads(job.payload_json)["deliveries"]
+        assert [item["operation"] for item in remaining] == ["buttons"]
+        job.available_at = outbox_service._utc_now() - timedelta(seconds=1)
+        db.commit()
+    finally:
+        db.close()
+
+    assert outbox_service.process_job(job_id) is True
+    assert sent == ["text", "buttons", "buttons"]
+
+
+def test_async_delivery_holds_later_replies_behind_a_failed_one(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    monkeypatch.setattr(app_module, "WHATSAPP_ASYNC_DELIVERY", True)
+    monkeypatch.setattr(
+        app_module,
+        "_outbound_executor",
+        SimpleNamespace(submit=lambda fn, *args: fn(*args)),
+    )
+    monkeypatch.setattr(outbox_service, "SessionLocal", isolated_app_db)
+    _create_user(isolated_app_db, flow_state=app_module.NORMAL)
+    sent = []
+    text_results = [
+        {
+            "ok": False,
+            "error": "whatsapp_transport_error",
+            "reason": "ConnectError",
+        }
+    ]
+
+    def send_text(to, body):
+        sent.append("text")
+        return text_results.pop(0) if text_results else {"ok": True}
+
+    monkeypatch.setattr(outbox_service, "send_text", send_text)
+    monkeypatch.setattr(
+        outbox_service,
+        "send_buttons",
+        lambda to, body, buttons: sent.append("buttons") or {"ok": True},
+    )
+
+    for message_id in ("wamid.ordered-first", "wamid.ordered-second"):
+        response = _signed_whatsapp_post(
+            client,
+            _whatsapp_payload(
+                message_id=message_id,
+                interactive_id="guide::job::unpaid_salary",
+            ),
+        )
+        assert response.status_code == 200
+
+    # The first reply failed and waits for its retry; the second message's
+    # replies must not overtake it.
+    assert sent == ["text"]
+    db = isolated_app_db()
+    try:
+        first, second = db.query(OutboxJob).order_by(OutboxJob.id).all()
+        assert first.status == outbox_service.PENDING
+        assert first.attempts == 1
+        assert second.status == outbox_service.PENDING
+        assert second.attempts == 0
+        assert first.ordering_key == second.ordering_key
+        assert "919911112222" not in first.ordering_key
+        first.available_at = outbox_service._utc_now() - timedelta(seconds=1)
+        db.commit()
+    finally:
+        db.close()
+
+    assert outbox_service.process_pending_jobs() == (2, 0)
+    assert sent == ["text", "text", "buttons", "text", "buttons"]
+
+def test_typing_indicators_are_coalesced_off_the_request_path(
+    monkeypatch,
+    app_module,
+):
+    queued = []
+    executor = MagicMock()
+    executor.submit.side_effect = lambda fn, wa_id: queued.append(
+        partial(fn, wa_id)
+    )
+    monkeypatch.setattr(app_module, "_typing_executor", executor)
+    monkeypatch.setattr(app_module, "_typing_states", {})
+    sent = []
+    monkeypatch.setattr(
+        app_module,
+        "_wa_send_typing_on",
+        lambda wa_id: sent.append(("on", wa_id)) or {"ok": True},
+    )
+    monkeypatch.setattr(
+        app_module,
+        "_wa_send_typing_off",
+        lambda wa_id: sent.append(("off", wa_id))
+        or {"ok": False, "error": "whatsapp_api_error"},
+    )
+
+    assert app_module.send_typing_on("919911112222")["ok"] is True
+    assert app_module.send_typing_off("919911112222")["ok"] is True
+    assert app_module.send_typing_on("919933334444")["ok"] is True
+
+    assert sent == []
+    assert len(queued) == 2
+    for run in queued:
+        run()
+    assert sent == [("off", "919911112222"), ("on", "919933334444")]
+    assert app_module._typing_states == {}
+
+
 def test_ambiguous_delivery_is_not_retried_or_reinterpreted(
     monkeypatch,
     app_module,
@@ -1097,7 +1432,7 @@ def test_ambiguous_delivery_is_not_retried_or_reinterpreted(
         db.close()
 
 
-def test_batched_messages_are_drained_safely_across_provider_retry(
+def test_batched_messages_are_processed_in_order_in_one_request(
     monkeypatch,
     app_module,
     client,
@@ -1119,7 +1454,12 @@ def test_batched_messages_are_drained_safely_across_provider_retry(
 
     first = _signed_whatsapp_post(client, payload)
 
-    assert first.status_code == 503
+    assert first.status_code == 200
+    assert first.get_json() == {
+        "status": "batch_processed",
+        "results": ["ok", "ok"],
+    }
+    assert transport_spies["home"].call_count == 2
     db = isolated_app_db()
     try:
         claimed = {
@@ -1130,24 +1470,929 @@ def test_batched_messages_are_drained_safely_across_provider_retry(
                 .all()
             )
         }
-        assert claimed == {"wamid.batch-1"}
+        assert claimed == {"wamid.batch-1", "wamid.batch-2"}
     finally:
         db.close()
 
     second = _signed_whatsapp_post(client, payload)
     assert second.status_code == 200
+    assert second.get_json()["status"] == "duplicate_ignored"
     assert transport_spies["home"].call_count == 2
 
+
+def test_webhook_expires_only_the_stale_booking_it_shows(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    transport_spies,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    user_id = _create_user(
+        isolated_app_db,
+        flow_state=app_module.WAITING_PAYMENT,
+        last_payment_link="https://rzp.test/pay",
+    )
+    stale_at = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(
+        days=1
+    )
     db = isolated_app_db()
     try:
-        claimed = {
-            row[0]
-            for row in (
-                db.query(InboundMessageEvent.message_id)
-                .filter(InboundMessageEvent.status == "DONE")
-                .all()
+        bookings = [
+            Booking(
+                whatsapp_id=wa_id,
+                name="Stale Payer",
+                phone=wa_id,
+                state_name="Maharashtra",
+                district_name="Pune",
+                category="Family",
+                subcategory="Divorce",
+                date=stale_at.date() + timedelta(days=3),
+                slot_readable="03:00 PM - 04:00 PM",
+                slot_code="3_4",
+                amount=499,
+                status=app_module.BookingStatus.PENDING,
+                payment_token=f"stale-token-{wa_id}",
+                created_at=stale_at,
             )
+            for wa_id in ("919911112222", "919933334444")
+        ]
+        db.add_all(bookings)
+        db.commit()
+        own_id, other_id = (booking.id for booking in bookings)
+    finally:
+        db.close()
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(message_id="wamid.stale-payment", text="paid?"),
+    )
+
+    assert response.status_code == 200
+    db = isolated_app_db()
+    try:
+        assert db.get(Booking, own_id).status == app_module.BookingStatus.EXPIRED
+        # Another sender's stale booking is left for maintenance.
+        assert (
+            db.get(Booking, other_id).status
+            == app_module.BookingStatus.PENDING
+        )
+        assert db.get(User, user_id).flow_state == app_module.ASK_DATE
+    finally:
+        db.close()
+
+
+def test_fast_ack_ingestion_queues_then_drains_in_sender_order(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    transport_spies,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    monkeypatch.setattr(app_module, "WHATSAPP_ASYNC_INGESTION", True)
+    submitted = MagicMock(return_value=True)
+    monkeypatch.setattr(app_module, "submit_inbound_drain", submitted)
+    _create_user(isolated_app_db, flow_state=app_module.NORMAL)
+    payload = _whatsapp_payload(message_id="wamid.async-1", text="menu")
+    messages = payload["entry"][0]["changes"][0]["value"]["messages"]
+    messages.append(
+        {
+            "from": "919911112222",
+            "id": "wamid.async-2",
+            "type": "text",
+            "text": {"body": "menu"},
         }
-        assert claimed == {"wamid.batch-1", "wamid.batch-2"}
+    )
+
+    first = _signed_whatsapp_post(client, payload)
+    replay = _signed_whatsapp_post(client, payload)
+
+    assert first.status_code == 200
+    assert first.get_json() == {"status": "queued"}
+    assert replay.get_json() == {"status": "duplicate_ignored"}
+    submitted.assert_called_once_with("919911112222")
+    assert transport_spies["home"].call_count == 0
+
+    transport_spies["home"].side_effect = [RuntimeError("boom"), None, None]
+    assert app_module.drain_inbound_messages("919911112222") == 0
+    db = isolated_app_db()
+    try:
+        statuses = dict(
+            db.query(
+                InboundMessageEvent.message_id,
+                InboundMessageEvent.status,
+            ).all()
+        )
+        # The failed head blocks its successor until it is retried.
+        assert statuses == {
+            "wamid.async-1": "FAILED",
+            "wamid.async-2": "RECEIVED",
+        }
+    finally:
+        db.close()
+
+    assert app_module.drain_pending_inbound_messages() == (1, 2)
+    assert transport_spies["home"].call_count == 3
+    db = isolated_app_db()
+    try:
+        events = db.query(InboundMessageEvent).order_by(
+            InboundMessageEvent.id
+        ).all()
+        assert [event.status for event in events] == ["DONE", "DONE"]
+        assert [event.payload for event in events] == [None, None]
+        assert events[0].attempts == 2
+    finally:
+        db.close()
+
+
+def test_fast_ack_drain_retries_a_failed_head_with_backoff(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    transport_spies,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    monkeypatch.setattr(app_module, "WHATSAPP_ASYNC_INGESTION", True)
+    monkeypatch.setattr(app_module, "INBOUND_RETRY_BASE_SECONDS", 0.01)
+    _create_user(isolated_app_db, flow_state=app_module.NORMAL)
+    transport_spies["home"].side_effect = [RuntimeError("boom"), None]
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(message_id="wamid.retry-1", text="menu"),
+    )
+
+    assert response.get_json() == {"status": "queued"}
+    deadline = time.monotonic() + 5
+    status = None
+    while time.monotonic() < deadline:
+        db = isolated_app_db()
+        try:
+            row = db.query(InboundMessageEvent).one()
+            status, attempts = row.status, row.attempts
+        finally:
+            db.close()
+        if status == "DONE":
+            break
+        time.sleep(0.02)
+
+    # No second webhook or recovery run: the drain retried the head itself.
+    assert (status, attempts) == ("DONE", 2)
+    assert transport_spies["home"].call_count == 2
+
+
+def test_fast_ack_ingestion_abandons_a_message_after_max_attempts(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    transport_spies,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    monkeypatch.setattr(app_module, "WHATSAPP_ASYNC_INGESTION", True)
+    monkeypatch.setattr(app_module, "INBOUND_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(
+        app_module,
+        "submit_inbound_drain",
+        MagicMock(return_value=True),
+    )
+    _create_user(isolated_app_db, flow_state=app_module.NORMAL)
+    payload = _whatsapp_payload(message_id="wamid.poison-1", text="menu")
+    messages = payload["entry"][0]["changes"][0]["value"]["messages"]
+    messages.append(
+        {
+            "from": "919911112222",
+            "id": "wamid.poison-2",
+            "type": "text",
+            "text": {"body": "menu"},
+        }
+    )
+    assert _signed_whatsapp_post(client, payload).status_code == 200
+
+    transport_spies["home"].side_effect = [RuntimeError("boom"), None]
+    app_module.drain_inbound_messages("919911112222")
+    assert app_module.drain_inbound_messages("919911112222") == 1
+
+    db = isolated_app_db()
+    try:
+        first, second = db.query(InboundMessageEvent).order_by(
+            InboundMessageEvent.id
+        ).all()
+        assert (first.status, first.payload) == ("FAILED", None)
+        assert first.last_error == "InboundProcessingError"
+        assert second.status == "DONE"
+    finally:
+        db.close()
+
+
+def test_batch_retry_resumes_at_first_unfinished_message(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    transport_spies,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    _create_user(isolated_app_db, flow_state=app_module.NORMAL)
+    payload = _whatsapp_payload(message_id="wamid.resume-1", text="menu")
+    messages = payload["entry"][0]["changes"][0]["value"]["messages"]
+    messages.append(
+        {
+            "from": "919911112222",
+            "id": "wamid.resume-2",
+            "type": "text",
+            "text": {"body": "menu"},
+        }
+    )
+    transport_spies["home"].side_effect = [None, RuntimeError("boom"), None]
+
+    first = _signed_whatsapp_post(client, payload)
+
+    assert first.status_code == 503
+    db = isolated_app_db()
+    try:
+        statuses = dict(
+            db.query(
+                InboundMessageEvent.message_id,
+                InboundMessageEvent.status,
+            ).all()
+        )
+        assert statuses == {
+            "wamid.resume-1": "DONE",
+            "wamid.resume-2": "FAILED",
+        }
+    finally:
+        db.close()
+
+    second = _signed_whatsapp_post(client, payload)
+
+    assert second.status_code == 200
+    assert second.get_json()["status"] == "ok"
+    assert transport_spies["home"].call_count == 3
+    db = isolated_app_db()
+    try:
+        event = (
+            db.query(InboundMessageEvent)
+            .filter_by(message_id="wamid.resume-2")
+            .one()
+        )
+        assert event.status == "DONE"
+        assert event.attempts == 2
+    finally:
+        db.close()
+
+
+def test_request_timing_reports_webhook_phases_when_enabled(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    transport_spies,
+):
+    import admin
+
+    _secure_whatsapp_route(monkeypatch, app_module)
+    monkeypatch.setattr(app_module, "ENV", "staging")
+    monkeypatch.setattr(request_timing, "REQUEST_TIMING_ENABLED", True)
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "admin-test-token")
+    request_timing.histograms.clear()
+    _create_user(isolated_app_db, flow_state=app_module.FLOW_VERIFY_DETAILS)
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(
+            message_id="wamid.timing-enabled",
+            interactive_id=app_module.BTN_DETAILS_OK,
+        ),
+    )
+
+    assert response.status_code == 200
+    phases = [
+        entry.split(";")[0]
+        for entry in response.headers["Server-Timing"].split(", ")
+    ]
+    assert phases[0] == "signature"
+    assert {"claim", "lock_wait", "user", "handler", "commit"} <= set(phases)
+    assert phases[-1] == "total"
+
+    report = client.get(
+        "/admin/performance",
+        headers={"Authorization": "Bearer admin-test-token"},
+    ).get_json()
+    assert report["enabled"] is True
+    assert report["phase"]["handler"]["count"] == 1
+    assert report["flow_state"]["VERIFY_DETAILS"]["count"] == 1
+    assert report["endpoint"]["webhook"]["buckets"]["le_inf"] == 1
+    request_timing.histograms.clear()
+
+
+def test_request_timing_is_inert_when_disabled(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    transport_spies,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    monkeypatch.setattr(app_module, "ENV", "staging")
+    monkeypatch.setattr(request_timing, "REQUEST_TIMING_ENABLED", False)
+    request_timing.histograms.clear()
+    _create_user(isolated_app_db, flow_state=app_module.FLOW_VERIFY_DETAILS)
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(
+            message_id="wamid.timing-disabled",
+            interactive_id=app_module.BTN_DETAILS_OK,
+        ),
+    )
+
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+    assert request_timing.histograms.snapshot() == {}
+
+
+def test_dispatch_tables_route_keywords_prefixes_and_flow_states(app_module):
+    assert app_module.message_keywords("hi") == frozenset({"welcome", "home"})
+    assert app_module.message_keywords("reset") == frozenset({"restart"})
+    assert "booking" in app_module.message_keywords("book consultation")
+    assert app_module.message_keywords("my landlord kept my deposit") == (
+        frozenset()
+    )
+
+    calls = []
+    routes = {
+        "exact": lambda ctx: calls.append(("exact", ctx.interactive_id)),
+        "guide::": lambda ctx: calls.append(("prefix", ctx.interactive_id)),
+    }
+
+    def context(interactive_id):
+        return app_module.InboundContext(
+            db=None,
+            user=None,
+            wa_id="919911112222",
+            message_id=None,
+            text_body="",
+            lower_text="",
+            interactive_id=interactive_id,
+            keywords=frozenset(),
+        )
+
+    app_module._route_interactive(routes, context("exact"))
+    app_module._route_interactive(routes, context("guide::rent_deposit"))
+    assert app_module._route_interactive(routes, context("other::x")) is None
+    assert app_module._route_interactive(routes, context(None)) is None
+    assert calls == [("exact", "exact"), ("prefix", "guide::rent_deposit")]
+
+    assert app_module._MENU_ROUTES["guide::"] is app_module._route_legal_guide
+    for state in (
+        app_module.ASK_LANGUAGE,
+        app_module.NORMAL,
+        app_module.ASK_BRIEF_SUMMARY,
+        app_module.REVIEW_CASE_BRIEF,
+        app_module.ASK_DATE,
+        app_module.ASK_SLOT,
+        app_module.WAITING_PAYMENT,
+    ):
+        assert state in app_module.FLOW_STATE_HANDLERS
+
+
+def test_each_inbound_message_is_one_unit_of_work(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    transport_spies,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    engine = isolated_app_db.kw["bind"]
+    counts = {"checkout": 0, "commit": 0}
+
+    def count(name):
+        def listener(*args):
+            counts[name] += 1
+
+        return listener
+
+    event.listen(engine, "checkout", count("checkout"))
+    event.listen(engine, "commit", count("commit"))
+
+    flows = [
+        ("greeting", None, {"text": "hi"}, app_module.ASK_LANGUAGE),
+        (
+            "district",
+            {"flow_state": app_module.ASK_DISTRICT},
+            {"text": "Pune"},
+            app_module.CONFIRM_LOCATION,
+        ),
+        (
+            "subcategory",
+            {
+                "flow_state": app_module.ASK_SUBCATEGORY,
+                "category": "Family",
+                "subcategory": None,
+            },
+            {"interactive_id": "subcat::Family::Divorce"},
+            app_module.ASK_BRIEF_SUMMARY,
+        ),
+    ]
+    for index, (name, user_values, message, expected_state) in enumerate(
+        flows
+    ):
+        wa_id = f"91991111{index:04d}"
+        if user_values is not None:
+            _create_user(
+                isolated_app_db,
+                whatsapp_id=wa_id,
+                case_id=f"NS-UOW{index}",
+                **user_values,
+            )
+        counts.update(checkout=0, commit=0)
+
+        response = _signed_whatsapp_post(
+            client,
+            _whatsapp_payload(
+                message_id=f"wamid.unit-of-work-{name}",
+                wa_id=wa_id,
+                **message,
+            ),
+        )
+
+        assert response.status_code == 200, name
+        # One transaction takes the durable claim; the second carries the
+        # conversation state and the DONE inbox row.
+        assert counts == {"checkout": 2, "commit": 2}, name
+        db = isolated_app_db()
+        try:
+            user = db.query(User).filter_by(whatsapp_id=wa_id).one()
+            assert user.flow_state == expected_state, name
+            event_row = (
+                db.query(InboundMessageEvent)
+                .filter_by(message_id=f"wamid.unit-of-work-{name}")
+                .one()
+            )
+            assert event_row.status == "DONE", name
+        finally:
+            db.close()
+
+
+def test_text_followed_by_a_menu_is_sent_as_one_message(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    _create_user(isolated_app_db, flow_state=app_module.REVIEW_BOOKING)
+    sent = []
+    for name in (
+        "_wa_send_text",
+        "_wa_send_buttons",
+        "_wa_send_list_picker",
+        "_wa_send_prepared",
+    ):
+        monkeypatch.setattr(
+            app_module,
+            name,
+            lambda *args, _name=name, **kwargs: sent.append(
+                (_name, args, kwargs)
+            )
+            or {"ok": True},
+        )
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(
+            message_id="wamid.coalesced-cancel",
+            interactive_id=app_module.BTN_REVIEW_CANCEL,
+        ),
+    )
+
+    assert response.status_code == 200
+    assert [name for name, _, _ in sent] == ["_wa_send_buttons"]
+    body = sent[0][1][1]
+    cancelled = app_module.t(
+        SimpleNamespace(language="en"),
+        "booking_cancelled_before_payment",
+    )
+    assert body.startswith(cancelled.strip())
+
+    sent.clear()
+    with app_module.app.test_request_context():
+        app_module.g.coalesce_replies = True
+        app_module.send_text("919911112222", "x" * 1_020)
+        app_module.send_buttons(
+            "919911112222",
+            "Choose an option",
+            [{"id": "yes", "title": "Yes"}],
+        )
+        app_module.send_text("919911112222", "Held until the barrier")
+        app_module.flush_replies()
+
+    assert [name for name, _, _ in sent] == [
+        "_wa_send_text",
+        "_wa_send_buttons",
+        "_wa_send_text",
+    ]
+
+
+def test_receipt_request_commits_on_a_file_backed_sqlite_database(
+    monkeypatch,
+    app_module,
+    client,
+    tmp_path,
+    transport_spies,
+):
+    # The shared in-memory test database uses one connection and hides
+    # SQLite's single writer; a file gives every session its own connection.
+    from db import Base, UnitOfWorkSession
+    from services import receipt_service
+    from services.rate_limit_service import DatabaseRateLimitStore
+
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'nyaysetu.db'}",
+        connect_args={"check_same_thread": False, "timeout": 1},
+    )
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(
+        class_=UnitOfWorkSession,
+        bind=engine,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+    monkeypatch.setattr(app_module, "get_db", session_factory)
+    monkeypatch.setattr(app_module, "record_event", lambda *args, **kwargs: None)
+    monkeypatch.setattr(receipt_service, "SessionLocal", session_factory)
+    monkeypatch.setattr(
+        app_module,
+        "rate_limit_store",
+        DatabaseRateLimitStore(session_factory),
+    )
+    _secure_whatsapp_route(monkeypatch, app_module)
+    user_id = _create_user(
+        session_factory,
+        flow_state=app_module.WAITING_PAYMENT,
+    )
+    booking_id = _create_paid_booking(
+        session_factory,
+        app_module,
+        payment_token="file-backed-receipt",
+    )
+
+    try:
+        response = _signed_whatsapp_post(
+            client,
+            _whatsapp_payload(message_id="wamid.file-receipt", text="receipt"),
+        )
+
+        assert response.status_code == 200
+        assert transport_spies["receipt"].call_count == 1
+        assert transport_spies["text"].call_count == 0
+        db = session_factory()
+        try:
+            user = db.get(User, user_id)
+            booking = db.get(Booking, booking_id)
+            assert user.flow_state == app_module.PAYMENT_CONFIRMED
+            assert booking.receipt_generated is True
+            assert booking.receipt_sent is True
+            assert (
+                db.query(RateLimitHit)
+                .filter_by(bucket_key="user:919911112222")
+                .count()
+                == 1
+            )
+        finally:
+            db.close()
+    finally:
+        engine.dispose()
+
+
+def test_capacity_error_keeps_the_consent_recorded_by_the_same_message(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    transport_spies,
+):
+    from services import booking_service
+
+    _secure_whatsapp_route(monkeypatch, app_module)
+    user_id = _create_user(
+        isolated_app_db,
+        flow_state=app_module.REVIEW_BOOKING,
+        state_name="Maharashtra",
+        district_name="Pune",
+        category="Family",
+        subcategory="Divorce",
+        temp_date=(
+            datetime.now(timezone.utc) + timedelta(days=1)
+        ).date().isoformat(),
+        temp_slot="3_4",
+    )
+    monkeypatch.setattr(
+        booking_service,
+        "validate_slot",
+        lambda date, slot_code, db=None: (True, None),
+    )
+    capacity_error = MagicMock(return_value="This slot is fully booked.")
+    monkeypatch.setattr(booking_service, "_capacity_error", capacity_error)
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(
+            message_id="wamid.review-capacity",
+            interactive_id=app_module.BTN_REVIEW_PAY,
+        ),
+    )
+
+    assert response.status_code == 200
+    assert capacity_error.call_count == 1
+    db = isolated_app_db()
+    try:
+        user = db.get(User, user_id)
+        consent = db.query(UserConsent).filter_by(user_id=user_id).one()
+        assert user.flow_state == app_module.ASK_DATE
+        assert consent.purpose == "BOOKING_PAYMENT"
+        assert consent.granted is True
+        assert db.query(Booking).count() == 0
+    finally:
+        db.close()
+
+
+def test_failed_receipt_resend_keeps_the_message_flow_state(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    transport_spies,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    user_id = _create_user(
+        isolated_app_db,
+        flow_state=app_module.WAITING_PAYMENT,
+    )
+    _create_paid_booking(
+        isolated_app_db,
+        app_module,
+        payment_token="failed-receipt-resend",
+    )
+    monkeypatch.setattr(
+        app_module,
+        "generate_pdf_receipt",
+        MagicMock(side_effect=OSError("disk full")),
+    )
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(message_id="wamid.receipt-failure", text="receipt"),
+    )
+
+    assert response.status_code == 200
+    assert transport_spies["receipt"].call_count == 0
+    assert "Unable to resend receipt" in transport_spies["text"].call_args.args[1]
+    db = isolated_app_db()
+    try:
+        user = db.get(User, user_id)
+        assert user.flow_state == app_module.PAYMENT_CONFIRMED
+    finally:
+        db.close()
+
+
+def test_async_receipt_resend_follows_the_message_replies(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    tmp_path,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    monkeypatch.setattr(app_module, "WHATSAPP_ASYNC_DELIVERY", True)
+    _create_user(isolated_app_db, flow_state=app_module.WAITING_PAYMENT)
+    booking_id = _create_paid_booking(
+        isolated_app_db,
+        app_module,
+        payment_token="async-receipt-resend",
+    )
+    monkeypatch.setattr(
+        app_module,
+        "generate_pdf_receipt",
+        MagicMock(side_effect=AssertionError("rendered in the request")),
+    )
+    submitted = []
+    monkeypatch.setattr(
+        app_module,
+        "submit_outbound_delivery",
+        lambda wa_id, job_id: submitted.append(job_id),
+    )
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(message_id="wamid.async-receipt", text="receipt"),
+    )
+
+    assert response.status_code == 200
+    db = isolated_app_db()
+    try:
+        job = db.query(OutboxJob).one()
+        deliveries = json.loads(job.payload_json)["deliveries"]
+        assert deliveries[-1] == {
+            "operation": "receipt",
+            "to": "919911112222",
+            "booking_id": booking_id,
+        }
+        # A receipt queued behind an earlier reply is sent after it.
+        deliveries.insert(
+            0,
+            {"operation": "text", "to": "919911112222", "body": "Hi"},
+        )
+        job.payload_json = json.dumps({"deliveries": deliveries})
+        db.commit()
+        job_id = job.id
+    finally:
+        db.close()
+    assert submitted == [job_id]
+
+    sent = []
+    pdf_path = tmp_path / "receipt.pdf"
+    pdf_path.write_bytes(b"%PDF")
+    monkeypatch.setattr(outbox_service, "SessionLocal", isolated_app_db)
+    monkeypatch.setattr(
+        outbox_service,
+        "send_text",
+        lambda to, body: sent.append("text") or {"ok": True},
+    )
+    monkeypatch.setattr(
+        outbox_service,
+        "generate_pdf_receipt",
+        lambda booking: str(pdf_path),
+    )
+    monkeypatch.setattr(
+        outbox_service,
+        "send_payment_receipt_pdf",
+        lambda to, path, booking_id: sent.append("receipt") or {"ok": True},
+    )
+
+    assert outbox_service.process_job(job_id) is True
+    assert sent == ["text", "receipt"]
+    assert not pdf_path.exists()
+    db = isolated_app_db()
+    try:
+        assert db.get(Booking, booking_id).receipt_sent is True
+    finally:
+        db.close()
+
+def test_replies_are_sent_only_after_the_message_commits(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    user_id = _create_user(isolated_app_db, flow_state=app_module.NORMAL)
+    timeline = []
+    event.listen(
+        isolated_app_db.kw["bind"],
+        "commit",
+        lambda connection: timeline.append("commit"),
+    )
+    for name in (
+        "_wa_send_text",
+        "_wa_send_buttons",
+        "_wa_send_list_picker",
+        "_wa_send_prepared",
+    ):
+        monkeypatch.setattr(
+            app_module,
+            name,
+            lambda *args, **kwargs: timeline.append("send") or {"ok": True},
+        )
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(
+            message_id="wamid.send-after-commit",
+            interactive_id=app_module.MORE_MENU_IDS["language"],
+        ),
+    )
+
+    assert response.status_code == 200
+    # The claim commits first, then the message's unit of work; the reply
+    # follows both.
+    assert timeline == ["commit", "commit", "send"]
+    db = isolated_app_db()
+    try:
+        assert db.get(User, user_id).flow_state == app_module.ASK_LANGUAGE
+    finally:
+        db.close()
+
+
+def test_failed_committed_reply_queues_the_replies_behind_it(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    deferred_threads,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    _create_user(isolated_app_db, flow_state=app_module.NORMAL)
+    monkeypatch.setattr(
+        app_module,
+        "_wa_send_text",
+        MagicMock(
+            return_value={
+                "ok": False,
+                "error": "whatsapp_transport_error",
+                "reason": "ConnectError",
+            }
+        ),
+    )
+    later_sends = MagicMock(side_effect=AssertionError("sent out of order"))
+    for name in ("_wa_send_buttons", "_wa_send_list_picker", "_wa_send_prepared"):
+        monkeypatch.setattr(app_module, name, later_sends)
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(
+            message_id="wamid.committed-reply-failure",
+            interactive_id="guide::job::unpaid_salary",
+        ),
+    )
+
+    assert response.status_code == 200
+    assert response.get_json()["status"] == "delivery_queued"
+    assert later_sends.call_count == 0
+    db = isolated_app_db()
+    try:
+        event_row = (
+            db.query(InboundMessageEvent)
+            .filter_by(message_id="wamid.committed-reply-failure")
+            .one()
+        )
+        job = db.query(OutboxJob).one()
+        deliveries = json.loads(job.payload_json)["deliveries"]
+        assert event_row.status == "DONE"
+        assert event_row.last_error.startswith("OutboundDeliveryQueued:")
+        assert [item["operation"] for item in deliveries] == ["text", "buttons"]
+        assert deferred_threads == [job.id]
+    finally:
+        db.close()
+
+
+def test_no_transaction_is_open_during_the_ai_provider_call(
+    monkeypatch,
+    app_module,
+    client,
+    isolated_app_db,
+    transport_spies,
+):
+    _secure_whatsapp_route(monkeypatch, app_module)
+    user_id = _create_user(
+        isolated_app_db,
+        flow_state=app_module.WAITING_PAYMENT,
+        ai_enabled=True,
+    )
+    _create_paid_booking(
+        isolated_app_db,
+        app_module,
+        payment_token="ai-outside-transaction",
+    )
+    counts = {"begin": 0, "commit": 0, "rollback": 0}
+    engine = isolated_app_db.kw["bind"]
+    for name in counts:
+        event.listen(
+            engine,
+            name,
+            lambda connection, _name=name: counts.update(
+                {_name: counts[_name] + 1}
+            ),
+        )
+    open_at_call = []
+
+    def provider(message, user, context="general"):
+        open_at_call.append(
+            counts["begin"] - counts["commit"] - counts["rollback"]
+        )
+        return "Bring your identity proof."
+
+    monkeypatch.setattr(app_module, "ai_reply_router", provider)
+
+    response = _signed_whatsapp_post(
+        client,
+        _whatsapp_payload(
+            message_id="wamid.ai-outside-transaction",
+            text="What should I bring to the consultation?",
+        ),
+    )
+
+    assert response.status_code == 200
+    assert open_at_call == [0]
+    assert "Bring your identity proof." in (
+        transport_spies["text"].call_args.args[1]
+    )
+    db = isolated_app_db()
+    try:
+        assert db.get(User, user_id).flow_state == app_module.PAYMENT_CONFIRMED
     finally:
         db.close()
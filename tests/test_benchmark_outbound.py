@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import json
+
+import httpx
+import pytest
+
+from jobs import benchmark_outbound
+from jobs.fake_graph_api import FakeGraphAPI, FaultProfile
+
+
+def test_outbound_benchmark_delivers_every_operation(isolated_app_db):
+    report = benchmark_outbound.run_benchmark(
+        isolated_app_db,
+        iterations=4,
+        threads=1,
+    )
+
+    assert list(report["operations"]) == list(benchmark_outbound.OPERATIONS)
+    for name, result in report["operations"].items():
+        assert result["outcomes"]["ok"] == 4, name
+    assert report["operations"]["document"]["server_requests_per_send"] == 2
+    assert report["server"] == {"media:200": 4, "messages:200": 12}
+    assert json.loads(json.dumps(report, sort_keys=True)) == report
+
+
+def test_rate_limits_are_retried_and_read_timeouts_are_not(isolated_app_db):
+    limited = benchmark_outbound.run_benchmark(
+        isolated_app_db,
+        operations=["send"],
+        iterations=3,
+        threads=1,
+        faults=FaultProfile(rate_429=1.0, retry_after_seconds=0),
+        max_retries=1,
+    )
+    timed_out = benchmark_outbound.run_benchmark(
+        isolated_app_db,
+        operations=["send"],
+        iterations=2,
+        threads=2,
+        faults=FaultProfile(timeout_rate=1.0, timeout_hold_seconds=0.5),
+        client_timeout=0.2,
+    )
+
+    assert limited["operations"]["send"]["outcomes"]["retryable"] == 3
+    assert limited["server"] == {"messages:429": 6}
+    assert timed_out["operations"]["send"]["outcomes"]["ambiguous"] == 2
+    assert timed_out["server"] == {"messages:timeout": 2}
+
+
+def test_fake_graph_api_rejects_malformed_and_unauthenticated_sends():
+    with FakeGraphAPI() as graph:
+        authorized = {"Authorization": "Bearer token"}
+        empty_text = httpx.post(
+            graph.messages_url,
+            headers=authorized,
+            json={
+                "messaging_product": "whatsapp",
+                "to": "919911112222",
+                "type": "text",
+                "text": {"body": " "},
+            },
+        )
+        anonymous = httpx.post(
+            graph.messages_url,
+            json={
+                "messaging_product": "whatsapp",
+                "to": "919911112222",
+                "type": "template",
+                "template": {"name": "reminder", "language": {"code": "en"}},
+            },
+        )
+
+    assert empty_text.status_code == 400
+    assert empty_text.json()["error"]["code"] == 100
+    assert anonymous.status_code == 401
+    assert [item.message_type for item in graph.requests] == ["text", "template"]
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [["--threads", "0"], ["--iterations", "many"], ["--rate-429", "1.5"]],
+)
+def test_outbound_benchmark_rejects_invalid_arguments(arguments):
+    with pytest.raises(SystemExit):
+        benchmark_outbound.build_parser().parse_args(arguments)
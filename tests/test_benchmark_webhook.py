@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from jobs import benchmark_webhook
+
+
+def test_every_benchmark_scenario_reaches_its_flow_state(
+    app_module,
+    isolated_app_db,
+):
+    report = benchmark_webhook.run_benchmark(
+        app_module,
+        isolated_app_db,
+        isolated_app_db.kw["bind"],
+        iterations=2,
+        warmup=0,
+    )
+
+    assert list(report["scenarios"]) == list(benchmark_webhook.SCENARIO_NAMES)
+    for name, result in report["scenarios"].items():
+        assert result["errors"] == 0, name
+        assert result["unexpected_flow_state"] == 0, name
+        assert result["db_statements"]["mean"] > 0, name
+        assert result["provider_calls_per_request"]["graph"] >= 1, name
+    scenarios = report["scenarios"]
+    assert scenarios["payment_link"]["provider_calls_per_request"][
+        "razorpay"
+    ] == 1
+    assert scenarios["ai_question"]["provider_calls_per_request"]["ai"] == 1
+    assert json.loads(json.dumps(report, sort_keys=True)) == report
+
+
+def test_benchmark_injects_provider_latency(app_module, isolated_app_db):
+    report = benchmark_webhook.run_benchmark(
+        app_module,
+        isolated_app_db,
+        isolated_app_db.kw["bind"],
+        scenarios=["category_list"],
+        iterations=1,
+        warmup=0,
+        graph_latency_ms=30,
+    )
+
+    assert report["scenarios"]["category_list"]["latency_ms"]["p50"] >= 30
+
+
+@pytest.mark.parametrize("value", ["0", "5001", "many"])
+def test_benchmark_rejects_out_of_range_iterations(value):
+    with pytest.raises(SystemExit):
+        benchmark_webhook.build_parser().parse_args(["--iterations", value])
@@ -344,6 +344,40 @@ def test_mark_booking_paid_uses_caller_session_and_is_idempotent(db):
     assert paid.paid_at == FIXED_UTC_NAIVE
 
 
+def test_lazy_expiry_only_transitions_a_stale_pending_booking(db):
+    stale = make_booking(
+        db,
+        suffix="stale",
+        created_at=(
+            FIXED_UTC_NAIVE
+            - timedelta(
+                minutes=booking_service.PAYMENT_LINK_TTL_MINUTES + 1
+            )
+        ),
+    )
+    fresh = make_booking(db, suffix="fresh")
+    paid = make_booking(
+        db,
+        suffix="paid",
+        status=BookingStatus.PAID,
+        created_at=FIXED_UTC_NAIVE - timedelta(days=1),
+    )
+
+    assert booking_service.expire_pending_booking_if_stale(db, None) is None
+    assert (
+        booking_service.expire_pending_booking_if_stale(db, stale).status
+        == BookingStatus.EXPIRED
+    )
+    assert (
+        booking_service.expire_pending_booking_if_stale(db, fresh).status
+        == BookingStatus.PENDING
+    )
+    assert (
+        booking_service.expire_pending_booking_if_stale(db, paid).status
+        == BookingStatus.PAID
+    )
+
+
 def test_confirm_missing_booking_and_expire_with_supplied_session(db):
     missing, message = booking_service.confirm_booking_after_payment(
         db,
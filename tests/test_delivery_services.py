@@ -22,6 +22,7 @@ from models import (
 from services import (
     outbox_service,
     receipt_service,
+    send_governor,
     whatsapp_service,
 )
 
@@ -104,6 +105,37 @@ def test_structured_whatsapp_failure_is_retried(monkeypatch, delivery_db):
     assert job.last_error == "payment_success_message_not_sent"
 
 
+def test_throttled_send_is_retried_without_spending_an_attempt(
+    monkeypatch,
+    delivery_db,
+):
+    booking = _paid_booking(delivery_db)
+    job_id = _enqueue(delivery_db, "consultation_reminder", booking)
+    priorities = []
+
+    def throttled(_db, _payload, _job):
+        priorities.append(send_governor._current_priority.get())
+        outbox_service._require_whatsapp_success(
+            {"ok": False, "error": "whatsapp_throttled"},
+            "consultation_reminder_not_sent",
+        )
+
+    monkeypatch.setitem(
+        outbox_service._HANDLERS,
+        "consultation_reminder",
+        throttled,
+    )
+
+    assert outbox_service.process_job(job_id) is False
+
+    delivery_db.expire_all()
+    job = delivery_db.get(OutboxJob, job_id)
+    assert priorities == ["reminder"]
+    assert job.status == outbox_service.PENDING
+    assert job.attempts == 0
+    assert job.last_error == "whatsapp_throttled"
+
+
 def test_open_payment_review_alert_is_delivered_once(
     monkeypatch,
     delivery_db,
@@ -5,6 +5,7 @@ from __future__ import annotations
 import runpy
 from pathlib import Path
 from types import SimpleNamespace
+from unittest.mock import MagicMock
 
 import pytest
 
@@ -72,6 +73,7 @@ def test_gunicorn_config_is_single_process_and_query_safe(monkeypatch):
 
 
 def test_gunicorn_config_rejects_worker_override(monkeypatch):
+    monkeypatch.delenv("RATE_LIMIT_BACKEND", raising=False)
     config = _gunicorn_config(monkeypatch)
     on_starting = config["on_starting"]
 
@@ -79,6 +81,18 @@ def test_gunicorn_config_rejects_worker_override(monkeypatch):
     with pytest.raises(RuntimeError, match="exactly one Gunicorn worker"):
         on_starting(SimpleNamespace(cfg=SimpleNamespace(workers=2)))
 
+    monkeypatch.setenv("DATABASE_URL", "postgresql://db.internal/nyaysetu")
+    with pytest.raises(RuntimeError, match="exactly one Gunicorn worker"):
+        on_starting(SimpleNamespace(cfg=SimpleNamespace(workers=2)))
+
+
+def test_gunicorn_config_allows_workers_with_shared_coordination(monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", "postgres://db.internal/nyaysetu")
+    monkeypatch.setenv("RATE_LIMIT_BACKEND", "database")
+    config = _gunicorn_config(monkeypatch)
+
+    config["on_starting"](SimpleNamespace(cfg=SimpleNamespace(workers=3)))
+
 
 def test_deployment_commands_and_render_release_controls_exist():
     procfile = (PROJECT_ROOT / "Procfile").read_text(encoding="utf-8")
@@ -224,3 +238,15 @@ def test_render_propagates_ses_configuration_to_the_email_outbox():
     for key in inherited:
         assert f"- key: {key}\n        fromService:" in outbox
         assert f"envVarKey: {key}" in outbox
+
+
+def test_gunicorn_workers_warm_the_local_model_after_fork(monkeypatch):
+    from services import local_ai_service
+
+    warm_up = MagicMock()
+    monkeypatch.setattr(local_ai_service, "warm_up_ollama", warm_up)
+    config = _gunicorn_config(monkeypatch)
+
+    config["post_fork"](SimpleNamespace(), SimpleNamespace())
+
+    assert warm_up.call_count == 1
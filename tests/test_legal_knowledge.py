@@ -248,3 +248,33 @@ def test_local_faq_answers_hinglish_without_external_ai(monkeypatch):
     assert "Abhi kya karein" in reply
     assert "legal advice nahi" in reply
     assert "lawyer consultation" in reply
+
+
+def test_rendered_guides_are_reused_until_the_content_revision_changes(
+    monkeypatch,
+):
+    user = SimpleNamespace(language="en")
+    first = guide_message(user, "Family", "Divorce")
+
+    assert guide_message(
+        SimpleNamespace(language="en"), "Family", "Divorce"
+    ) is first
+
+    monkeypatch.setattr(legal_knowledge, "LEGAL_CONTENT_VERSION", "test-r2")
+    revised = guide_message(user, "Family", "Divorce")
+
+    assert revised is not first
+    assert "test-r2" in revised
+
+
+def test_local_fallback_answer_is_memoized_per_context(monkeypatch):
+    monkeypatch.delenv("LOCAL_AI_PROVIDER", raising=False)
+    user = SimpleNamespace(language="en")
+    question = "My landlord is not returning my deposit"
+
+    answer = local_ai_reply(question, user)
+    post_payment = local_ai_reply(question, user, context="post_payment")
+
+    assert local_ai_reply(question, user) is answer
+    assert "book a lawyer consultation" in answer
+    assert "book a lawyer consultation" not in post_payment
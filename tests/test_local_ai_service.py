@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from services import local_ai_service
+
+
+def _ollama_client(monkeypatch, handler) -> list[dict]:
+    requests = []
+
+    def record(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        return handler(request)
+
+    client = httpx.Client(transport=httpx.MockTransport(record))
+    monkeypatch.setattr(local_ai_service, "_HTTP_CLIENT", client)
+    monkeypatch.setenv("LOCAL_AI_PROVIDER", "ollama")
+    return requests
+
+
+def _stream(tokens: list[str]) -> httpx.Response:
+    lines = [json.dumps({"response": token, "done": False}) for token in tokens]
+    lines.append(json.dumps({"response": "", "done": True}))
+    return httpx.Response(200, content="\n".join(lines).encode("utf-8"))
+
+
+def test_ollama_answer_is_streamed_and_cut_at_the_word_budget(monkeypatch):
+    sentence = "Keep copies of every notice you receive. "
+    requests = _ollama_client(
+        monkeypatch,
+        lambda _request: _stream([sentence] * 100),
+    )
+    user = SimpleNamespace(language="en")
+
+    reply = local_ai_service.local_ai_reply("Landlord kept my deposit", user)
+
+    answer = reply.split("\n\n⚠️")[0]
+    assert requests[0]["stream"] is True
+    assert requests[0]["keep_alive"] == "30m"
+    assert answer.endswith("receive.")
+    assert len(answer.split()) <= local_ai_service._WORD_BUDGET
+
+
+def test_busy_ollama_falls_back_to_the_local_guide(monkeypatch):
+    requests = _ollama_client(monkeypatch, lambda _request: _stream(["unused"]))
+    monkeypatch.setattr(
+        local_ai_service,
+        "_generation_slots",
+        local_ai_service.BoundedSemaphore(1),
+    )
+    user = SimpleNamespace(language="en")
+    assert local_ai_service._generation_slots.acquire(blocking=False)
+
+    reply = local_ai_service.local_ai_reply("Landlord kept my deposit", user)
+
+    assert requests == []
+    assert reply == local_ai_service._fallback_reply(
+        "Landlord kept my deposit",
+        user,
+        "general",
+    )
+
+
+@pytest.mark.parametrize("status_code", [500, 404])
+def test_ollama_errors_fall_back_and_release_the_slot(monkeypatch, status_code):
+    _ollama_client(monkeypatch, lambda _request: httpx.Response(status_code))
+    user = SimpleNamespace(language="en")
+
+    reply = local_ai_service.local_ai_reply("Landlord kept my deposit", user)
+
+    assert reply == local_ai_service._fallback_reply(
+        "Landlord kept my deposit",
+        user,
+        "general",
+    )
+    assert local_ai_service._generation_slots.acquire(blocking=False)
+    local_ai_service._generation_slots.release()
+
+
+def test_warm_up_loads_the_model_without_generating(monkeypatch):
+    requests = _ollama_client(
+        monkeypatch,
+        lambda _request: httpx.Response(200, json={"done": True}),
+    )
+    started = []
+    monkeypatch.setattr(
+        local_ai_service,
+        "Thread",
+        lambda target, **_kwargs: SimpleNamespace(
+            start=lambda: started.append(target()),
+        ),
+    )
+
+    local_ai_service.warm_up_ollama()
+
+    assert len(started) == 1
+    assert requests == [
+        {"model": "llama3.1:8b", "prompt": "", "keep_alive": "30m"}
+    ]
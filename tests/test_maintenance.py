@@ -26,6 +26,7 @@ from models import (
     SupportRequest,
     User,
     WebhookEvent,
+    WhatsAppMediaUpload,
 )
 from services import maintenance_service
 
@@ -279,6 +280,16 @@ def _seed_retention_matrix(session_factory, now: datetime) -> dict[str, int]:
             status="OPEN",
             created_at=now,
         )
+        expired_media = WhatsAppMediaUpload(
+            content_sha256="a" * 64,
+            media_id="media-expired",
+            expires_at=now - timedelta(seconds=1),
+        )
+        live_media = WhatsAppMediaUpload(
+            content_sha256="b" * 64,
+            media_id="media-live",
+            expires_at=now + timedelta(days=1),
+        )
         resolved_reconciliation = PaymentReconciliation(
             payment_id="pay-reconciliation-resolved",
             payment_link_id="plink-reconciliation-resolved",
@@ -314,6 +325,8 @@ def _seed_retention_matrix(session_factory, now: datetime) -> dict[str, int]:
                 stale_reconciliation,
                 recent_reconciliation,
                 resolved_reconciliation,
+                expired_media,
+                live_media,
             ]
         )
         db.commit()
@@ -337,6 +350,8 @@ def _seed_retention_matrix(session_factory, now: datetime) -> dict[str, int]:
             "stale_reconciliation": stale_reconciliation.id,
             "recent_reconciliation": recent_reconciliation.id,
             "resolved_reconciliation": resolved_reconciliation.id,
+            "expired_media": expired_media.id,
+            "live_media": live_media.id,
         }
     finally:
         db.close()
@@ -416,6 +431,7 @@ def test_execution_prunes_only_safe_terminal_records(maintenance_db):
     assert report["categories"]["inbound_message_events"]["affected"] == 1
     assert report["categories"]["analytics_events"]["affected"] == 1
     assert report["categories"]["completed_outbox_jobs"]["affected"] == 1
+    assert report["categories"]["expired_media_uploads"]["affected"] == 1
     assert report["categories"]["legacy_processed_messages"]["affected"] == 0
 
     db = maintenance_db()
@@ -439,6 +455,8 @@ def test_execution_prunes_only_safe_terminal_records(maintenance_db):
         assert db.get(OutboxJob, ids["recent_completed_outbox"]) is not None
         assert db.get(OutboxJob, ids["dead_outbox"]) is not None
         assert db.get(OutboxJob, ids["failed_outbox"]) is not None
+        assert db.get(WhatsAppMediaUpload, ids["expired_media"]) is None
+        assert db.get(WhatsAppMediaUpload, ids["live_media"]) is not None
 
         assert db.query(ProcessedMessage).count() == 2
         assert db.query(User).count() == 1
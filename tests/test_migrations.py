@@ -67,25 +67,29 @@ def test_fresh_database_upgrade_builds_current_schema(tmp_path):
             "lease_expires_at",
             "processed_at",
             "expires_at",
+            "wa_id",
+            "payload",
         }.issubset(inbound_columns)
 
         outbox_columns = {
             column["name"]
             for column in inspector.get_columns("outbox_jobs")
         }
-        assert "dedupe_key" in outbox_columns
+        assert {"dedupe_key", "ordering_key"}.issubset(outbox_columns)
 
         with engine.connect() as connection:
             assert (
                 connection.execute(
                     sa.text("SELECT version_num FROM alembic_version")
                 ).scalar_one()
-                == "20260819_01"
+                == "20261016_06"
             )
         assert {
             "document_orders",
             "document_answer_revisions",
             "document_audit_events",
+            "whatsapp_media_uploads",
+            "shared_ai_answers",
         }.issubset(inspector.get_table_names())
     finally:
         engine.dispose()
@@ -134,6 +138,14 @@ def _create_legacy_database(path: Path) -> None:
             sa.Column("created_at", sa.DateTime(), nullable=False),
             sa.Column("updated_at", sa.DateTime(), nullable=False),
         )
+        tallies = sa.Table(
+            "category_analytics",
+            legacy,
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("category", sa.String()),
+            sa.Column("subcategory", sa.String()),
+            sa.Column("count", sa.Integer()),
+        )
         legacy.create_all(engine)
 
         now = datetime(2026, 7, 29, 12, 0, 0)
@@ -193,6 +205,16 @@ def _create_legacy_database(path: Path) -> None:
                     "updated_at": now,
                 },
             )
+            connection.execute(
+                tallies.insert(),
+                [
+                    {"category": "Family", "subcategory": "Divorce", "count": 3},
+                    {"category": "Family", "subcategory": "Divorce", "count": 2},
+                    {"category": "Family", "subcategory": "Custody", "count": 1},
+                    {"category": "Property", "subcategory": None, "count": 4},
+                    {"category": "Property", "subcategory": None, "count": 5},
+                ],
+            )
             connection.execute(
                 outbox.insert(),
                 {
@@ -232,7 +254,7 @@ def test_legacy_upgrade_adds_compatibility_and_backfills_safely(tmp_path):
             column["name"]
             for column in inspector.get_columns("outbox_jobs")
         }
-        assert "dedupe_key" in outbox_columns
+        assert {"dedupe_key", "ordering_key"}.issubset(outbox_columns)
         dedupe_is_unique = any(
             constraint.get("column_names") == ["dedupe_key"]
             for constraint in inspector.get_unique_constraints("outbox_jobs")
@@ -299,5 +321,26 @@ def test_legacy_upgrade_adds_compatibility_and_backfills_safely(tmp_path):
             assert paid["created_at"] is not None
             assert completed["fulfillment_status"] == "COMPLETED"
             assert completed["completed_at"] is not None
+
+            # Racing increments left duplicate tally rows; they are folded
+            # before the upsert key is added. NULL keys are left untouched.
+            assert connection.execute(
+                sa.text(
+                    """
+                    SELECT category, subcategory, count
+                    FROM category_analytics
+                    ORDER BY id
+                    """
+                )
+            ).all() == [
+                ("Family", "Divorce", 5),
+                ("Family", "Custody", 1),
+                ("Property", None, 4),
+                ("Property", None, 5),
+            ]
+        assert "uq_category_analytics_key" in {
+            index["name"]
+            for index in inspector.get_indexes("category_analytics")
+        }
     finally:
         engine.dispose()
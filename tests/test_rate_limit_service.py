@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import socketserver
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from db import Base
+from models import RateLimitHit
+from services import rate_limit_service
+from services.rate_limit_service import (
+    DatabaseRateLimitStore,
+    MemoryRateLimitStore,
+    RedisRateLimitStore,
+)
+
+
+class _SortedSetServer(socketserver.ThreadingTCPServer):
+    """Just enough of the Redis protocol to exercise the rate-limit store."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SortedSetHandler)
+        self.sets: dict[bytes, dict[bytes, float]] = {}
+        self.lock = threading.Lock()
+        self.commands: list[bytes] = []
+
+
+def _score_bound(raw: bytes, *, lower: bool):
+    if raw in {b"-inf", b"+inf"}:
+        value = float(raw)
+        return lambda score: score >= value if lower else score <= value
+    if raw.startswith(b"("):
+        value = float(raw[1:])
+        return lambda score: score > value if lower else score < value
+    value = float(raw)
+    return lambda score: score >= value if lower else score <= value
+
+
+class _SortedSetHandler(socketserver.StreamRequestHandler):
+    def _read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        arguments = []
+        for _ in range(int(header[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            arguments.append(self.rfile.read(length + 2)[:-2])
+        return arguments
+
+    def _apply(self, command):
+        name, arguments = command[0].upper(), command[1:]
+        sets = self.server.sets
+        if name == b"ZREMRANGEBYSCORE":
+            members = sets.get(arguments[0], {})
+            low = _score_bound(arguments[1], lower=True)
+            high = _score_bound(arguments[2], lower=False)
+            removed = [
+                member
+                for member, score in members.items()
+                if low(score) and high(score)
+            ]
+            for member in removed:
+                members.pop(member)
+            return len(removed)
+        if name == b"ZADD":
+            sets.setdefault(arguments[0], {})[arguments[2]] = float(
+                arguments[1]
+            )
+            return 1
+        if name == b"ZCARD":
+            return len(sets.get(arguments[0], {}))
+        if name == b"ZREM":
+            return int(
+                sets.get(arguments[0], {}).pop(arguments[1], None) is not None
+            )
+        if name == b"PEXPIRE":
+            return 1
+        if name == b"SCAN":
+            prefix = arguments[2].rstrip(b"*")
+            return [b"0", [key for key in sets if key.startswith(prefix)]]
+        if name == b"DEL":
+            return sum(sets.pop(key, None) is not None for key in arguments)
+        raise ValueError(name)
+
+    @staticmethod
+    def _encode(reply) -> bytes:
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        if isinstance(reply, str):
+            return b"+%s\r\n" % reply.encode()
+        return b"*%d\r\n" % len(reply) + b"".join(
+            _SortedSetHandler._encode(item) for item in reply
+        )
+
+    def handle(self):
+        queued = None
+        while True:
+            command = self._read_command()
+            if command is None:
+                return
+            name = command[0].upper()
+            self.server.commands.append(name)
+            if name == b"MULTI":
+                queued = []
+                reply = "OK"
+            elif name == b"EXEC":
+                with self.server.lock:
+                    reply = [self._apply(item) for item in queued]
+                queued = None
+            elif queued is not None:
+                queued.append(command)
+                reply = "QUEUED"
+            else:
+                with self.server.lock:
+                    reply = self._apply(command)
+            self.wfile.write(self._encode(reply))
+
+
+@pytest.fixture
+def redis_stand_in():
+    server = _SortedSetServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    try:
+        yield sessionmaker(bind=engine, autoflush=False)
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture(params=["memory", "database", "redis"])
+def store(request, session_factory, redis_stand_in):
+    if request.param == "memory":
+        return MemoryRateLimitStore()
+    if request.param == "database":
+        return DatabaseRateLimitStore(session_factory)
+    host, port = redis_stand_in.server_address
+    return RedisRateLimitStore(f"redis://{host}:{port}/0")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    current = {"now": 10_000.0}
+    monkeypatch.setattr(rate_limit_service.time, "time", lambda: current["now"])
+    return current
+
+
+def test_every_backend_applies_the_same_sliding_window(store, clock):
+    accepted = []
+    for _ in range(3):
+        accepted.append(store.hit("user:1", 3, 60))
+        clock["now"] += 1
+    assert accepted == [False, False, False]
+    assert store.hit("user:1", 3, 60) is True
+    assert store.hit("user:2", 3, 60) is False
+
+    # Rejected attempts are not counted: the first hit ages out exactly when
+    # the window has elapsed since it was accepted.
+    clock["now"] += 56.5
+    assert store.hit("user:1", 3, 60) is True
+    clock["now"] += 0.5
+    assert store.hit("user:1", 3, 60) is False
+    assert store.hit("user:1", 3, 60) is True
+
+
+def test_every_backend_treats_a_limit_of_one_as_a_cooldown(store, clock):
+    assert store.hit("ai:1", 1, 2.0) is False
+    clock["now"] += 1.9
+    assert store.hit("ai:1", 1, 2.0) is True
+    clock["now"] += 0.1
+    assert store.hit("ai:1", 1, 2.0) is False
+    assert store.hit("ai:disabled", 1, 0.0) is False
+    assert store.hit("ai:disabled", 1, 0.0) is False
+
+
+def test_every_backend_discards_hits_left_by_a_clock_moving_backwards(
+    store,
+    clock,
+):
+    assert store.hit("global", 1, 60) is False
+    clock["now"] -= 3_600
+    assert store.hit("global", 1, 60) is False
+
+
+def test_every_backend_keeps_hits_in_the_window_when_the_clock_moves_back(
+    store,
+    clock,
+):
+    assert store.hit("user:1", 2, 60) is False
+    clock["now"] += 30
+    assert store.hit("user:1", 2, 60) is False
+    clock["now"] -= 20
+
+    # Only the hit now in the future is discarded; the first one still counts.
+    assert store.hit("user:1", 2, 60) is False
+    assert store.hit("user:1", 2, 60) is True
+
+
+def test_every_backend_can_be_cleared(store, clock):
+    assert store.hit("notice:user:1", 1, 60) is False
+    store.clear()
+    assert store.hit("notice:user:1", 1, 60) is False
+
+
+def test_database_store_prunes_idle_keys(session_factory, clock):
+    store = DatabaseRateLimitStore(
+        session_factory,
+        cleanup_interval_seconds=0.0,
+    )
+    for index in range(5):
+        assert store.hit(f"user:{index}", 2, 60) is False
+    clock["now"] += 61
+    assert store.hit("user:active", 2, 60) is False
+
+    db = session_factory()
+    try:
+        assert [row.bucket_key for row in db.query(RateLimitHit).all()] == [
+            "user:active"
+        ]
+    finally:
+        db.close()
+
+
+def test_redis_store_removes_an_overflowing_hit(redis_stand_in, clock):
+    host, port = redis_stand_in.server_address
+    store = RedisRateLimitStore(f"redis://{host}:{port}")
+
+    assert store.hit("user:1", 1, 60) is False
+    assert store.hit("user:1", 1, 60) is True
+
+    assert redis_stand_in.commands.count(b"ZREM") == 1
+    assert len(redis_stand_in.sets[b"nyaysetu:ratelimit:user:1"]) == 1
+
+
+def test_redis_store_rejects_unsupported_urls():
+    with pytest.raises(ValueError, match="redis://"):
+        RedisRateLimitStore("http://localhost:6379")
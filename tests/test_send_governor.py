@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import threading
+import time
+
+import pytest
+
+from services.send_governor import SendGovernor, send_priority
+
+
+def _governor(clock, **overrides) -> SendGovernor:
+    options = {
+        "rate": 10.0,
+        "min_rate": 1.0,
+        "pair_burst": 2,
+        "pair_interval_seconds": 6.0,
+        "max_wait_seconds": 0.0,
+        "clock": clock,
+    }
+    options.update(overrides)
+    return SendGovernor(**options)
+
+
+def test_global_and_pair_buckets_limit_sends():
+    now = [100.0]
+    governor = _governor(lambda: now[0])
+
+    assert governor.acquire("919900000001") is True
+    assert governor.acquire("919900000001") is True
+    assert governor.acquire("919900000001") is False
+    assert all(governor.acquire(f"91990000010{index}") for index in range(8))
+    assert governor.acquire("919900000002") is False
+
+    now[0] += 6.0
+    assert governor.acquire("919900000001") is True
+    assert governor.snapshot()["rejected"] == 2
+
+
+def test_throttling_halves_the_rate_once_and_success_regains_it():
+    now = [100.0]
+    governor = _governor(lambda: now[0])
+
+    governor.record("919900000001", status_code=429)
+    governor.record("919900000002", status_code=429)
+    assert governor.rate == 5.0
+
+    now[0] += 1.0
+    governor.record("919900000001", status_code=200)
+    assert governor.rate == 5.5
+
+    now[0] += 1.0
+    governor.record("919900000001", status_code=400, error_code=130429)
+    assert governor.rate == 2.75
+    assert governor.snapshot()["decreases"] == 2
+
+    governor.record("919900000003", status_code=400, error_code=131056)
+    assert governor.rate == 2.75
+    assert governor.acquire("919900000003") is False
+
+
+def test_waiting_conversations_preempt_reminders():
+    governor = _governor(time.monotonic, rate=2.0, max_wait_seconds=0.75)
+    assert governor.acquire("919900000001") is True
+    assert governor.acquire("919900000002") is True
+    results = {}
+
+    def send(name, priority, recipient):
+        with send_priority(priority):
+            results[name] = governor.acquire(recipient)
+
+    reminder = threading.Thread(
+        target=send,
+        args=("reminder", "reminder", "919900000003"),
+    )
+    conversation = threading.Thread(
+        target=send,
+        args=("conversation", "conversation", "919900000004"),
+    )
+    reminder.start()
+    time.sleep(0.1)
+    conversation.start()
+    reminder.join()
+    conversation.join()
+
+    assert results == {"conversation": True, "reminder": False}
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        with send_priority("bulk"):
+            pass
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from services.ttl_cache import TTLCache, cache_stats
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = TTLCache(max_entries=2, ttl_seconds=60, clock=lambda: 100.0)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {
+        "entries": 2,
+        "max_entries": 2,
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1,
+        "expirations": 0,
+    }
+
+
+def test_entries_expire_lazily_and_a_zero_ttl_stores_nothing():
+    now = [100.0]
+    cache = TTLCache(max_entries=10, ttl_seconds=5, clock=lambda: now[0])
+
+    cache.set("short", "value", ttl_seconds=1)
+    cache.set("default", "value")
+    cache.set("disabled", "value", ttl_seconds=0)
+    now[0] = 101.0
+
+    assert cache.get("short") is None
+    assert cache.get("default") == "value"
+    assert cache.get("disabled") is None
+    assert list(cache.live_keys()) == ["default"]
+
+    now[0] = 106.0
+    cache.set("fresh", "value")
+    assert len(cache) == 1
+    assert cache.stats()["expirations"] == 2
+
+
+def test_named_caches_report_their_counters():
+    cache = TTLCache(max_entries=1, ttl_seconds=60, name="test_named_cache")
+    cache.get("missing")
+
+    assert cache_stats()["test_named_cache"]["misses"] == 1
@@ -15,8 +15,14 @@ from unittest.mock import MagicMock
 
 import httpx
 import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
+from db import Base
+from models import WhatsAppMediaUpload
 from services import whatsapp_service as whatsapp
+from services.send_governor import SendGovernor
 
 
 def _response(
@@ -255,3 +261,84 @@ def test_payment_success_message_uses_amount_stored_on_booking(monkeypatch):
         "Stored amount: INR 777",
     )
     db.close.assert_called_once()
+
+
+def test_identical_documents_reuse_the_uploaded_media_id(monkeypatch, tmp_path):
+    _configure_transport(monkeypatch)
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(whatsapp, "SessionLocal", session_factory)
+    monkeypatch.setattr(whatsapp, "_media_ids", {})
+    uploads = iter(["media-1", "media-2"])
+    sent_media = []
+
+    def handle(method, url, **kwargs):
+        if url.endswith("/media"):
+            return _response(200, {"id": next(uploads)})
+        document = kwargs["json"]["document"]
+        sent_media.append(document["id"])
+        if document["id"] == "media-1" and len(sent_media) == 3:
+            return _response(400, {"error": {"message": "media expired"}})
+        return _response(200, {"messages": [{"id": "accepted"}]})
+
+    request = MagicMock(side_effect=handle)
+    monkeypatch.setattr(whatsapp._HTTP_CLIENT, "request", request)
+    receipt = tmp_path / "receipt.pdf"
+    receipt.write_bytes(b"%PDF-1.4 identical receipt")
+
+    try:
+        assert whatsapp.send_document("919876543210", str(receipt))["ok"]
+        # A new process has only the durable row.
+        monkeypatch.setattr(whatsapp, "_media_ids", {})
+        assert whatsapp.send_document("919876543210", str(receipt))["ok"]
+        # Meta dropped the media early: upload once more and replace the row.
+        assert whatsapp.send_document("919876543210", str(receipt))["ok"]
+
+        media_uploads = [
+            call for call in request.call_args_list
+            if call.args[1].endswith("/media")
+        ]
+        assert len(media_uploads) == 2
+        assert sent_media == ["media-1", "media-1", "media-1", "media-2"]
+        db = session_factory()
+        try:
+            row = db.query(WhatsAppMediaUpload).one()
+            assert row.media_id == "media-2"
+        finally:
+            db.close()
+    finally:
+        engine.dispose()
+
+
+def test_governed_sends_report_throttling_without_network_io(monkeypatch):
+    _configure_transport(monkeypatch)
+    monkeypatch.setenv("WHATSAPP_HTTP_MAX_RETRIES", "0")
+    governor = SendGovernor(
+        rate=10.0,
+        min_rate=1.0,
+        pair_burst=1,
+        pair_interval_seconds=60.0,
+        max_wait_seconds=0.0,
+    )
+    monkeypatch.setattr(whatsapp, "governor", governor)
+    request = MagicMock(
+        return_value=_response(
+            429,
+            {"error": {"message": "Rate limit hit", "code": 130429}},
+        )
+    )
+    monkeypatch.setattr(whatsapp._HTTP_CLIENT, "request", request)
+
+    limited = whatsapp.send_text("919876543210", "First")
+    throttled = whatsapp.send_text("919876543210", "Second")
+
+    assert limited["status_code"] == 429
+    assert governor.rate == 5.0
+    assert throttled == {"ok": False, "error": "whatsapp_throttled"}
+    assert whatsapp.is_retryable_delivery_failure(throttled) is True
+    request.assert_called_once()